@@ -15,6 +15,7 @@ from app.memory.memory_consolidator import MemoryConsolidator
 from app.rag.knowledge_base import KnowledgeBase
 from app.config import settings
 from app.tools.tool_belt import ToolBelt
+from app.llm.instrumentation import with_agent_label
 
 
 logger = logging.getLogger(__name__)
@@ -88,7 +89,7 @@ class AutonomousAgent(AIAgent):
             統合された知識（箇条書き）:
             """
         )
-        chain = prompt | self.llm | self.output_parser
+        chain = with_agent_label(prompt | self.llm | self.output_parser, "AutonomousAgent.synthesis")
         synthesized_text = chain.invoke({"topic": topic, "information": information})
         logger.info(f"知識統合完了:\n{synthesized_text}")
         return synthesized_text
@@ -5,6 +5,9 @@
 from langchain_core.runnables import Runnable
 from typing import Any, Dict, Optional
 
+from app.llm.instrumentation import with_agent_label
+from app.tracing import trace_span
+
 
 class AIAgent:
     """
@@ -17,8 +20,10 @@ class AIAgent:
         """
         コンストラクタ。
         サブクラスの__init__の最後に呼び出され、チェーンを構築する。
+        構築したチェーンにはエージェント名が付与され、LLM呼び出しの計測に使用される。
         """
-        self._chain = self.build_chain()
+        chain = self.build_chain()
+        self._chain = with_agent_label(chain, self.__class__.__name__) if chain is not None else None
 
     def build_chain(self) -> Optional[Runnable]:
         """
@@ -44,4 +49,24 @@ class AIAgent:
                 f"{self.__class__.__name__} is not designed to be invoked directly. "
                 "It may use multiple internal chains. Call a specific method instead."
             )
-        return self._chain.invoke(input_data)
\ No newline at end of file
+        with trace_span(f"{self.__class__.__name__}.invoke", "agent"):
+            return self._chain.invoke(input_data)
+
+    async def ainvoke(self, input_data: Dict[str, Any] | str) -> Any:
+        """
+        構築されたチェーンを非同期に実行（ainvoke）します。
+        LangChainのainvokeを利用するため、LLMの応答待ちの間もスレッドを占有しません。
+
+        Args:
+            input_data: チェーンへの入力データ。
+
+        Returns:
+            チェーンの実行結果。
+        """
+        if not hasattr(self, '_chain') or self._chain is None:
+            raise RuntimeError(
+                f"{self.__class__.__name__} is not designed to be invoked directly. "
+                "It may use multiple internal chains. Call a specific method instead."
+            )
+        with trace_span(f"{self.__class__.__name__}.ainvoke", "agent"):
+            return await self._chain.ainvoke(input_data)
\ No newline at end of file
@@ -2,8 +2,9 @@
 # title: 認知ループAIエージェント
 # role: 計画に基づき、情報検索、評価、改善、知識グラフ化を反復的に実行し、分析結果を生成する。
 
+import asyncio
 import logging
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Optional, cast
 
 from langchain_core.documents import Document
 from langchain_core.prompts import ChatPromptTemplate
@@ -13,10 +14,12 @@ from app.agents.base import AIAgent
 from app.agents.knowledge_graph_agent import KnowledgeGraphAgent
 from app.agents.query_refinement_agent import QueryRefinementAgent
 from app.agents.retrieval_evaluator_agent import RetrievalEvaluatorAgent
+from app.knowledge_graph.models import KnowledgeGraph
 from app.knowledge_graph.persistent_knowledge_graph import PersistentKnowledgeGraph
 from app.rag.retriever import Retriever
 from app.tools.tool_belt import ToolBelt
 from app.agents.tool_using_agent import ToolUsingAgent
+from app.memory.context_assembler import ContextAssembler, ContextSection
 
 from app.config import settings # ADDED
 
@@ -38,6 +41,7 @@ class CognitiveLoopAgent(AIAgent):
         persistent_knowledge_graph: PersistentKnowledgeGraph,
         tool_using_agent: ToolUsingAgent,
         tool_belt: ToolBelt,
+        context_assembler: Optional[ContextAssembler] = None,
     ):
         self.llm = llm
         self.output_parser = output_parser
@@ -49,6 +53,7 @@ class CognitiveLoopAgent(AIAgent):
         self.persistent_knowledge_graph = persistent_knowledge_graph
         self.tool_using_agent = tool_using_agent
         self.tool_belt = tool_belt
+        self.context_assembler = context_assembler
         super().__init__()
 
     def build_chain(self) -> Runnable:
@@ -57,7 +62,7 @@ class CognitiveLoopAgent(AIAgent):
         """
         return self.prompt_template | self.llm | self.output_parser
 
-    def _iterative_retrieval(self, query: str) -> str:
+    async def _aiterative_retrieval(self, query: str) -> str:
         """
         検索、評価、クエリ改善を繰り返して情報の質を高める反復的検索を実行します。
         必要に応じて外部ツールも利用します。
@@ -71,12 +76,12 @@ class CognitiveLoopAgent(AIAgent):
             logger.info(f"検索イテレーション {i+1}/{max_iterations}: クエリ='{current_query}'")
             
             # 1. RAG検索
-            docs: List[Document] = self.retriever.invoke(current_query)
+            docs: List[Document] = await self.retriever.ainvoke(current_query)
             rag_retrieved_info = "\n\n".join([doc.page_content for doc in docs])
 
             # 2. RAG検索結果の評価
             eval_input = {"query": current_query, "retrieved_info": rag_retrieved_info}
-            evaluation = self.retrieval_evaluator_agent.invoke(eval_input)
+            evaluation = await self.retrieval_evaluator_agent.ainvoke(eval_input)
             
             logger.info(f"RAG検索品質の評価: {evaluation}")
 
@@ -96,7 +101,7 @@ class CognitiveLoopAgent(AIAgent):
                 }
                 
                 try:
-                    tool_decision = self.tool_using_agent.invoke(tool_selection_input)
+                    tool_decision = await self.tool_using_agent.ainvoke(tool_selection_input)
                     if ": " in tool_decision:
                         chosen_tool_name, tool_query = tool_decision.split(": ", 1)
                         chosen_tool_name = chosen_tool_name.strip()
@@ -105,7 +110,8 @@ class CognitiveLoopAgent(AIAgent):
                         chosen_tool = self.tool_belt.get_tool(chosen_tool_name)
                         if chosen_tool:
                             logger.info(f"ツール '{chosen_tool_name}' を使用して '{tool_query}' を検索します。")
-                            tool_result = chosen_tool.use(tool_query)
+                            # ツールは同期APIのため、イベントループを塞がないようスレッドで実行する
+                            tool_result = await asyncio.to_thread(chosen_tool.use, tool_query)
                             current_retrieved_info = f"{current_retrieved_info}\n\n--- 外部ツール ({chosen_tool_name}) からの情報 ---\n{tool_result}"
                             logger.info(f"外部ツールからの情報取得完了。")
                             tool_used_this_cycle = True
@@ -130,7 +136,7 @@ class CognitiveLoopAgent(AIAgent):
                 "evaluation_summary": evaluation.get("summary", ""),
                 "suggestions": evaluation.get("suggestions", "")
             }
-            refined_query = self.query_refinement_agent.invoke(refine_input)
+            refined_query = await self.query_refinement_agent.ainvoke(refine_input)
             logger.info(f"改善されたクエリ: '{refined_query}'")
             current_query = refined_query
         else:
@@ -138,38 +144,75 @@ class CognitiveLoopAgent(AIAgent):
 
         return final_info
 
+    def _assemble_final_input(
+        self,
+        query: str,
+        plan: str,
+        dialogue_history: List[str],
+        relevant_graph: KnowledgeGraph,
+        final_retrieved_info: str,
+    ) -> Dict[str, Any]:
+        """
+        最終プロンプトの入力を組み立てる。ContextAssemblerが設定されていれば、各文脈をトークン予算内に収める。
+        """
+        no_memory = "関連する長期記憶はありません。"
+        if self.context_assembler is None:
+            return {
+                "query": query,
+                "plan": plan,
+                "dialogue_history": "\n".join(dialogue_history) or "なし",
+                "long_term_memory_context": relevant_graph.to_string() if relevant_graph.nodes else no_memory,
+                "final_retrieved_info": final_retrieved_info,
+            }
+
+        assembled = self.context_assembler.assemble([
+            ContextSection.from_text("plan", plan),
+            ContextSection.from_dialogue_history("dialogue_history", dialogue_history, empty_text="なし"),
+            ContextSection.from_knowledge_graph("long_term_memory_context", relevant_graph, empty_text=no_memory),
+            # 検索結果は検索順位の高い文書チャンクから採用する
+            ContextSection.from_text("final_retrieved_info", final_retrieved_info, separator="\n\n"),
+        ])
+        logger.info(f"認知ループのコンテキストを組み立てました: {ContextAssembler.format_report(assembled['report'])}")
+        return {"query": query, **assembled["sections"]}
+
     def invoke(self, input_data: Dict[str, Any] | str) -> str:
         """
-        認知ループを実行し、最終的な分析結果を返します。
+        認知ループを実行し、最終的な分析結果を返します。ainvokeの同期ラッパーです。
+        """
+        return asyncio.run(self.ainvoke(input_data))
+
+    async def ainvoke(self, input_data: Dict[str, Any] | str) -> str:
+        """
+        認知ループを非同期に実行し、最終的な分析結果を返します。
         """
         if not isinstance(input_data, dict):
             raise TypeError("CognitiveLoopAgent expects a dictionary as input.")
 
         query = input_data.get("query", "")
         plan = input_data.get("plan", "")
+        dialogue_history: List[str] = list(input_data.get("dialogue_history") or [])
 
         # 1. 反復的検索（ツール利用を含む）
-        final_retrieved_info = self._iterative_retrieval(query)
+        final_retrieved_info = await self._aiterative_retrieval(query)
 
         # 2. 知識グラフの生成と永続化
+        seed_ids: List[str] = []
         if final_retrieved_info:
             logger.info("検索結果から知識グラフを生成しています...")
             kg_input = {"text_chunk": final_retrieved_info}
-            new_knowledge_graph = self.knowledge_graph_agent.invoke(kg_input)
+            new_knowledge_graph = await self.knowledge_graph_agent.ainvoke(kg_input)
             self.persistent_knowledge_graph.merge(new_knowledge_graph)
             self.persistent_knowledge_graph.save()
-            long_term_memory_context = self.persistent_knowledge_graph.get_graph().to_string()
-        else:
-            long_term_memory_context = "関連する長期記憶はありません。"
+            seed_ids = [node.id for node in new_knowledge_graph.nodes]
+
+        # グラフ全体ではなく、クエリと今回の検索結果に関連する部分グラフのみを長期記憶として使用する
+        relevant_graph = self.persistent_knowledge_graph.get_relevant_subgraph(
+            query, seed_ids=seed_ids, max_hops=cast(int, settings.CONTEXT_BUDGET_SETTINGS["knowledge_graph_max_hops"])
+        )
 
         # 3. 最終的な分析結果の生成
-        final_input = {
-            "query": query,
-            "plan": plan,
-            "long_term_memory_context": long_term_memory_context,
-            "final_retrieved_info": final_retrieved_info,
-        }
+        final_input = self._assemble_final_input(query, plan, dialogue_history, relevant_graph, final_retrieved_info)
         
         if self._chain is None:
             raise RuntimeError("CognitiveLoopAgent's chain is not initialized.")
-        return self._chain.invoke(final_input)
\ No newline at end of file
+        return await self._chain.ainvoke(final_input)
\ No newline at end of file
@@ -18,6 +18,7 @@ from app.memory.memory_consolidator import MemoryConsolidator
 from app.rag.knowledge_base import KnowledgeBase
 from app.knowledge_graph.models import KnowledgeGraph
 from app.agents import prompts # Added import for WISDOM_SYNTHESIS_PROMPT
+from app.llm.instrumentation import with_agent_label
 
 logger = logging.getLogger(__name__)
 
@@ -43,7 +44,7 @@ class ConsolidationAgent(AIAgent):
         self.memory_consolidator = memory_consolidator
         self.persistent_knowledge_graph = persistent_knowledge_graph
         self.processed_sessions_log = "memory/processed_sessions.log"
-        self.wisdom_synthesis_chain = prompts.WISDOM_SYNTHESIS_PROMPT | self.llm | self.output_parser # Added
+        self.wisdom_synthesis_chain = with_agent_label(prompts.WISDOM_SYNTHESIS_PROMPT | self.llm | self.output_parser, "ConsolidationAgent.wisdom_synthesis") # Added
         super().__init__()
 
     def build_chain(self) -> Runnable:
@@ -4,27 +4,31 @@
 
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.runnables import Runnable
-from langchain_core.output_parsers import JsonOutputParser
-from typing import Any, Dict
+from typing import Any, Dict, Optional
 
 from app.agents.base import AIAgent
 from app.knowledge_graph.models import KnowledgeGraph as KnowledgeGraphModel
+from app.llm.structured_output import StructuredOutputStats, build_structured_chain
 
 class KnowledgeGraphAgent(AIAgent):
     """
     テキストから知識グラフを生成するAIエージェント。
     """
-    def __init__(self, llm: Any, prompt_template: ChatPromptTemplate):
+    def __init__(self, llm: Any, prompt_template: ChatPromptTemplate, structured_output_stats: Optional[StructuredOutputStats] = None):
         self.llm = llm
         self.prompt_template = prompt_template
-        self.output_parser = JsonOutputParser(pydantic_object=KnowledgeGraphModel)
+        self.structured_output_stats = structured_output_stats
         super().__init__()
 
     def build_chain(self) -> Runnable:
         """
         知識グラフ生成エージェントのLangChainチェーンを構築します。
         """
-        return self.prompt_template | self.llm | self.output_parser
+        # 解析できない場合は空のグラフとし、知識グラフの更新だけを見送る
+        return build_structured_chain(
+            self.prompt_template, self.llm, "KnowledgeGraphAgent",
+            stats=self.structured_output_stats, pydantic_object=KnowledgeGraphModel, default={"nodes": [], "edges": []},
+        )
 
     def invoke(self, input_data: Dict[str, Any] | str) -> KnowledgeGraphModel:
         """
@@ -36,5 +40,17 @@ class KnowledgeGraphAgent(AIAgent):
         if self._chain is None:
             raise RuntimeError("KnowledgeGraphAgent's chain is not initialized.")
         
-        result: KnowledgeGraphModel = self._chain.invoke(input_data)
-        return result
\ No newline at end of file
+        # JsonOutputParserはpydantic_objectを指定しても辞書を返すため、モデルに変換する
+        return KnowledgeGraphModel.model_validate(self._chain.invoke(input_data))
+
+    async def ainvoke(self, input_data: Dict[str, Any] | str) -> KnowledgeGraphModel:
+        """
+        invokeの非同期版。
+        """
+        if not isinstance(input_data, dict):
+            raise TypeError("KnowledgeGraphAgent expects a dictionary as input.")
+        
+        if self._chain is None:
+            raise RuntimeError("KnowledgeGraphAgent's chain is not initialized.")
+        
+        return KnowledgeGraphModel.model_validate(await self._chain.ainvoke(input_data))
\ No newline at end of file
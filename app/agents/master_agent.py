@@ -3,11 +3,12 @@
 # role: AIの認知・メタ認知プロセス全体を統括する司令塔。
 
 from __future__ import annotations
+import asyncio
 import logging
 import time
 from langchain_core.runnables import Runnable
 from langchain_core.prompts import ChatPromptTemplate
-from typing import Any, Dict, TYPE_CHECKING, List
+from typing import Any, AsyncIterator, Dict, TYPE_CHECKING, List, Optional, Tuple
 
 import app.agents.prompts as prompts # Import prompts module as prompts
 from app.agents.orchestration_agent import OrchestrationAgent # New import
@@ -17,8 +18,11 @@ from app.memory.working_memory import WorkingMemory
 from app.cognitive_modeling.predictive_coding_engine import PredictiveCodingEngine
 from app.memory.memory_consolidator import MemoryConsolidator
 from app.digital_homeostasis.ethical_motivation_engine import EthicalMotivationEngine
-from app.models import MasterAgentResponse
+from app.models import MasterAgentResponse, OrchestrationDecision, StreamEvent
 from app.engine import MetaIntelligenceEngine
+from app.llm.streaming import ainvoke_streaming
+from app.llm.instrumentation import with_agent_label
+from app.meta_cognition.reflection_queue import ReflectionQueue
 
 if TYPE_CHECKING:
     from app.agents.planning_agent import PlanningAgent
@@ -47,7 +51,11 @@ class MasterAgent(AIAgent):
         # REMOVED: execution_mode: str,
         value_evaluator: 'ValueEvaluator',
         orchestration_agent: 'OrchestrationAgent', # ADDED
+        reflection_queue: Optional[ReflectionQueue] = None,
     ):
+        """
+        reflection_queueを指定した場合、回答後の倫理的な動機づけと価値観の評価はキューに積み、回答を待たずに返す。
+        """
         self.llm = llm
         self.output_parser = output_parser
         self.memory_consolidator = memory_consolidator
@@ -59,39 +67,84 @@ class MasterAgent(AIAgent):
         self.dialogue_history: List[str] = []
         self.value_evaluator = value_evaluator
         self.orchestration_agent = orchestration_agent # ADDED
+        self.reflection_queue = reflection_queue
+        if reflection_queue is not None:
+            reflection_queue.register("master_agent.post_answer", self._areflect)
         
         # MasterAgentのプロンプトは、もはや静的なEXECUTION_MODEに依存しない。
         # 代わりに、デフォルトまたはフルパイプラインの汎用プロンプトを使用する。
         self.prompt_template = prompts.MASTER_AGENT_PROMPT # type: ignore[attr-defined]
+        # simpleパイプライン用の、関連情報のみから回答を生成するチェーン
+        self.simple_chain: Runnable = with_agent_label(
+            prompts.SIMPLE_MASTER_AGENT_PROMPT | self.llm | self.output_parser, "MasterAgent.simple"
+        )
 
         super().__init__()
 
     def build_chain(self) -> Runnable:
         return self.prompt_template | self.llm | self.output_parser
 
+    async def agenerate_final_answer(self, input_data: Dict[str, Any]) -> str:
+        """
+        計画と認知ループの分析結果から最終回答を非同期に生成する。
+        入力には "query", "plan", "cognitive_loop_output" が必要。
+        ストリーミング実行中であれば、生成されたトークンを逐次送出する。
+        """
+        if self._chain is None:
+            raise RuntimeError("MasterAgent's chain is not initialized.")
+        return await ainvoke_streaming(self._chain, input_data)
+
+    async def agenerate_simple_answer(self, input_data: Dict[str, Any]) -> str:
+        """
+        関連情報のみから最終回答を非同期に生成する。
+        入力には "query", "retrieved_info" が必要。
+        ストリーミング実行中であれば、生成されたトークンを逐次送出する。
+        """
+        return await ainvoke_streaming(self.simple_chain, input_data)
+
     def end_session(self):
         """
         セッションを終了し、ワーキングメモリを保存・クリアする。
+        予測符号化エンジンのスレッドも終了するため、終了したMasterAgentは再利用しないこと。
         """
         logger.info("--- 対話セッション終了処理 ---")
         self.memory_consolidator.save_working_memory_for_consolidation(self.working_memory)
         self.working_memory.clear()
         self.dialogue_history = []
+        self.predictive_coding_engine.close()
         logger.info("ワーキングメモリを保存し、リセットしました。")
 
-    def invoke(self, input_data: Dict[str, Any] | str) -> MasterAgentResponse:
-        if not isinstance(input_data, str):
-            raise TypeError("MasterAgent expects a string query as input.")
-        query = input_data
+    async def _areflect(self, payload: Dict[str, Any]) -> None:
+        """回答に対する倫理的な動機づけと価値観の評価を行い、記録する。"""
+        motivation = await self.ethical_motivation_engine.aassess_and_generate_motivation(payload["final_answer"])
+        self.memory_consolidator.log_event("homeostasis_check", motivation)
+        await self.value_evaluator.aassess_and_update_values(payload["final_answer"])
 
-        overall_start_time = time.time()
-        # MODIFIED: Log message to reflect dynamic mode selection
-        logger.info(f"--- Invoking MasterAgent ---")
+    def invoke(self, input_data: Dict[str, Any] | str) -> MasterAgentResponse:
+        """ainvokeの同期ラッパー。"""
+        return asyncio.run(self.ainvoke(input_data))
 
+    async def _aprepare(self, query: str) -> Tuple[str, OrchestrationDecision]:
+        """予測誤差から蒸留コンテキストを作成し、実行モードを選択する。"""
+        # 予測誤差の分析は、モード選択と並行して行う
         start_time = time.time()
         logger.info("START: Predictive Cognitive Modeling")
-        
-        prediction_error = self.predictive_coding_engine.process_input(query, self.dialogue_history)
+        prediction_task = asyncio.create_task(
+            self.predictive_coding_engine.aprocess_input(query, list(self.dialogue_history))
+        )
+
+        # ADDED: Dynamic mode selection using OrchestrationAgent
+        start_time_orchestration = time.time()
+        logger.info("START: Orchestration Agent Mode Selection")
+        # OrchestrationAgent's invoke method expects a dictionary with 'query'
+        try:
+            chosen_mode = await self.orchestration_agent.ainvoke({"query": query})
+        except BaseException:
+            prediction_task.cancel()
+            raise
+        logger.info(f"Orchestration Agent selected mode: '{chosen_mode}' ({(time.time() - start_time_orchestration):.2f} s)")
+
+        prediction_error = await prediction_task
         
         distilled_context: str
         if "summary" in prediction_error and prediction_error["summary"] and prediction_error.get("error_type") != "新規情報なし":
@@ -103,29 +156,56 @@ class MasterAgent(AIAgent):
         end_time = time.time()
         logger.info(f"END: Predictive Cognitive Modeling ({(end_time - start_time):.2f} s)")
         logger.info(f"生成された蒸留コンテキスト: {distilled_context}")
+        return distilled_context, chosen_mode
 
-        # ADDED: Dynamic mode selection using OrchestrationAgent
-        start_time_orchestration = time.time()
-        logger.info("START: Orchestration Agent Mode Selection")
-        # OrchestrationAgent's invoke method expects a dictionary with 'query'
-        chosen_mode = self.orchestration_agent.invoke({"query": query})
-        logger.info(f"Orchestration Agent selected mode: '{chosen_mode}' ({(time.time() - start_time_orchestration):.2f} s)")
-
-
-        # MODIFIED: Pass the dynamically chosen mode to the engine
-        response = self.engine.run(distilled_context, chosen_mode)
-
-        motivation = self.ethical_motivation_engine.assess_and_generate_motivation(response["final_answer"])
-        self.memory_consolidator.log_event("homeostasis_check", motivation)
-        
-        self.value_evaluator.assess_and_update_values(response["final_answer"])
+    async def _afinish(self, query: str, response: MasterAgentResponse) -> None:
+        """回答後の評価を行い（または内省キューに積み）、対話を記録する。"""
+        if self.reflection_queue is not None:
+            self.reflection_queue.enqueue("master_agent.post_answer", {"final_answer": response["final_answer"]})
+        else:
+            await self._areflect({"final_answer": response["final_answer"]})
         
         self.memory_consolidator.log_interaction(query, response["final_answer"])
 
         self.dialogue_history.append(f"User: {query}")
         self.dialogue_history.append(f"AI: {response['final_answer']}")
+        # 次の入力に備え、この時点の対話履歴から次の状態の予測を先行して始める
+        self.predictive_coding_engine.prepare_next_prediction(self.dialogue_history)
+
+    async def ainvoke(self, input_data: Dict[str, Any] | str) -> MasterAgentResponse:
+        if not isinstance(input_data, str):
+            raise TypeError("MasterAgent expects a string query as input.")
+        query = input_data
+
+        overall_start_time = time.time()
+        # MODIFIED: Log message to reflect dynamic mode selection
+        logger.info(f"--- Invoking MasterAgent ---")
+
+        distilled_context, chosen_mode = await self._aprepare(query)
+
+        # MODIFIED: Pass the dynamically chosen mode to the engine
+        # パイプラインはエンジン全体で共有されるため、このセッションの対話履歴は引数で渡す
+        response = await self.engine.arun(distilled_context, chosen_mode, dialogue_history=list(self.dialogue_history))
+
+        await self._afinish(query, response)
 
         overall_end_time = time.time()
         logger.info(f"--- MasterAgent Invocation Finished (Total: {(overall_end_time - overall_start_time):.2f} s) ---")
 
-        return response
\ No newline at end of file
+        return response
+
+    async def astream(self, query: str) -> AsyncIterator[StreamEvent]:
+        """
+        ainvokeと同じ処理を行いながら、エンジンのストリーミングイベント（"token", "reset", "response"）を逐次返す。
+        回答後の処理は、"response" イベントを返す前に行う。
+        """
+        overall_start_time = time.time()
+        logger.info(f"--- Invoking MasterAgent (streaming) ---")
+
+        distilled_context, chosen_mode = await self._aprepare(query)
+        async for event in self.engine.astream(distilled_context, chosen_mode, dialogue_history=list(self.dialogue_history)):
+            if event["type"] == "response":
+                await self._afinish(query, event["response"])
+            yield event
+
+        logger.info(f"--- MasterAgent Invocation Finished (Total: {(time.time() - overall_start_time):.2f} s) ---")
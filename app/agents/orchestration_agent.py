@@ -3,42 +3,75 @@
 # role: ユーザーの要求を分析し、最適な実行パイプラインを選択する。
 
 import logging
+import time
+import numpy as np
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.runnables import Runnable
 # ◾️◾️◾️◾️◾️◾️◾️◾️◾️◾️◾️↓修正開始◾️◾️◾️◾️◾️◾️◾️◾️◾️◾️◾️
-from langchain_core.output_parsers import JsonOutputParser
-from typing import Any, Dict
+from typing import Any, Dict, Optional, Tuple
 from app.models import OrchestrationDecision
 # ◾️◾️◾️◾️◾️◾️◾️◾️◾️◾️◾️↑修正終わり◾️◾️◾️◾️◾️◾️◾️◾️◾️◾️◾️
 
 from app.agents.base import AIAgent
+from app.llm.structured_output import StructuredOutputStats, build_structured_chain
 from app.reasoning.complexity_analyzer import ComplexityAnalyzer
+from app.reasoning.decision_cache import SemanticDecisionCache
+from app.reasoning.mode_router import ModeDecisionLog, ModeRouter, ModeRouterStats
 
 logger = logging.getLogger(__name__)
 
+# モード選択の出力を解析できなかった場合の決定。パイプライン全体を失敗させず、simpleモードで応答する。
+_DEFAULT_DECISION: OrchestrationDecision = {
+    "chosen_mode": "simple",
+    "reason": "モード選択の出力を解析できなかったため、simpleモードを選択しました。",
+    "agent_configs": {},
+}
+_INVALID_MODE_REASON = "提案されたモードが無効だったため、simpleモードにフォールバックしました。"
+
 class OrchestrationAgent(AIAgent):
     """
     ユーザーの要求に応じて最適な実行モードを選択するエージェント。
     """
-    def __init__(self, llm: Any, output_parser: Any, prompt_template: ChatPromptTemplate, complexity_analyzer: ComplexityAnalyzer):
+    def __init__(
+        self,
+        llm: Any,
+        output_parser: Any,
+        prompt_template: ChatPromptTemplate,
+        complexity_analyzer: ComplexityAnalyzer,
+        structured_output_stats: Optional[StructuredOutputStats] = None,
+        mode_router: Optional[ModeRouter] = None,
+        mode_router_stats: Optional[ModeRouterStats] = None,
+        decision_log: Optional[ModeDecisionLog] = None,
+        confidence_threshold: float = 1.0,
+        decision_cache: Optional[SemanticDecisionCache] = None,
+    ):
+        """
+        mode_routerの確信度がconfidence_threshold以上の場合は、LLMを呼び出さずにそのモードを選択する。
+        そうでない場合、decision_cacheに類似したクエリの決定があればそれを再利用し、なければLLMで決定してdecision_cacheに登録する。
+        decision_logには、ルーターの学習に用いるため、それぞれの決定を決定元とともに記録する。
+        """
         self.llm = llm
-        # ◾️◾️◾️◾️◾️◾️◾️◾️◾️◾️◾️↓修正開始◾️◾️◾️◾️◾️◾️◾️◾️◾️◾️◾️
-        # OrchestrationDecisionの構造をLLMに出力させるため、JsonOutputParserを使用
-        self.output_parser = JsonOutputParser(pydantic_object=OrchestrationDecision)
-        # ◾️◾️◾️◾️◾️◾️◾️◾️◾️◾️◾️↑修正終わり◾️◾️◾️◾️◾️◾️◾️◾️◾️◾️◾️
         self.prompt_template = prompt_template
         self.complexity_analyzer = complexity_analyzer
+        self.structured_output_stats = structured_output_stats
+        self.mode_router = mode_router
+        self.mode_router_stats = mode_router_stats
+        self.decision_log = decision_log
+        self.confidence_threshold = confidence_threshold
+        self.decision_cache = decision_cache
         super().__init__()
 
     def build_chain(self) -> Runnable:
         """
         オーケストレーションエージェントのLangChainチェーンを構築します。
         """
-        return self.prompt_template | self.llm | self.output_parser
+        return build_structured_chain(
+            self.prompt_template, self.llm, "OrchestrationAgent",
+            stats=self.structured_output_stats, expected_type=dict, default=_DEFAULT_DECISION,
+        )
 
-    # ◾️◾️◾️◾️◾️◾️◾️◾️◾️◾️◾️↓修正開始◾️◾️◾️◾️◾️◾️◾️◾️◾️◾️◾️
-    def invoke(self, input_data: Dict[str, Any] | str) -> OrchestrationDecision: # 戻り値の型をOrchestrationDecisionに変更
-    # ◾️◾️◾️◾️◾️◾️◾️◾️◾️◾️◾️↑修正終わり◾️◾️◾️◾️◾️◾️◾️◾️◾️◾️◾️
+    def _prepare_input(self, input_data: Dict[str, Any] | str) -> Dict[str, Any]:
+        """入力を検証し、複雑性レベルを付与したチェーン入力を作成する。"""
         if not isinstance(input_data, dict):
             raise TypeError("OrchestrationAgent expects a dictionary as input.")
 
@@ -49,22 +82,115 @@ class OrchestrationAgent(AIAgent):
         complexity_level = self.complexity_analyzer.analyze_query_complexity(query)
         logger.info(f"クエリの複雑性レベル: {complexity_level}")
 
-        orchestration_input = {"query": query, "complexity_level": complexity_level}
-        
-        # ◾️◾️◾️◾️◾️◾️◾️◾️◾️◾️◾️↓修正開始◾️◾️◾️◾️◾️◾️◾️◾️◾️◾️◾️
-        decision: OrchestrationDecision = self._chain.invoke(orchestration_input)
-        
-        # 決定されたモードが有効なものか確認し、無効なら"simple"にフォールバック
+        return {"query": query, "complexity_level": complexity_level}
+
+    def _validate_decision(self, decision: OrchestrationDecision) -> OrchestrationDecision:
+        """決定されたモードが有効なものか確認し、無効なら"simple"にフォールバックする。"""
         chosen_mode = decision.get("chosen_mode", "simple").lower()
         valid_modes = ["simple", "full", "parallel", "quantum", "speculative", "self_discover", "internal_dialogue"]
         
         if chosen_mode not in valid_modes:
             logger.warning(f"Orchestration Agentが有効でないモード '{chosen_mode}' を提案しました。'simple'モードにフォールバックします。")
             decision["chosen_mode"] = "simple"
-            decision["reason"] = "提案されたモードが無効だったため、simpleモードにフォールバックしました。"
-            # agent_configsも存在しない場合は空のdictを保証
-            if "agent_configs" not in decision:
-                decision["agent_configs"] = {}
+            decision["reason"] = _INVALID_MODE_REASON
+        # 修復した出力などでagent_configsが欠けている場合も空のdictを保証
+        if "agent_configs" not in decision:
+            decision["agent_configs"] = {}
             
         return decision
-        # ◾️◾️◾️◾️◾️◾️◾️◾️◾️◾️◾️↑修正終わり◾️◾️◾️◾️◾️◾️◾️◾️◾️◾️◾️
\ No newline at end of file
+
+    def _route(self, input_data: Dict[str, Any] | str) -> Optional[OrchestrationDecision]:
+        """ルーターの確信度が閾値以上であれば、LLMを呼び出さずに決定したモードを返す。"""
+        if self.mode_router is None or not isinstance(input_data, dict):
+            return None
+        query = input_data.get("query", "")
+        start = time.perf_counter()
+        mode, confidence = self.mode_router.predict(query)
+        if mode is None or confidence < self.confidence_threshold:
+            return None
+        elapsed = time.perf_counter() - start
+        if self.mode_router_stats is not None:
+            self.mode_router_stats.record_hit(elapsed)
+        if self.decision_log is not None:
+            self.decision_log.append(query, mode, "router", elapsed, confidence)
+        logger.info(f"モードルーターがモードを選択しました: {mode} (確信度: {confidence:.2f})")
+        return self._validate_decision({
+            "chosen_mode": mode,
+            "reason": f"過去のモード選択から学習したルーターが、確信度{confidence:.2f}で選択しました。",
+            "agent_configs": {},
+        })
+
+    def _use_cached(
+        self, query: str, cached: Optional[Tuple[OrchestrationDecision, float, str]], elapsed: float
+    ) -> Optional[OrchestrationDecision]:
+        """キャッシュにヒットした決定を、再利用したことが分かる理由に書き換えて返す。"""
+        if cached is None:
+            return None
+        decision, similarity, cached_query = cached
+        if self.decision_log is not None:
+            self.decision_log.append(query, decision["chosen_mode"], "cache", elapsed, similarity)
+        logger.info(f"類似した過去のクエリ「{cached_query}」(類似度: {similarity:.3f}) のモード選択を再利用します: {decision['chosen_mode']}")
+        decision["reason"] = f"類似した過去のクエリ「{cached_query}」（類似度{similarity:.2f}）の決定を再利用しました: {decision.get('reason', '')}"
+        return self._validate_decision(decision)
+
+    def _record_llm_decision(
+        self, input_data: Dict[str, Any] | str, decision: OrchestrationDecision, elapsed: float, vector: Optional[np.ndarray]
+    ) -> None:
+        """
+        LLMによる決定を集計し、ルーターの学習データとキャッシュに登録する。
+        解析の失敗や無効なモードでsimpleとなった決定は、LLMの判断ではないため登録しない。
+        """
+        if self.mode_router_stats is not None:
+            self.mode_router_stats.record_fallback(elapsed)
+        if not isinstance(input_data, dict) or decision.get("reason") in (_DEFAULT_DECISION["reason"], _INVALID_MODE_REASON):
+            return
+        query = input_data.get("query", "")
+        if self.decision_log is not None:
+            self.decision_log.append(query, decision["chosen_mode"].lower(), "llm", elapsed)
+        if self.decision_cache is not None and vector is not None:
+            self.decision_cache.put(query, vector, decision)
+
+    # ◾️◾️◾️◾️◾️◾️◾️◾️◾️◾️◾️↓修正開始◾️◾️◾️◾️◾️◾️◾️◾️◾️◾️◾️
+    def invoke(self, input_data: Dict[str, Any] | str) -> OrchestrationDecision: # 戻り値の型をOrchestrationDecisionに変更
+    # ◾️◾️◾️◾️◾️◾️◾️◾️◾️◾️◾️↑修正終わり◾️◾️◾️◾️◾️◾️◾️◾️◾️◾️◾️
+        routed = self._route(input_data)
+        if routed is not None:
+            return routed
+        start = time.perf_counter()
+        vector: Optional[np.ndarray] = None
+        if self.decision_cache is not None and isinstance(input_data, dict):
+            query = input_data.get("query", "")
+            try:
+                vector = self.decision_cache.embed(query)
+                cached = self._use_cached(query, self.decision_cache.lookup(vector), time.perf_counter() - start)
+                if cached is not None:
+                    return cached
+            except Exception as e:
+                logger.warning(f"モード選択キャッシュを参照できませんでした: {e}")
+        orchestration_input = self._prepare_input(input_data)
+        assert self._chain is not None
+        decision: OrchestrationDecision = self._validate_decision(self._chain.invoke(orchestration_input))
+        self._record_llm_decision(input_data, decision, time.perf_counter() - start, vector)
+        return decision
+
+    async def ainvoke(self, input_data: Dict[str, Any] | str) -> OrchestrationDecision:
+        """invokeの非同期版。"""
+        routed = self._route(input_data)
+        if routed is not None:
+            return routed
+        start = time.perf_counter()
+        vector: Optional[np.ndarray] = None
+        if self.decision_cache is not None and isinstance(input_data, dict):
+            query = input_data.get("query", "")
+            try:
+                vector = await self.decision_cache.aembed(query)
+                cached = self._use_cached(query, self.decision_cache.lookup(vector), time.perf_counter() - start)
+                if cached is not None:
+                    return cached
+            except Exception as e:
+                logger.warning(f"モード選択キャッシュを参照できませんでした: {e}")
+        orchestration_input = self._prepare_input(input_data)
+        assert self._chain is not None
+        decision: OrchestrationDecision = self._validate_decision(await self._chain.ainvoke(orchestration_input))
+        self._record_llm_decision(input_data, decision, time.perf_counter() - start, vector)
+        return decision
@@ -7,6 +7,7 @@ from langchain_core.runnables import Runnable
 from typing import Any
 
 from app.agents.base import AIAgent
+from app.llm.instrumentation import with_agent_label
 
 class PlanningAgent(AIAgent):
     """
@@ -24,8 +25,8 @@ class PlanningAgent(AIAgent):
         """
         return self.prompt_template | self.llm | self.output_parser
         
-    def select_thinking_modules(self, query: str) -> str:
-        """Self-Discover Pipelineのために、使用する思考モジュールのシーケンスを決定する"""
+    def _build_module_selection_chain(self) -> Runnable:
+        """思考モジュールのシーケンスを決定するためのチェーンを構築する"""
         module_selection_prompt = ChatPromptTemplate.from_template(
             """あなたは思考戦略家です。与えられた要求を解決するために、以下の思考モジュールの中から最も効果的なものを、適切な順番でカンマ区切りでリストアップしてください。
             
@@ -40,5 +41,12 @@ class PlanningAgent(AIAgent):
             思考モジュールシーケンス (例: DECOMPOSE, RAG_SEARCH, SYNTHESIZE):
             """
         )
-        chain = module_selection_prompt | self.llm | self.output_parser
-        return chain.invoke({"query": query})
\ No newline at end of file
+        return with_agent_label(module_selection_prompt | self.llm | self.output_parser, "PlanningAgent.module_selection")
+
+    def select_thinking_modules(self, query: str) -> str:
+        """Self-Discover Pipelineのために、使用する思考モジュールのシーケンスを決定する"""
+        return self._build_module_selection_chain().invoke({"query": query})
+
+    async def aselect_thinking_modules(self, query: str) -> str:
+        """select_thinking_modulesの非同期版"""
+        return await self._build_module_selection_chain().ainvoke({"query": query})
\ No newline at end of file
@@ -4,26 +4,29 @@
 
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.runnables import Runnable
-from langchain_core.output_parsers import JsonOutputParser
-from typing import Any, Dict
+from typing import Any, Dict, Optional
 
 from app.agents.base import AIAgent
+from app.llm.structured_output import StructuredOutputStats, build_structured_chain
 
 class PredictiveFilterAgent(AIAgent):
     """
     入力情報から予測誤差（新規で驚きのある情報）を抽出するAIエージェント。
     """
-    def __init__(self, llm: Any, prompt_template: ChatPromptTemplate):
+    def __init__(self, llm: Any, prompt_template: ChatPromptTemplate, structured_output_stats: Optional[StructuredOutputStats] = None):
         self.llm = llm
-        self.output_parser = JsonOutputParser()
         self.prompt_template = prompt_template
+        self.structured_output_stats = structured_output_stats
         super().__init__()
 
     def build_chain(self) -> Runnable:
         """
         予測フィルターエージェントのLangChainチェーンを構築します。
         """
-        return self.prompt_template | self.llm | self.output_parser
+        return build_structured_chain(
+            self.prompt_template, self.llm, "PredictiveFilterAgent",
+            stats=self.structured_output_stats, expected_type=dict,
+        )
 
     def invoke(self, input_data: Dict[str, Any] | str) -> Dict[str, Any]:
         """
@@ -96,6 +96,9 @@ COGNITIVE_LOOP_AGENT_PROMPT = ChatPromptTemplate.from_template(
 **行動計画:**
 {plan}
 
+**直近の対話履歴:**
+{dialogue_history}
+
 **長期記憶からの関連知識（知識グラフ）:**
 {long_term_memory_context}
 
@@ -324,7 +327,7 @@ ORCHESTRATION_PROMPT = ChatPromptTemplate.from_template(
 - **self_discover**: AI自身に思考戦略を構築させ、自律的に解決策を発見させたい場合。
 - **internal_dialogue**: 複数の内的な思考エージェントによる対話を通じて、深く内省的な結論を導きたい場合。
 
-エージェント設定の例（必要であれば含めてください。設定がない場合は空のオブジェクト `{}` を含めてください）:
+エージェント設定の例（必要であれば含めてください。設定がない場合は空のオブジェクト `{{}}` を含めてください）:
 {{
     "agent_name_1": {{
         "parameter_1": "value_1",
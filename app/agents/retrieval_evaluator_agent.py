@@ -4,26 +4,38 @@
 
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.runnables import Runnable
-from langchain_core.output_parsers import JsonOutputParser
-from typing import Any, Dict
+from typing import Any, Dict, Optional
 
 from app.agents.base import AIAgent
+from app.llm.structured_output import StructuredOutputStats, build_structured_chain
+
+# 評価結果を解析できなかった場合の評価。スコアを0とし、検索結果が不十分な場合と同様に外部ツールでの補完へ進ませる。
+_DEFAULT_EVALUATION: Dict[str, Any] = {
+    "relevance_score": 0,
+    "completeness_score": 0,
+    "noise_score": 0,
+    "summary": "評価結果を解析できませんでした。",
+    "suggestions": "",
+}
 
 class RetrievalEvaluatorAgent(AIAgent):
     """
     RAGによって検索された情報の品質を評価するAIエージェント。
     """
-    def __init__(self, llm: Any, prompt_template: ChatPromptTemplate):
+    def __init__(self, llm: Any, prompt_template: ChatPromptTemplate, structured_output_stats: Optional[StructuredOutputStats] = None):
         self.llm = llm
         self.prompt_template = prompt_template
-        self.output_parser = JsonOutputParser()
+        self.structured_output_stats = structured_output_stats
         super().__init__()
 
     def build_chain(self) -> Runnable:
         """
         検索品質評価エージェントのLangChainチェーンを構築します。
         """
-        return self.prompt_template | self.llm | self.output_parser
+        return build_structured_chain(
+            self.prompt_template, self.llm, "RetrievalEvaluatorAgent",
+            stats=self.structured_output_stats, expected_type=dict, default=_DEFAULT_EVALUATION,
+        )
 
     def invoke(self, input_data: Dict[str, Any] | str) -> Dict[str, Any]:
         """
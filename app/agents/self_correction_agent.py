@@ -45,15 +45,36 @@ class SelfCorrectionAgent(AIAgent):
         try:
             # Use the LLM to decide which suggestions to "apply" and how to summarize the action
             application_decision_summary = self.invoke({"improvement_suggestions": suggestions_str})
-            
-            if application_decision_summary and "適用すべき提案はありません" not in application_decision_summary:
-                self.memory_consolidator.log_autonomous_thought(
-                    topic="self_improvement_applied_decision",
-                    synthesized_knowledge=f"【自己改善の適用決定】\n決定内容: {application_decision_summary}\n元の提案: {suggestions_str}"
-                )
-                logger.info(f"自己改善の適用が決定され、ログに記録されました:\n{application_decision_summary}")
-            else:
-                logger.info("自己改善提案の適用は見送られました。")
+            self._log_application_decision(application_decision_summary, suggestions_str)
+        except Exception as e:
+            logger.error(f"自己修正エージェントによる適用検討中にエラーが発生しました: {e}", exc_info=True)
+
+    async def aconsider_and_log_application(self, improvement_suggestions: List[Dict[str, Any]]) -> None:
+        """
+        consider_and_log_applicationの非同期版。
+        """
+        if not improvement_suggestions:
+            logger.info("適用すべき自己改善提案がありません。")
+            return
 
+        logger.info("自己改善提案の適用を検討中...")
+        suggestions_str = "\n".join([str(s) for s in improvement_suggestions])
+
+        try:
+            application_decision_summary = await self.ainvoke({"improvement_suggestions": suggestions_str})
+            self._log_application_decision(application_decision_summary, suggestions_str)
         except Exception as e:
-            logger.error(f"自己修正エージェントによる適用検討中にエラーが発生しました: {e}", exc_info=True)
\ No newline at end of file
+            logger.error(f"自己修正エージェントによる適用検討中にエラーが発生しました: {e}", exc_info=True)
+
+    def _log_application_decision(self, application_decision_summary: str, suggestions_str: str) -> None:
+        """
+        LLMによる適用判断の結果をログに記録します。
+        """
+        if application_decision_summary and "適用すべき提案はありません" not in application_decision_summary:
+            self.memory_consolidator.log_autonomous_thought(
+                topic="self_improvement_applied_decision",
+                synthesized_knowledge=f"【自己改善の適用決定】\n決定内容: {application_decision_summary}\n元の提案: {suggestions_str}"
+            )
+            logger.info(f"自己改善の適用が決定され、ログに記録されました:\n{application_decision_summary}")
+        else:
+            logger.info("自己改善提案の適用は見送られました。")
\ No newline at end of file
@@ -3,7 +3,7 @@
 # role: AI自身のパフォーマンスに対する自己批判を分析し、具体的な改善提案を生成する。
 
 import logging
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Optional
 
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.runnables import Runnable
@@ -11,6 +11,7 @@ from langchain_core.output_parsers import JsonOutputParser # For structured outp
 
 from app.agents.base import AIAgent
 from app.agents import prompts # Import prompts to get SELF_IMPROVEMENT_AGENT_PROMPT
+from app.llm.structured_output import StructuredOutputStats, build_structured_chain
 
 logger = logging.getLogger(__name__)
 
@@ -18,17 +19,28 @@ class SelfImprovementAgent(AIAgent):
     """
     自己批判に基づいて、具体的な改善提案を生成するAIエージェント。
     """
-    def __init__(self, llm: Any, output_parser: JsonOutputParser, prompt_template: ChatPromptTemplate):
+    def __init__(
+        self,
+        llm: Any,
+        output_parser: JsonOutputParser,
+        prompt_template: ChatPromptTemplate,
+        structured_output_stats: Optional[StructuredOutputStats] = None,
+    ):
         self.llm = llm
         self.output_parser = output_parser # Expecting JsonOutputParser
         self.prompt_template = prompt_template
+        self.structured_output_stats = structured_output_stats
         super().__init__()
 
     def build_chain(self) -> Runnable:
         """
         自己改善提案を生成するためのLangChainチェーンを構築します。
         """
-        return self.prompt_template | self.llm | self.output_parser
+        # 出力はリストのため、オブジェクトしか生成できないJSONモードは使わない。解析できない場合は提案なしとする
+        return build_structured_chain(
+            self.prompt_template, self.llm, "SelfImprovementAgent",
+            stats=self.structured_output_stats, expected_type=list, default=[], json_mode=False,
+        )
 
     def invoke(self, input_data: Dict[str, Any] | str) -> List[Dict[str, Any]]:
         """
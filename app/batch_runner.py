@@ -0,0 +1,211 @@
+# /app/batch_runner.py
+# title: バッチ処理ランナー
+# role: JSONLファイルのクエリを、MetaIntelligenceEngineで並行して処理し、結果をJSONLファイルへ1件ずつ追記する。
+#       結果ファイルに記録済みのIDは再実行時に処理しないため、中断しても続きから再開できる。
+
+from __future__ import annotations
+import asyncio
+import json
+import logging
+import os
+import time
+from collections import Counter
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+
+from app.agents.orchestration_agent import OrchestrationAgent
+from app.engine import MetaIntelligenceEngine
+from app.llm.instrumentation import llm_call_context
+from app.models import BatchReport, OrchestrationDecision
+from app.tracing import start_trace
+
+logger = logging.getLogger(__name__)
+
+
+def _percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * q
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+class BatchRunner:
+    """
+    入力のJSONLを1行ずつ読みながら、最大concurrency件のクエリを並行して処理する。
+    各行はJSONオブジェクトで、id_fieldのIDとquery_fieldのクエリを持つ（IDがない行は行番号をIDとする）。
+    行に"mode"があればそのモードで、なければforced_mode、それもなければOrchestrationAgentが選んだモードで実行する。
+    結果ファイルには、成功した行を {"id", "status": "ok", "mode", "latency_seconds", "response"} として、
+    失敗した行を {"id", "status": "error", "error"} として追記する。再実行時は成功したIDのみを処理済みとみなし、失敗したIDは処理し直す。
+    """
+    def __init__(
+        self,
+        engine: MetaIntelligenceEngine,
+        orchestration_agent: OrchestrationAgent,
+        concurrency: int = 4,
+        forced_mode: Optional[str] = None,
+        latency_budget_ms: Optional[float] = None,
+        id_field: str = "id",
+        query_field: str = "query",
+        log_every: int = 50,
+    ):
+        """
+        Args:
+            concurrency: 同時に処理するクエリの最大数。実際のLLM呼び出しの並行数はLLMスケジューラの実行枠で制限される。
+            forced_mode: すべての行をこのモードで実行する。Noneの場合はOrchestrationAgentでモードを選ぶ。
+            latency_budget_ms: 各クエリの遅延予算。予算に収まらないと見積もられるモードは切り下げる。
+            log_every: 進捗をログに出力する間隔（処理件数）。
+        """
+        if forced_mode is not None and forced_mode not in engine.pipelines:
+            raise ValueError(f"不明なモードです: {forced_mode}（利用可能: {sorted(engine.pipelines)}）")
+        self.engine = engine
+        self.orchestration_agent = orchestration_agent
+        self.concurrency = max(1, concurrency)
+        self.forced_mode = forced_mode
+        self.latency_budget_ms = latency_budget_ms
+        self.id_field = id_field
+        self.query_field = query_field
+        self.log_every = log_every
+
+    # --- 入出力 ---
+    @staticmethod
+    def load_completed_ids(output_path: str) -> Set[str]:
+        """結果ファイルから、成功したIDを読み込む。書き込み途中で終了した最後の行は読み飛ばす。"""
+        completed: Set[str] = set()
+        if not os.path.exists(output_path):
+            return completed
+        with open(output_path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                if record.get("status") == "ok":
+                    completed.add(str(record["id"]))
+        return completed
+
+    def _read_items(self, input_path: str) -> Iterator[Tuple[str, Optional[Dict[str, Any]]]]:
+        """入力の各行を(ID, 行のオブジェクト)として返す。解析できない行はオブジェクトをNoneとして返す。"""
+        with open(input_path, "r", encoding="utf-8") as f:
+            for line_number, line in enumerate(f, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    item = json.loads(line)
+                except json.JSONDecodeError as e:
+                    logger.warning(f"{input_path}:{line_number} をJSONとして解析できないため読み飛ばします: {e}")
+                    yield f"line-{line_number}", None
+                    continue
+                if not isinstance(item, dict):
+                    yield f"line-{line_number}", None
+                    continue
+                yield str(item.get(self.id_field, f"line-{line_number}")), item
+
+    @staticmethod
+    def _append(f: Any, record: Dict[str, Any]) -> None:
+        f.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+
+    # --- 処理 ---
+    async def _decide(self, query: str, mode: Optional[str]) -> OrchestrationDecision:
+        if mode is not None:
+            return {"chosen_mode": mode, "reason": "バッチ処理で指定されたモード", "agent_configs": {}}
+        with llm_call_context(mode="orchestration"):
+            return await self.orchestration_agent.ainvoke({"query": query})
+
+    async def _process(self, item_id: str, item: Dict[str, Any]) -> Dict[str, Any]:
+        query = item.get(self.query_field)
+        if not isinstance(query, str) or not query.strip():
+            raise ValueError(f"'{self.query_field}'にクエリの文字列がありません。")
+        mode = item.get("mode") or self.forced_mode
+        if mode is not None and mode not in self.engine.pipelines:
+            raise ValueError(f"不明なモードです: {mode}")
+        start = time.perf_counter()
+        with llm_call_context(request_id=item_id), start_trace(item_id, name="batch.item"):
+            decision = await self._decide(query, mode)
+            response = await self.engine.arun(query, decision, self.latency_budget_ms)
+        return {
+            "id": item_id,
+            "status": "ok",
+            "mode": decision.get("chosen_mode"),
+            "latency_seconds": time.perf_counter() - start,
+            "response": response,
+        }
+
+    async def arun(self, input_path: str, output_path: str) -> BatchReport:
+        """
+        入力ファイルのクエリを処理し、結果を結果ファイルへ追記して、集計結果を返す。
+        中断（キャンセルやKeyboardInterrupt）した場合も、それまでに完了した結果は結果ファイルに残る。
+        """
+        if not os.path.exists(input_path):
+            raise FileNotFoundError(f"入力ファイルが見つかりません: {input_path}")
+        completed = self.load_completed_ids(output_path)
+        if completed:
+            logger.info(f"処理済みの{len(completed)}件を読み飛ばします: {output_path}")
+        os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+
+        queue: "asyncio.Queue[Optional[Tuple[str, Optional[Dict[str, Any]]]]]" = asyncio.Queue(maxsize=self.concurrency * 2)
+        latencies: List[float] = []
+        modes: Counter = Counter()
+        counts = {"processed": 0, "succeeded": 0, "failed": 0, "skipped": 0}
+        start = time.perf_counter()
+
+        with open(output_path, "a", encoding="utf-8") as out:
+            async def produce() -> None:
+                seen: Set[str] = set()
+                for item_id, item in self._read_items(input_path):
+                    if item_id in completed or item_id in seen:
+                        counts["skipped"] += 1
+                        continue
+                    seen.add(item_id)
+                    await queue.put((item_id, item))
+                for _ in range(self.concurrency):
+                    await queue.put(None)
+
+            async def work() -> None:
+                while True:
+                    entry = await queue.get()
+                    if entry is None:
+                        return
+                    item_id, item = entry
+                    try:
+                        if item is None:
+                            raise ValueError("行をJSONオブジェクトとして解析できません。")
+                        record = await self._process(item_id, item)
+                        latencies.append(record["latency_seconds"])
+                        modes[record["mode"]] += 1
+                        counts["succeeded"] += 1
+                    except Exception as e:
+                        logger.error(f"バッチ処理の項目 {item_id} の処理に失敗しました: {e}", exc_info=True)
+                        record = {"id": item_id, "status": "error", "error": f"{type(e).__name__}: {e}"}
+                        counts["failed"] += 1
+                    self._append(out, record)
+                    counts["processed"] += 1
+                    if self.log_every and counts["processed"] % self.log_every == 0:
+                        elapsed = time.perf_counter() - start
+                        logger.info(
+                            f"バッチ処理: {counts['processed']}件完了 (失敗 {counts['failed']}件, "
+                            f"{counts['processed'] / elapsed:.2f} 件/s)"
+                        )
+
+            await asyncio.gather(produce(), *(work() for _ in range(self.concurrency)))
+
+        wall_seconds = time.perf_counter() - start
+        report: BatchReport = {
+            "processed": counts["processed"],
+            "succeeded": counts["succeeded"],
+            "failed": counts["failed"],
+            "skipped": counts["skipped"],
+            "wall_seconds": wall_seconds,
+            "throughput_qps": counts["processed"] / wall_seconds if wall_seconds > 0 else 0.0,
+            "latency_mean": sum(latencies) / len(latencies) if latencies else 0.0,
+            "latency_p50": _percentile(latencies, 0.5),
+            "latency_p90": _percentile(latencies, 0.9),
+            "latency_p99": _percentile(latencies, 0.99),
+            "latency_max": max(latencies, default=0.0),
+            "modes": dict(modes),
+        }
+        logger.info(f"バッチ処理が完了しました: {report}")
+        return report
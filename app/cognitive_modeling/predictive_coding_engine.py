@@ -2,30 +2,137 @@
 # title: 予測符号化エンジン
 # role: 内部のワールドモデルから次の入力を予測し、実際の入力との「予測誤差」を算出することで、学習のトリガーを生成する。
 
+import asyncio
+import contextvars
 import logging
-from typing import Any, Dict
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Coroutine, Dict, Optional, Tuple
 
 from app.agents.base import AIAgent
 from app.cognitive_modeling.world_model_agent import WorldModelAgent
 from app.memory.working_memory import WorkingMemory
 from app.knowledge_graph.persistent_knowledge_graph import PersistentKnowledgeGraph
 from app.agents.knowledge_graph_agent import KnowledgeGraphAgent
+from app.llm.instrumentation import llm_call_context
+from app.llm.scheduler import LLMPriority, llm_priority
+from app.tracing import trace_span
 
 logger = logging.getLogger(__name__)
 
 class PredictiveCodingEngine:
     """
     予測符号化理論に基づき、予測と観測の差分（予測誤差）を計算するエンジン。
+    次の状態の予測は、前の回答の直後にprepare_next_predictionで先行して計算しておき、入力が届いた時点では誤差の分析のみを行う。
+    予測誤差に基づくワールドモデルの更新（知識グラフへの統合と保存を含む）は、応答を待たせないよう別スレッドで実行する。
     """
-    def __init__(self, world_model_agent: WorldModelAgent, working_memory: WorkingMemory, knowledge_graph_agent: KnowledgeGraphAgent, persistent_knowledge_graph: PersistentKnowledgeGraph):
+    def __init__(
+        self,
+        world_model_agent: WorldModelAgent,
+        working_memory: WorkingMemory,
+        knowledge_graph_agent: KnowledgeGraphAgent,
+        persistent_knowledge_graph: PersistentKnowledgeGraph,
+        merge_prediction_and_error: bool = False,
+        background_update: bool = True,
+    ):
+        """
+        Args:
+            merge_prediction_and_error: Trueの場合、予測と予測誤差の分析を1回のLLM呼び出しで行う（先行した予測は行わない）。
+            background_update: Trueの場合、ワールドモデルの更新を別スレッドで実行し、完了を待たずに戻る。
+        """
         self.world_model_agent = world_model_agent
         self.working_memory = working_memory
         self.knowledge_graph_agent = knowledge_graph_agent
         self.persistent_knowledge_graph = persistent_knowledge_graph
+        self.merge_prediction_and_error = merge_prediction_and_error
+        self.background_update = background_update
+        # 予測と更新はそれぞれ1スレッドで順に実行する（更新による知識グラフの保存が重ならないようにする）
+        self._prediction_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="predictive-coding-prediction")
+        self._update_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="predictive-coding-update")
+        self._lock = threading.Lock()
+        # 先行して計算している予測と、その元になった対話履歴
+        self._prepared: Optional[Tuple[str, "Future[str]"]] = None
+
+    def _submit(
+        self, executor: ThreadPoolExecutor, coroutine_function: Callable[[], Coroutine[Any, Any, Any]], priority: LLMPriority, mode: str, span: str
+    ) -> "Future[Any]":
+        """
+        コルーチンを、現在のコンテキスト（LLM呼び出しの計測やトレースなど）を引き継いだ別スレッドのイベントループで実行する。
+        実行はリクエストのトレースにspanの名前で記録される。
+        """
+        context = contextvars.copy_context()
+
+        def run() -> Any:
+            with llm_priority(priority), llm_call_context(mode=mode), trace_span(span, "background"):
+                return asyncio.run(coroutine_function())
+
+        return executor.submit(context.run, run)
+
+    def prepare_next_prediction(self, dialogue_history: list[str]) -> None:
+        """
+        対話履歴から次の入力の予測を別スレッドで開始する。次のaprocess_inputが同じ対話履歴で呼ばれた場合、その予測を用いる。
+        予測と誤差の分析を1回の呼び出しで行う設定の場合は何もしない。
+        """
+        if self.merge_prediction_and_error:
+            return
+        history = "\n".join(dialogue_history)
+        future = self._submit(
+            self._prediction_executor,
+            lambda: self.world_model_agent.apredict_next_state({"dialogue_history": history}),
+            LLMPriority.INTERACTIVE, "predictive_coding", "PredictiveCodingEngine.prepare_next_prediction",
+        )
+        with self._lock:
+            self._prepared = (history, future)
+
+    async def _apredict(self, history: str) -> str:
+        """対話履歴に対する予測を返す。先行して計算した予測があればその完了を待ち、なければここで計算する。"""
+        with self._lock:
+            prepared, self._prepared = self._prepared, None
+        if prepared is not None and prepared[0] == history:
+            try:
+                prediction = await asyncio.wrap_future(prepared[1])
+                logger.info("先行して計算した次の状態の予測を使用します。")
+                return prediction
+            except Exception as e:
+                logger.warning(f"先行した予測に失敗したため、予測をやり直します: {e}")
+        return await self.world_model_agent.apredict_next_state({"dialogue_history": history})
+
+    def _update_model(self, update_input: Dict[str, Any]) -> None:
+        """ワールドモデルを更新する。background_updateが有効な場合は別スレッドで開始してすぐに戻る。"""
+        future = self._submit(
+            self._update_executor, lambda: self.world_model_agent.aupdate_model(update_input),
+            LLMPriority.BACKGROUND, "predictive_coding", "PredictiveCodingEngine.update_model",
+        )
+        if not self.background_update:
+            future.result()
+            return
+        future.add_done_callback(self._log_update_failure)
+
+    def close(self, wait: bool = False) -> None:
+        """
+        予測と更新のスレッドを終了する。実行待ちの予測と更新は取り消し、実行中のものは終了を待たない（wait=Trueの場合は待つ）。
+        セッションの終了時に呼び出し、セッションごとに作成されるスレッドが残り続けないようにする。
+        """
+        with self._lock:
+            self._prepared = None
+        self._prediction_executor.shutdown(wait=wait, cancel_futures=True)
+        self._update_executor.shutdown(wait=wait, cancel_futures=True)
+
+    @staticmethod
+    def _log_update_failure(future: "Future[Any]") -> None:
+        error = future.exception()
+        if error is not None:
+            logger.error(f"ワールドモデルの更新に失敗しました: {error}", exc_info=error)
 
     def process_input(self, user_input: str, dialogue_history: list[str]) -> Dict[str, Any]:
         """
-        ユーザー入力を処理し、予測誤差を計算してワーキングメモリに格納する。
+        ユーザー入力を処理し、予測誤差を計算してワーキングメモリに格納する。aprocess_inputの同期ラッパー。
+        """
+        return asyncio.run(self.aprocess_input(user_input, dialogue_history))
+
+    async def aprocess_input(self, user_input: str, dialogue_history: list[str]) -> Dict[str, Any]:
+        """
+        ユーザー入力を非同期に処理し、予測誤差を計算してワーキングメモリに格納する。
 
         Args:
             user_input (str): ユーザーからの最新の入力。
@@ -35,20 +142,26 @@ class PredictiveCodingEngine:
             Dict[str, Any]: 計算された予測誤差、または新規情報がなかったことを示す辞書。
         """
         logger.info("--- 予測符号化エンジン起動 ---")
-        
-        # 1. ワールドモデルに基づき、次の入力を予測する
-        prediction_input = {
-            "dialogue_history": "\n".join(dialogue_history)
-        }
-        prediction = self.world_model_agent.predict_next_state(prediction_input)
-        logger.info(f"予測された次の状態: {prediction}")
-
-        # 2. 予測と実際の入力を比較し、予測誤差を計算する
-        error_calculation_input = {
-            "prediction": prediction,
-            "actual_input": user_input
-        }
-        prediction_error = self.world_model_agent.calculate_prediction_error(error_calculation_input)
+        history = "\n".join(dialogue_history)
+
+        if self.merge_prediction_and_error:
+            # 1-2. 予測と予測誤差の分析を1回の呼び出しで行う
+            prediction_error = await self.world_model_agent.apredict_and_calculate_error({
+                "dialogue_history": history,
+                "actual_input": user_input
+            })
+            logger.info(f"予測された次の状態: {prediction_error.get('prediction')}")
+        else:
+            # 1. ワールドモデルに基づき、次の入力を予測する（先行して計算していればその結果を用いる）
+            prediction = await self._apredict(history)
+            logger.info(f"予測された次の状態: {prediction}")
+
+            # 2. 予測と実際の入力を比較し、予測誤差を計算する
+            error_calculation_input = {
+                "prediction": prediction,
+                "actual_input": user_input
+            }
+            prediction_error = await self.world_model_agent.acalculate_prediction_error(error_calculation_input)
         logger.info(f"計算された予測誤差: {prediction_error}")
         
         # 3. 予測誤差（新規情報）をワーキングメモリに格納
@@ -57,12 +170,12 @@ class PredictiveCodingEngine:
             logger.info(f"予測誤差をワーキングメモリに追加しました: {prediction_error['summary']}")
             
             # ワールドモデルの更新をトリガーし、知識グラフに統合
-            self.world_model_agent.update_model({
-                "dialogue_history": "\n".join(dialogue_history),
+            self._update_model({
+                "dialogue_history": history,
                 "prediction_error": prediction_error.get("summary", "")
             })
         else:
             logger.info("予測誤差は検出されませんでした（学習の必要なし）。")
             
         logger.info("--- 予測符号化エンジン終了 ---")
-        return prediction_error
\ No newline at end of file
+        return prediction_error
@@ -2,27 +2,44 @@
 # title: ワールドモデルAIエージェント
 # role: 対話の文脈から世界の次の状態を予測し、予測誤差を計算・分析し、内部の世界モデルを更新する。
 
+import asyncio
 import logging
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.runnables import Runnable
-from langchain_core.output_parsers import JsonOutputParser, StrOutputParser
+from langchain_core.output_parsers import StrOutputParser
 from typing import Any, Dict, Optional
 
 from app.agents.base import AIAgent
 from app.knowledge_graph.persistent_knowledge_graph import PersistentKnowledgeGraph
 from app.agents.knowledge_graph_agent import KnowledgeGraphAgent
 from app.knowledge_graph.models import KnowledgeGraph
+from app.llm.instrumentation import with_agent_label
+from app.llm.structured_output import StructuredOutputStats, build_structured_chain
 
 logger = logging.getLogger(__name__)
 
+# 予測誤差の分析結果を解析できなかった場合の結果。新規情報なしとして扱い、ワーキングメモリへの追加を見送る。
+_DEFAULT_PREDICTION_ERROR: Dict[str, Any] = {
+    "error_type": "新規情報なし",
+    "summary": "予測誤差の分析結果を解析できませんでした。",
+    "key_info": [],
+}
+
 class WorldModelAgent(AIAgent):
     """
     世界の内部モデルを維持し、予測と学習を行うエージェント。
     """
-    def __init__(self, llm: Any, knowledge_graph_agent: KnowledgeGraphAgent, persistent_knowledge_graph: PersistentKnowledgeGraph):
+    def __init__(
+        self,
+        llm: Any,
+        knowledge_graph_agent: KnowledgeGraphAgent,
+        persistent_knowledge_graph: PersistentKnowledgeGraph,
+        structured_output_stats: Optional[StructuredOutputStats] = None,
+    ):
         self.llm = llm
         self.knowledge_graph_agent = knowledge_graph_agent
         self.persistent_knowledge_graph = persistent_knowledge_graph
+        self.structured_output_stats = structured_output_stats
         super().__init__()
 
     def build_chain(self) -> Optional[Runnable]:
@@ -32,8 +49,8 @@ class WorldModelAgent(AIAgent):
         """
         return None
 
-    def predict_next_state(self, input_data: Dict[str, Any]) -> str:
-        """対話履歴から次のユーザーの意図や発言を予測する。"""
+    def _build_prediction_chain(self) -> Runnable:
+        """次の状態を予測するチェーンを構築する。"""
         prompt = ChatPromptTemplate.from_template(
             """あなたは対話の文脈を読む専門家です。以下の対話履歴に基づき、ユーザーが次にどのような発言をするか、その意図や内容を予測してください。
             
@@ -42,11 +59,18 @@ class WorldModelAgent(AIAgent):
             ---
             予測される次のユーザーの発言/意図:"""
         )
-        chain = prompt | self.llm | StrOutputParser()
-        return chain.invoke(input_data)
+        return with_agent_label(prompt | self.llm | StrOutputParser(), "WorldModelAgent.prediction")
 
-    def calculate_prediction_error(self, input_data: Dict[str, Any]) -> Dict[str, Any]:
-        """予測と実際の入力の差分（予測誤差）を分析し、構造化して返す。"""
+    def predict_next_state(self, input_data: Dict[str, Any]) -> str:
+        """対話履歴から次のユーザーの意図や発言を予測する。"""
+        return self._build_prediction_chain().invoke(input_data)
+
+    async def apredict_next_state(self, input_data: Dict[str, Any]) -> str:
+        """predict_next_stateの非同期版。"""
+        return await self._build_prediction_chain().ainvoke(input_data)
+
+    def _build_prediction_error_chain(self) -> Runnable:
+        """予測誤差を分析するチェーンを構築する。"""
         prompt = ChatPromptTemplate.from_template(
             """あなたは、予測と現実のズレを分析する認知科学者です。AIの「予測」と実際の「ユーザー入力」を比較し、その間の「予測誤差」（＝新規性、驚き）を分析してください。
             出力は、誤差のカテゴリ、要約、キーワードを含む厳密なJSON形式でなければなりません。
@@ -65,12 +89,57 @@ class WorldModelAgent(AIAgent):
             }}
             """
         )
-        chain = prompt | self.llm | JsonOutputParser()
-        return chain.invoke(input_data)
+        chain = build_structured_chain(
+            prompt, self.llm, "WorldModelAgent.prediction_error",
+            stats=self.structured_output_stats, expected_type=dict, default=_DEFAULT_PREDICTION_ERROR,
+        )
+        return with_agent_label(chain, "WorldModelAgent.prediction_error")
 
-    def update_model(self, input_data: Dict[str, Any]) -> str:
-        """予測誤差に基づき、ワールドモデル（この場合はLLMの内部状態）の解釈を更新するための要約を生成し、知識グラフに統合する。"""
-        logger.info("ワールドモデルの更新を開始します。")
+    def calculate_prediction_error(self, input_data: Dict[str, Any]) -> Dict[str, Any]:
+        """予測と実際の入力の差分（予測誤差）を分析し、構造化して返す。"""
+        return self._build_prediction_error_chain().invoke(input_data)
+
+    async def acalculate_prediction_error(self, input_data: Dict[str, Any]) -> Dict[str, Any]:
+        """calculate_prediction_errorの非同期版。"""
+        return await self._build_prediction_error_chain().ainvoke(input_data)
+
+    def _build_merged_prediction_error_chain(self) -> Runnable:
+        """次の状態の予測と予測誤差の分析を1回の呼び出しで行うチェーンを構築する。"""
+        prompt = ChatPromptTemplate.from_template(
+            """あなたは、予測と現実のズレを分析する認知科学者です。まず以下の対話履歴だけから、ユーザーが次にどのような発言をするか、その意図や内容を予測してください。
+            次に、その「予測」と実際の「ユーザー入力」を比較し、その間の「予測誤差」（＝新規性、驚き）を分析してください。
+            出力は、予測、誤差のカテゴリ、要約、キーワードを含む厳密なJSON形式でなければなりません。
+
+            対話履歴:
+            {dialogue_history}
+
+            実際のユーザー入力:
+            {actual_input}
+            ---
+            予測と予測誤差の分析結果 (JSON):
+            {{
+                "prediction": "対話履歴から予測される次のユーザーの発言/意図",
+                "error_type": "予測誤差のカテゴリ（例: トピックの急な変更, 予期せぬ詳細情報, 矛盾した情報, 新規情報なし）",
+                "summary": "誤差の簡単な要約",
+                "key_info": ["関連するキーワード1", "関連するキーワード2"]
+            }}
+            """
+        )
+        chain = build_structured_chain(
+            prompt, self.llm, "WorldModelAgent.merged_prediction_error",
+            stats=self.structured_output_stats, expected_type=dict, default=_DEFAULT_PREDICTION_ERROR,
+        )
+        return with_agent_label(chain, "WorldModelAgent.merged_prediction_error")
+
+    async def apredict_and_calculate_error(self, input_data: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        対話履歴（"dialogue_history"）から次の状態を予測し、実際の入力（"actual_input"）との予測誤差を1回のLLM呼び出しで分析する。
+        結果はacalculate_prediction_errorと同じ形式で、予測は"prediction"に含まれる。
+        """
+        return await self._build_merged_prediction_error_chain().ainvoke(input_data)
+
+    def _build_update_chain(self) -> Runnable:
+        """ワールドモデル更新メモを生成するチェーンを構築する。"""
         prompt = ChatPromptTemplate.from_template(
             """あなたは学習するAIです。これまでの文脈と、新たに発生した「予測誤差」を踏まえ、世界の理解をどのように更新すべきか、内省的なメモを記述してください。
             このメモは、知識グラフに追加するのに適した客観的な事実や関係性を含んでください。
@@ -83,15 +152,23 @@ class WorldModelAgent(AIAgent):
             ---
             ワールドモデル更新のための内省メモ（知識グラフ形式で解釈可能な事実の箇条書きなど）:"""
         )
-        chain = prompt | self.llm | StrOutputParser()
-        update_summary = chain.invoke(input_data)
+        return with_agent_label(prompt | self.llm | StrOutputParser(), "WorldModelAgent.update")
+
+    def update_model(self, input_data: Dict[str, Any]) -> str:
+        """予測誤差に基づき、ワールドモデル（この場合はLLMの内部状態）の解釈を更新するための要約を生成し、知識グラフに統合する。"""
+        return asyncio.run(self.aupdate_model(input_data))
+
+    async def aupdate_model(self, input_data: Dict[str, Any]) -> str:
+        """update_modelの非同期版。"""
+        logger.info("ワールドモデルの更新を開始します。")
+        update_summary = await self._build_update_chain().ainvoke(input_data)
         logger.info(f"ワールドモデル更新メモ: {update_summary}")
 
         if update_summary.strip():
             logger.info("ワールドモデル更新メモを知識グラフに統合しています...")
             kg_input = {"text_chunk": update_summary}
             try:
-                new_knowledge_graph: KnowledgeGraph = self.knowledge_graph_agent.invoke(kg_input)
+                new_knowledge_graph: KnowledgeGraph = await self.knowledge_graph_agent.ainvoke(kg_input)
                 self.persistent_knowledge_graph.merge(new_knowledge_graph)
                 self.persistent_knowledge_graph.save()
                 logger.info("ワールドモデル更新が知識グラフに永続化されました。")
@@ -2,6 +2,7 @@
 # title: アプリケーション設定
 # role: アプリケーション全体で使用される設定値を一元管理する。
 
+import json
 import os
 from dotenv import load_dotenv
 
@@ -9,18 +10,181 @@ load_dotenv()
 
 class Config:
     # LLM関連の設定
+    # モデルをOllamaに常駐させる秒数。すべてのLLM・埋め込みの呼び出しで指定し、既定（5分）でアンロードされないようにする。-1で無期限。
+    MODEL_KEEP_ALIVE_SECONDS = int(os.getenv("OLLAMA_KEEP_ALIVE_SECONDS", "1800"))
     GENERATION_LLM_SETTINGS = {
         "model": "gemma3:latest",
         "temperature": 0.7,
-    }
-    VERIFIER_LLM_SETTINGS = {
-        "model": "gemma3:latest",
-        "temperature": 0.4,
+        "keep_alive": MODEL_KEEP_ALIVE_SECONDS,
     }
     EMBEDDING_MODEL_NAME = "nomic-embed-text"
 
+    # エージェントの役割ごとのLLM設定
+    # 各役割はGENERATION_LLM_SETTINGSを基に、ここで指定した項目（model, temperature, num_predict(最大出力トークン数), stopなど）だけを上書きする。
+    # モード名や短い検索クエリしか出力しない役割は、出力長を制限し、より小さなモデルに割り当てることもできる。
+    # cacheをTrueにした役割は、LLM_RESPONSE_CACHE_SETTINGSの応答キャッシュを使用する（決定的な分類系エージェント向け）。
+    # 定義されていない役割はgenerationの設定を使用する。
+    AGENT_LLM_PROFILES = {
+        "generation": {},
+        "verifier": {"temperature": 0.4},
+        "orchestration": {"num_predict": 256, "cache": True},
+        "retrieval_evaluation": {"num_predict": 384, "cache": True},
+        "tool_selection": {"num_predict": 64, "cache": True},
+        "query_refinement": {"num_predict": 64},
+        "knowledge_graph": {},
+        "planning": {},
+        # IdleManagerから実行されるバックグラウンド処理（自律学習、記憶の統合）
+        "background": {},
+    }
+    # 起動時に役割ごとの設定を上書きする。環境変数LLM_AGENT_PROFILESにJSONで指定する。
+    # 例: LLM_AGENT_PROFILES='{"orchestration": {"model": "gemma3:1b"}, "tool_selection": {"model": "gemma3:1b"}}'
+    AGENT_LLM_PROFILE_OVERRIDES = json.loads(os.getenv("LLM_AGENT_PROFILES", "{}"))
+
+    # モデルのウォームアップ設定
+    # 起動時に、AGENT_LLM_PROFILESで使用するすべてのモデルと埋め込みモデルを並列に読み込ませ、初回とその後の最初のトークンまでの時間を記録する。
+    # アイドル中は、keep_aliveが切れるrewarm_margin_seconds前に再読み込みする。
+    MODEL_WARMUP_SETTINGS = {
+        "enabled": os.getenv("MODEL_WARMUP", "1") == "1",
+        "rewarm_margin_seconds": 120,
+        "probe_prompt": "こんにちは",
+        # 対話を始める前にウォームアップの完了を待つ最大秒数
+        "startup_wait_seconds": 120,
+    }
+
+    # LLM応答キャッシュの設定
+    # 決定的な分類系エージェント（オーケストレーション、検索品質評価など）のみがオプトインで使用する。
+    LLM_RESPONSE_CACHE_SETTINGS = {
+        "enabled": True,
+        "path": "memory/llm_response_cache.sqlite3",
+        "max_entries": 5000,
+        "ttl_seconds": 60 * 60 * 24,
+    }
+
+    # LLMスケジューラの設定
+    # max_concurrencyはOllamaの並列スロット数(OLLAMA_NUM_PARALLEL)に合わせる。
+    # これを超える呼び出しはOllama内部ではなくアプリ側で優先度順に待機させる。
+    LLM_SCHEDULER_SETTINGS = {
+        "max_concurrency": int(os.getenv("OLLAMA_NUM_PARALLEL", "1")),
+        # IdleManagerなどのバックグラウンド処理が同時に使用できる実行枠の上限
+        "max_background_concurrency": 1,
+    }
+
+    # LLM呼び出し計測の設定
+    # すべてのLLM呼び出しについて、エージェント名・待ち時間・生成時間・パース時間などを記録する。
+    LLM_INSTRUMENTATION_SETTINGS = {
+        "enabled": True,
+        "jsonl_path": "memory/llm_calls.jsonl",
+        "prometheus_path": "memory/llm_metrics.prom",
+        # Trueの場合、main_loopが回答ごとにエージェント別の内訳を表示する
+        "print_breakdown": os.getenv("LLM_DEBUG_BREAKDOWN", "0") == "1",
+    }
+
+    # リクエスト単位のトレース
+    # エンジン・パイプライン・エージェント・LLM呼び出し・ツール・知識ベースと知識グラフの操作を入れ子のスパンとして記録し、直近max_traces件を保持する。
+    # export_each_requestがTrueの場合（環境変数TRACE_EXPORT=1）、リクエストごとにexport_dirへChromeのトレースイベント形式のJSONを書き出す。
+    TRACING_SETTINGS = {
+        "enabled": os.getenv("TRACING", "1") == "1",
+        "max_traces": 50,
+        "max_spans_per_trace": 10000,
+        "export_dir": "memory/traces",
+        "export_each_request": os.getenv("TRACE_EXPORT", "0") == "1",
+    }
+
+    # JSONを出力するエージェントの解析設定
+    # json_modeがTrueの場合、OllamaのJSONモード(format="json")で生成させる。解析できない出力は修復を試み、
+    # それでも失敗した場合は、そのエージェントだけにmax_reasks回まで出力し直させる。
+    STRUCTURED_OUTPUT_SETTINGS = {
+        "json_mode": True,
+        "max_reasks": 1,
+    }
+
+    # 学習型モードルーターの設定
+    # LLMによるモード選択の結果をdecision_log_pathに記録し、`python -m benchmarks.mode_router_benchmark train`で学習したモデルをmodel_pathに保存する。
+    # モデルがある場合、その確信度がconfidence_threshold以上のクエリはLLMを呼び出さずにモードを決定する。
+    MODE_ROUTER_SETTINGS = {
+        "enabled": True,
+        "model_path": "memory/mode_router.npz",
+        "decision_log_path": "memory/mode_decisions.jsonl",
+        "confidence_threshold": 0.9,
+        # 文字n-gramの長さの範囲と、ハッシュする特徴量の次元数
+        "ngram_range": (1, 3),
+        "num_features": 2 ** 15,
+    }
+
+    # モード選択の意味的キャッシュの設定
+    # LLMで決定したモードをクエリの埋め込みとともに保存し、コサイン類似度がsimilarity_threshold以上のクエリには同じ決定を再利用する。
+    # 最大max_entries件を最後に使われた順に保持し、pathに保存して再起動後も使用する。
+    ORCHESTRATION_DECISION_CACHE_SETTINGS = {
+        "enabled": True,
+        "path": "memory/orchestration_decision_cache.npz",
+        "max_entries": 500,
+        "similarity_threshold": 0.92,
+    }
+
+    # プロンプトに埋め込む文脈のトークン予算
+    # 認知ループの最終プロンプトで、計画・対話履歴・知識グラフ・検索結果に合計total_tokensを重みに応じて配分する。
+    # 必要量が配分に満たない区画の余りは、他の区画へ再配分される。
+    CONTEXT_BUDGET_SETTINGS = {
+        "total_tokens": 3000,
+        "weights": {
+            "plan": 1.0,
+            "dialogue_history": 1.0,
+            "long_term_memory_context": 2.0,
+            "final_retrieved_info": 3.0,
+        },
+        # 知識グラフから、クエリに関連するエンティティの何ホップ先までを文脈に含めるか
+        "knowledge_graph_max_hops": 2,
+    }
+
     # ファイルパス関連
     KNOWLEDGE_BASE_SOURCE = "data/documents/initial_facts.txt"
+    # ナレッジベースのインデックスの保存先。ソースファイルの内容と埋め込みモデルが変わらない限り、起動時に再度の埋め込みを行わない。
+    # 実行中に追加したドキュメントはジャーナルに記録し、checkpoint_every回の追加ごとと終了時にスナップショットを保存する。
+    KNOWLEDGE_BASE_INDEX_SETTINGS = {
+        "index_dir": os.getenv("KNOWLEDGE_BASE_INDEX_DIR", "memory/vector_index"),
+        "checkpoint_every": 20,
+    }
+    # ナレッジベースのベクトルストアのインデックスの設定
+    # index_typeは"flat"（総当たり）、"ivf"（粗い量子化器で候補のリストを絞る）、"hnsw"（グラフ探索）、"auto"のいずれか。
+    # "auto"はflatで始め、チャンク数がauto_threshold以上になった時点でauto_index_typeへバックグラウンドで作り直す。
+    # ivf_nlistがNoneの場合はチャンク数の平方根の4倍とする。ivf_nprobeとhnsw_ef_searchを大きくすると、再現率が上がり検索は遅くなる。
+    KNOWLEDGE_BASE_ANN_SETTINGS = {
+        "index_type": os.getenv("KNOWLEDGE_BASE_INDEX_TYPE", "auto"),
+        "auto_threshold": 50000,
+        "auto_index_type": "hnsw",
+        "ivf_nlist": None,
+        "ivf_nprobe": 16,
+        "hnsw_m": 32,
+        "hnsw_ef_construction": 80,
+        "hnsw_ef_search": 64,
+    }
+    # 知識ベースの検索の設定
+    # ベクトル検索とBM25の語彙検索（文字bigram）からそれぞれcandidates件を取り出し、重み付きのRRF（rrf_k）で統合した上位k件を用いる。
+    # lexical_weightを0にするとベクトル検索のみとなる。重みはHTTPサーバーの要求ごとにも指定できる。
+    RETRIEVAL_SETTINGS = {
+        "k": 4,
+        "hybrid": os.getenv("HYBRID_RETRIEVAL", "1") != "0",
+        "vector_weight": 1.0,
+        "lexical_weight": 1.0,
+        "candidates": 20,
+        "rrf_k": 60,
+    }
+    # ドキュメントの一括取り込みの設定（build_index.pyでdocuments_dir以下のファイルをナレッジベースへ取り込む）
+    INGESTION_SETTINGS = {
+        "documents_dir": os.getenv("DOCUMENTS_DIR", "data/documents"),
+        "extensions": [".txt", ".md"],
+        "batch_size": 64,
+        "max_concurrency": int(os.getenv("INGESTION_CONCURRENCY", "4")),
+        "read_block_chars": 1 << 20,
+        "checkpoint_interval_seconds": 60,
+        "log_every_seconds": 5,
+    }
+    # 埋め込みキャッシュの設定（テキストと埋め込みモデル名をキーに、ナレッジベースへの追加と検索クエリで埋め込みを再利用する）
+    EMBEDDING_CACHE_SETTINGS = {
+        "enabled": True,
+        "path": "memory/embedding_cache.sqlite3",
+        "max_entries": 100000,
+    }
     KNOWLEDGE_GRAPH_STORAGE_PATH = "memory/knowledge_graph.json"
     MEMORY_LOG_FILE_PATH = "memory/session_memory.jsonl"
     
@@ -38,6 +202,82 @@ class Config:
         }
     }
 
+    # パイプラインの期限（秒）
+    # hedge_after_secondsまでにメインパイプラインが終わらない場合、simpleパイプラインを並行して開始し、先に得られた回答を採用する。
+    # deadline_secondsまでにどちらの回答も得られない場合は、処理を打ち切ってエラーの回答を返す。Noneの項目は制限しない。
+    # LLMの実行枠(OLLAMA_NUM_PARALLEL)が1の場合、並行したsimpleパイプラインはメインパイプラインと実行枠を交互に使う。
+    ENGINE_DEADLINE_SETTINGS = {
+        "enabled": True,
+        "modes": {
+            "simple": {"hedge_after_seconds": None, "deadline_seconds": None},
+            "full": {"hedge_after_seconds": 90, "deadline_seconds": 300},
+            "parallel": {"hedge_after_seconds": 90, "deadline_seconds": 300},
+            "quantum": {"hedge_after_seconds": 120, "deadline_seconds": 360},
+            "speculative": {"hedge_after_seconds": 90, "deadline_seconds": 300},
+            "self_discover": {"hedge_after_seconds": 120, "deadline_seconds": 360},
+            "internal_dialogue": {"hedge_after_seconds": 120, "deadline_seconds": 360},
+        },
+    }
+
+    # パイプラインの段階をグラフとして実行する際に、並行に実行する段階の最大数
+    # LLMの実行枠(OLLAMA_NUM_PARALLEL)が1の場合、並行した段階のLLM呼び出しは実行枠を交互に使う。
+    STEP_GRAPH_SETTINGS = {
+        "max_concurrency": 4,
+    }
+
+    # 予測符号化
+    # merge_prediction_and_error: 次の状態の予測と予測誤差の分析を1回のLLM呼び出しで行う（前の回答の直後に予測を先行して計算する代わりに）。
+    # background_update: 予測誤差に基づくワールドモデルの更新（知識グラフへの統合と保存）を、応答を待たせずに別スレッドで行う。
+    PREDICTIVE_CODING_SETTINGS = {
+        "merge_prediction_and_error": os.getenv("PREDICTIVE_CODING_MERGE", "0") == "1",
+        "background_update": True,
+    }
+
+    # 応答後の内省キュー
+    # 有効な場合、回答に必要ない評価（倫理的な動機づけ、価値観の更新、fullパイプラインの自己改善など）はキューに積み、回答を待たずに返す。
+    # 未処理の項目はpathのジャーナルに記録され、再起動後に処理を再開する。アイドル中に処理するが、max_defer_secondsより長く待った項目は対話中でも処理する。
+    REFLECTION_QUEUE_SETTINGS = {
+        "enabled": os.getenv("REFLECTION_QUEUE", "1") == "1",
+        "path": "memory/reflection_queue.jsonl",
+        "max_attempts": 3,
+        "max_defer_seconds": 600,
+    }
+
+    # モードのコストモデル
+    # モードと複雑性レベルごとに直近window件の処理時間とLLM呼び出し数を記録し、遅延予算（ミリ秒）に処理時間のp90が収まらないモードを、
+    # quality_orderでそれより後ろにある、予算に収まるモードへ切り下げる。遅延予算は決定やリクエストで指定するほか、環境変数LATENCY_BUDGET_MSで既定値を設定できる。
+    MODE_COST_SETTINGS = {
+        "enabled": True,
+        "path": "memory/mode_cost_model.json",
+        "window": 100,
+        "min_samples": 5,
+        # 観測値をファイルへ保存する最短の間隔（秒）。終了時には間隔によらず保存する
+        "save_interval_seconds": 30,
+        "quality_order": ["full", "self_discover", "internal_dialogue", "parallel", "quantum", "speculative", "simple"],
+        "default_latency_budget_ms": float(os.environ["LATENCY_BUDGET_MS"]) if os.getenv("LATENCY_BUDGET_MS") else None,
+    }
+
+    # ローカルHTTPサーバー（server.py）
+    # セッションごとにワーキングメモリと対話履歴を持ち、複数のセッションを並行して処理する。知識ベースと知識グラフは全セッションで共有する。
+    # session_idle_timeout_secondsより長く使われていないセッションは終了し、ワーキングメモリを記憶の整理のために保存する。
+    SERVER_SETTINGS = {
+        "host": os.getenv("LUCA_SERVER_HOST", "127.0.0.1"),
+        "port": int(os.getenv("LUCA_SERVER_PORT", "8765")),
+        "max_sessions": 100,
+        "session_idle_timeout_seconds": 1800,
+        "session_sweep_interval_seconds": 60,
+        "max_body_bytes": 1_000_000,
+    }
+
+    # バッチ処理（batch.py）
+    # 入力のJSONLの各行からid_fieldのIDとquery_fieldのクエリを読み、最大concurrency件を並行して処理する。
+    BATCH_SETTINGS = {
+        "concurrency": int(os.getenv("BATCH_CONCURRENCY", "4")),
+        "id_field": "id",
+        "query_field": "query",
+        "log_every": 50,
+    }
+
     # アイドル時間と自律思考の実行間隔（秒）
     IDLE_EVOLUTION_TRIGGER_SECONDS = 30
     AUTONOMOUS_CYCLE_INTERVAL_SECONDS = 60
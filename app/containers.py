@@ -3,9 +3,10 @@
 # role: 各AIエージェント、LLM、プロンプトテンプレート、およびその他の依存関係を定義し、提供する。
 
 from dependency_injector import containers, providers
-from langchain_ollama import OllamaLLM
+from langchain_ollama import OllamaLLM, OllamaEmbeddings
+from langchain_core.embeddings import Embeddings
 from langchain_core.output_parsers import StrOutputParser, JsonOutputParser
-from typing import Dict, Any
+from typing import Dict, Any, Optional, cast
 
 from app.config import settings
 import app.agents.prompts as prompts
@@ -43,8 +44,10 @@ from app.meta_cognition.self_critic_agent import SelfCriticAgent
 from app.meta_cognition.meta_cognitive_engine import MetaCognitiveEngine
 from app.memory.working_memory import WorkingMemory
 from app.memory.memory_consolidator import MemoryConsolidator
+from app.memory.context_assembler import ContextAssembler
 from app.problem_discovery.problem_discovery_agent import ProblemDiscoveryAgent
-from app.rag.knowledge_base import KnowledgeBase
+from app.rag.embedding_cache import CachedEmbeddings, EmbeddingCacheStore
+from app.rag.knowledge_base import KnowledgeBase, open_knowledge_base
 from app.rag.retriever import Retriever
 from app.tools.tool_belt import ToolBelt
 from app.knowledge_graph.persistent_knowledge_graph import PersistentKnowledgeGraph
@@ -53,6 +56,7 @@ from app.engine import MetaIntelligenceEngine
 from app.pipelines.base import BasePipeline
 from app.pipelines.simple_pipeline import SimplePipeline
 from app.pipelines.full_pipeline import FullPipeline
+from app.pipelines.step_graph import StepGraphStats
 from app.pipelines.parallel_pipeline import ParallelPipeline
 from app.pipelines.quantum_inspired_pipeline import QuantumInspiredPipeline
 from app.pipelines.speculative_pipeline import SpeculativePipeline
@@ -64,6 +68,17 @@ from app.meta_intelligence import (
 )
 from app.meta_intelligence.providers.base import LLMProvider as BaseLLMProvider, ProviderCapability
 from app.idle_manager import IdleManager
+from app.meta_cognition.reflection_queue import ReflectionQueue
+from app.llm.profiles import LLMProfileRegistry
+from app.llm.response_cache import ResponseCacheStore
+from app.llm.scheduler import LLMScheduler, ScheduledOllamaLLM
+from app.llm.warmup import ModelWarmer
+from app.reasoning.decision_cache import SemanticDecisionCache
+from app.reasoning.mode_cost_model import ModeCostModel
+from app.reasoning.mode_router import ModeDecisionLog, ModeRouter, ModeRouterStats
+from app.llm.instrumentation import LLMCallRecorder, install_llm_instrumentation, with_agent_label
+from app.tracing import Tracer, install_tracer
+from app.llm.structured_output import StructuredOutputStats
 
 class OllamaProvider(BaseLLMProvider):
     def __init__(self, llm_instance: OllamaLLM):
@@ -80,7 +95,7 @@ class OllamaProvider(BaseLLMProvider):
 
     async def standard_call(self, prompt: str, system_prompt: str = "", **kwargs) -> Dict[str, Any]:
         full_prompt = f"{system_prompt}\n\n{prompt}" if system_prompt else prompt
-        response = await self._llm.ainvoke(full_prompt, **kwargs)
+        response = await with_agent_label(self._llm, "OllamaProvider").ainvoke(full_prompt, **kwargs)
         return {"text": response, "usage": {}, "model": self._llm.model}
 
     def should_use_enhancement(self, prompt: str, **kwargs) -> bool:
@@ -95,24 +110,122 @@ class Container(containers.DeclarativeContainer):
     )
 
     # --- Core Components ---
-    llm_instance: providers.Singleton[OllamaLLM] = providers.Singleton(OllamaLLM, **settings.GENERATION_LLM_SETTINGS)
-    verifier_llm_instance: providers.Singleton[OllamaLLM] = providers.Singleton(OllamaLLM, **settings.VERIFIER_LLM_SETTINGS)
+    # LLM呼び出しの計測。リソースの初期化時にコンテキストへ登録され、以降のすべてのチェーン実行に付与される。
+    llm_call_recorder: providers.Singleton[LLMCallRecorder] = providers.Singleton(
+        LLMCallRecorder,
+        jsonl_path=settings.LLM_INSTRUMENTATION_SETTINGS["jsonl_path"],
+        prometheus_path=settings.LLM_INSTRUMENTATION_SETTINGS["prometheus_path"],
+    )
+    llm_instrumentation: providers.Resource[Optional[LLMCallRecorder]] = providers.Resource(
+        install_llm_instrumentation,
+        recorder=llm_call_recorder,
+        enabled=settings.LLM_INSTRUMENTATION_SETTINGS["enabled"],
+    )
+    # リクエスト単位のトレース。リソースの初期化時にコンテキストへ登録され、以降のリクエストの処理がスパンとして記録される。
+    tracer: providers.Singleton[Tracer] = providers.Singleton(
+        Tracer,
+        max_traces=settings.TRACING_SETTINGS["max_traces"],
+        max_spans_per_trace=settings.TRACING_SETTINGS["max_spans_per_trace"],
+        export_dir=settings.TRACING_SETTINGS["export_dir"],
+        export_each_trace=settings.TRACING_SETTINGS["export_each_request"],
+    )
+    tracing: providers.Resource[Optional[Tracer]] = providers.Resource(
+        install_tracer,
+        tracer=tracer,
+        enabled=settings.TRACING_SETTINGS["enabled"],
+    )
+    # すべてのLLM呼び出しは共通のスケジューラを経由し、対話中の呼び出しがバックグラウンド処理より優先される。
+    llm_scheduler: providers.Singleton[LLMScheduler] = providers.Singleton(
+        LLMScheduler,
+        max_concurrency=settings.LLM_SCHEDULER_SETTINGS["max_concurrency"],
+        max_background_concurrency=settings.LLM_SCHEDULER_SETTINGS["max_background_concurrency"],
+    )
+    # 応答キャッシュの保存先。AGENT_LLM_PROFILESでcacheを指定した分類系エージェントの役割のみが使用する。
+    llm_response_cache_store: providers.Singleton[ResponseCacheStore] = providers.Singleton(
+        ResponseCacheStore,
+        path=settings.LLM_RESPONSE_CACHE_SETTINGS["path"],
+        max_entries=settings.LLM_RESPONSE_CACHE_SETTINGS["max_entries"],
+        ttl_seconds=settings.LLM_RESPONSE_CACHE_SETTINGS["ttl_seconds"],
+    )
+    # エージェントの役割ごとのLLM。役割ごとにモデルや生成設定を変えられ、実行中の上書きも可能。
+    llm_profile_registry: providers.Singleton[LLMProfileRegistry] = providers.Singleton(
+        LLMProfileRegistry,
+        base_settings=settings.GENERATION_LLM_SETTINGS,
+        profiles=settings.AGENT_LLM_PROFILES,
+        overrides=settings.AGENT_LLM_PROFILE_OVERRIDES,
+        scheduler=llm_scheduler,
+        cache_store=llm_response_cache_store if settings.LLM_RESPONSE_CACHE_SETTINGS["enabled"] else None,
+    )
+    llm_instance: providers.Provider[OllamaLLM] = llm_profile_registry.provided.get.call("generation")
+    verifier_llm_instance: providers.Provider[OllamaLLM] = llm_profile_registry.provided.get.call("verifier")
+    orchestration_llm: providers.Provider[OllamaLLM] = llm_profile_registry.provided.get.call("orchestration")
+    retrieval_evaluation_llm: providers.Provider[OllamaLLM] = llm_profile_registry.provided.get.call("retrieval_evaluation")
+    tool_selection_llm: providers.Provider[OllamaLLM] = llm_profile_registry.provided.get.call("tool_selection")
+    query_refinement_llm: providers.Provider[OllamaLLM] = llm_profile_registry.provided.get.call("query_refinement")
+    knowledge_graph_llm: providers.Provider[OllamaLLM] = llm_profile_registry.provided.get.call("knowledge_graph")
+    planning_llm: providers.Provider[OllamaLLM] = llm_profile_registry.provided.get.call("planning")
+    background_llm: providers.Provider[OllamaLLM] = llm_profile_registry.provided.get.call("background")
     output_parser: providers.Singleton[StrOutputParser] = providers.Singleton(StrOutputParser)
     json_output_parser: providers.Singleton[JsonOutputParser] = providers.Singleton(JsonOutputParser)
+    # JSONを出力するエージェントの解析結果（修復・再要求・既定値の使用）をエージェントごとに集計する
+    structured_output_stats: providers.Singleton[StructuredOutputStats] = providers.Singleton(StructuredOutputStats)
     tool_belt: providers.Singleton[ToolBelt] = providers.Singleton(ToolBelt)
+    embeddings: providers.Singleton[OllamaEmbeddings] = providers.Singleton(
+        OllamaEmbeddings, model=settings.EMBEDDING_MODEL_NAME, keep_alive=settings.MODEL_KEEP_ALIVE_SECONDS
+    )
+    # 埋め込みキャッシュ。ナレッジベース（追加・インデックスの作り直し・検索）と判断キャッシュのクエリの埋め込みで共有する
+    embedding_cache_store: providers.Singleton[EmbeddingCacheStore] = providers.Singleton(
+        EmbeddingCacheStore,
+        path=settings.EMBEDDING_CACHE_SETTINGS["path"],
+        max_entries=settings.EMBEDDING_CACHE_SETTINGS["max_entries"],
+    )
+    embedding_cache: providers.Singleton[CachedEmbeddings] = providers.Singleton(
+        CachedEmbeddings, embeddings=embeddings, store=embedding_cache_store, model=settings.EMBEDDING_MODEL_NAME
+    )
+    # キャッシュが無効な場合は、埋め込みモデルを直接使用する。統計はembedding_cacheから読む
+    cached_embeddings: providers.Provider[Embeddings] = cast(
+        providers.Provider[Embeddings], embedding_cache if settings.EMBEDDING_CACHE_SETTINGS["enabled"] else embeddings
+    )
+    # 起動時のモデルの読み込みと、アイドル中のkeep_aliveの延長
+    model_warmer: providers.Singleton[ModelWarmer] = providers.Singleton(
+        ModelWarmer,
+        llm_models=llm_profile_registry.provided.models,
+        embedding_models=[settings.EMBEDDING_MODEL_NAME],
+        keep_alive_seconds=settings.MODEL_KEEP_ALIVE_SECONDS,
+        rewarm_margin_seconds=settings.MODEL_WARMUP_SETTINGS["rewarm_margin_seconds"],
+        probe_prompt=settings.MODEL_WARMUP_SETTINGS["probe_prompt"],
+    )
     knowledge_base: providers.Resource[KnowledgeBase] = providers.Resource(
-        KnowledgeBase.create_and_load,
-        source=settings.KNOWLEDGE_BASE_SOURCE
+        open_knowledge_base,
+        source=settings.KNOWLEDGE_BASE_SOURCE,
+        embeddings=cached_embeddings,
+        index_dir=settings.KNOWLEDGE_BASE_INDEX_SETTINGS["index_dir"],
+        checkpoint_every=settings.KNOWLEDGE_BASE_INDEX_SETTINGS["checkpoint_every"],
+        build_lexical_index=settings.RETRIEVAL_SETTINGS["hybrid"],
+        ann_settings=settings.KNOWLEDGE_BASE_ANN_SETTINGS,
     )
     persistent_knowledge_graph: providers.Singleton[PersistentKnowledgeGraph] = providers.Singleton(
         PersistentKnowledgeGraph,
         storage_path=settings.KNOWLEDGE_GRAPH_STORAGE_PATH
     )
-    retriever: providers.Singleton[Retriever] = providers.Singleton(Retriever, knowledge_base=knowledge_base)
+    retriever: providers.Singleton[Retriever] = providers.Singleton(
+        Retriever,
+        knowledge_base=knowledge_base,
+        k=settings.RETRIEVAL_SETTINGS["k"],
+        vector_weight=settings.RETRIEVAL_SETTINGS["vector_weight"],
+        lexical_weight=settings.RETRIEVAL_SETTINGS["lexical_weight"] if settings.RETRIEVAL_SETTINGS["hybrid"] else 0.0,
+        candidates=settings.RETRIEVAL_SETTINGS["candidates"],
+        rrf_k=settings.RETRIEVAL_SETTINGS["rrf_k"],
+    )
     memory_consolidator: providers.Singleton[MemoryConsolidator] = providers.Singleton(
         MemoryConsolidator, log_file_path=settings.MEMORY_LOG_FILE_PATH
     )
     working_memory: providers.Singleton[WorkingMemory] = providers.Singleton(WorkingMemory)
+    context_assembler: providers.Singleton[ContextAssembler] = providers.Singleton(
+        ContextAssembler,
+        total_tokens=settings.CONTEXT_BUDGET_SETTINGS["total_tokens"],
+        weights=settings.CONTEXT_BUDGET_SETTINGS["weights"],
+    )
 
     # --- MetaIntelligence System ---
     ollama_provider: providers.Singleton[OllamaProvider] = providers.Singleton(OllamaProvider, llm_instance=llm_instance)
@@ -150,7 +263,8 @@ class Container(containers.DeclarativeContainer):
         SelfImprovementAgent,
         llm=llm_instance,
         output_parser=json_output_parser,
-        prompt_template=prompts.SELF_IMPROVEMENT_AGENT_PROMPT
+        prompt_template=prompts.SELF_IMPROVEMENT_AGENT_PROMPT,
+        structured_output_stats=structured_output_stats,
     )
     self_correction_agent: providers.Factory[SelfCorrectionAgent] = providers.Factory(
         SelfCorrectionAgent,
@@ -171,7 +285,7 @@ class Container(containers.DeclarativeContainer):
     # IdleManagerが依存するため、先に定義
     autonomous_agent: providers.Factory[AutonomousAgent] = providers.Factory(
         AutonomousAgent,
-        llm=llm_instance,
+        llm=background_llm,
         output_parser=output_parser,
         memory_consolidator=memory_consolidator,
         knowledge_base=knowledge_base,
@@ -180,13 +294,14 @@ class Container(containers.DeclarativeContainer):
     
     knowledge_graph_agent: providers.Factory[KnowledgeGraphAgent] = providers.Factory(
         KnowledgeGraphAgent,
-        llm=llm_instance,
-        prompt_template=prompts.KNOWLEDGE_GRAPH_AGENT_PROMPT
+        llm=knowledge_graph_llm,
+        prompt_template=prompts.KNOWLEDGE_GRAPH_AGENT_PROMPT,
+        structured_output_stats=structured_output_stats,
     )
 
     consolidation_agent: providers.Factory[ConsolidationAgent] = providers.Factory(
         ConsolidationAgent,
-        llm=llm_instance,
+        llm=background_llm,
         output_parser=output_parser,
         prompt_template=prompts.CONSOLIDATION_AGENT_PROMPT,
         knowledge_base=knowledge_base,
@@ -195,6 +310,14 @@ class Container(containers.DeclarativeContainer):
         persistent_knowledge_graph=persistent_knowledge_graph,
     )
     
+    # 回答後の評価を、応答の後で実行するためのキュー
+    reflection_queue: providers.Singleton[ReflectionQueue] = providers.Singleton(
+        ReflectionQueue,
+        path=settings.REFLECTION_QUEUE_SETTINGS["path"],
+        max_attempts=settings.REFLECTION_QUEUE_SETTINGS["max_attempts"],
+        max_defer_seconds=settings.REFLECTION_QUEUE_SETTINGS["max_defer_seconds"],
+    )
+
     # ◾️◾️◾️◾️◾️◾️◾️◾️◾️◾️◾️↓修正開始◾️◾️◾️◾️◾️◾️◾️◾️◾️◾️◾️
     idle_manager: providers.Singleton[IdleManager] = providers.Singleton(
         IdleManager,
@@ -204,17 +327,44 @@ class Container(containers.DeclarativeContainer):
         emergent_network=emergent_intelligence_network,
         value_system=evolving_value_system,
         memory_consolidator=memory_consolidator,
+        model_warmer=model_warmer if settings.MODEL_WARMUP_SETTINGS["enabled"] else None,
+        reflection_queue=reflection_queue if settings.REFLECTION_QUEUE_SETTINGS["enabled"] else None,
     )
     # ◾️◾️◾️◾️◾️◾️◾️◾️◾️◾️◾️↑修正終わり◾️◾️◾️◾️◾️◾️◾️◾️◾️◾️◾️
     
     # --- Agents (残り) ---
     complexity_analyzer: providers.Factory[ComplexityAnalyzer] = providers.Factory(ComplexityAnalyzer)
+    # 過去のモード選択から学習したルーター。確信度の高いクエリではモード選択のLLM呼び出しを省略する。
+    mode_router: providers.Singleton[ModeRouter] = providers.Singleton(
+        ModeRouter.load_or_untrained,
+        path=settings.MODE_ROUTER_SETTINGS["model_path"],
+        ngram_range=settings.MODE_ROUTER_SETTINGS["ngram_range"],
+        num_features=settings.MODE_ROUTER_SETTINGS["num_features"],
+    )
+    mode_router_stats: providers.Singleton[ModeRouterStats] = providers.Singleton(ModeRouterStats)
+    mode_decision_log: providers.Singleton[ModeDecisionLog] = providers.Singleton(
+        ModeDecisionLog, path=settings.MODE_ROUTER_SETTINGS["decision_log_path"]
+    )
+    # 類似したクエリに過去のモード選択を再利用するキャッシュ
+    orchestration_decision_cache: providers.Singleton[SemanticDecisionCache] = providers.Singleton(
+        SemanticDecisionCache,
+        embeddings=cached_embeddings,
+        path=settings.ORCHESTRATION_DECISION_CACHE_SETTINGS["path"],
+        max_entries=settings.ORCHESTRATION_DECISION_CACHE_SETTINGS["max_entries"],
+        similarity_threshold=settings.ORCHESTRATION_DECISION_CACHE_SETTINGS["similarity_threshold"],
+    )
     orchestration_agent: providers.Factory[OrchestrationAgent] = providers.Factory(
         OrchestrationAgent,
-        llm=llm_instance,
+        llm=orchestration_llm,
         output_parser=json_output_parser,
         prompt_template=prompts.ORCHESTRATION_PROMPT,
         complexity_analyzer=complexity_analyzer,
+        structured_output_stats=structured_output_stats,
+        mode_router=mode_router if settings.MODE_ROUTER_SETTINGS["enabled"] else None,
+        mode_router_stats=mode_router_stats,
+        decision_log=mode_decision_log,
+        confidence_threshold=settings.MODE_ROUTER_SETTINGS["confidence_threshold"],
+        decision_cache=orchestration_decision_cache if settings.ORCHESTRATION_DECISION_CACHE_SETTINGS["enabled"] else None,
     )
     
     world_model_agent: providers.Factory[WorldModelAgent] = providers.Factory(
@@ -222,6 +372,7 @@ class Container(containers.DeclarativeContainer):
         llm=llm_instance,
         knowledge_graph_agent=knowledge_graph_agent,
         persistent_knowledge_graph=persistent_knowledge_graph,
+        structured_output_stats=structured_output_stats,
     )
     predictive_coding_engine: providers.Factory[PredictiveCodingEngine] = providers.Factory(
         PredictiveCodingEngine,
@@ -229,6 +380,8 @@ class Container(containers.DeclarativeContainer):
         working_memory=working_memory,
         knowledge_graph_agent=knowledge_graph_agent,
         persistent_knowledge_graph=persistent_knowledge_graph,
+        merge_prediction_and_error=settings.PREDICTIVE_CODING_SETTINGS["merge_prediction_and_error"],
+        background_update=settings.PREDICTIVE_CODING_SETTINGS["background_update"],
     )
     integrated_information_agent: providers.Factory[IntegratedInformationAgent] = providers.Factory(
         IntegratedInformationAgent,
@@ -237,7 +390,8 @@ class Container(containers.DeclarativeContainer):
     )
     dialogue_participant_agent: providers.Factory[DialogueParticipantAgent] = providers.Factory(
         DialogueParticipantAgent,
-        llm=llm_instance
+        llm=llm_instance,
+        structured_output_stats=structured_output_stats,
     )
     mediator_agent: providers.Factory[MediatorAgent] = providers.Factory(
         MediatorAgent,
@@ -251,7 +405,8 @@ class Container(containers.DeclarativeContainer):
     value_evaluator: providers.Factory[ValueEvaluator] = providers.Factory(
         ValueEvaluator,
         llm=llm_instance,
-        output_parser=json_output_parser
+        output_parser=json_output_parser,
+        structured_output_stats=structured_output_stats,
     )
     integrity_monitor: providers.Factory[IntegrityMonitor] = providers.Factory(
         IntegrityMonitor,
@@ -265,27 +420,29 @@ class Container(containers.DeclarativeContainer):
     )
     problem_discovery_agent: providers.Factory[ProblemDiscoveryAgent] = providers.Factory(
         ProblemDiscoveryAgent, llm=llm_instance, output_parser=json_output_parser,
-        prompt_template=prompts.PROBLEM_DISCOVERY_AGENT_PROMPT
+        prompt_template=prompts.PROBLEM_DISCOVERY_AGENT_PROMPT,
+        structured_output_stats=structured_output_stats,
     )
     
     planning_agent: providers.Factory[PlanningAgent] = providers.Factory(
-        PlanningAgent, llm=llm_instance, output_parser=output_parser,
+        PlanningAgent, llm=planning_llm, output_parser=output_parser,
         prompt_template=prompts.PLANNING_AGENT_PROMPT
     )
     retrieval_evaluator_agent: providers.Factory[RetrievalEvaluatorAgent] = providers.Factory(
         RetrievalEvaluatorAgent,
-        llm=llm_instance,
-        prompt_template=prompts.RETRIEVAL_EVALUATOR_AGENT_PROMPT
+        llm=retrieval_evaluation_llm,
+        prompt_template=prompts.RETRIEVAL_EVALUATOR_AGENT_PROMPT,
+        structured_output_stats=structured_output_stats,
     )
     query_refinement_agent: providers.Factory[QueryRefinementAgent] = providers.Factory(
         QueryRefinementAgent,
-        llm=llm_instance,
+        llm=query_refinement_llm,
         output_parser=output_parser,
         prompt_template=prompts.QUERY_REFINEMENT_AGENT_PROMPT
     )
     tool_using_agent: providers.Factory[ToolUsingAgent] = providers.Factory(
         ToolUsingAgent,
-        llm=llm_instance,
+        llm=tool_selection_llm,
         output_parser=output_parser,
         prompt_template=prompts.TOOL_USING_AGENT_PROMPT
     )
@@ -301,6 +458,7 @@ class Container(containers.DeclarativeContainer):
         persistent_knowledge_graph=persistent_knowledge_graph,
         tool_using_agent=tool_using_agent,
         tool_belt=tool_belt,
+        context_assembler=context_assembler,
     )
 
     decompose_agent: providers.Factory[DecomposeAgent] = providers.Factory(DecomposeAgent, llm=llm_instance, output_parser=output_parser)
@@ -317,12 +475,14 @@ class Container(containers.DeclarativeContainer):
         engine=providers.Self,
         value_evaluator=value_evaluator,
         orchestration_agent=orchestration_agent,
+        reflection_queue=reflection_queue if settings.REFLECTION_QUEUE_SETTINGS["enabled"] else None,
     )
     simple_pipeline: providers.Factory[SimplePipeline] = providers.Factory(
         SimplePipeline,
         master_agent=_master_agent_factory,
         cognitive_loop_agent=cognitive_loop_agent
     )
+    step_graph_stats: providers.Singleton[StepGraphStats] = providers.Singleton(StepGraphStats)
     full_pipeline: providers.Factory[FullPipeline] = providers.Factory(
         FullPipeline,
         master_agent=_master_agent_factory,
@@ -334,6 +494,9 @@ class Container(containers.DeclarativeContainer):
         self_improvement_agent=self_improvement_agent,
         self_correction_agent=self_correction_agent,
         self_evolving_system=self_evolving_system,
+        max_concurrency=settings.STEP_GRAPH_SETTINGS["max_concurrency"],
+        step_graph_stats=step_graph_stats,
+        reflection_queue=reflection_queue if settings.REFLECTION_QUEUE_SETTINGS["enabled"] else None,
     )
     parallel_pipeline: providers.Factory[ParallelPipeline] = providers.Factory(
         ParallelPipeline,
@@ -365,6 +528,15 @@ class Container(containers.DeclarativeContainer):
         consciousness_staging_area=consciousness_staging_area,
         integrated_information_agent=integrated_information_agent
     )
+    # モードと複雑性レベルごとの処理時間の記録。遅延予算に収まらないモードの切り下げに用いる。
+    mode_cost_model: providers.Singleton[ModeCostModel] = providers.Singleton(
+        ModeCostModel,
+        quality_order=settings.MODE_COST_SETTINGS["quality_order"],
+        path=settings.MODE_COST_SETTINGS["path"],
+        window=settings.MODE_COST_SETTINGS["window"],
+        min_samples=settings.MODE_COST_SETTINGS["min_samples"],
+        save_interval_seconds=settings.MODE_COST_SETTINGS["save_interval_seconds"],
+    )
     engine: providers.Singleton[MetaIntelligenceEngine] = providers.Singleton(
         MetaIntelligenceEngine,
         pipelines=providers.Dict(
@@ -375,7 +547,11 @@ class Container(containers.DeclarativeContainer):
             speculative=speculative_pipeline,
             self_discover=self_discover_pipeline,
             internal_dialogue=internal_dialogue_pipeline
-        )
+        ),
+        deadlines=settings.ENGINE_DEADLINE_SETTINGS["modes"] if settings.ENGINE_DEADLINE_SETTINGS["enabled"] else None,
+        cost_model=mode_cost_model if settings.MODE_COST_SETTINGS["enabled"] else None,
+        complexity_analyzer=complexity_analyzer,
+        default_latency_budget_ms=settings.MODE_COST_SETTINGS["default_latency_budget_ms"],
     )
     master_agent: providers.Factory[MasterAgent] = providers.Factory(
         MasterAgent,
@@ -388,4 +564,5 @@ class Container(containers.DeclarativeContainer):
         engine=engine,
         value_evaluator=value_evaluator,
         orchestration_agent=orchestration_agent,
+        reflection_queue=reflection_queue if settings.REFLECTION_QUEUE_SETTINGS["enabled"] else None,
     )
\ No newline at end of file
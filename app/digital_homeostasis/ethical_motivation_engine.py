@@ -23,8 +23,17 @@ class EthicalMotivationEngine:
         現在の応答とシステムの健全性を評価し、次の行動への動機付けを生成する。
         """
         logger.info("ホメオスタシス評価と動機付けの生成を開始します...")
-        
-        health_status = self.integrity_monitor.get_health_status()
+        return self._generate_motivation(self.integrity_monitor.get_health_status())
+
+    async def aassess_and_generate_motivation(self, final_answer: str) -> Dict[str, Any]:
+        """
+        assess_and_generate_motivationの非同期版。
+        """
+        logger.info("ホメオスタシス評価と動機付けの生成を開始します...")
+        return self._generate_motivation(await self.integrity_monitor.aget_health_status())
+
+    def _generate_motivation(self, health_status: Dict[str, Any]) -> Dict[str, Any]:
+        """健全性ステータスと現在の価値観から動機付けを組み立てる。"""
         current_values = self.value_evaluator.core_values
 
         motivation: Dict[str, Any] = {
@@ -4,11 +4,12 @@
 
 import logging
 import time
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional
 
 from app.knowledge_graph.persistent_knowledge_graph import PersistentKnowledgeGraph
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser
+from app.llm.instrumentation import with_agent_label
 
 logger = logging.getLogger(__name__)
 
@@ -30,10 +31,8 @@ class IntegrityMonitor:
             """
         )
 
-    def check_logical_consistency(self) -> List[str]:
-        """
-        知識グラフ全体の論理的整合性をチェックする。
-        """
+    def _get_graph_snippet(self) -> Optional[str]:
+        """整合性チェックの対象となる知識グラフの断片を返す。グラフが空の場合はNoneを返す。"""
         logger.info("知識グラフの論理的整合性チェックを開始します...")
         graph_string = self.knowledge_graph.get_graph().to_string()
         
@@ -41,11 +40,11 @@ class IntegrityMonitor:
 
         if "知識グラフは空です" in graph_snippet:
              logger.info("知識グラフが空のため、整合性チェックをスキップします。")
-             return []
-
-        chain = self.consistency_check_prompt | self.llm | StrOutputParser()
-        result = chain.invoke({"graph_snippet": graph_snippet})
+             return None
+        return graph_snippet
 
+    def _interpret_result(self, result: str) -> List[str]:
+        """LLMの分析結果を不整合のリストに変換する。"""
         if "問題なし" in result:
             logger.info("論理的整合性に問題は見つかりませんでした。")
             return []
@@ -53,12 +52,28 @@ class IntegrityMonitor:
             logger.warning(f"論理的な不整合の可能性が検出されました: {result}")
             return [result]
 
-    def get_health_status(self) -> Dict[str, Any]:
+    def check_logical_consistency(self) -> List[str]:
         """
-        現在の知的健全性の全体的なステータスを返す。
+        知識グラフ全体の論理的整合性をチェックする。
         """
-        inconsistencies = self.check_logical_consistency()
-        
+        graph_snippet = self._get_graph_snippet()
+        if graph_snippet is None:
+            return []
+        chain = with_agent_label(self.consistency_check_prompt | self.llm | StrOutputParser(), "IntegrityMonitor")
+        return self._interpret_result(chain.invoke({"graph_snippet": graph_snippet}))
+
+    async def acheck_logical_consistency(self) -> List[str]:
+        """
+        check_logical_consistencyの非同期版。
+        """
+        graph_snippet = self._get_graph_snippet()
+        if graph_snippet is None:
+            return []
+        chain = with_agent_label(self.consistency_check_prompt | self.llm | StrOutputParser(), "IntegrityMonitor")
+        return self._interpret_result(await chain.ainvoke({"graph_snippet": graph_snippet}))
+
+    def _build_health_status(self, inconsistencies: List[str]) -> Dict[str, Any]:
+        """不整合のリストから健全性ステータスを組み立てる。"""
         status = {
             "is_healthy": not inconsistencies,
             "inconsistencies": inconsistencies,
@@ -66,3 +81,15 @@ class IntegrityMonitor:
         }
         logger.info(f"現在の知的健全性ステータス: {'健全' if status['is_healthy'] else '要注意'}")
         return status
+
+    def get_health_status(self) -> Dict[str, Any]:
+        """
+        現在の知的健全性の全体的なステータスを返す。
+        """
+        return self._build_health_status(self.check_logical_consistency())
+
+    async def aget_health_status(self) -> Dict[str, Any]:
+        """
+        get_health_statusの非同期版。
+        """
+        return self._build_health_status(await self.acheck_logical_consistency())
@@ -3,36 +3,224 @@
 # role: 実行モードに応じて適切な推論パイプラインを選択し、処理を実行する。
 
 from __future__ import annotations
+import asyncio
 import logging
-from typing import TYPE_CHECKING, Dict, Any
+import threading
+import time
+from typing import TYPE_CHECKING, AsyncIterator, Dict, Any, List, Optional, Set
+
+from app.llm.instrumentation import current_request_id, llm_call_context
+from app.llm.scheduler import count_llm_calls
+from app.llm.streaming import (
+    StreamingLatencyStats, emit_stream_reset, forward_stream_events, iterate_stream_events, start_stream_task,
+)
+from app.tracing import start_trace
 
 if TYPE_CHECKING:
     from app.pipelines.base import BasePipeline
+    from app.reasoning.complexity_analyzer import ComplexityAnalyzer
+    from app.reasoning.mode_cost_model import ModeCostModel
     from app.models import MasterAgentResponse
     from app.models import OrchestrationDecision # ADDED
+    from app.models import StreamEvent
 
 logger = logging.getLogger(__name__)
 
+# ヘッジ実行やフォールバックでsimpleパイプラインに渡す決定
+_FALLBACK_DECISION: 'OrchestrationDecision' = {"chosen_mode": "simple", "reason": "フォールバック", "agent_configs": {}}
+
+
+class HedgedRunFailed(Exception):
+    """ヘッジ実行で、期限までにメインパイプラインとsimpleパイプラインのどちらも回答を返さなかったことを表す。"""
+
+
+class DeadlineStats:
+    """
+    モードごとに、実行回数、ヘッジ（simpleパイプラインの並行実行）の開始回数、
+    ヘッジ後にどちらの回答が採用されたか、期限までに回答が得られなかった回数を集計する。
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts: Dict[str, Dict[str, int]] = {}
+
+    def record(self, mode: str, outcome: str) -> None:
+        """outcomeはruns, hedged, primary_won, hedge_won, deadline_exceededのいずれか。"""
+        with self._lock:
+            counts = self._counts.setdefault(mode, {
+                "runs": 0, "hedged": 0, "primary_won": 0, "hedge_won": 0, "deadline_exceeded": 0,
+            })
+            counts[outcome] += 1
+
+    def get_stats(self) -> Dict[str, Dict[str, int]]:
+        """モードごとの集計値を返す。"""
+        with self._lock:
+            return {mode: dict(counts) for mode, counts in self._counts.items()}
+
+
 class MetaIntelligenceEngine:
     """
     推論パイプラインを管理し、実行するコアエンジン。
+    モードごとにヘッジ開始時間と期限を設定した場合、メインパイプラインがヘッジ開始時間までに終わらなければ
+    simpleパイプラインを並行して開始し、期限までに先に得られた回答を採用する。
+    コストモデルを指定した場合、モードと複雑性レベルごとの処理時間とLLM呼び出し数を記録し、
+    遅延予算に収まらないと見積もられるモードを、予算に収まるモードへ切り下げる。
     """
-    def __init__(self, pipelines: Dict[str, BasePipeline]):
+    def __init__(
+        self,
+        pipelines: Dict[str, BasePipeline],
+        deadlines: Optional[Dict[str, Dict[str, Optional[float]]]] = None,
+        cost_model: Optional[ModeCostModel] = None,
+        complexity_analyzer: Optional[ComplexityAnalyzer] = None,
+        default_latency_budget_ms: Optional[float] = None,
+    ):
+        """
+        Args:
+            pipelines: モード名とパイプラインの対応。
+            deadlines: モード名ごとのhedge_after_seconds（simpleパイプラインを並行して開始するまでの秒数）と
+                deadline_seconds（回答を待つ最大秒数）。指定のないモードは期限なしで実行する。
+            cost_model: モードごとの処理時間を記録・見積もるコストモデル。
+            complexity_analyzer: コストモデルの記録と見積もりに用いる、クエリの複雑性レベルの分析器。
+            default_latency_budget_ms: リクエストにも決定にも遅延予算がない場合に用いる遅延予算。
+        """
         self.pipelines = pipelines
+        self.deadlines = deadlines or {}
+        self.cost_model = cost_model
+        self.complexity_analyzer = complexity_analyzer
+        self.default_latency_budget_ms = default_latency_budget_ms
+        self.streaming_stats = StreamingLatencyStats()
+        self.deadline_stats = DeadlineStats()
 
     # MODIFIED: mode parameter is now OrchestrationDecision
-    def run(self, query: str, orchestration_decision: 'OrchestrationDecision') -> MasterAgentResponse:
+    def run(
+        self,
+        query: str,
+        orchestration_decision: 'OrchestrationDecision',
+        latency_budget_ms: Optional[float] = None,
+        dialogue_history: Optional[List[str]] = None,
+    ) -> MasterAgentResponse:
+        """arunの同期ラッパー。"""
+        return asyncio.run(self.arun(query, orchestration_decision, latency_budget_ms, dialogue_history))
+
+    def _complexity(self, query: str) -> str:
+        return self.complexity_analyzer.analyze_query_complexity(query) if self.complexity_analyzer is not None else "unknown"
+
+    def apply_latency_budget(
+        self, query: str, orchestration_decision: 'OrchestrationDecision', latency_budget_ms: Optional[float] = None
+    ) -> 'OrchestrationDecision':
+        """
+        遅延予算（引数、決定のlatency_budget_ms、既定値の順に優先）に処理時間のp90が収まらないと見積もられるモードを、
+        予算に収まる最も品質の高いモードに切り下げた決定を返す。切り下げない場合は元の決定をそのまま返す。
+        """
+        if latency_budget_ms is None:
+            latency_budget_ms = orchestration_decision.get("latency_budget_ms")
+        if latency_budget_ms is None:
+            latency_budget_ms = self.default_latency_budget_ms
+        mode = orchestration_decision.get("chosen_mode", "simple")
+        if self.cost_model is None or latency_budget_ms is None or mode not in self.pipelines:
+            return orchestration_decision
+        chosen, reason = self.cost_model.choose_mode(mode, self._complexity(query), latency_budget_ms)
+        if reason is None:
+            return orchestration_decision
+        logger.warning(f"モードを切り下げます: {reason}")
+        return {
+            **orchestration_decision,
+            "chosen_mode": chosen,
+            "reason": f"{orchestration_decision.get('reason', '')} ({reason})",
+            "latency_budget_ms": latency_budget_ms,
+        }
+
+    async def astream(
+        self,
+        query: str,
+        orchestration_decision: 'OrchestrationDecision',
+        latency_budget_ms: Optional[float] = None,
+        dialogue_history: Optional[List[str]] = None,
+    ) -> AsyncIterator[StreamEvent]:
+        """
+        arunと同じ処理を行いながら、最終回答のトークンを生成され次第イベントとして返す。
+        最後に完全な応答と初回トークン到達時間(TTFT)を含む "response" イベントを返す。
+        パイプラインの失敗によりフォールバックした場合は、"reset" イベントの後に改めてトークンが送られる。
+        遅延予算はarunと同様に実行時に1度だけ適用し、ストリーミングの統計は切り下げ後のモードで記録する。
+        """
+        start_time = time.perf_counter()
+        first_token_time: Optional[float] = None
+        applied: Dict[str, Any] = {}
+        task, queue = start_stream_task(self._arun_traced(query, orchestration_decision, latency_budget_ms, dialogue_history, applied))
+
+        async for event in iterate_stream_events(task, queue):
+            if event["type"] == "token" and first_token_time is None:
+                first_token_time = time.perf_counter() - start_time
+                logger.info(f"最初のトークンを受信しました (TTFT: {first_token_time:.2f} s)")
+            yield event
+
+        response = await task
+        if first_token_time is None and response.get("final_answer"):
+            # 最終段がストリーミングに対応していないパイプラインでは、回答全体を1つの断片として送る
+            first_token_time = time.perf_counter() - start_time
+            yield {"type": "token", "content": response["final_answer"]}
+
+        total_time = time.perf_counter() - start_time
+        mode = applied.get("chosen_mode") or orchestration_decision.get("chosen_mode", "simple")
+        if first_token_time is not None:
+            self.streaming_stats.record(mode, first_token_time, total_time)
+        logger.info(f"ストリーミング実行完了 (mode: {mode}, TTFT: {first_token_time if first_token_time is not None else float('nan'):.2f} s, 合計: {total_time:.2f} s)")
+        yield {
+            "type": "response",
+            "response": response,
+            "time_to_first_token": first_token_time,
+            "total_time": total_time,
+        }
+
+    async def arun(
+        self,
+        query: str,
+        orchestration_decision: 'OrchestrationDecision',
+        latency_budget_ms: Optional[float] = None,
+        dialogue_history: Optional[List[str]] = None,
+    ) -> MasterAgentResponse:
         """
         指定されたモードで適切なパイプラインを実行する。
         失敗した場合は、フォールバックパイプライン（simpleモード）を試行する。
+        モードに期限が設定されている場合は、期限内に回答が得られるよう、simpleパイプラインを並行して実行することがある。
 
         Args:
             query (str): ユーザーからのクエリ。
             orchestration_decision (OrchestrationDecision): OrchestrationAgentによって決定された実行モードと関連する設定。
+            latency_budget_ms (Optional[float]): リクエストの遅延予算。予算に収まらないと見積もられるモードは切り下げる。
+            dialogue_history (Optional[List[str]]): 要求元のセッションのこれまでの対話履歴。実行するパイプライン（フォールバックを含む）にそのまま渡す。
 
         Returns:
             MasterAgentResponse: パイプラインの実行結果。
         """
+        return await self._arun_traced(query, orchestration_decision, latency_budget_ms, dialogue_history)
+
+    async def _arun_traced(
+        self,
+        query: str,
+        orchestration_decision: 'OrchestrationDecision',
+        latency_budget_ms: Optional[float],
+        dialogue_history: Optional[List[str]] = None,
+        applied: Optional[Dict[str, Any]] = None,
+    ) -> MasterAgentResponse:
+        # リクエストのトレースの外で呼び出された場合は、このエンジンの実行を1件のトレースとして記録する
+        with start_trace(
+            current_request_id(), name="MetaIntelligenceEngine.arun", category="engine",
+            mode=orchestration_decision.get("chosen_mode"),
+        ):
+            return await self._arun(query, orchestration_decision, latency_budget_ms, dialogue_history, applied)
+
+    async def _arun(
+        self,
+        query: str,
+        orchestration_decision: 'OrchestrationDecision',
+        latency_budget_ms: Optional[float],
+        dialogue_history: Optional[List[str]] = None,
+        applied: Optional[Dict[str, Any]] = None,
+    ) -> MasterAgentResponse:
+        """遅延予算を適用した上でパイプラインを実行する。appliedを指定した場合は、適用後の決定をそこに書き込む。"""
+        orchestration_decision = self.apply_latency_budget(query, orchestration_decision, latency_budget_ms)
+        if applied is not None:
+            applied.update(orchestration_decision)
         # ◾️◾️◾️◾️◾️◾️◾️◾️◾️◾️◾️↓修正開始◾️◾️◾️◾️◾️◾️◾️◾️◾️◾️◾️
         initial_mode = orchestration_decision.get("chosen_mode", "simple") # OrchestrationDecisionからモードを抽出
         # ◾️◾️◾️◾️◾️◾️◾️◾️◾️◾️◾️↑修正終わり◾️◾️◾️◾️◾️◾️◾️◾️◾️◾️◾️
@@ -49,16 +237,22 @@ class MetaIntelligenceEngine:
             logger.info(f"メインパイプライン '{initial_mode}' で実行中...")
             # ◾️◾️◾️◾️◾️◾️◾️◾️◾️◾️◾️↓修正開始◾️◾️◾️◾️◾️◾️◾️◾️◾️◾️◾️
             # orchestration_decisionをパイプラインに渡すように変更
-            response = current_pipeline.run(query, orchestration_decision) 
+            # モードに期限が設定されていれば、期限付き（必要に応じてsimpleパイプラインとの並行実行）で実行する
+            response = await self._run_with_deadline(initial_mode, current_pipeline, query, orchestration_decision, dialogue_history)
             # ◾️◾️◾️◾️◾️◾️◾️◾️◾️◾️◾️↑修正終わり◾️◾️◾️◾️◾️◾️◾️◾️◾️◾️◾️
-            
-            # Simple check for unsatisfactory response (can be expanded)
-            if not response.get("final_answer"):
-                logger.warning(f"メインパイプライン '{initial_mode}' が空の回答を返しました。simpleモードにフォールバックします。")
-                raise ValueError("Empty final_answer from main pipeline.")
 
             return response
 
+        except HedgedRunFailed as e:
+            # simpleパイプラインは既に並行して試行済みのため、再度のフォールバックは行わない
+            logger.error(f"パイプライン '{initial_mode}' とsimpleパイプラインのいずれも期限内に回答を返しませんでした: {e}")
+            return {
+                "final_answer": "申し訳ありません、時間内に要求を処理できませんでした。もう一度お試しいただくか、質問を短くしてください。",
+                "self_criticism": f"メインパイプライン({initial_mode})と並行して実行したsimpleパイプラインの両方が、期限内に回答を返しませんでした。詳細: {e}",
+                "potential_problems": "LLMの応答が遅延しているか、パイプラインが停止している可能性があります。",
+                "retrieved_info": ""
+            }
+
         except Exception as e:
             logger.error(f"パイプライン '{initial_mode}' の実行中にエラーが発生しました: {e}。simpleモードで再試行します。", exc_info=True)
             
@@ -66,10 +260,12 @@ class MetaIntelligenceEngine:
             if initial_mode != "simple": # Check against initial_mode (the one that caused the error)
                 try:
                     logger.info("フォールバックパイプライン 'simple' で実行中...")
+                    emit_stream_reset()
                     fallback_pipeline = self.pipelines["simple"]
                     # ◾️◾️◾️◾️◾️◾️◾️◾️◾️◾️◾️↓修正開始◾️◾️◾️◾️◾️◾️◾️◾️◾️◾️◾️
                     # フォールバックパイプラインにもOrchestrationDecisionを渡す (simpleモードのデフォルトで)
-                    fallback_response = fallback_pipeline.run(query, {"chosen_mode": "simple", "reason": "フォールバック", "agent_configs": {}}) 
+                    with llm_call_context(mode="simple"):
+                        fallback_response = await fallback_pipeline.arun(query, _FALLBACK_DECISION, dialogue_history)
                     # ◾️◾️◾️◾️◾️◾️◾️◾️◾️◾️◾️↑修正終わり◾️◾️◾️◾️◾️◾️◾️◾️◾️◾️◾️
                     
                     if not fallback_response.get("final_answer"):
@@ -96,4 +292,111 @@ class MetaIntelligenceEngine:
                     "self_criticism": f"simpleパイプラインでの処理に失敗しました。詳細: {e}",
                     "potential_problems": "シンプルな実行モードでも問題が発生しました。システムログを確認してください。",
                     "retrieved_info": ""
-                }
\ No newline at end of file
+                }
+
+    async def _run_pipeline(
+        self,
+        mode: str,
+        pipeline: BasePipeline,
+        query: str,
+        orchestration_decision: 'OrchestrationDecision',
+        dialogue_history: Optional[List[str]] = None,
+    ) -> MasterAgentResponse:
+        """
+        パイプラインを実行し、空の回答は失敗として例外を送出する。
+        コストモデルには、最後まで実行したパイプラインの処理時間とLLM呼び出し数を記録する。
+        ヘッジ実行で負けた側などキャンセルされた実行は、処理時間が打ち切られておりp90を歪めるため記録しない。
+        """
+        start = time.perf_counter()
+        with llm_call_context(mode=mode), count_llm_calls() as calls:
+            response = await pipeline.arun(query, orchestration_decision, dialogue_history)
+        self._record_cost(mode, query, time.perf_counter() - start, calls.count)
+        # Simple check for unsatisfactory response (can be expanded)
+        if not response.get("final_answer"):
+            logger.warning(f"パイプライン '{mode}' が空の回答を返しました。")
+            raise ValueError(f"Empty final_answer from pipeline '{mode}'.")
+        return response
+
+    def _record_cost(self, mode: str, query: str, elapsed: float, llm_calls: int) -> None:
+        if self.cost_model is not None:
+            self.cost_model.record(mode, self._complexity(query), elapsed, llm_calls)
+
+    async def _run_with_deadline(
+        self,
+        mode: str,
+        pipeline: BasePipeline,
+        query: str,
+        orchestration_decision: 'OrchestrationDecision',
+        dialogue_history: Optional[List[str]] = None,
+    ) -> MasterAgentResponse:
+        """
+        モードの期限設定に従ってパイプラインを実行する。
+        ヘッジ開始時間までに終わらなければ、simpleパイプラインを並行して開始する。simpleパイプラインの断片は採用するまで表示を保留する。
+        期限までにどちらかが回答を返せばそれを採用し、もう一方はキャンセルする。
+        ヘッジしない場合に期限を過ぎたときはasyncio.TimeoutErrorを、ヘッジ後にどちらも回答を返さなかったときはHedgedRunFailedを送出する。
+        """
+        self.deadline_stats.record(mode, "runs")
+        limits = self.deadlines.get(mode, {})
+        hedge_after = limits.get("hedge_after_seconds") if mode != "simple" else None
+        deadline = limits.get("deadline_seconds")
+        if hedge_after is None:
+            coro = self._run_pipeline(mode, pipeline, query, orchestration_decision, dialogue_history)
+            if deadline is None:
+                return await coro
+            try:
+                return await asyncio.wait_for(coro, timeout=deadline)
+            except asyncio.TimeoutError:
+                self.deadline_stats.record(mode, "deadline_exceeded")
+                raise asyncio.TimeoutError(f"パイプライン '{mode}' が期限({deadline} s)までに終わりませんでした。") from None
+
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        primary: asyncio.Future[Any] = asyncio.ensure_future(self._run_pipeline(mode, pipeline, query, orchestration_decision, dialogue_history))
+        hedge: Optional[asyncio.Future[Any]] = None
+        try:
+            done, _ = await asyncio.wait({primary}, timeout=hedge_after)
+            if primary in done:
+                return primary.result()
+
+            self.deadline_stats.record(mode, "hedged")
+            logger.warning(f"パイプライン '{mode}' が{hedge_after} s以内に終わらないため、simpleパイプラインを並行して開始します。")
+            hedge, hedge_queue = start_stream_task(
+                self._run_pipeline("simple", self.pipelines["simple"], query, _FALLBACK_DECISION, dialogue_history)
+            )
+            pending: Set[asyncio.Future[Any]] = {primary, hedge}
+            errors: Dict[str, str] = {}
+            while pending:
+                remaining = None if deadline is None else deadline - (loop.time() - start)
+                if remaining is not None and remaining <= 0:
+                    break
+                done, pending = await asyncio.wait(pending, timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    break
+                # 同時に終わった場合はメインパイプラインの回答を優先する
+                for task in sorted(done, key=lambda t: t is not primary):
+                    name = mode if task is primary else "simple"
+                    if task.exception() is not None:
+                        errors[name] = f"{type(task.exception()).__name__}: {task.exception()}"
+                        logger.warning(f"ヘッジ実行中のパイプライン '{name}' が失敗しました: {errors[name]}")
+                        continue
+                    elapsed = loop.time() - start
+                    if task is primary:
+                        self.deadline_stats.record(mode, "primary_won")
+                        logger.info(f"ヘッジ実行: メインパイプライン '{mode}' の回答を採用しました ({elapsed:.2f} s)。")
+                    else:
+                        self.deadline_stats.record(mode, "hedge_won")
+                        logger.info(f"ヘッジ実行: simpleパイプラインの回答を採用しました ({elapsed:.2f} s)。")
+                        # メインパイプラインが途中まで送出した断片を取り消し、保留していたsimpleパイプラインの断片を送出する
+                        emit_stream_reset()
+                        forward_stream_events(hedge_queue)
+                    result: MasterAgentResponse = task.result()
+                    return result
+
+            self.deadline_stats.record(mode, "deadline_exceeded")
+            if len(errors) < 2:
+                errors["deadline"] = f"{deadline} s"
+            raise HedgedRunFailed(", ".join(f"{name}: {error}" for name, error in errors.items()))
+        finally:
+            for future in (primary, hedge):
+                if future is not None and not future.done():
+                    future.cancel()
@@ -2,6 +2,7 @@
 # title: Idle Time Manager
 # role: Manages the application's idle state and triggers background tasks.
 
+import contextvars
 import time
 import logging
 import threading
@@ -14,6 +15,10 @@ from app.meta_intelligence.emergent.network import EmergentIntelligenceNetwork
 from app.meta_intelligence.value_evolution.values import EvolvingValueSystem
 from app.memory.memory_consolidator import MemoryConsolidator
 from app.config import settings
+from app.llm.scheduler import LLMPriority, llm_priority
+from app.llm.instrumentation import llm_call_context
+from app.llm.warmup import ModelWarmer
+from app.meta_cognition.reflection_queue import ReflectionQueue
 
 logger = logging.getLogger(__name__)
 
@@ -30,9 +35,13 @@ class IdleManager:
         emergent_network: EmergentIntelligenceNetwork,
         value_system: EvolvingValueSystem,
         memory_consolidator: MemoryConsolidator,
+        model_warmer: Optional[ModelWarmer] = None,
+        reflection_queue: Optional[ReflectionQueue] = None,
     ):
         """
         IdleManagerを初期化します。
+        model_warmerを指定した場合、監視ループごとに、keep_aliveが切れそうなモデルを再読み込みします。
+        reflection_queueを指定した場合、監視ループごとに、応答後の処理を1件ずつ実行します（対話中は待ち時間が長くなった項目のみ）。
         """
         self.self_evolving_system = self_evolving_system
         self.autonomous_agent = autonomous_agent
@@ -40,6 +49,8 @@ class IdleManager:
         self.emergent_network = emergent_network
         self.value_system = value_system
         self.memory_consolidator = memory_consolidator
+        self.model_warmer = model_warmer
+        self.reflection_queue = reflection_queue
 
         self._last_active_time: float = time.time()
         self._is_idle: bool = False
@@ -62,6 +73,21 @@ class IdleManager:
         """
         logger.info("Idle monitor thread started.")
         while not self._stop_event.is_set():
+            # 対話中に使われなかった役割のモデルもあるため、アイドル状態に関わらずkeep_aliveの期限を確認する
+            if self.model_warmer is not None:
+                try:
+                    self.model_warmer.rewarm_if_due()
+                except Exception as e:
+                    logger.error(f"Error during model re-warm: {e}", exc_info=True)
+
+            # 応答後の処理は、他のアイドル時のタスクより先に、新しい回答ほど遅れないよう1件ずつ実行する
+            if self.reflection_queue is not None:
+                try:
+                    with llm_priority(LLMPriority.BACKGROUND), llm_call_context(request_id="reflection", mode="reflection"):
+                        self.reflection_queue.process_due(idle=self._is_idle, max_items=1)
+                except Exception as e:
+                    logger.error(f"Error during reflection queue processing: {e}", exc_info=True)
+
             # アイドル状態の時のみタスクを実行
             if self._is_idle:
                 current_time = time.time()
@@ -84,7 +110,9 @@ class IdleManager:
         if current_time - self._last_run_times[task_name] > interval:
             logger.info(f"Idle time task '{task_name}' is due. Starting execution.")
             try:
-                task_function()
+                # バックグラウンドタスクのLLM呼び出しは、ユーザーとの対話を待たせないよう低優先度で実行する
+                with llm_priority(LLMPriority.BACKGROUND), llm_call_context(request_id=f"idle:{task_name}", mode="idle"):
+                    task_function()
             except Exception as e:
                 logger.error(f"Error during idle task '{task_name}': {e}", exc_info=True)
             finally:
@@ -146,7 +174,9 @@ class IdleManager:
         アイドル監視スレッドを開始します。
         """
         if self._monitor_thread is None:
-            self._monitor_thread = threading.Thread(target=self._monitor_loop, daemon=True)
+            # LLM呼び出しの計測などのコンテキストを引き継ぐため、現在のコンテキストのコピー上で実行する
+            context = contextvars.copy_context()
+            self._monitor_thread = threading.Thread(target=context.run, args=(self._monitor_loop,), daemon=True)
             self._monitor_thread.start()
 
     def stop(self):
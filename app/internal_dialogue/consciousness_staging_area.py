@@ -2,6 +2,7 @@
 # title: 意識のステージングエリア
 # role: 内的対話が行われる「場」を提供し、調停者の指示に従って対話の進行を管理する。
 
+import asyncio
 import logging
 from typing import Any, Dict, List
 from langchain_core.prompts import ChatPromptTemplate
@@ -9,20 +10,21 @@ from langchain_core.runnables import Runnable
 from langchain_core.output_parsers import StrOutputParser
 
 from app.internal_dialogue.mediator_agent import MediatorAgent
+from app.llm.instrumentation import with_agent_label
 
 logger = logging.getLogger(__name__)
 
 class ConsciousnessStagingArea:
     """
     多様な思考エージェントが対話を行う仮想的なステージ。
+    エンジンのパイプラインとして複数のリクエストから並行して使われるため、対話の履歴はインスタンスに持たず、arun_dialogueの呼び出しごとに持つ。
     """
     def __init__(self, llm: Any, mediator_agent: MediatorAgent):
         self.llm = llm
         self.mediator_agent = mediator_agent
         self.output_parser = StrOutputParser()
-        self.dialogue_history: List[str] = []
 
-    def _run_single_turn(self, query: str, participant: Dict[str, str], current_history: str) -> str:
+    async def _arun_single_turn(self, query: str, participant: Dict[str, str], current_history: str) -> str:
         """個々の思考エージェントの意見を生成する。"""
         prompt = ChatPromptTemplate.from_template(
             """あなたは {persona}
@@ -36,8 +38,8 @@ class ConsciousnessStagingArea:
             あなたの意見 (@{name}):
             """
         )
-        chain = prompt | self.llm | self.output_parser
-        response = chain.invoke({
+        chain = with_agent_label(prompt | self.llm | self.output_parser, "ConsciousnessStagingArea")
+        response = await chain.ainvoke({
             "name": participant["name"],
             "persona": participant["persona"],
             "query": query,
@@ -47,9 +49,16 @@ class ConsciousnessStagingArea:
 
     def run_dialogue(self, query: str, participants: List[Dict[str, str]], max_turns: int = 5) -> str:
         """
-        内省的な対話の全プロセスを実行する。
+        内省的な対話の全プロセスを実行する。arun_dialogueの同期ラッパー。
         """
-        self.dialogue_history = []
+        return asyncio.run(self.arun_dialogue(query, participants, max_turns=max_turns))
+
+    async def arun_dialogue(self, query: str, participants: List[Dict[str, str]], max_turns: int = 5) -> str:
+        """
+        内省的な対話の全プロセスを非同期に実行する。
+        各発言はそれまでの議論を参照するため、発言同士は順番に生成する。
+        """
+        dialogue_history: List[str] = []
         logger.info(f"--- 内的対話開始 --- 要求: '{query}'")
         logger.info(f"参加エージェント: {[p['name'] for p in participants]}")
 
@@ -59,17 +68,17 @@ class ConsciousnessStagingArea:
             # 全員に一度ずつ発言させる
             if turn == 0:
                 for p in participants:
-                    statement = self._run_single_turn(query, p, "\n".join(self.dialogue_history))
-                    self.dialogue_history.append(statement)
+                    statement = await self._arun_single_turn(query, p, "\n".join(dialogue_history))
+                    dialogue_history.append(statement)
                     logger.info(statement)
             
             # 調停者が介入
             mediator_input = {
                 "query": query,
-                "dialogue_history": "\n".join(self.dialogue_history)
+                "dialogue_history": "\n".join(dialogue_history)
             }
-            mediator_action = self.mediator_agent.invoke(mediator_input)
-            self.dialogue_history.append(f"@調停者: {mediator_action}")
+            mediator_action = await self.mediator_agent.ainvoke(mediator_input)
+            dialogue_history.append(f"@調停者: {mediator_action}")
             logger.info(f"@調停者: {mediator_action}")
 
             # 結論を出すように指示されたら終了
@@ -81,15 +90,15 @@ class ConsciousnessStagingArea:
             mentioned_agents = [p for p in participants if f"@{p['name']}" in mediator_action]
             if mentioned_agents:
                 for p in mentioned_agents:
-                     statement = self._run_single_turn(query, p, "\n".join(self.dialogue_history))
-                     self.dialogue_history.append(statement)
+                     statement = await self._arun_single_turn(query, p, "\n".join(dialogue_history))
+                     dialogue_history.append(statement)
                      logger.info(statement)
             else: # 指名がない場合は全員に再度発言させる
                  for p in participants:
-                    statement = self._run_single_turn(query, p, "\n".join(self.dialogue_history))
-                    self.dialogue_history.append(statement)
+                    statement = await self._arun_single_turn(query, p, "\n".join(dialogue_history))
+                    dialogue_history.append(statement)
                     logger.info(statement)
 
-        final_summary = "\n".join(self.dialogue_history)
+        final_summary = "\n".join(dialogue_history)
         logger.info("--- 内的対話終了 ---")
         return final_summary
\ No newline at end of file
@@ -4,18 +4,30 @@
 
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.runnables import Runnable
-from langchain_core.output_parsers import JsonOutputParser
-from typing import Any, Dict, List
+from pydantic import BaseModel
+from typing import Any, Dict, List, Optional
 
 from app.agents.base import AIAgent
+from app.llm.structured_output import StructuredOutputStats, build_structured_chain
+
+
+class _Participant(BaseModel):
+    name: str
+    persona: str
+
+
+class _ParticipantList(BaseModel):
+    """LLMが出力する思考エージェントのリストの形式。"""
+    participants: List[_Participant]
+
 
 class DialogueParticipantAgent(AIAgent):
     """
     与えられた要求に応じて、多様な視点を持つ対話参加者（思考エージェント）を生成する。
     """
-    def __init__(self, llm: Any):
+    def __init__(self, llm: Any, structured_output_stats: Optional[StructuredOutputStats] = None):
         self.llm = llm
-        self.output_parser = JsonOutputParser()
+        self.structured_output_stats = structured_output_stats
         self.prompt_template = ChatPromptTemplate.from_template(
             """あなたは、複雑な問題に対して多様な視点を生み出す「アイデアの生成者」です。
             以下のユーザー要求を分析し、この問題について議論すべき、独立した視点を持つ思考エージェント（ペルソナ）を5人、JSON形式で生成してください。
@@ -42,7 +54,10 @@ class DialogueParticipantAgent(AIAgent):
         """
         エージェントのLangChainチェーンを構築します。
         """
-        return self.prompt_template | self.llm | self.output_parser
+        return build_structured_chain(
+            self.prompt_template, self.llm, "DialogueParticipantAgent",
+            stats=self.structured_output_stats, pydantic_object=_ParticipantList,
+        )
 
     def invoke(self, input_data: Dict[str, Any] | str) -> List[Dict[str, str]]:
         if not isinstance(input_data, dict):
@@ -52,4 +67,14 @@ class DialogueParticipantAgent(AIAgent):
             raise RuntimeError("DialogueParticipantAgent's chain is not initialized.")
         
         result: Dict[str, List[Dict[str, str]]] = self._chain.invoke(input_data)
+        return result.get("participants", [])
+
+    async def ainvoke(self, input_data: Dict[str, Any] | str) -> List[Dict[str, str]]:
+        if not isinstance(input_data, dict):
+            raise TypeError("DialogueParticipantAgent expects a dictionary as input.")
+        
+        if self._chain is None:
+            raise RuntimeError("DialogueParticipantAgent's chain is not initialized.")
+        
+        result: Dict[str, List[Dict[str, str]]] = await self._chain.ainvoke(input_data)
         return result.get("participants", [])
\ No newline at end of file
@@ -2,7 +2,7 @@
 # title: 知識グラフデータモデル
 # role: 知識グラフを構成するNode, Edge, KnowledgeGraphのデータ構造を定義する。
 
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Iterable
 from pydantic import BaseModel, Field
 from datetime import datetime
 
@@ -41,8 +41,67 @@ class KnowledgeGraph(BaseModel):
         """
         if not self.nodes and not self.edges:
             return "知識グラフは空です。"
+        return self.format_lines(
+            [self.node_line(n) for n in self.nodes],
+            [self.edge_line(e) for e in self.edges],
+        )
 
-        node_str = "\n".join([f"- ノード: {n.id} (ラベル: {n.label}, プロパティ: {n.properties})" for n in self.nodes])
-        edge_str = "\n".join([f"- 関係: ({e.source})-[{e.label} (信頼度: {e.weight:.2f})]->({e.target})" for e in self.edges])
+    @staticmethod
+    def node_line(node: Node) -> str:
+        """ノード1件をto_stringと同じ形式の1行に変換する。"""
+        return f"- ノード: {node.id} (ラベル: {node.label}, プロパティ: {node.properties})"
 
-        return f"--- 知識グラフ ---\n[ノード]\n{node_str}\n\n[関係]\n{edge_str}\n----------------"
\ No newline at end of file
+    @staticmethod
+    def edge_line(edge: Edge) -> str:
+        """エッジ1件をto_stringと同じ形式の1行に変換する。"""
+        return f"- 関係: ({edge.source})-[{edge.label} (信頼度: {edge.weight:.2f})]->({edge.target})"
+
+    @staticmethod
+    def format_lines(node_lines: List[str], edge_lines: List[str]) -> str:
+        """ノードとエッジの行をto_stringの形式にまとめる。"""
+        node_str = "\n".join(node_lines)
+        edge_str = "\n".join(edge_lines)
+        return f"--- 知識グラフ ---\n[ノード]\n{node_str}\n\n[関係]\n{edge_str}\n----------------"
+
+    def find_mentioned_nodes(self, text: str, min_length: int = 2) -> List[str]:
+        """
+        テキスト中に名前が現れるノードのIDを返す（大文字小文字は区別しない）。
+        短いIDは誤検出が多いため、min_length未満のIDは対象外とする。
+        """
+        lowered = text.lower()
+        matched = [n.id for n in self.nodes if len(n.id) >= min_length and n.id.lower() in lowered]
+        # 「東京タワー」に一致した場合の「東京」のように、より長い一致の一部でしかないものは除く
+        return [m for m in matched if not any(m != other and m.lower() in other.lower() for other in matched)]
+
+    def relevant_subgraph(self, seed_ids: Iterable[str], max_hops: int = 2) -> "KnowledgeGraph":
+        """
+        シードノードからmax_hops以内にあるノードと、それらの間のエッジからなる部分グラフを返す。
+        エッジは向きを無視して辿る。返すグラフのノードはシードからの距離の近い順、
+        エッジは「重み / (1 + シードに近い側の端点の距離)」の大きい順に並ぶため、先頭ほど関連が強い。
+        """
+        node_by_id = {n.id: n for n in self.nodes}
+        adjacency: Dict[str, List[Edge]] = {}
+        for edge in self.edges:
+            adjacency.setdefault(edge.source, []).append(edge)
+            adjacency.setdefault(edge.target, []).append(edge)
+
+        distance: Dict[str, int] = {}
+        frontier: List[str] = []
+        for seed in seed_ids:
+            if seed not in distance and (seed in node_by_id or seed in adjacency):
+                distance[seed] = 0
+                frontier.append(seed)
+        for hop in range(1, max_hops + 1):
+            next_frontier: List[str] = []
+            for node_id in frontier:
+                for edge in adjacency.get(node_id, []):
+                    neighbour = edge.target if edge.source == node_id else edge.source
+                    if neighbour not in distance:
+                        distance[neighbour] = hop
+                        next_frontier.append(neighbour)
+            frontier = next_frontier
+
+        edges = [e for e in self.edges if e.source in distance and e.target in distance]
+        edges.sort(key=lambda e: e.weight / (1 + min(distance[e.source], distance[e.target])), reverse=True)
+        nodes = sorted((node_by_id[i] for i in distance if i in node_by_id), key=lambda n: distance[n.id])
+        return KnowledgeGraph(nodes=nodes, edges=edges)
@@ -5,9 +5,11 @@
 import json
 import logging
 import os
-from typing import Set, Dict
+import threading
+from typing import Iterable, Optional, Set, Dict
 from datetime import datetime
 
+from app.tracing import traced
 from .models import KnowledgeGraph, Node, Edge
 
 logger = logging.getLogger(__name__)
@@ -15,9 +17,11 @@ logger = logging.getLogger(__name__)
 class PersistentKnowledgeGraph:
     """
     ファイルベースで知識グラフを永続化し、更新を管理するクラス。
+    複数のセッションやバックグラウンドのスレッドから共有されるため、グラフの読み書きはlockで排他する。
     """
     def __init__(self, storage_path: str):
         self.storage_path = storage_path
+        self.lock = threading.RLock()
         self.graph = self._load()
 
     def _load(self) -> KnowledgeGraph:
@@ -31,16 +35,22 @@ class PersistentKnowledgeGraph:
                 logger.error(f"永続的知識グラフのロードに失敗しました: {e}. 新しいグラフを作成します。")
         return KnowledgeGraph()
 
+    @traced("PersistentKnowledgeGraph.save", "knowledge_graph")
     def save(self) -> None:
         """現在の知識グラフをストレージに保存する。"""
         try:
             os.makedirs(os.path.dirname(self.storage_path), exist_ok=True)
-            with open(self.storage_path, 'w', encoding='utf-8') as f:
-                f.write(self.graph.model_dump_json(indent=4))
+            # 保存中に終了しても既存のファイルが壊れないよう、一時ファイルに書いてから置き換える
+            tmp_path = f"{self.storage_path}.tmp"
+            with self.lock:
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    f.write(self.graph.model_dump_json(indent=4))
+                os.replace(tmp_path, self.storage_path)
             logger.info(f"知識グラフが {self.storage_path} に保存されました。")
         except IOError as e:
             logger.error(f"知識グラフの保存に失敗しました: {e}")
 
+    @traced("PersistentKnowledgeGraph.merge", "knowledge_graph")
     def merge(self, new_graph: KnowledgeGraph) -> None:
         """
         新しいグラフを既存のグラフにマージする。
@@ -48,6 +58,11 @@ class PersistentKnowledgeGraph:
         if not new_graph:
             return
 
+        with self.lock:
+            self._merge_locked(new_graph)
+        logger.info(f"知識グラフをマージしました。現在のノード数: {len(self.graph.nodes)}, エッジ数: {len(self.graph.edges)}")
+
+    def _merge_locked(self, new_graph: KnowledgeGraph) -> None:
         existing_node_ids: Set[str] = {node.id for node in self.graph.nodes}
         for new_node in new_graph.nodes:
             if new_node.id not in existing_node_ids:
@@ -67,17 +82,36 @@ class PersistentKnowledgeGraph:
             else:
                 self.graph.edges.append(new_edge)
                 edge_map[edge_key] = new_edge
-        
-        logger.info(f"知識グラフをマージしました。現在のノード数: {len(self.graph.nodes)}, エッジ数: {len(self.graph.edges)}")
 
     def get_graph(self) -> KnowledgeGraph:
         """現在のグラフオブジェクトを返す。"""
         return self.graph
 
+    @traced("PersistentKnowledgeGraph.get_relevant_subgraph", "knowledge_graph")
+    def get_relevant_subgraph(self, query: str, seed_ids: Optional[Iterable[str]] = None, max_hops: int = 2) -> KnowledgeGraph:
+        """
+        クエリに名前が現れるエンティティと、指定されたシードノードを起点に、max_hops以内の部分グラフを返す。
+        グラフ全体ではなく、この部分グラフをプロンプトに含めることで、グラフの成長に伴うプロンプトの肥大化を防ぐ。
+        """
+        with self.lock:
+            seeds = self.graph.find_mentioned_nodes(query) + list(seed_ids or [])
+            subgraph = self.graph.relevant_subgraph(seeds, max_hops=max_hops)
+            # 部分グラフのノードは元のグラフと同じオブジェクトのため、そのまま最終アクセス日時を更新できる
+            accessed_at = datetime.utcnow().isoformat()
+            for node in subgraph.nodes:
+                if "last_accessed" in node.metadata:
+                    node.metadata["last_accessed"] = accessed_at
+        logger.debug(
+            f"関連部分グラフを抽出しました (シード: {len(seeds)}, ノード: {len(subgraph.nodes)}/{len(self.graph.nodes)}, "
+            f"エッジ: {len(subgraph.edges)}/{len(self.graph.edges)})"
+        )
+        return subgraph
+
     def access_node(self, node_id: str) -> None:
         """ノードへのアクセスを記録し、最終アクセス日時を更新する。"""
-        for node in self.graph.nodes:
-            if node.id == node_id:
-                if "last_accessed" in node.metadata:
-                    node.metadata["last_accessed"] = datetime.utcnow().isoformat()
-                break
\ No newline at end of file
+        with self.lock:
+            for node in self.graph.nodes:
+                if node.id == node_id:
+                    if "last_accessed" in node.metadata:
+                        node.metadata["last_accessed"] = datetime.utcnow().isoformat()
+                    break
\ No newline at end of file
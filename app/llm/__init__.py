@@ -0,0 +1,12 @@
+# /app/llm/__init__.py
+# title: LLM基盤パッケージ
+# role: LLM呼び出しを横断的に支える仕組み（応答キャッシュなど）をまとめて公開する。
+
+from .fake import FakeOllamaEmbeddings, FakeOllamaLLM, override_container_with_fakes
+from .instrumentation import LLMCallRecorder, install_llm_instrumentation, llm_call_context, with_agent_label
+from .profiles import LLMProfileRegistry
+from .response_cache import ResponseCacheStore, LLMResponseCache
+from .scheduler import LLMPriority, LLMScheduler, ScheduledOllamaLLM, llm_priority
+from .streaming import StreamingLatencyStats, ainvoke_streaming, emit_stream_reset, is_streaming
+from .structured_output import StructuredOutputStats, build_structured_chain, repair_json
+from .warmup import ModelWarmer
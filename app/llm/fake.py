@@ -0,0 +1,410 @@
+# /app/llm/fake.py
+# title: オフライン用の決定的なLLM・埋め込みモデル
+# role: Ollamaを起動せずにパイプライン全体を実行・計測できるよう、各プロンプトの出力形式に沿った応答を返すLLMと、文字bigramに基づく埋め込みモデルを提供する。
+
+from __future__ import annotations
+import asyncio
+import json
+import re
+import threading
+import time
+import zlib
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Mapping, Optional, Tuple, cast
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from pydantic import Field
+
+from app.llm.scheduler import ScheduledOllamaLLM
+from app.llm.structured_output import JSON_REASK_MARKER
+
+# 応答に埋め込むクエリ文字列の最大長
+_MAX_QUERY_CHARS = 60
+
+
+def _extract_after(prompt: str, labels: List[str]) -> str:
+    """
+    プロンプト中の「ラベル: 値」または「ラベル:」の次の行から値を取り出す。
+    見つからない場合は空文字列を返す。
+    """
+    for label in labels:
+        match = re.search(re.escape(label) + r"[^\n:：]*[:：]\**[ \t]*(.*)", prompt)
+        if not match:
+            continue
+        value = match.group(1).strip()
+        if not value:
+            following = prompt[match.end():].lstrip("\n")
+            value = following.split("\n", 1)[0].strip()
+        if value and not value.startswith("---"):
+            return value[:_MAX_QUERY_CHARS]
+    return ""
+
+
+def _query_of(prompt: str) -> str:
+    return _extract_after(prompt, ["ユーザーの要求", "元の要求", "ユーザー要求", "複雑な要求", "要求", "トピック"]) or "ご質問"
+
+
+def _bullets(topic: str, items: List[str]) -> str:
+    return "\n".join(f"- {topic}について、{item}" for item in items)
+
+
+def _knowledge_graph(prompt: str) -> str:
+    text = _extract_after(prompt, ["テキスト"]) or _query_of(prompt)
+    terms = [t for t in re.split(r"[\s、。,.:：「」()（）\-*]+", text) if len(t) >= 2][:3] or ["概念"]
+    nodes = [{"id": t, "label": "Concept", "properties": {"source": "fake"}} for t in terms]
+    edges = [
+        {"source": terms[i], "target": terms[i + 1], "label": "関連する"}
+        for i in range(len(terms) - 1)
+    ]
+    return json.dumps({"nodes": nodes, "edges": edges}, ensure_ascii=False)
+
+
+def _retrieval_evaluation(prompt: str) -> str:
+    return json.dumps({
+        "relevance_score": 9,
+        "completeness_score": 9,
+        "noise_score": 8,
+        "summary": f"「{_query_of(prompt)}」に対して、検索された情報は十分に関連しています。",
+        "suggestions": "現時点で追加の改善は不要です。",
+    }, ensure_ascii=False)
+
+
+def _tool_selection(prompt: str) -> str:
+    match = re.search(r"^- ([^:\n]+):", prompt, re.MULTILINE)
+    tool_name = match.group(1).strip() if match else "WikipediaSearch"
+    quoted = re.search(r"「(.+?)」", prompt)
+    return f"{tool_name}: {quoted.group(1)[:_MAX_QUERY_CHARS] if quoted else _query_of(prompt)}"
+
+
+def _orchestration(prompt: str) -> str:
+    level = _extract_after(prompt, ["要求の複雑性レベル"])
+    mode = {"low": "simple", "medium": "parallel", "high": "full"}.get(level, "simple")
+    return json.dumps({
+        "chosen_mode": mode,
+        "reason": f"複雑性レベルが「{level or '不明'}」であるため、{mode}モードが適していると判断しました。",
+        "agent_configs": {},
+    }, ensure_ascii=False)
+
+
+def _mediator(prompt: str) -> str:
+    if prompt.count("@調停者:") >= 1:
+        return "全員の意見が出揃いましたので、これまでの議論を統合し、結論を導き出してください。"
+    match = re.search(r"^\s*@([^:\n@]+):", prompt, re.MULTILINE)
+    name = match.group(1).strip() if match else "参加者"
+    return f"@{name}さん、他の方の指摘したリスクについて、どのようにお考えですか？"
+
+
+def _participants(prompt: str) -> str:
+    roles = ["楽観主義者", "現実主義者", "倫理学者", "技術者", "利用者代表"]
+    return json.dumps({
+        "participants": [
+            {"name": role, "persona": f"あなたは{role}として、問題を独自の視点から検討する思考エージェントです。"}
+            for role in roles
+        ]
+    }, ensure_ascii=False)
+
+
+def _answer(prompt: str) -> str:
+    query = _query_of(prompt)
+    return (
+        f"「{query}」についてお答えします。\n"
+        f"まず、ご要求の要点を整理すると、背景となる事実と、それに基づく判断の二つに分けて考えることができます。\n"
+        f"関連情報を踏まえると、{query}に関しては複数の観点からの検討が有効です。"
+        f"第一に事実関係を確認し、第二に考えられる選択肢を比較し、第三に実行上の注意点を明らかにすることが大切です。\n"
+        f"以上を踏まえ、状況に応じて最も適した方法を選択されることをお勧めいたします。"
+    )
+
+
+# プロンプト中の特徴的な文字列と、それに対応する応答生成関数の対応表。
+# 上から順に評価されるため、より具体的な文字列を先に並べる。
+_RULES: List[Tuple[str, Callable[[str], str]]] = [
+    ("知識グラフ (JSON):", _knowledge_graph),
+    ("評価結果 (JSON):", _retrieval_evaluation),
+    ("選択したツールとクエリ:", _tool_selection),
+    ("改善された検索クエリ:", lambda p: f"{_query_of(p)}の具体例と背景"),
+    ("選択した実行モードとエージェント設定 (JSON形式):", _orchestration),
+    ("考えられる潜在的な問題や次の疑問 (JSON形式のリスト):", lambda p: json.dumps(
+        [f"{_query_of(p)}の長期的な影響", f"{_query_of(p)}に関する代替案", "実行時に必要な資源"], ensure_ascii=False)),
+    ("改善提案 (JSON形式のリスト):", lambda p: json.dumps([{
+        "area": "CognitiveLoopAgent",
+        "type": "PromptRefinement",
+        "description": "分析結果の各ステップに根拠となる参照情報を明示するようプロンプトを改善する。",
+        "details": {"target": "COGNITIVE_LOOP_AGENT_PROMPT"},
+    }], ensure_ascii=False)),
+    ("予測誤差の分析結果 (JSON):", lambda p: json.dumps({
+        "error_type": "予期せぬ詳細情報",
+        "summary": f"ユーザーは「{_extract_after(p, ['実際のユーザー入力']) or 'ご質問'}」について具体的に尋ねています。",
+        "key_info": [_extract_after(p, ["実際のユーザー入力"])[:20] or "ご質問"],
+    }, ensure_ascii=False)),
+    ("思考エージェントのリスト (JSON):", _participants),
+    ("各コアバリュー", lambda p: json.dumps(
+        {"Helpfulness": 0.1, "Harmlessness": 0.0, "Honesty": 0.0, "Empathy": 0.0})),
+    ("思考モジュールシーケンス", lambda p: "DECOMPOSE, RAG_SEARCH, SYNTHESIZE"),
+    ("次のアクション（質問、要約、または結論の指示）:", _mediator),
+    ("あなたの意見 (@", lambda p: f"私の立場からは、{_query_of(p)}には見過ごされがちなリスクと機会の両方があると考えます。"),
+    ("---\n行動計画:", lambda p: _bullets(_query_of(p), ["関連する事実を検索します。", "論点を整理します。", "結論をまとめます。"])),
+    ("思考プロセスと分析結果:", lambda p: "ステップ1: 関連情報を確認しました。\nステップ2: 論点を整理しました。\n結論: " + _answer(p)),
+    ("抽出されたキーワード:", lambda p: ", ".join(re.findall(r"[^\s、。,]{2,}", _query_of(p))[:3]) or "キーワード"),
+    ("生成された知識", lambda p: _bullets(_extract_after(p, ["キーワードリスト"]) or "キーワード", ["基本的な定義です。"])),
+    ("推測される状態:", lambda p: "ユーザーは具体的な情報を求めており、落ち着いた状態にあると推測されます。"),
+    ("あなたは情報検証の専門家です", lambda p: "問題なし"),
+    ("知識グラフの断片:", lambda p: "問題なし"),
+    ("**メタ認知評価と改善提案:**", lambda p: "計画は概ね妥当ですが、分析結果に根拠の明示が不足している箇所があります。参照情報の出典を示すと、より説得力が増します。"),
+    ("抽出された知恵:", lambda p: _bullets("知識", ["事実は関係性の中で意味を持ちます。", "予測誤差は学習の機会です。", "多様な視点は理解を深めます。"])),
+    ("適用を決定した改善", lambda p: "- 分析結果に根拠を明示するプロンプト改善を適用します。理由: 回答の信頼性が向上するためです。"),
+    ("統合される知識:", lambda p: _bullets("対話", ["新しい事実が確認されました。"])),
+    ("予測される次のユーザーの発言/意図:", lambda p: "ユーザーは直前の話題について、より具体的な説明を求めると予測されます。"),
+    ("ワールドモデル更新のための内省メモ", lambda p: "- ユーザーは具体的な情報を重視する。\n- 話題は継続している。"),
+    ("分解されたサブタスクリスト:", lambda p: _bullets(_query_of(p), ["前提を確認する。", "要素に分解する。", "順に検討する。"])),
+    ("批判的な評価:", lambda p: "前提の検証が不十分であり、代替案の比較が欠けています。"),
+    ("統合された要約/結論:", _answer),
+    ("統合された洞察と最終回答:", _answer),
+    ("統合・選択された最終回答:", _answer),
+    ("検証・統合された最終回答:", _answer),
+    ("ペルソナとしての回答:", lambda p: f"私の視点から見ると、{_query_of(p)}には独自の意義があります。"),
+    ("思考ドラフト:", lambda p: f"{_query_of(p)}について、思いつく観点を列挙します。事実、影響、対策。"),
+    ("統合された知識（箇条書き）:", lambda p: _bullets(_query_of(p), ["主要な事実です。"])),
+    ("最終回答:", _answer),
+]
+
+
+def generate_fake_response(prompt: str) -> str:
+    """プロンプトの出力形式に沿った決定的な応答を生成する。"""
+    if JSON_REASK_MARKER in prompt:
+        # JSON出力の再要求には、元のプロンプトに対する応答を返し直す
+        prompt = prompt.split(JSON_REASK_MARKER, 1)[0]
+    for marker, generate in _RULES:
+        if marker in prompt:
+            return generate(prompt)
+    if "JSON" in prompt:
+        return "{}"
+    return _answer(prompt)
+
+
+class FakeLLMUsage:
+    """
+    FakeOllamaLLMの呼び出し数と入出力文字数の累計。役割ごとに作られる複数のインスタンスで共有し、合計とモデル別の内訳を集計する。
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._totals: Dict[str, int] = {"calls": 0, "prompt_chars": 0, "completion_chars": 0}
+        self._by_model: Dict[str, Dict[str, int]] = {}
+        self._json_responses = 0
+
+    def record(self, model: str, prompt_chars: int, completion_chars: int) -> None:
+        with self._lock:
+            for totals in (self._totals, self._by_model.setdefault(model, {"calls": 0, "prompt_chars": 0, "completion_chars": 0})):
+                totals["calls"] += 1
+                totals["prompt_chars"] += prompt_chars
+                totals["completion_chars"] += completion_chars
+
+    def next_json_response(self) -> int:
+        """JSONを返す応答の通し番号を返す。"""
+        with self._lock:
+            self._json_responses += 1
+            return self._json_responses
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {**self._totals, "by_model": {model: dict(t) for model, t in self._by_model.items()}}
+
+    def reset(self) -> None:
+        with self._lock:
+            self._totals = {"calls": 0, "prompt_chars": 0, "completion_chars": 0}
+            self._by_model = {}
+
+
+class FakeOllamaLLM(ScheduledOllamaLLM):
+    """
+    Ollamaサーバーへの通信部分のみを置き換えたOllamaLLM。
+    スケジューラ、キャッシュ、コールバック、ストリーミングなどの上位の処理は本物と同じ経路を通る。
+    応答はgenerate_fake_responseで生成され、トークンごとに指定された遅延を挟んで返される。
+    num_predictとstopは本物と同様に出力を打ち切る。
+    """
+    first_token_latency_seconds: float = 0.0
+    token_latency_seconds: float = 0.0
+    # モデル名ごとの(最初のトークンまでの遅延, 1トークンあたりの遅延)。指定の無いモデルには上の2つの値を用いる。
+    # モデルの大きさによる速度の違いを模擬するため、実行中にモデルが変更された場合も呼び出しごとに参照する。
+    latency_by_model: Dict[str, Tuple[float, float]] = Field(default_factory=dict)
+    chars_per_token: int = 2
+    # 0より大きい場合、JSONを返す応答のうちこの件数に1件を崩した形で返す（修復と再要求の経路を計測するため）。
+    # 崩し方は、説明文付きで途中切れのもの（修復可能）と、JSONを含まないもの（再要求が必要）を交互に用いる。
+    malformed_json_every: int = 0
+    usage: FakeLLMUsage = Field(default_factory=FakeLLMUsage)
+
+    def _latency(self) -> Tuple[float, float]:
+        return self.latency_by_model.get(self.model, (self.first_token_latency_seconds, self.token_latency_seconds))
+
+    def _malform_json(self, prompt: str, text: str) -> str:
+        if self.malformed_json_every <= 0 or JSON_REASK_MARKER in prompt or text[:1] not in "{[":
+            return text
+        count = self.usage.next_json_response()
+        if count % self.malformed_json_every:
+            return text
+        if (count // self.malformed_json_every) % 2:
+            return f"以下が結果です: {text[:max(1, len(text) * 2 // 3)]}"
+        return "申し訳ありませんが、JSON形式で出力できませんでした。"
+
+    def _plan_response(self, prompt: str, stop: Optional[List[str]]) -> List[str]:
+        text = self._malform_json(prompt, generate_fake_response(prompt))
+        for sequence in stop or self.stop or []:
+            if sequence and sequence in text:
+                text = text[:text.index(sequence)]
+        size = max(1, self.chars_per_token)
+        tokens = [text[i:i + size] for i in range(0, len(text), size)]
+        if self.num_predict is not None and self.num_predict >= 0:
+            tokens = tokens[:self.num_predict]
+        self.usage.record(self.model, len(prompt), sum(len(t) for t in tokens))
+        return tokens
+
+    def _stream_part(self, token: str) -> Mapping[str, Any]:
+        return {"model": self.model, "response": token, "done": False}
+
+    def _final_part(self, prompt: str, tokens: List[str]) -> Mapping[str, Any]:
+        return {
+            "model": self.model,
+            "response": "",
+            "done": True,
+            "done_reason": "length" if self.num_predict is not None and len(tokens) >= self.num_predict else "stop",
+            "prompt_eval_count": len(prompt),
+            "eval_count": len(tokens),
+        }
+
+    def _create_generate_stream(
+        self,
+        prompt: str,
+        stop: Optional[List[str]] = None,
+        **kwargs: Any,
+    ) -> Iterator[Mapping[str, Any] | str]:
+        tokens = self._plan_response(prompt, stop)
+        first_token_latency, token_latency = self._latency()
+        if first_token_latency:
+            time.sleep(first_token_latency)
+        for token in tokens:
+            if token_latency:
+                time.sleep(token_latency)
+            yield self._stream_part(token)
+        yield self._final_part(prompt, tokens)
+
+    async def _acreate_generate_stream(
+        self,
+        prompt: str,
+        stop: Optional[List[str]] = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[Mapping[str, Any] | str]:
+        tokens = self._plan_response(prompt, stop)
+        first_token_latency, token_latency = self._latency()
+        if first_token_latency:
+            await asyncio.sleep(first_token_latency)
+        for token in tokens:
+            if token_latency:
+                await asyncio.sleep(token_latency)
+            yield self._stream_part(token)
+        yield self._final_part(prompt, tokens)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        生成を行った呼び出し数と、プロンプト・応答の文字数の累計を返す。
+        usageを共有するすべてのインスタンスの合計で、by_modelにモデル別の内訳が入る。
+        """
+        return self.usage.get_stats()
+
+    def reset_stats(self) -> None:
+        """累計値をリセットする。"""
+        self.usage.reset()
+
+
+class FakeOllamaEmbeddings(Embeddings):
+    """
+    文字bigramを固定次元に射影して正規化する、決定的な埋め込みモデル。
+    文字列の重なりが多いほどコサイン類似度が高くなるため、検索結果もある程度意味を持つ。
+    """
+    def __init__(self, model: str = "fake-embedding", dimensions: int = 768, latency_seconds: float = 0.0):
+        self.model = model
+        self.dimensions = dimensions
+        self.latency_seconds = latency_seconds
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.texts = 0
+
+    def _embed(self, text: str) -> List[float]:
+        vector = np.zeros(self.dimensions, dtype=np.float32)
+        padded = f" {text} "
+        for i in range(len(padded) - 1):
+            bucket = zlib.crc32(padded[i:i + 2].encode("utf-8"))
+            vector[bucket % self.dimensions] += 1.0 if (bucket >> 16) & 1 else -1.0
+        norm = float(np.linalg.norm(vector))
+        if norm > 0:
+            vector /= norm
+        return vector.tolist()
+
+    def _record(self, count: int) -> None:
+        with self._lock:
+            self.calls += 1
+            self.texts += count
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        self._record(len(texts))
+        if self.latency_seconds:
+            time.sleep(self.latency_seconds * len(texts))
+        return [self._embed(t) for t in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        self._record(len(texts))
+        if self.latency_seconds:
+            await asyncio.sleep(self.latency_seconds * len(texts))
+        return [self._embed(t) for t in texts]
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return (await self.aembed_documents([text]))[0]
+
+
+def override_container_with_fakes(
+    container: Any,
+    token_latency_seconds: float = 0.0,
+    first_token_latency_seconds: float = 0.0,
+    embedding_latency_seconds: float = 0.0,
+    malformed_json_every: int = 0,
+    latency_by_model: Optional[Dict[str, Tuple[float, float]]] = None,
+    profile_overrides: Optional[Dict[str, Dict[str, Any]]] = None,
+) -> Tuple[FakeOllamaLLM, FakeOllamaEmbeddings]:
+    """
+    Containerの役割ごとのLLMと埋め込みモデルを、オフライン用の実装で上書きする。
+    役割ごとの生成設定（AGENT_LLM_PROFILESとprofile_overrides）はそのまま使われ、すべてのLLMが呼び出しの集計を共有する。
+    計測の妨げにならないよう、応答キャッシュは使用せず、Ollamaに接続するモデルのウォームアップも無効にする。
+    Containerのプロバイダが解決される前に呼び出すこと。
+    生成用（generation）のLLMを返す。そのget_statsはすべての役割の合計となる。
+    """
+    from dependency_injector import providers
+
+    from app.config import settings
+    from app.llm.profiles import LLMProfileRegistry
+
+    usage = FakeLLMUsage()
+
+    def create_llm(**llm_settings: Any) -> FakeOllamaLLM:
+        return FakeOllamaLLM(
+            **llm_settings,
+            token_latency_seconds=token_latency_seconds,
+            first_token_latency_seconds=first_token_latency_seconds,
+            latency_by_model=latency_by_model or {},
+            malformed_json_every=malformed_json_every,
+            usage=usage,
+        )
+
+    registry = LLMProfileRegistry(
+        base_settings=settings.GENERATION_LLM_SETTINGS,
+        profiles=cast(Dict[str, Dict[str, Any]], settings.AGENT_LLM_PROFILES),
+        overrides=profile_overrides,
+        scheduler=container.llm_scheduler(),
+        cache_store=None,
+        llm_factory=create_llm,
+    )
+    embeddings = FakeOllamaEmbeddings(model=settings.EMBEDDING_MODEL_NAME, latency_seconds=embedding_latency_seconds)
+    container.llm_profile_registry.override(providers.Object(registry))
+    container.embeddings.override(providers.Object(embeddings))
+    container.model_warmer.override(providers.Object(None))
+    return registry.get("generation"), embeddings
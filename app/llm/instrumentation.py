@@ -0,0 +1,341 @@
+# /app/llm/instrumentation.py
+# title: LLM呼び出し計測
+# role: LangChainのコールバックを利用して、チェーン実行ごとのエージェント名・実行モード・入出力サイズ・待ち時間・生成時間・パース時間を記録し、JSONLとPrometheus形式で出力する。
+
+from __future__ import annotations
+import contextlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.outputs import LLMResult
+from langchain_core.runnables import Runnable
+from langchain_core.tracers.context import register_configure_hook
+
+from app.llm.scheduler import QUEUE_WAIT_EVENT, get_current_priority
+from app.models import LLMCallRecord
+from app.tracing import current_span_context, record_span
+
+logger = logging.getLogger(__name__)
+
+# 計測が有効なコンテキストで使用されるレコーダー。
+# configure hookとして登録しているため、このコンテキスト内で実行されるすべてのRunnableに自動的に付与される。
+_active_recorder: ContextVar[Optional["LLMCallRecorder"]] = ContextVar("llm_call_recorder", default=None)
+register_configure_hook(_active_recorder, inheritable=True)
+
+# 現在のリクエストIDと実行モード。レコードの付帯情報として使用する。
+_call_context: ContextVar[Dict[str, Optional[str]]] = ContextVar("llm_call_context", default={})
+
+
+@contextlib.contextmanager
+def llm_call_context(request_id: Optional[str] = None, mode: Optional[str] = None) -> Iterator[None]:
+    """
+    ブロック内で行われるLLM呼び出しに、リクエストIDと実行モードを関連付ける。
+    指定しなかった項目は外側のコンテキストの値を引き継ぐ。
+    """
+    current = dict(_call_context.get())
+    if request_id is not None:
+        current["request_id"] = request_id
+    if mode is not None:
+        current["mode"] = mode
+    token = _call_context.set(current)
+    try:
+        yield
+    finally:
+        _call_context.reset(token)
+
+
+def current_request_id() -> Optional[str]:
+    """llm_call_contextで指定された現在のリクエストIDを返す。指定されていない場合はNoneを返す。"""
+    return _call_context.get().get("request_id")
+
+
+def with_agent_label(chain: Runnable, agent: str) -> Runnable:
+    """
+    チェーンにエージェント名を付与する。
+    名前はメタデータとして子の実行に引き継がれ、LLM呼び出しのレコードの agent 列になる。
+    """
+    return chain.with_config(run_name=agent, metadata={"agent": agent})
+
+
+class _PendingCall:
+    """LLM呼び出しの開始から、後続のパーサーの完了までの計測中の状態。"""
+    def __init__(self, record: LLMCallRecord, started_at: float):
+        self.record = record
+        self.started_at = started_at
+        self.ended_at: Optional[float] = None
+        # 呼び出しを開始した時点のトレースのスパン。完了時にその子のスパンとして記録する
+        self.trace_parent = current_span_context()
+
+
+class LLMCallRecorder(BaseCallbackHandler):
+    """
+    LLM呼び出しを1件ずつ記録するコールバックハンドラ。
+    プロンプト→LLM→パーサーからなるチェーンでは、LLMの完了後に同じ親の下で実行されるパーサーの時間をパース時間とする。
+    待ち時間は、ScheduledOllamaLLMが実行枠を得た時点で送出するカスタムイベントから取得する。
+    """
+    # 非同期実行時もイベントループ上で直接呼び出させ、スレッドプールへの受け渡しを避ける
+    run_inline = True
+
+    def __init__(
+        self,
+        jsonl_path: Optional[str] = None,
+        prometheus_path: Optional[str] = None,
+        max_requests: int = 100,
+    ):
+        self.jsonl_path = jsonl_path
+        self.prometheus_path = prometheus_path
+        self.max_requests = max_requests
+        self._lock = threading.Lock()
+        self._calls: Dict[UUID, _PendingCall] = {}
+        # LLMの完了後、親チェーン（とその中のパーサー）の完了を待っているレコード。キーは親の実行ID
+        self._awaiting_parent: Dict[UUID, _PendingCall] = {}
+        self._parsers: Dict[UUID, Tuple[UUID, float]] = {}
+        self._by_request: "OrderedDict[str, List[LLMCallRecord]]" = OrderedDict()
+        self._totals: Dict[Tuple[str, str], Dict[str, float]] = {}
+
+        for path in (jsonl_path, prometheus_path):
+            directory = os.path.dirname(path) if path else ""
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+
+    # --- コールバック ---
+    def on_llm_start(
+        self,
+        serialized: Dict[str, Any],
+        prompts: List[str],
+        *,
+        run_id: UUID,
+        parent_run_id: Optional[UUID] = None,
+        metadata: Optional[Dict[str, Any]] = None,
+        **kwargs: Any,
+    ) -> None:
+        metadata = metadata or {}
+        context = _call_context.get()
+        record: LLMCallRecord = {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "request_id": context.get("request_id") or "",
+            "mode": context.get("mode") or "none",
+            "agent": str(metadata.get("agent", "unknown")),
+            "model": str(metadata.get("ls_model_name", "")),
+            "priority": get_current_priority().value,
+            "prompt_chars": sum(len(p) for p in prompts),
+            "output_chars": 0,
+            "queue_wait": 0.0,
+            "generation_time": 0.0,
+            "parse_time": 0.0,
+            "error": None,
+        }
+        with self._lock:
+            self._calls[run_id] = _PendingCall(record, time.perf_counter())
+
+    def on_custom_event(self, name: str, data: Any, *, run_id: UUID, **kwargs: Any) -> None:
+        if name != QUEUE_WAIT_EVENT:
+            return
+        with self._lock:
+            call = self._calls.get(run_id)
+            if call is not None:
+                call.record["queue_wait"] = float(data.get("queue_wait", 0.0))
+
+    def on_llm_end(self, response: LLMResult, *, run_id: UUID, parent_run_id: Optional[UUID] = None, **kwargs: Any) -> None:
+        now = time.perf_counter()
+        finished: Optional[_PendingCall] = None
+        with self._lock:
+            call = self._calls.pop(run_id, None)
+            if call is None:
+                return
+            call.ended_at = now
+            call.record["generation_time"] = max(0.0, now - call.started_at - call.record["queue_wait"])
+            call.record["output_chars"] = sum(len(g.text) for gens in response.generations for g in gens)
+            if parent_run_id is None:
+                finished = call
+            else:
+                # 同じ親の下で先に完了していたLLM呼び出しがあれば、それはここで確定させる
+                finished = self._awaiting_parent.pop(parent_run_id, None)
+                self._awaiting_parent[parent_run_id] = call
+        if finished is not None:
+            self._finish(finished)
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        now = time.perf_counter()
+        with self._lock:
+            call = self._calls.pop(run_id, None)
+        if call is None:
+            return
+        call.record["generation_time"] = max(0.0, now - call.started_at - call.record["queue_wait"])
+        call.record["error"] = f"{type(error).__name__}: {error}"
+        self._finish(call)
+
+    def on_chain_start(
+        self,
+        serialized: Dict[str, Any],
+        inputs: Dict[str, Any],
+        *,
+        run_id: UUID,
+        parent_run_id: Optional[UUID] = None,
+        **kwargs: Any,
+    ) -> None:
+        if kwargs.get("run_type") == "parser" and parent_run_id is not None:
+            with self._lock:
+                self._parsers[run_id] = (parent_run_id, time.perf_counter())
+
+    def on_chain_end(self, outputs: Any, *, run_id: UUID, **kwargs: Any) -> None:
+        self._on_chain_finished(run_id, None)
+
+    def on_chain_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        self._on_chain_finished(run_id, f"{type(error).__name__}: {error}")
+
+    def _on_chain_finished(self, run_id: UUID, error: Optional[str]) -> None:
+        now = time.perf_counter()
+        finished: Optional[_PendingCall] = None
+        with self._lock:
+            parser = self._parsers.pop(run_id, None)
+            if parser is not None:
+                parent_run_id, parser_started_at = parser
+                call = self._awaiting_parent.get(parent_run_id)
+                if call is not None and call.ended_at is not None:
+                    # ストリーミング時はパーサーが生成と並行して動くため、生成完了後の時間のみを数える
+                    call.record["parse_time"] += max(0.0, now - max(parser_started_at, call.ended_at))
+                    if error is not None:
+                        call.record["error"] = error
+                return
+            finished = self._awaiting_parent.pop(run_id, None)
+        if finished is not None:
+            if error is not None and finished.record["error"] is None:
+                finished.record["error"] = error
+            self._finish(finished)
+
+    # --- 集計と出力 ---
+    def _finish(self, call: _PendingCall) -> None:
+        record = call.record
+        record_span(
+            call.trace_parent, f"llm.{record['agent']}", "llm", call.started_at, time.perf_counter(),
+            model=record["model"], queue_wait=record["queue_wait"], generation_time=record["generation_time"],
+            prompt_chars=record["prompt_chars"], output_chars=record["output_chars"], error=record["error"],
+        )
+        with self._lock:
+            request_id = record["request_id"]
+            if request_id:
+                self._by_request.setdefault(request_id, []).append(record)
+                self._by_request.move_to_end(request_id)
+                while len(self._by_request) > self.max_requests:
+                    self._by_request.popitem(last=False)
+            totals = self._totals.setdefault(
+                (record["agent"], record["mode"]),
+                {"calls": 0, "errors": 0, "prompt_chars": 0, "output_chars": 0, "queue_wait": 0.0, "generation_time": 0.0, "parse_time": 0.0},
+            )
+            totals["calls"] += 1
+            totals["errors"] += 1 if record["error"] else 0
+            for key in ("prompt_chars", "output_chars", "queue_wait", "generation_time", "parse_time"):
+                totals[key] += record[key]  # type: ignore[literal-required]
+        logger.debug(
+            f"LLM呼び出し: {record['agent']} (mode: {record['mode']}, 待ち: {record['queue_wait']:.2f} s, "
+            f"生成: {record['generation_time']:.2f} s, パース: {record['parse_time']:.3f} s)"
+        )
+        if self.jsonl_path:
+            try:
+                with open(self.jsonl_path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            except IOError as e:
+                logger.error(f"LLM呼び出しログの書き込みに失敗しました {self.jsonl_path}: {e}")
+
+    def get_request_records(self, request_id: str) -> List[LLMCallRecord]:
+        """指定したリクエストで行われたLLM呼び出しのレコードを、完了順に返す。"""
+        with self._lock:
+            return list(self._by_request.get(request_id, []))
+
+    def get_request_breakdown(self, request_id: str) -> List[Dict[str, Any]]:
+        """指定したリクエストのLLM呼び出しをエージェントごとに集計し、生成時間の長い順に返す。"""
+        breakdown: Dict[str, Dict[str, Any]] = {}
+        for record in self.get_request_records(request_id):
+            row = breakdown.setdefault(record["agent"], {
+                "agent": record["agent"], "calls": 0, "errors": 0, "prompt_chars": 0, "output_chars": 0,
+                "queue_wait": 0.0, "generation_time": 0.0, "parse_time": 0.0,
+            })
+            row["calls"] += 1
+            row["errors"] += 1 if record["error"] else 0
+            for key in ("prompt_chars", "output_chars", "queue_wait", "generation_time", "parse_time"):
+                row[key] += record[key]  # type: ignore[literal-required]
+        return sorted(breakdown.values(), key=lambda r: r["generation_time"], reverse=True)
+
+    def format_request_breakdown(self, request_id: str) -> str:
+        """get_request_breakdownの結果を表示用の表に整形する。"""
+        rows = self.get_request_breakdown(request_id)
+        if not rows:
+            return "LLM呼び出しは記録されていません。"
+        header = f"{'agent':<40} {'calls':>5} {'wait_s':>8} {'gen_s':>8} {'parse_s':>8} {'prompt':>8} {'output':>8}"
+        lines = [header, "-" * len(header)]
+        for r in rows:
+            lines.append(
+                f"{r['agent'][:40]:<40} {r['calls']:>5} {r['queue_wait']:>8.2f} {r['generation_time']:>8.2f} "
+                f"{r['parse_time']:>8.3f} {r['prompt_chars']:>8} {r['output_chars']:>8}"
+            )
+        total_gen = sum(r["generation_time"] for r in rows)
+        total_wait = sum(r["queue_wait"] for r in rows)
+        lines.append(f"合計: {sum(r['calls'] for r in rows)}回, 待ち {total_wait:.2f} s, 生成 {total_gen:.2f} s")
+        return "\n".join(lines)
+
+    def render_prometheus(self) -> str:
+        """エージェント・実行モードごとの累積値を、Prometheusのテキスト形式で返す。"""
+        with self._lock:
+            totals = {key: dict(value) for key, value in self._totals.items()}
+        metrics = [
+            ("luca_llm_calls_total", "counter", "Number of LLM calls.", "calls"),
+            ("luca_llm_errors_total", "counter", "Number of failed LLM calls.", "errors"),
+            ("luca_llm_prompt_chars_total", "counter", "Characters sent to the LLM.", "prompt_chars"),
+            ("luca_llm_output_chars_total", "counter", "Characters generated by the LLM.", "output_chars"),
+            ("luca_llm_queue_wait_seconds_total", "counter", "Time spent waiting for a scheduler slot.", "queue_wait"),
+            ("luca_llm_generation_seconds_total", "counter", "Time spent generating.", "generation_time"),
+            ("luca_llm_parse_seconds_total", "counter", "Time spent parsing LLM output.", "parse_time"),
+        ]
+        lines: List[str] = []
+        for name, metric_type, help_text, key in metrics:
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {metric_type}")
+            for (agent, mode), values in sorted(totals.items()):
+                labels = f'agent="{_escape_label(agent)}",mode="{_escape_label(mode)}"'
+                lines.append(f"{name}{{{labels}}} {values[key]:g}")
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus_snapshot(self, path: Optional[str] = None) -> None:
+        """render_prometheusの内容をファイルへ書き出す。node_exporterのtextfile collectorで読めるよう、置き換えは原子的に行う。"""
+        path = path or self.prometheus_path
+        if not path:
+            return
+        tmp_path = f"{path}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(self.render_prometheus())
+            os.replace(tmp_path, path)
+        except IOError as e:
+            logger.error(f"Prometheusスナップショットの書き込みに失敗しました {path}: {e}")
+
+
+def _escape_label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def install_llm_instrumentation(recorder: LLMCallRecorder, enabled: bool = True) -> Iterator[Optional[LLMCallRecorder]]:
+    """
+    レコーダーを現在のコンテキストで有効にするContainerのリソース。
+    以降にこのコンテキストから開始されたasyncio.runやスレッド（コンテキストを引き継ぐもの）の中のLLM呼び出しが記録される。
+    終了時にPrometheusスナップショットを書き出す。
+    """
+    if not enabled:
+        yield None
+        return
+    _active_recorder.set(recorder)
+    logger.info(f"LLM呼び出しの計測を有効にしました (JSONL: {recorder.jsonl_path}, Prometheus: {recorder.prometheus_path})")
+    try:
+        yield recorder
+    finally:
+        recorder.write_prometheus_snapshot()
+        _active_recorder.set(None)
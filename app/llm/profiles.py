@@ -0,0 +1,138 @@
+# /app/llm/profiles.py
+# title: エージェント別LLMプロファイル
+# role: エージェントの役割ごとに、使用するモデルと生成設定（temperature、最大出力トークン数、停止文字列）を対応付け、役割ごとのLLMインスタンスを提供する。設定は実行中にも上書きできる。
+
+from __future__ import annotations
+import logging
+import threading
+from typing import Any, Callable, Dict, List, Optional
+
+from app.llm.response_cache import LLMResponseCache, ResponseCacheStore
+from app.llm.scheduler import ScheduledOllamaLLM
+
+logger = logging.getLogger(__name__)
+
+# プロファイルのうち、LLMの生成設定ではなくレジストリが解釈するキー。Trueの場合、その役割のLLMに応答キャッシュを付ける。
+CACHE_KEY = "cache"
+
+
+class LLMProfileRegistry:
+    """
+    役割名からLLMインスタンスを引くレジストリ。
+    各役割の設定は、基本設定（GENERATION_LLM_SETTINGS）に役割ごとの差分を重ねたものとなる。
+    インスタンスは役割ごとに1つ作られ、overrideで設定を変更すると、そのインスタンスを保持するエージェントにも次の呼び出しから反映される。
+    """
+    def __init__(
+        self,
+        base_settings: Dict[str, Any],
+        profiles: Dict[str, Dict[str, Any]],
+        overrides: Optional[Dict[str, Dict[str, Any]]] = None,
+        scheduler: Optional[Any] = None,
+        cache_store: Optional[ResponseCacheStore] = None,
+        llm_factory: Callable[..., Any] = ScheduledOllamaLLM,
+        default_role: str = "generation",
+    ):
+        """
+        Args:
+            base_settings: すべての役割に共通する生成設定。
+            profiles: 役割名ごとの、基本設定に対する差分。
+            overrides: 起動時に適用する、役割名ごとの追加の差分（環境変数からの指定など）。
+            scheduler: LLMに渡すLLMScheduler。
+            cache_store: 応答キャッシュの保存先。Noneの場合、cacheを指定した役割でもキャッシュを使用しない。
+            llm_factory: 生成設定を受け取ってLLMを作成する関数。オフライン実行ではFakeOllamaLLMなどに差し替える。
+            default_role: 未定義の役割に用いる役割名。
+        """
+        self.base_settings = dict(base_settings)
+        self.scheduler = scheduler
+        self.cache_store = cache_store
+        self.llm_factory = llm_factory
+        self.default_role = default_role
+        self._lock = threading.Lock()
+        self._profiles: Dict[str, Dict[str, Any]] = {role: dict(profile) for role, profile in profiles.items()}
+        self._profiles.setdefault(default_role, {})
+        for role, profile in (overrides or {}).items():
+            self._profiles.setdefault(role, {}).update(profile)
+        self._instances: Dict[str, Any] = {}
+
+    def roles(self) -> List[str]:
+        """定義されている役割名の一覧を返す。"""
+        with self._lock:
+            return list(self._profiles)
+
+    def models(self) -> List[str]:
+        """すべての役割で使用するモデル名を、重複を除いて返す。実行中の上書きも反映する。"""
+        with self._lock:
+            resolved = [self._resolve_locked(role).get("model") for role in self._profiles]
+        return list(dict.fromkeys(str(model) for model in resolved if model))
+
+    def _resolve_locked(self, role: str) -> Dict[str, Any]:
+        profile = self._profiles.get(role)
+        if profile is None:
+            profile = self._profiles[self.default_role]
+        return {**self.base_settings, **profile}
+
+    def resolve(self, role: str) -> Dict[str, Any]:
+        """役割の実効設定（基本設定に差分を重ねたもの）を返す。"""
+        with self._lock:
+            return self._resolve_locked(role)
+
+    def _make_cache(self, settings: Dict[str, Any]) -> Optional[LLMResponseCache]:
+        if not settings.get(CACHE_KEY) or self.cache_store is None:
+            return None
+        return LLMResponseCache(store=self.cache_store, llm_settings=self._llm_settings(settings))
+
+    @staticmethod
+    def _llm_settings(settings: Dict[str, Any]) -> Dict[str, Any]:
+        return {k: v for k, v in settings.items() if k != CACHE_KEY}
+
+    def get(self, role: str) -> Any:
+        """役割に対応するLLMを返す。初回の呼び出し時に作成する。"""
+        with self._lock:
+            llm = self._instances.get(role)
+            if llm is None:
+                settings = self._resolve_locked(role)
+                llm = self.llm_factory(
+                    **self._llm_settings(settings),
+                    scheduler=self.scheduler,
+                    cache=self._make_cache(settings),
+                )
+                self._instances[role] = llm
+                logger.info(f"LLMプロファイル '{role}' を初期化しました: {self._llm_settings(settings)}")
+            return llm
+
+    def override(self, role: str, **settings: Any) -> None:
+        """
+        役割の設定を実行中に上書きする。Noneを指定した項目は基本設定の値に戻る。
+        作成済みのLLMにも直ちに反映され、応答キャッシュは新しい設定に対応するものに切り替わる。
+        """
+        with self._lock:
+            profile = self._profiles.setdefault(role, dict(self._profiles[self.default_role]))
+            for key, value in settings.items():
+                if value is None:
+                    profile.pop(key, None)
+                else:
+                    profile[key] = value
+            llm = self._instances.get(role)
+            if llm is None:
+                return
+            resolved = self._resolve_locked(role)
+            for key in set(self._llm_settings(settings)) | set(self._llm_settings(resolved)):
+                if key in type(llm).model_fields:
+                    setattr(llm, key, resolved.get(key, type(llm).model_fields[key].default))
+            llm.cache = self._make_cache(resolved)
+        logger.info(f"LLMプロファイル '{role}' を上書きしました: {self._llm_settings(resolved)}")
+
+    def get_cache_stats(self) -> Dict[str, Any]:
+        """応答キャッシュを使用している役割ごとのキャッシュ統計を返す。"""
+        with self._lock:
+            instances = dict(self._instances)
+        return {
+            role: llm.cache.get_stats()
+            for role, llm in instances.items()
+            if isinstance(getattr(llm, "cache", None), LLMResponseCache)
+        }
+
+    def describe(self) -> Dict[str, Dict[str, Any]]:
+        """すべての役割の実効設定を返す。"""
+        with self._lock:
+            return {role: self._llm_settings(self._resolve_locked(role)) for role in self._profiles}
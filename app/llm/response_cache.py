@@ -0,0 +1,172 @@
+# /app/llm/response_cache.py
+# title: LLM応答キャッシュ
+# role: レンダリング済みプロンプトとモデル設定をキーに、LLMの応答をローカルディスク（SQLite）へ永続化して再利用する。
+
+from __future__ import annotations
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from langchain_core.caches import BaseCache, RETURN_VAL_TYPE
+from langchain_core.outputs import Generation
+
+logger = logging.getLogger(__name__)
+
+
+class ResponseCacheStore:
+    """
+    LLM応答を保存するSQLiteベースのストア。
+    最大件数を超えた場合はLRUで、有効期限(TTL)を過ぎたエントリは参照時に削除する。
+    複数のLLMResponseCacheから共有されることを想定し、スレッドセーフに実装されている。
+    """
+    def __init__(self, path: str, max_entries: int, ttl_seconds: float):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+
+        cache_dir = os.path.dirname(path)
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS llm_responses (
+                key TEXT PRIMARY KEY,
+                model TEXT NOT NULL,
+                value TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_accessed REAL NOT NULL
+            )"""
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_llm_responses_lru ON llm_responses (last_accessed)")
+        self._conn.commit()
+        logger.info(f"LLM応答キャッシュを初期化しました: {path} (最大{max_entries}件, TTL {ttl_seconds}秒)")
+
+    def get(self, key: str) -> Optional[str]:
+        """キーに対応する値を返す。存在しないか期限切れの場合はNoneを返す。"""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, created_at FROM llm_responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            value, created_at = row
+            if self.ttl_seconds and now - created_at > self.ttl_seconds:
+                self._conn.execute("DELETE FROM llm_responses WHERE key = ?", (key,))
+                self._conn.commit()
+                return None
+            self._conn.execute("UPDATE llm_responses SET last_accessed = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            return value
+
+    def put(self, key: str, model: str, value: str) -> None:
+        """値を保存し、最大件数を超えた分を最終アクセスが古い順に削除する。"""
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO llm_responses (key, model, value, created_at, last_accessed) VALUES (?, ?, ?, ?, ?)",
+                (key, model, value, now, now),
+            )
+            if self.ttl_seconds:
+                self._conn.execute("DELETE FROM llm_responses WHERE created_at < ?", (now - self.ttl_seconds,))
+            count = self._conn.execute("SELECT COUNT(*) FROM llm_responses").fetchone()[0]
+            if count > self.max_entries:
+                self._conn.execute(
+                    "DELETE FROM llm_responses WHERE key IN (SELECT key FROM llm_responses ORDER BY last_accessed ASC LIMIT ?)",
+                    (count - self.max_entries,),
+                )
+            self._conn.commit()
+
+    def clear(self, model: Optional[str] = None) -> None:
+        """キャッシュを削除する。modelが指定された場合はそのモデルのエントリのみ削除する。"""
+        with self._lock:
+            if model is None:
+                self._conn.execute("DELETE FROM llm_responses")
+            else:
+                self._conn.execute("DELETE FROM llm_responses WHERE model = ?", (model,))
+            self._conn.commit()
+
+    def count(self) -> int:
+        """現在のエントリ数を返す。"""
+        with self._lock:
+            return int(self._conn.execute("SELECT COUNT(*) FROM llm_responses").fetchone()[0])
+
+    def close(self) -> None:
+        """データベース接続を閉じる。"""
+        with self._lock:
+            self._conn.close()
+
+
+class LLMResponseCache(BaseCache):
+    """
+    特定のモデル設定に紐づいたLangChain互換のキャッシュ。
+    OllamaLLMのllm_stringにはモデル名やサンプリング設定が含まれないため、
+    LLMの生成に使用した設定を受け取り、それをキーの一部として使用する。
+    """
+    def __init__(self, store: ResponseCacheStore, llm_settings: Dict[str, Any]):
+        self.store = store
+        self.model = str(llm_settings.get("model", ""))
+        self._namespace = json.dumps(llm_settings, sort_keys=True, ensure_ascii=False, default=str)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _make_key(self, prompt: str, llm_string: str) -> str:
+        digest = hashlib.sha256()
+        for part in (self._namespace, llm_string, prompt):
+            digest.update(part.encode("utf-8"))
+            digest.update(b"\x00")
+        return digest.hexdigest()
+
+    def lookup(self, prompt: str, llm_string: str) -> Optional[RETURN_VAL_TYPE]:
+        value = self.store.get(self._make_key(prompt, llm_string))
+        generations: Optional[List[Generation]] = None
+        if value is not None:
+            try:
+                generations = [
+                    Generation(text=g["text"], generation_info=g.get("generation_info"))
+                    for g in json.loads(value)
+                ]
+            except Exception as e:
+                logger.warning(f"LLM応答キャッシュのデシリアライズに失敗しました: {e}")
+        with self._lock:
+            if generations is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        if generations is not None:
+            logger.debug(f"LLM応答キャッシュにヒットしました (model: {self.model})")
+        return generations
+
+    def update(self, prompt: str, llm_string: str, return_val: RETURN_VAL_TYPE) -> None:
+        try:
+            value = json.dumps(
+                [{"text": g.text, "generation_info": g.generation_info} for g in return_val],
+                ensure_ascii=False,
+                default=str,
+            )
+            self.store.put(self._make_key(prompt, llm_string), self.model, value)
+        except Exception as e:
+            logger.warning(f"LLM応答キャッシュへの保存に失敗しました: {e}")
+
+    def clear(self, **kwargs: Any) -> None:
+        self.store.clear(model=self.model)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """ヒット数・ミス数・ヒット率を返す。ヒット数がOllamaへの往復を省略できた回数に相当する。"""
+        with self._lock:
+            hits, misses = self.hits, self.misses
+        total = hits + misses
+        return {
+            "model": self.model,
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": hits / total if total else 0.0,
+            "entries": self.store.count(),
+        }
@@ -0,0 +1,333 @@
+# /app/llm/scheduler.py
+# title: LLMリクエストスケジューラ
+# role: Ollamaへの同時リクエスト数を並列スロット数に制限し、ユーザー対話(interactive)の呼び出しをIdleManagerのバックグラウンド処理より優先して実行させる。
+
+from __future__ import annotations
+import asyncio
+import contextlib
+import logging
+import threading
+import time
+from collections import deque
+from contextvars import ContextVar
+from enum import Enum
+from typing import Any, AsyncIterator, Deque, Dict, Iterator, List, Optional
+
+from langchain_core.callbacks import AsyncCallbackManager, AsyncCallbackManagerForLLMRun, CallbackManager, CallbackManagerForLLMRun
+from langchain_core.outputs import GenerationChunk, LLMResult
+from langchain_ollama import OllamaLLM
+
+logger = logging.getLogger(__name__)
+
+
+class LLMPriority(str, Enum):
+    """LLM呼び出しの優先度クラス。"""
+    INTERACTIVE = "interactive"
+    BACKGROUND = "background"
+
+
+# 実行枠を得た時点で、LLM呼び出しのコールバックへ送出するカスタムイベントの名前。dataのqueue_waitに待ち時間（秒）が入る。
+QUEUE_WAIT_EVENT = "llm_queue_wait"
+
+# 現在の呼び出し元の優先度。スレッドや非同期タスクごとに独立して保持される。
+_current_priority: ContextVar[LLMPriority] = ContextVar("llm_priority", default=LLMPriority.INTERACTIVE)
+
+
+def get_current_priority() -> LLMPriority:
+    """現在のコンテキストの優先度を返す。"""
+    return _current_priority.get()
+
+
+@contextlib.contextmanager
+def llm_priority(priority: LLMPriority) -> Iterator[None]:
+    """
+    ブロック内で行われるLLM呼び出しの優先度を設定する。
+    asyncio.runやasyncio.to_threadはコンテキストを引き継ぐため、その内部の呼び出しにも適用される。
+    """
+    token = _current_priority.set(priority)
+    try:
+        yield
+    finally:
+        _current_priority.reset(token)
+
+
+class LLMCallCounter:
+    """count_llm_callsのブロック内で、実際に生成まで到達したLLM呼び出しの数。"""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.count = 0
+
+    def increment(self) -> None:
+        with self._lock:
+            self.count += 1
+
+
+# 現在のコンテキストで有効な呼び出し数のカウンタ。子タスクやスレッドにはコピーされるが、同じカウンタを参照する。
+_call_counter: ContextVar[Optional[LLMCallCounter]] = ContextVar("llm_call_counter", default=None)
+
+
+@contextlib.contextmanager
+def count_llm_calls() -> Iterator[LLMCallCounter]:
+    """
+    ブロック内で行われたLLM呼び出しの数を数える。応答キャッシュにヒットした呼び出しは数えない。
+    入れ子にした場合は、内側のブロックの呼び出しは内側のカウンタのみで数える。
+    """
+    counter = LLMCallCounter()
+    token = _call_counter.set(counter)
+    try:
+        yield counter
+    finally:
+        _call_counter.reset(token)
+
+
+def _count_call() -> None:
+    counter = _call_counter.get()
+    if counter is not None:
+        counter.increment()
+
+
+def _resolve(future: asyncio.Future[None]) -> None:
+    # 待機中のタスクがキャンセルされた場合、futureは既に完了している
+    if not future.done():
+        future.set_result(None)
+
+
+class _Waiter:
+    """実行枠の割り当てを待つ呼び出し。スレッドと非同期タスクの双方から待機できる。"""
+    def __init__(self, priority: LLMPriority, loop: Optional[asyncio.AbstractEventLoop] = None):
+        self.priority = priority
+        self.enqueued_at = time.perf_counter()
+        self.granted = False
+        self._loop = loop
+        self._event: Optional[threading.Event] = None
+        self._future: Optional[asyncio.Future[None]] = None
+        if loop is None:
+            self._event = threading.Event()
+        else:
+            self._future = loop.create_future()
+
+    def grant(self) -> None:
+        self.granted = True
+        if self._event is not None:
+            self._event.set()
+        elif self._loop is not None and self._future is not None:
+            self._loop.call_soon_threadsafe(_resolve, self._future)
+
+    def wait(self) -> None:
+        assert self._event is not None
+        self._event.wait()
+
+    async def await_grant(self) -> None:
+        assert self._future is not None
+        await self._future
+
+
+class LLMScheduler:
+    """
+    Ollamaへの呼び出しを、並列スロット数に合わせた同時実行数の範囲で優先度順に実行させるスケジューラ。
+    バックグラウンドの呼び出しは、待機中のinteractiveな呼び出しが無い場合にのみ実行枠を得る。
+    実行中の生成を中断することはないため、interactiveな呼び出しの待ち時間は最大でも実行中の生成1回分となる。
+    """
+    def __init__(self, max_concurrency: int, max_background_concurrency: Optional[int] = None, max_samples: int = 1000):
+        if max_concurrency < 1:
+            raise ValueError("max_concurrency must be at least 1.")
+        self.max_concurrency = max_concurrency
+        self.max_background_concurrency = min(max_background_concurrency or max_concurrency, max_concurrency)
+        self.max_samples = max_samples
+
+        self._lock = threading.Lock()
+        self._waiting: Dict[LLMPriority, Deque[_Waiter]] = {p: deque() for p in LLMPriority}
+        self._active: Dict[LLMPriority, int] = {p: 0 for p in LLMPriority}
+        self._wait_samples: Dict[LLMPriority, Deque[float]] = {p: deque(maxlen=max_samples) for p in LLMPriority}
+        self._completed: Dict[LLMPriority, int] = {p: 0 for p in LLMPriority}
+        self._max_queue_depth: Dict[LLMPriority, int] = {p: 0 for p in LLMPriority}
+        logger.info(
+            f"LLMスケジューラを初期化しました (同時実行数: {self.max_concurrency}, "
+            f"バックグラウンド同時実行数: {self.max_background_concurrency})"
+        )
+
+    def _admit_locked(self) -> None:
+        """空いている実行枠を、優先度順に待機中の呼び出しへ割り当てる。ロック取得中に呼び出すこと。"""
+        while sum(self._active.values()) < self.max_concurrency:
+            interactive = self._waiting[LLMPriority.INTERACTIVE]
+            background = self._waiting[LLMPriority.BACKGROUND]
+            if interactive:
+                waiter = interactive.popleft()
+            elif background and self._active[LLMPriority.BACKGROUND] < self.max_background_concurrency:
+                waiter = background.popleft()
+            else:
+                return
+            self._active[waiter.priority] += 1
+            self._wait_samples[waiter.priority].append(time.perf_counter() - waiter.enqueued_at)
+            waiter.grant()
+
+    def _enqueue(self, waiter: _Waiter) -> None:
+        with self._lock:
+            queue = self._waiting[waiter.priority]
+            queue.append(waiter)
+            self._max_queue_depth[waiter.priority] = max(self._max_queue_depth[waiter.priority], len(queue))
+            self._admit_locked()
+        if not waiter.granted:
+            logger.debug(f"LLM呼び出しが実行枠を待機しています (priority: {waiter.priority.value})")
+
+    def acquire(self, priority: Optional[LLMPriority] = None) -> LLMPriority:
+        """実行枠を得るまで現在のスレッドをブロックする。得た枠の優先度を返す。"""
+        waiter = _Waiter(priority or get_current_priority())
+        self._enqueue(waiter)
+        waiter.wait()
+        return waiter.priority
+
+    async def aacquire(self, priority: Optional[LLMPriority] = None) -> LLMPriority:
+        """実行枠を得るまでイベントループをブロックせずに待機する。得た枠の優先度を返す。"""
+        waiter = _Waiter(priority or get_current_priority(), loop=asyncio.get_running_loop())
+        self._enqueue(waiter)
+        try:
+            await waiter.await_grant()
+        except asyncio.CancelledError:
+            with self._lock:
+                if waiter.granted:
+                    # 割り当て直後にキャンセルされた場合は枠を返却する
+                    self._release_locked(waiter.priority)
+                else:
+                    self._waiting[waiter.priority].remove(waiter)
+            raise
+        return waiter.priority
+
+    def _release_locked(self, priority: LLMPriority) -> None:
+        self._active[priority] -= 1
+        self._completed[priority] += 1
+        self._admit_locked()
+
+    def release(self, priority: LLMPriority) -> None:
+        """実行枠を返却し、待機中の呼び出しに割り当てる。"""
+        with self._lock:
+            self._release_locked(priority)
+
+    @contextlib.contextmanager
+    def slot(self, priority: Optional[LLMPriority] = None) -> Iterator[None]:
+        """実行枠を保持するコンテキストマネージャ。"""
+        acquired = self.acquire(priority)
+        try:
+            yield
+        finally:
+            self.release(acquired)
+
+    @contextlib.asynccontextmanager
+    async def aslot(self, priority: Optional[LLMPriority] = None) -> AsyncIterator[None]:
+        """実行枠を保持する非同期コンテキストマネージャ。"""
+        acquired = await self.aacquire(priority)
+        try:
+            yield
+        finally:
+            self.release(acquired)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """優先度ごとの待ち行列の深さ、実行中の数、待ち時間の統計を返す。"""
+        with self._lock:
+            snapshot = {
+                p: (len(self._waiting[p]), self._active[p], self._max_queue_depth[p], self._completed[p], list(self._wait_samples[p]))
+                for p in LLMPriority
+            }
+        stats: Dict[str, Any] = {"max_concurrency": self.max_concurrency}
+        for priority, (depth, active, max_depth, completed, waits) in snapshot.items():
+            ordered: List[float] = sorted(waits)
+            stats[priority.value] = {
+                "queue_depth": depth,
+                "max_queue_depth": max_depth,
+                "active": active,
+                "completed": completed,
+                "wait_mean": sum(ordered) / len(ordered) if ordered else 0.0,
+                "wait_p95": ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))] if ordered else 0.0,
+                "wait_max": ordered[-1] if ordered else 0.0,
+            }
+        return stats
+
+
+def _report_queue_wait(run_manager: Optional[CallbackManagerForLLMRun], queue_wait: float) -> None:
+    """実行枠を得るまでの待ち時間を、LLM呼び出しのコールバックへ通知する。"""
+    if run_manager is not None:
+        CallbackManager(handlers=run_manager.handlers).on_custom_event(
+            QUEUE_WAIT_EVENT, {"queue_wait": queue_wait}, run_id=run_manager.run_id
+        )
+
+
+async def _areport_queue_wait(run_manager: Optional[AsyncCallbackManagerForLLMRun], queue_wait: float) -> None:
+    """_report_queue_waitの非同期版。"""
+    if run_manager is not None:
+        await AsyncCallbackManager(handlers=run_manager.handlers).on_custom_event(
+            QUEUE_WAIT_EVENT, {"queue_wait": queue_wait}, run_id=run_manager.run_id
+        )
+
+
+class ScheduledOllamaLLM(OllamaLLM):
+    """
+    生成の前にLLMSchedulerから実行枠を取得するOllamaLLM。
+    応答キャッシュにヒットした呼び出しは生成処理まで到達しないため、実行枠を消費しない。
+    実行枠を得るまでの待ち時間は、QUEUE_WAIT_EVENTとしてコールバックへ通知する。
+    生成した呼び出しは、count_llm_callsのカウンタにも数える。
+    """
+    scheduler: Optional[Any] = None
+
+    def _generate(
+        self,
+        prompts: List[str],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> LLMResult:
+        _count_call()
+        if self.scheduler is None:
+            return super()._generate(prompts, stop=stop, run_manager=run_manager, **kwargs)
+        enqueued_at = time.perf_counter()
+        with self.scheduler.slot():
+            _report_queue_wait(run_manager, time.perf_counter() - enqueued_at)
+            return super()._generate(prompts, stop=stop, run_manager=run_manager, **kwargs)
+
+    async def _agenerate(
+        self,
+        prompts: List[str],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> LLMResult:
+        _count_call()
+        if self.scheduler is None:
+            return await super()._agenerate(prompts, stop=stop, run_manager=run_manager, **kwargs)
+        enqueued_at = time.perf_counter()
+        async with self.scheduler.aslot():
+            await _areport_queue_wait(run_manager, time.perf_counter() - enqueued_at)
+            return await super()._agenerate(prompts, stop=stop, run_manager=run_manager, **kwargs)
+
+    def _stream(
+        self,
+        prompt: str,
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> Iterator[GenerationChunk]:
+        _count_call()
+        if self.scheduler is None:
+            yield from super()._stream(prompt, stop=stop, run_manager=run_manager, **kwargs)
+            return
+        enqueued_at = time.perf_counter()
+        with self.scheduler.slot():
+            _report_queue_wait(run_manager, time.perf_counter() - enqueued_at)
+            yield from super()._stream(prompt, stop=stop, run_manager=run_manager, **kwargs)
+
+    async def _astream(
+        self,
+        prompt: str,
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[GenerationChunk]:
+        _count_call()
+        if self.scheduler is None:
+            async for chunk in super()._astream(prompt, stop=stop, run_manager=run_manager, **kwargs):
+                yield chunk
+            return
+        enqueued_at = time.perf_counter()
+        async with self.scheduler.aslot():
+            await _areport_queue_wait(run_manager, time.perf_counter() - enqueued_at)
+            async for chunk in super()._astream(prompt, stop=stop, run_manager=run_manager, **kwargs):
+                yield chunk
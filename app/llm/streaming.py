@@ -0,0 +1,147 @@
+# /app/llm/streaming.py
+# title: 最終回答トークンストリーミング
+# role: パイプラインの最終LLM段が生成したトークンを、呼び出し元（エンジンのastream）へ逐次受け渡す仕組みと、初回トークン到達時間(TTFT)の集計を提供する。
+
+from __future__ import annotations
+import asyncio
+import logging
+import threading
+from contextvars import ContextVar
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from langchain_core.runnables import Runnable
+
+from app.models import StreamEvent
+
+logger = logging.getLogger(__name__)
+
+# 現在のタスクがストリーミング実行中の場合に、イベントの送出先となるキュー。
+# contextvarsを使うため、並行する複数のリクエストが互いのキューに書き込むことはない。
+_stream_queue: ContextVar[Optional["asyncio.Queue[StreamEvent]"]] = ContextVar("llm_stream_queue", default=None)
+
+
+def is_streaming() -> bool:
+    """現在のコンテキストがストリーミング実行中かどうかを返す。"""
+    return _stream_queue.get() is not None
+
+
+async def ainvoke_streaming(chain: Runnable, input_data: Dict[str, Any]) -> str:
+    """
+    最終回答を生成するチェーンを実行する。
+    ストリーミング実行中であれば.astreamで生成された断片を逐次送出し、そうでなければ通常の.ainvokeと同じ動作をする。
+    いずれの場合も、生成された全文を返す。
+    """
+    queue = _stream_queue.get()
+    if queue is None:
+        result: str = await chain.ainvoke(input_data)
+        return result
+
+    chunks: List[str] = []
+    async for chunk in chain.astream(input_data):
+        text = chunk if isinstance(chunk, str) else str(chunk)
+        if not text:
+            continue
+        chunks.append(text)
+        queue.put_nowait({"type": "token", "content": text})
+    return "".join(chunks)
+
+
+def emit_stream_reset() -> None:
+    """
+    それまでに送出した断片が無効になったことを通知する（フォールバック時など）。
+    ストリーミング実行中でなければ何もしない。
+    """
+    queue = _stream_queue.get()
+    if queue is not None:
+        queue.put_nowait({"type": "reset"})
+
+
+def forward_stream_events(source: "asyncio.Queue[StreamEvent]") -> None:
+    """
+    別のストリーミングコンテキスト（start_stream_taskのキュー）に溜まったイベントを、現在のコンテキストのキューへ移す。
+    並行して実行し、結果を採用するまで表示を保留していた処理の断片を送出するために使う。
+    """
+    queue = _stream_queue.get()
+    while not source.empty():
+        event = source.get_nowait()
+        if queue is not None:
+            queue.put_nowait(event)
+
+
+def start_stream_task(coro: Any) -> "tuple[asyncio.Task[Any], asyncio.Queue[StreamEvent]]":
+    """
+    コルーチンをストリーミングコンテキスト付きのタスクとして開始し、タスクとイベントキューを返す。
+    """
+    queue: asyncio.Queue[StreamEvent] = asyncio.Queue()
+    token = _stream_queue.set(queue)
+    try:
+        # create_taskは現在のコンテキストをコピーするため、タスク内からのみキューが参照される
+        task = asyncio.ensure_future(coro)
+    finally:
+        _stream_queue.reset(token)
+    return task, queue
+
+
+async def iterate_stream_events(task: "asyncio.Task[Any]", queue: "asyncio.Queue[StreamEvent]") -> AsyncIterator[StreamEvent]:
+    """
+    タスクが完了するまでキューに届いたイベントを順に返す。
+    呼び出し側がイテレーションを途中で打ち切った場合は、タスクをキャンセルする。
+    """
+    try:
+        while not task.done():
+            getter = asyncio.ensure_future(queue.get())
+            done, _ = await asyncio.wait({getter, task}, return_when=asyncio.FIRST_COMPLETED)
+            if getter in done:
+                yield getter.result()
+            else:
+                getter.cancel()
+        while not queue.empty():
+            yield queue.get_nowait()
+    finally:
+        if not task.done():
+            task.cancel()
+
+
+class StreamingLatencyStats:
+    """
+    モードごとの初回トークン到達時間(TTFT)と総処理時間を集計する。
+    体感の待ち時間はTTFTで決まるため、総処理時間とは別に記録する。
+    """
+    def __init__(self, max_samples: int = 1000):
+        self.max_samples = max_samples
+        self._samples: Dict[str, List[tuple[float, float]]] = {}
+        self._lock = threading.Lock()
+
+    def record(self, mode: str, time_to_first_token: float, total_time: float) -> None:
+        """1回分の計測値を記録する。"""
+        with self._lock:
+            samples = self._samples.setdefault(mode, [])
+            samples.append((time_to_first_token, total_time))
+            if len(samples) > self.max_samples:
+                del samples[: len(samples) - self.max_samples]
+
+    @staticmethod
+    def _percentile(values: List[float], q: float) -> float:
+        ordered = sorted(values)
+        index = min(len(ordered) - 1, max(0, int(round(q * (len(ordered) - 1)))))
+        return ordered[index]
+
+    def get_stats(self) -> Dict[str, Dict[str, float]]:
+        """モードごとの件数とTTFT・総処理時間の平均/p50/p95を返す。"""
+        with self._lock:
+            snapshot = {mode: list(samples) for mode, samples in self._samples.items()}
+        stats: Dict[str, Dict[str, float]] = {}
+        for mode, samples in snapshot.items():
+            if not samples:
+                continue
+            ttfts = [s[0] for s in samples]
+            totals = [s[1] for s in samples]
+            stats[mode] = {
+                "count": float(len(samples)),
+                "ttft_mean": sum(ttfts) / len(ttfts),
+                "ttft_p50": self._percentile(ttfts, 0.5),
+                "ttft_p95": self._percentile(ttfts, 0.95),
+                "total_mean": sum(totals) / len(totals),
+                "total_p95": self._percentile(totals, 0.95),
+            }
+        return stats
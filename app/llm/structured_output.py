@@ -0,0 +1,277 @@
+# /app/llm/structured_output.py
+# title: 構造化出力（JSON）の解析・修復・再要求
+# role: JSONを返すエージェントのために、OllamaのJSONモードの指定、崩れたJSONの修復、失敗したエージェントだけへの再要求、既定値へのフォールバックを行うチェーンを構築し、エージェントごとの解析結果を集計する。
+
+from __future__ import annotations
+import ast
+import copy
+import logging
+import re
+import threading
+from typing import Any, Dict, List, Optional
+
+from langchain_core.exceptions import OutputParserException
+from langchain_core.output_parsers import JsonOutputParser
+from langchain_core.outputs import Generation
+from langchain_core.prompts import BasePromptTemplate, PromptTemplate
+from langchain_core.runnables import Runnable, RunnableLambda
+from langchain_core.utils.json import parse_partial_json
+from pydantic import TypeAdapter, ValidationError
+
+from app.config import settings
+from app.models import StructuredOutputCounts
+
+logger = logging.getLogger(__name__)
+
+# with_fallbacksがフォールバック側の入力に、直前の例外を格納するキー
+_ERROR_KEY = "__structured_output_error"
+
+# 再要求のプロンプトに含める、直前の出力の最大文字数
+_MAX_PREVIOUS_OUTPUT_CHARS = 2000
+
+# 再要求のプロンプトで、元のプロンプトの直後に置かれる文字列
+JSON_REASK_MARKER = "\n\n---\nあなたの直前の出力は、JSONとして解析できませんでした。"
+
+# 解析できなかったエージェントへの再要求。元のプロンプトに、直前の出力と解析エラーを添える。
+JSON_REASK_PROMPT = PromptTemplate.from_template(
+    "{original_prompt}" + JSON_REASK_MARKER + """
+エラー: {error}
+
+直前の出力:
+{previous_output}
+---
+上記の指示に従い、説明文やコードブロックを付けずに、JSONのみを出力し直してください。
+修正したJSON:"""
+)
+
+_FENCE_RE = re.compile(r"```(?:json|JSON)?\s*(.*?)(?:```|$)", re.DOTALL)
+_TRAILING_COMMA_RE = re.compile(r",(\s*[}\]])")
+_EMPTY_VALUE_RE = re.compile(r":(\s*)(?=[,}])")
+
+
+def _extract_json_span(text: str) -> str:
+    """
+    最初の「{」または「[」から、対応する括弧で閉じるまでの範囲を取り出す。
+    文字列リテラル中の括弧は数えない。閉じる前にテキストが終わった場合（出力の途中切れ）は末尾までを返す。
+    """
+    starts = [i for i in (text.find("{"), text.find("[")) if i >= 0]
+    if not starts:
+        raise ValueError("JSONの開始位置が見つかりません。")
+    start = min(starts)
+    depth = 0
+    in_string = False
+    escaped = False
+    for i in range(start, len(text)):
+        char = text[i]
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char in "{[":
+            depth += 1
+        elif char in "}]":
+            depth -= 1
+            if depth == 0:
+                return text[start:i + 1]
+    return text[start:]
+
+
+def _error_summary(error: Any) -> str:
+    """例外メッセージの1行目を、プロンプトやログに含められる長さで返す。"""
+    return str(error).split("\n", 1)[0][:300]
+
+
+def repair_json(text: str) -> Any:
+    """
+    LLMの出力から、崩れたJSONをできるだけ復元して解析する。
+    コードフェンスや前後の説明文、末尾のカンマ、値の欠落、途中で切れた文字列や括弧、
+    Pythonのリテラル表記（シングルクォートやTrue/None）に対応する。復元できない場合はValueErrorを送出する。
+    """
+    candidate = text.strip()
+    fence = _FENCE_RE.search(candidate)
+    if fence:
+        candidate = fence.group(1)
+    span = _extract_json_span(candidate)
+    cleaned = _EMPTY_VALUE_RE.sub(r":\1null", _TRAILING_COMMA_RE.sub(r"\1", span))
+
+    try:
+        parsed = parse_partial_json(cleaned, strict=False)
+    except ValueError:
+        parsed = None
+    if parsed is not None:
+        return parsed
+    try:
+        return ast.literal_eval(span)
+    except (ValueError, SyntaxError, MemoryError, RecursionError) as e:
+        raise ValueError(f"JSONとして解析できません: {span[:200]}") from e
+
+
+class StructuredOutputStats:
+    """
+    構造化出力を返すエージェントごとに、解析の成否を集計する。
+    parsedはそのまま解析できた数、repairedは修復して解析できた数、failuresは解析に失敗した数、
+    reaskedは再要求した数、recoveredは再要求で回復した数、defaultedは既定値で代替した数。
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts: Dict[str, StructuredOutputCounts] = {}
+
+    def record(self, agent: str, outcome: str) -> None:
+        """エージェントの解析結果を1件記録する。"""
+        with self._lock:
+            counts = self._counts.setdefault(agent, {
+                "parsed": 0, "repaired": 0, "failures": 0, "reasked": 0, "recovered": 0, "defaulted": 0,
+            })
+            counts[outcome] += 1  # type: ignore[literal-required]
+
+    def get_stats(self) -> Dict[str, StructuredOutputCounts]:
+        """エージェントごとの集計値を返す。"""
+        with self._lock:
+            return {agent: dict(counts) for agent, counts in self._counts.items()}  # type: ignore[misc]
+
+    def format_summary(self) -> str:
+        """解析に失敗したことのあるエージェントの集計をログ向けの1行にまとめる。"""
+        parts = [
+            f"{agent}: 失敗 {c['failures']}/{c['parsed'] + c['repaired'] + c['failures']} "
+            f"(修復 {c['repaired']}, 再要求で回復 {c['recovered']}/{c['reasked']}, 既定値 {c['defaulted']})"
+            for agent, c in self.get_stats().items()
+            if c["failures"] or c["repaired"]
+        ]
+        return ", ".join(parts) if parts else "構造化出力の解析失敗はありません"
+
+
+class RepairingJsonOutputParser(JsonOutputParser):
+    """
+    JsonOutputParserで解析できない出力をrepair_jsonで修復するパーサー。
+    pydantic_objectやexpected_typeを指定した場合は、その形に合わない出力も解析失敗として扱う。
+    修復できない場合は、元の出力をllm_outputに持つOutputParserExceptionを送出する。
+    """
+    agent_name: str = "unknown"
+    stats: Optional[Any] = None
+    expected_type: Optional[type] = None
+
+    def _record(self, outcome: str) -> None:
+        if self.stats is not None:
+            self.stats.record(self.agent_name, outcome)
+
+    def _validate(self, parsed: Any, text: str) -> Any:
+        error: Optional[str] = None
+        if self.expected_type is not None and not isinstance(parsed, self.expected_type):
+            error = f"{self.expected_type.__name__}ではなく{type(parsed).__name__}が出力されました"
+        elif self.pydantic_object is not None:
+            try:
+                TypeAdapter(self.pydantic_object).validate_python(parsed)
+            except ValidationError as e:
+                error = str(e)
+        if error is not None:
+            self._record("failures")
+            raise OutputParserException(f"出力が期待する形式ではありません: {error}", llm_output=text)
+        return parsed
+
+    def parse_result(self, result: List[Generation], *, partial: bool = False) -> Any:
+        if partial:
+            return super().parse_result(result, partial=True)
+        text = result[0].text
+        try:
+            parsed = super().parse_result(result)
+        except OutputParserException:
+            pass
+        else:
+            parsed = self._validate(parsed, text)
+            self._record("parsed")
+            return parsed
+
+        try:
+            parsed = repair_json(text)
+        except ValueError as e:
+            self._record("failures")
+            raise OutputParserException(f"JSONの修復に失敗しました: {e}", llm_output=text) from e
+        parsed = self._validate(parsed, text)
+        logger.info(f"{self.agent_name}: 崩れたJSON出力を修復しました。")
+        self._record("repaired")
+        return parsed
+
+
+def supports_json_mode(llm: Any) -> bool:
+    """LLMが出力形式の指定（OllamaのJSONモード）に対応しているかを返す。"""
+    return "format" in getattr(type(llm), "model_fields", {})
+
+
+def build_structured_chain(
+    prompt: BasePromptTemplate,
+    llm: Any,
+    agent_name: str,
+    stats: Optional[StructuredOutputStats] = None,
+    pydantic_object: Optional[Any] = None,
+    expected_type: Optional[type] = None,
+    default: Optional[Any] = None,
+    max_reasks: Optional[int] = None,
+    json_mode: Optional[bool] = None,
+) -> Runnable:
+    """
+    JSONを返すエージェントのチェーンを構築する。
+    LLMがJSONモードに対応していればそれを指定し、解析できない出力は修復を試みる。
+    それでも解析できない場合は、元のプロンプトに直前の出力とエラーを添えて、このエージェントだけに最大max_reasks回再要求する。
+    defaultを指定した場合、再要求も失敗した時はその値を返し、呼び出し元（パイプライン全体）に例外を伝えない。
+
+    Args:
+        prompt: エージェントのプロンプト。
+        llm: 使用するLLM。
+        agent_name: 集計とログに用いるエージェント名。
+        stats: 解析結果の集計先。
+        pydantic_object: 出力の形を検証するモデルまたはTypedDict。
+        expected_type: 出力の型（dictやlist）。pydantic_objectより緩い検証として用いる。
+        default: すべて失敗した場合に返す値。Noneの場合は例外を送出する。
+        max_reasks: 再要求の最大回数。省略時は設定値。
+        json_mode: JSONモードを指定するかどうか。省略時は設定値。OllamaのJSONモードはオブジェクトしか出力しないため、リストを返すエージェントではFalseにする。
+    """
+    if max_reasks is None:
+        max_reasks = int(settings.STRUCTURED_OUTPUT_SETTINGS["max_reasks"])
+    if json_mode is None:
+        json_mode = bool(settings.STRUCTURED_OUTPUT_SETTINGS["json_mode"])
+    json_llm = llm.bind(format="json") if json_mode and supports_json_mode(llm) else llm
+
+    def parser() -> RepairingJsonOutputParser:
+        return RepairingJsonOutputParser(
+            pydantic_object=pydantic_object, expected_type=expected_type, agent_name=agent_name, stats=stats
+        )
+
+    def build_reask_prompt(inputs: Dict[str, Any]) -> str:
+        error = inputs[_ERROR_KEY]
+        original_inputs = {k: v for k, v in inputs.items() if k != _ERROR_KEY}
+        previous_output = getattr(error, "llm_output", None) or ""
+        if stats is not None:
+            stats.record(agent_name, "reasked")
+        logger.warning(f"{agent_name}: JSON出力を解析できなかったため、再要求します。")
+        return JSON_REASK_PROMPT.format(
+            original_prompt=prompt.invoke(original_inputs).to_string(),
+            previous_output=previous_output[:_MAX_PREVIOUS_OUTPUT_CHARS],
+            error=_error_summary(error),
+        )
+
+    def mark_recovered(parsed: Any) -> Any:
+        if stats is not None:
+            stats.record(agent_name, "recovered")
+        return parsed
+
+    def use_default(inputs: Dict[str, Any]) -> Any:
+        if stats is not None:
+            stats.record(agent_name, "defaulted")
+        logger.error(f"{agent_name}: 再要求後もJSON出力を解析できなかったため、既定値を使用します。({_error_summary(inputs.get(_ERROR_KEY))})")
+        return copy.deepcopy(default)
+
+    chain = prompt | json_llm | parser()
+    fallbacks: List[Runnable] = [
+        RunnableLambda(build_reask_prompt) | json_llm | parser() | RunnableLambda(mark_recovered)
+        for _ in range(max_reasks)
+    ]
+    if default is not None:
+        fallbacks.append(RunnableLambda(use_default))
+    if not fallbacks:
+        return chain
+    return chain.with_fallbacks(fallbacks, exceptions_to_handle=(OutputParserException,), exception_key=_ERROR_KEY)
@@ -0,0 +1,181 @@
+# /app/llm/warmup.py
+# title: モデルのウォームアップと常駐管理
+# role: 起動時に、設定されたすべての生成モデルと埋め込みモデルを並列にOllamaへ読み込ませてkeep_aliveで常駐させ、
+#       アイドル中はkeep_aliveが切れる前に再読み込みする。初回（コールド）と読み込み後（ウォーム）の最初のトークンまでの時間を計測する。
+
+from __future__ import annotations
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+import ollama
+
+from app.models import ModelWarmupResult
+
+logger = logging.getLogger(__name__)
+
+
+class ModelWarmer:
+    """
+    Ollamaのモデルを事前に読み込み、常駐させ続ける。
+    生成モデルは1トークンだけ生成させて、読み込みを含む初回と読み込み済みの2回目の最初のトークンまでの時間を計測する。
+    埋め込みモデルは短いテキストを2回埋め込み、同様に計測する。
+    """
+    def __init__(
+        self,
+        llm_models: Callable[[], List[str]],
+        embedding_models: List[str],
+        keep_alive_seconds: int,
+        rewarm_margin_seconds: float,
+        probe_prompt: str = "こんにちは",
+        base_url: Optional[str] = None,
+        client: Optional[Any] = None,
+    ):
+        """
+        Args:
+            llm_models: ウォームアップ対象の生成モデル名の一覧を返す関数。実行中にモデルの割り当てが変わった場合も追従する。
+            embedding_models: ウォームアップ対象の埋め込みモデル名。
+            keep_alive_seconds: モデルを常駐させる秒数。負の値の場合は無期限で、再読み込みは行わない。
+            rewarm_margin_seconds: keep_aliveが切れるこの秒数前に再読み込みする。
+            probe_prompt: 計測に使うプロンプト。
+            base_url: OllamaサーバーのURL。省略時はollamaパッケージの既定値。
+            client: ollama.Clientと同じインターフェースを持つクライアント。
+        """
+        self.llm_models = llm_models
+        self.embedding_models = embedding_models
+        self.keep_alive_seconds = keep_alive_seconds
+        self.rewarm_margin_seconds = rewarm_margin_seconds
+        self.probe_prompt = probe_prompt
+        self._client = client or ollama.Client(host=base_url)
+        self._lock = threading.Lock()
+        self._results: Dict[str, ModelWarmupResult] = {}
+        self._last_warmed: Dict[str, float] = {}
+        self._thread: Optional[threading.Thread] = None
+        self._done = threading.Event()
+
+    def _targets(self) -> Dict[str, str]:
+        """モデル名と種類（llm/embedding）の対応を返す。"""
+        targets = {model: "llm" for model in self.llm_models()}
+        targets.update({model: "embedding" for model in self.embedding_models})
+        return targets
+
+    def _probe_llm(self, model: str) -> tuple[float, float]:
+        """1トークンを生成させ、最初のトークンまでの時間と、Ollamaが報告したモデルの読み込み時間（秒）を返す。"""
+        start = time.perf_counter()
+        first_token: Optional[float] = None
+        load_duration = 0.0
+        for part in self._client.generate(
+            model=model,
+            prompt=self.probe_prompt,
+            stream=True,
+            options={"num_predict": 1},
+            keep_alive=self.keep_alive_seconds,
+        ):
+            if first_token is None:
+                first_token = time.perf_counter() - start
+            if part.get("done"):
+                load_duration = (part.get("load_duration") or 0) / 1e9
+        return (first_token if first_token is not None else time.perf_counter() - start), load_duration
+
+    def _probe_embedding(self, model: str) -> tuple[float, float]:
+        """短いテキストを埋め込み、応答までの時間と、Ollamaが報告したモデルの読み込み時間（秒）を返す。"""
+        start = time.perf_counter()
+        response = self._client.embed(model=model, input=self.probe_prompt, keep_alive=self.keep_alive_seconds)
+        return time.perf_counter() - start, (response.get("load_duration") or 0) / 1e9
+
+    def _warm(self, model: str, kind: str) -> ModelWarmupResult:
+        probe = self._probe_llm if kind == "llm" else self._probe_embedding
+        try:
+            cold, load_duration = probe(model)
+            warm, _ = probe(model)
+            result: ModelWarmupResult = {
+                "model": model,
+                "kind": kind,
+                "cold_first_token": cold,
+                "warm_first_token": warm,
+                "load_duration": load_duration,
+                "error": None,
+            }
+            logger.info(
+                f"モデル '{model}' をウォームアップしました: 最初のトークンまで コールド {cold:.3f} s "
+                f"(読み込み {load_duration:.3f} s) / ウォーム {warm:.3f} s, keep_alive {self.keep_alive_seconds} s"
+            )
+        except Exception as e:
+            result = {
+                "model": model,
+                "kind": kind,
+                "cold_first_token": None,
+                "warm_first_token": None,
+                "load_duration": None,
+                "error": f"{type(e).__name__}: {e}",
+            }
+            logger.warning(f"モデル '{model}' のウォームアップに失敗しました: {e}")
+        with self._lock:
+            self._results[model] = result
+            if result["error"] is None:
+                self._last_warmed[model] = time.time()
+        return result
+
+    def warm_up(self) -> Dict[str, ModelWarmupResult]:
+        """すべての対象モデルを並列にウォームアップし、モデルごとの計測結果を返す。"""
+        targets = self._targets()
+        if not targets:
+            return {}
+        with ThreadPoolExecutor(max_workers=len(targets), thread_name_prefix="model-warmup") as executor:
+            results = list(executor.map(lambda item: self._warm(*item), targets.items()))
+        return {r["model"]: r for r in results}
+
+    def _run(self) -> None:
+        try:
+            self.warm_up()
+        finally:
+            self._done.set()
+
+    def start(self) -> None:
+        """ウォームアップを別スレッドで開始する。Containerの初期化などと並行して進める場合に使う。"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="model-warmup", daemon=True)
+            self._thread.start()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """startで開始したウォームアップの完了を待つ。完了した場合はTrueを返す。"""
+        if self._thread is None:
+            return True
+        return self._done.wait(timeout)
+
+    def touch(self, model: str) -> None:
+        """モデルが使用され、keep_aliveが延長されたことを記録する。"""
+        with self._lock:
+            self._last_warmed[model] = time.time()
+
+    def rewarm_if_due(self, now: Optional[float] = None) -> List[str]:
+        """
+        keep_aliveが切れるまでrewarm_margin_seconds未満となったモデルを再読み込みし、そのモデル名を返す。
+        再読み込みは生成を伴わないため、Ollamaの実行枠をほとんど消費しない。
+        """
+        if self.keep_alive_seconds < 0 or not self._done.is_set() and self._thread is not None:
+            return []
+        now = now or time.time()
+        deadline = self.keep_alive_seconds - self.rewarm_margin_seconds
+        targets = self._targets()
+        with self._lock:
+            due = [m for m in targets if now - self._last_warmed.get(m, 0.0) >= deadline]
+        for model in due:
+            try:
+                if targets[model] == "llm":
+                    # プロンプトを指定しない生成要求は、モデルの読み込みとkeep_aliveの更新のみを行う
+                    self._client.generate(model=model, keep_alive=self.keep_alive_seconds)
+                else:
+                    self._client.embed(model=model, input="", keep_alive=self.keep_alive_seconds)
+                self.touch(model)
+                logger.info(f"モデル '{model}' を再読み込みし、keep_aliveを延長しました。")
+            except Exception as e:
+                logger.warning(f"モデル '{model}' の再読み込みに失敗しました: {e}")
+        return due
+
+    def get_stats(self) -> Dict[str, ModelWarmupResult]:
+        """モデルごとのウォームアップの計測結果を返す。"""
+        with self._lock:
+            return {model: dict(result) for model, result in self._results.items()}  # type: ignore[misc]
@@ -2,10 +2,13 @@
 # title: アプリケーションメインモジュール
 # role: DIコンテナから依存関係を注入され、ユーザー入力と自律思考のメインループを管理する。
 
+import asyncio
 import logging
 import queue
 import threading
 import time
+import uuid
+from typing import Optional
 from dependency_injector.wiring import inject, Provide
 
 from app.containers import Container
@@ -13,6 +16,10 @@ from app.models import MasterAgentResponse
 from app.idle_manager import IdleManager
 from app.engine import MetaIntelligenceEngine
 from app.agents.orchestration_agent import OrchestrationAgent
+from app.config import settings
+from app.llm.instrumentation import LLMCallRecorder, llm_call_context
+from app.llm.structured_output import StructuredOutputStats
+from app.tracing import start_trace
 
 logger = logging.getLogger(__name__)
 
@@ -30,11 +37,45 @@ def user_input_thread(input_queue: queue.Queue[str]):
             input_queue.put('quit')
             break
 
+async def process_query(
+    query: str,
+    engine: MetaIntelligenceEngine,
+    orchestration_agent: OrchestrationAgent,
+    request_id: Optional[str] = None,
+) -> MasterAgentResponse:
+    """
+    1件のユーザー入力について、モード選択からパイプライン実行までを単一のイベントループ上で行う。
+    最終回答は生成され次第、逐次表示する。
+    request_idを指定した場合、この処理中のLLM呼び出しはそのIDで記録される。
+    """
+    with llm_call_context(request_id=request_id), start_trace(request_id, name="process_query"):
+        # OrchestrationAgentを使用して動的に実行モードを決定
+        logger.info("オーケストレーションエージェントによるモード選択を開始します...")
+        with llm_call_context(mode="orchestration"):
+            orchestration_decision = await orchestration_agent.ainvoke({"query": query})
+        logger.info(f"選択されたモード: {orchestration_decision.get('chosen_mode')}, 理由: {orchestration_decision.get('reason')}")
+
+        # 決定されたモードでエンジンを実行し、最終回答のトークンをそのまま表示する
+        response: Optional[MasterAgentResponse] = None
+        print("\n--- 最終回答 ---")
+        async for event in engine.astream(query=query, orchestration_decision=orchestration_decision):
+            if event["type"] == "token":
+                print(event["content"], end="", flush=True)
+            elif event["type"] == "reset":
+                print("\n\nシステム: 処理に失敗したため、シンプルモードで回答し直します。\n\n--- 最終回答 ---")
+            elif event["type"] == "response":
+                response = event["response"]
+        print()
+    assert response is not None
+    return response
+
 @inject
 def main_loop(
     engine: MetaIntelligenceEngine = Provide[Container.engine],
     idle_manager: IdleManager = Provide[Container.idle_manager],
     orchestration_agent: OrchestrationAgent = Provide[Container.orchestration_agent],
+    llm_call_recorder: LLMCallRecorder = Provide[Container.llm_call_recorder],
+    structured_output_stats: StructuredOutputStats = Provide[Container.structured_output_stats],
 ):
     """
     ユーザー入力の処理とAIの自律思考を並行して実行するメインループ。
@@ -65,20 +106,21 @@ def main_loop(
                 if user_input:
                     print("\nシステム: 考え中...")
                     
-                    # OrchestrationAgentを使用して動的に実行モードを決定
-                    logger.info("オーケストレーションエージェントによるモード選択を開始します...")
-                    orchestration_decision = orchestration_agent.invoke({"query": user_input})
-                    logger.info(f"選択されたモード: {orchestration_decision.get('chosen_mode')}, 理由: {orchestration_decision.get('reason')}")
-
-                    # 決定されたモードでエンジンを実行
-                    response: MasterAgentResponse = engine.run(query=user_input, orchestration_decision=orchestration_decision)
+                    request_id = uuid.uuid4().hex[:12]
+                    response: MasterAgentResponse = asyncio.run(
+                        process_query(user_input, engine, orchestration_agent, request_id=request_id)
+                    )
+                    llm_call_recorder.write_prometheus_snapshot()
                     
-                    print("\n--- 最終回答 ---")
-                    print(response["final_answer"])
                     print("\n--- 自己評価 ---")
                     print(response["self_criticism"])
                     print("\n--- 潜在的な問題 ---")
                     print(response["potential_problems"])
+
+                    if settings.LLM_INSTRUMENTATION_SETTINGS["print_breakdown"]:
+                        print(f"\n--- LLM呼び出しの内訳 (request: {request_id}) ---")
+                        print(llm_call_recorder.format_request_breakdown(request_id))
+                        print(f"構造化出力: {structured_output_stats.format_summary()}")
                     
                     print("\nシステム: 何かお手伝いできることはありますか？ (終了するには 'quit' と入力してください)")
                     print("あなた: ", end="", flush=True)
@@ -2,5 +2,6 @@
 # title: 記憶関連パッケージ初期化ファイル
 # role: 記憶に関連するクラスをインポートし、パッケージとして利用可能にする。
 
+from .context_assembler import ContextAssembler, ContextSection, estimate_tokens
 from .memory_consolidator import MemoryConsolidator
 from .working_memory import WorkingMemory
\ No newline at end of file
@@ -0,0 +1,205 @@
+# /app/memory/context_assembler.py
+# title: トークン予算付きコンテキスト組み立て
+# role: 長期記憶・検索結果・計画・対話履歴など、プロンプトに埋め込む複数の文脈を、設定されたトークン予算の範囲に収まるよう配分・切り詰め、削った量を報告する。
+
+from __future__ import annotations
+import logging
+from typing import Callable, Dict, List, Optional
+
+from app.knowledge_graph.models import KnowledgeGraph
+from app.models import AssembledContext, ContextSectionReport
+
+logger = logging.getLogger(__name__)
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    テキストのトークン数を概算する。
+    Ollamaのトークナイザーはアプリから参照できないため、日本語などの非ASCII文字は1文字あたり1トークン、
+    ASCII文字は4文字あたり1トークンとして見積もる。
+    """
+    ascii_chars = len(text.encode("ascii", "ignore"))
+    return (len(text) - ascii_chars) + (ascii_chars + 3) // 4
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """テキストを先頭からmax_tokensに収まる長さで切り詰める。"""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    low, high = 0, len(text)
+    while low < high:
+        mid = (low + high + 1) // 2
+        if estimate_tokens(text[:mid]) <= max_tokens:
+            low = mid
+        else:
+            high = mid - 1
+    return text[:low]
+
+
+class ContextSection:
+    """
+    予算配分の対象となる、プロンプト中の1つの区画。
+    unitsは削る単位（行や文書チャンク）で、重要度の高い順に並べる。予算を超えた分は末尾から削られる。
+    """
+    def __init__(
+        self,
+        name: str,
+        units: List[str],
+        separator: str = "\n",
+        reverse_output: bool = False,
+        allow_partial: bool = True,
+        render: Optional[Callable[[List[str]], str]] = None,
+        empty_text: str = "",
+    ):
+        """
+        Args:
+            name: 区画の名前。プロンプトの変数名と揃える。
+            units: 重要度の高い順に並んだ構成要素。
+            separator: 出力時に要素を連結する区切り文字。
+            reverse_output: Trueの場合、残した要素を逆順に出力する（新しい順に優先した対話履歴を時系列に戻す場合など）。
+            allow_partial: 予算の境界にかかった要素を途中で切ってでも含めるかどうか。
+            render: 残した要素から区画のテキストを組み立てる関数。省略時はseparatorで連結する。
+            empty_text: 要素が1つも残らなかった場合のテキスト。
+        """
+        self.name = name
+        self.units = [u for u in units if u]
+        self.separator = separator
+        self.reverse_output = reverse_output
+        self.allow_partial = allow_partial
+        self.render = render
+        self.empty_text = empty_text
+
+    @classmethod
+    def from_text(cls, name: str, text: str, separator: str = "\n", **kwargs) -> "ContextSection":
+        """テキストをseparatorで分割し、先頭ほど重要な区画として作成する。"""
+        return cls(name, text.split(separator) if text else [], separator=separator, **kwargs)
+
+    @classmethod
+    def from_dialogue_history(cls, name: str, history: List[str], **kwargs) -> "ContextSection":
+        """対話履歴から、新しい発言ほど優先し、出力は時系列順となる区画を作成する。"""
+        return cls(name, list(reversed(history)), reverse_output=True, **kwargs)
+
+    @classmethod
+    def from_knowledge_graph(cls, name: str, graph: KnowledgeGraph, **kwargs) -> "ContextSection":
+        """
+        関連度順に並んだ知識グラフ（KnowledgeGraph.relevant_subgraphの結果）から区画を作成する。
+        関連の強いエッジから順に、その端点のノードとともに採用される。
+        """
+        node_by_id = {n.id: n for n in graph.nodes}
+        units: List[str] = []
+        emitted: set[str] = set()
+        for edge in graph.edges:
+            for node_id in (edge.source, edge.target):
+                if node_id not in emitted and node_id in node_by_id:
+                    units.append(KnowledgeGraph.node_line(node_by_id[node_id]))
+                    emitted.add(node_id)
+            units.append(KnowledgeGraph.edge_line(edge))
+        # エッジを持たないノード（シードのみなど）は最後に回す
+        units.extend(KnowledgeGraph.node_line(n) for n in graph.nodes if n.id not in emitted)
+
+        def render(lines: List[str]) -> str:
+            node_lines = [line for line in lines if line.startswith("- ノード:")]
+            edge_lines = [line for line in lines if line.startswith("- 関係:")]
+            return KnowledgeGraph.format_lines(node_lines, edge_lines)
+
+        kwargs.setdefault("allow_partial", False)
+        return cls(name, units, render=render, **kwargs)
+
+    def text(self, units: List[str]) -> str:
+        """指定した要素から区画のテキストを組み立てる。"""
+        if not units:
+            return self.empty_text
+        ordered = list(reversed(units)) if self.reverse_output else units
+        if self.render is not None:
+            return self.render(ordered)
+        return self.separator.join(ordered)
+
+
+class ContextAssembler:
+    """
+    複数の区画に、重みに応じてトークン予算を配分する。
+    必要量が配分に満たない区画の余りは、他の区画へ重みに応じて再配分される。
+    """
+    def __init__(self, total_tokens: int, weights: Dict[str, float], min_partial_tokens: int = 32):
+        """
+        Args:
+            total_tokens: 全区画の合計トークン予算。プロンプトの固定部分は含まない。
+            weights: 区画名ごとの配分の重み。未指定の区画の重みは1.0。
+            min_partial_tokens: 要素を途中で切って含める場合の最小トークン数。これ未満しか残っていなければ含めない。
+        """
+        self.total_tokens = total_tokens
+        self.weights = weights
+        self.min_partial_tokens = min_partial_tokens
+
+    def _allocate(self, needs: Dict[str, int]) -> Dict[str, int]:
+        """各区画の必要量と重みから、区画ごとの予算を決める。"""
+        budgets: Dict[str, int] = {}
+        remaining = self.total_tokens
+        active = dict(needs)
+        while active:
+            weight_sum = sum(self.weights.get(name, 1.0) for name in active) or 1.0
+            shares = {name: remaining * self.weights.get(name, 1.0) / weight_sum for name in active}
+            satisfied = [name for name, need in active.items() if need <= shares[name]]
+            if not satisfied:
+                for name in active:
+                    budgets[name] = int(shares[name])
+                break
+            for name in satisfied:
+                budgets[name] = active.pop(name)
+                remaining -= budgets[name]
+        return budgets
+
+    def _fit(self, section: ContextSection, budget: int) -> tuple[List[str], int]:
+        """区画の要素を重要度順に予算まで採用し、採用した要素と切り詰めた要素の数を返す。"""
+        kept: List[str] = []
+        used = 0
+        separator_tokens = estimate_tokens(section.separator)
+        for unit in section.units:
+            cost = estimate_tokens(unit) + (separator_tokens if kept else 0)
+            if used + cost <= budget:
+                kept.append(unit)
+                used += cost
+                continue
+            remaining = budget - used - (separator_tokens if kept else 0)
+            if section.allow_partial and remaining >= self.min_partial_tokens:
+                kept.append(truncate_to_tokens(unit, remaining - 1) + "…")
+                return kept, 1
+            break
+        return kept, 0
+
+    def assemble(self, sections: List[ContextSection]) -> AssembledContext:
+        """
+        区画ごとに予算を配分して切り詰め、プロンプトに埋め込むテキストと、削った量の報告を返す。
+        """
+        needs = {s.name: estimate_tokens(s.text(s.units)) for s in sections}
+        budgets = self._allocate(needs)
+
+        texts: Dict[str, str] = {}
+        report: Dict[str, ContextSectionReport] = {}
+        for section in sections:
+            if needs[section.name] <= budgets[section.name]:
+                kept, truncated = section.units, 0
+            else:
+                kept, truncated = self._fit(section, budgets[section.name])
+            text = section.text(kept)
+            used = estimate_tokens(text) if kept else 0
+            texts[section.name] = text
+            report[section.name] = {
+                "budget_tokens": budgets[section.name],
+                "original_tokens": needs[section.name] if section.units else 0,
+                "used_tokens": used,
+                "dropped_tokens": max(0, (needs[section.name] if section.units else 0) - used),
+                "total_units": len(section.units),
+                "dropped_units": len(section.units) - len(kept) + truncated,
+            }
+        return {"sections": texts, "report": report}
+
+    @staticmethod
+    def format_report(report: Dict[str, ContextSectionReport]) -> str:
+        """assembleの報告をログ向けの1行にまとめる。"""
+        parts = [
+            f"{name}: {r['used_tokens']}/{r['original_tokens']} tok (予算 {r['budget_tokens']}, 削除 {r['dropped_units']}/{r['total_units']}件)"
+            for name, r in report.items()
+        ]
+        dropped = sum(r["dropped_tokens"] for r in report.values())
+        return f"{', '.join(parts)}; 合計削除 {dropped} tok"
@@ -3,4 +3,5 @@
 # role: このディレクトリをPythonパッケージとして定義する。
 
 from .meta_cognitive_engine import MetaCognitiveEngine
-from .self_critic_agent import SelfCriticAgent
\ No newline at end of file
+from .self_critic_agent import SelfCriticAgent
+from .reflection_queue import ReflectionQueue
\ No newline at end of file
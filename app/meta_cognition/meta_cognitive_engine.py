@@ -28,4 +28,19 @@ class MetaCognitiveEngine:
             "final_answer": final_answer,
         }
         criticism = self.self_critic_agent.invoke(input_data)
+        return criticism
+
+    async def acritique_process_and_response(
+        self, query: str, plan: str, cognitive_loop_output: str, final_answer: str
+    ) -> str:
+        """
+        critique_process_and_responseの非同期版。
+        """
+        input_data = {
+            "query": query,
+            "plan": plan,
+            "cognitive_loop_output": cognitive_loop_output,
+            "final_answer": final_answer,
+        }
+        criticism: str = await self.self_critic_agent.ainvoke(input_data)
         return criticism
\ No newline at end of file
@@ -0,0 +1,203 @@
+# /app/meta_cognition/reflection_queue.py
+# title: 応答後の内省キュー
+# role: 回答が得られた後の評価（倫理的な動機づけ、価値観の更新、自己改善、実行トレースの収集など）を、
+#       ユーザーへの応答の後で実行するためのキュー。未処理の項目はジャーナルファイルに記録し、異常終了後も再起動時に処理を再開する。
+
+from __future__ import annotations
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from app.tracing import current_trace_id, start_trace
+
+logger = logging.getLogger(__name__)
+
+ReflectionHandler = Callable[[Dict[str, Any]], Awaitable[None]]
+
+
+class ReflectionQueue:
+    """
+    項目の種類ごとに登録した非同期の処理関数で、キューに積まれた項目を処理する。
+    ジャーナル（JSONL）には、追加（put）、完了（done）、失敗（fail）を1行ずつ追記してfsyncする。
+    起動時にジャーナルを再生して未処理の項目を復元し、未処理の項目のみからなるジャーナルに書き直す。
+    処理はIdleManagerの監視ループからprocess_dueで行い、アイドル中はすべての項目を、
+    対話が続いている間もmax_defer_secondsより長く待っている項目は処理する。
+    """
+    def __init__(self, path: Optional[str], max_attempts: int = 3, max_defer_seconds: Optional[float] = 600):
+        """
+        Args:
+            path: ジャーナルの保存先。Noneの場合は保存しない。
+            max_attempts: 処理に失敗した項目を再試行する最大回数。超えた項目は破棄する。
+            max_defer_seconds: 対話中であっても処理を始めるまでの最大の待ち時間（秒）。Noneの場合はアイドル中のみ処理する。
+        """
+        self.path = path
+        self.max_attempts = max_attempts
+        self.max_defer_seconds = max_defer_seconds
+        self._lock = threading.Lock()
+        self._handlers: Dict[str, ReflectionHandler] = {}
+        self._pending: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._stats = {"enqueued": 0, "recovered": 0, "processed": 0, "failed": 0, "dropped": 0}
+        self._deferred_seconds = 0.0
+        self._load()
+
+    # --- 永続化 ---
+    def _append_locked(self, record: Dict[str, Any]) -> None:
+        if not self.path:
+            return
+        try:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+        except IOError as e:
+            logger.error(f"内省キューのジャーナルへの書き込みに失敗しました {self.path}: {e}")
+
+    def _compact_locked(self) -> None:
+        """未処理の項目のみからなるジャーナルに書き直す。"""
+        if not self.path:
+            return
+        tmp_path = f"{self.path}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                for item in self._pending.values():
+                    f.write(json.dumps({"op": "put", "item": item}, ensure_ascii=False, default=str) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+        except IOError as e:
+            logger.error(f"内省キューのジャーナルの書き直しに失敗しました {self.path}: {e}")
+
+    def _load(self) -> None:
+        if not self.path:
+            return
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # 書き込み途中で終了した最後の行は読み飛ばす
+                    continue
+                if record.get("op") == "put":
+                    self._pending[record["item"]["id"]] = record["item"]
+                elif record.get("op") == "done":
+                    self._pending.pop(record.get("id"), None)
+                elif record.get("op") == "fail" and record.get("id") in self._pending:
+                    self._pending[record["id"]]["attempts"] = record.get("attempts", 0)
+        with self._lock:
+            self._stats["recovered"] = len(self._pending)
+            self._compact_locked()
+        if self._pending:
+            logger.info(f"内省キューの未処理の項目を復元しました: {self.path} ({len(self._pending)}件)")
+
+    # --- 登録と追加 ---
+    def register(self, kind: str, handler: ReflectionHandler) -> None:
+        """項目の種類に対する処理関数を登録する。同じ種類に再度登録した場合は置き換える。"""
+        with self._lock:
+            self._handlers[kind] = handler
+
+    def enqueue(self, kind: str, payload: Dict[str, Any]) -> str:
+        """
+        項目をキューに追加し、そのIDを返す。payloadのうちJSONに変換できない値は文字列として保存される。
+        ジャーナルへの書き込みが終わってから戻るため、戻った後に異常終了しても項目は失われない。
+        """
+        item_id = uuid.uuid4().hex
+        item = {
+            "id": item_id, "kind": kind, "payload": payload, "enqueued_at": time.time(), "attempts": 0,
+            "trace_id": current_trace_id(),
+        }
+        with self._lock:
+            self._pending[item_id] = item
+            self._append_locked({"op": "put", "item": item})
+            self._stats["enqueued"] += 1
+        return item_id
+
+    # --- 処理 ---
+    def _take_due(self, idle: bool, now: float, skip: set) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            for item in self._pending.values():
+                if item["id"] in skip or item["kind"] not in self._handlers:
+                    continue
+                overdue = self.max_defer_seconds is not None and now - item["enqueued_at"] >= self.max_defer_seconds
+                if idle or overdue:
+                    return item
+        return None
+
+    def _finish(self, item: Dict[str, Any], elapsed: float, error: Optional[Exception]) -> None:
+        with self._lock:
+            if error is None:
+                self._pending.pop(item["id"], None)
+                self._append_locked({"op": "done", "id": item["id"]})
+                self._stats["processed"] += 1
+                self._deferred_seconds += elapsed
+            else:
+                item["attempts"] += 1
+                self._stats["failed"] += 1
+                if item["attempts"] >= self.max_attempts:
+                    logger.error(f"内省キューの項目を{item['attempts']}回処理できなかったため破棄します: {item['kind']} ({item['id']})")
+                    self._pending.pop(item["id"], None)
+                    self._append_locked({"op": "done", "id": item["id"]})
+                    self._stats["dropped"] += 1
+                else:
+                    self._append_locked({"op": "fail", "id": item["id"], "attempts": item["attempts"], "error": str(error)})
+            if not self._pending:
+                self._compact_locked()
+
+    async def aprocess_due(self, idle: bool, max_items: Optional[int] = None, now: Optional[float] = None) -> int:
+        """
+        処理の時期が来た項目を古い順に処理し、処理した（失敗を含む）件数を返す。
+        失敗した項目は、次回以降の呼び出しで再試行する。
+
+        Args:
+            idle: アイドル中であればTrue。Falseの場合は、max_defer_secondsより長く待っている項目のみを処理する。
+            max_items: 1回の呼び出しで処理する最大件数。
+        """
+        count = 0
+        attempted: set = set()
+        while max_items is None or count < max_items:
+            item = self._take_due(idle, time.time() if now is None else now, attempted)
+            if item is None:
+                break
+            attempted.add(item["id"])
+            start = time.perf_counter()
+            error: Optional[Exception] = None
+            try:
+                # 処理は、項目を追加したリクエストのトレースに追記する
+                with start_trace(item.get("trace_id"), name=f"reflection.{item['kind']}", category="background"):
+                    await self._handlers[item["kind"]](item["payload"])
+            except Exception as e:
+                logger.error(f"内省キューの項目の処理に失敗しました: {item['kind']} ({item['id']}): {e}", exc_info=True)
+                error = e
+            elapsed = time.perf_counter() - start
+            self._finish(item, elapsed, error)
+            if error is None:
+                logger.info(f"応答後の処理 '{item['kind']}' を実行しました ({elapsed:.2f} s、ユーザーの待ち時間から除外)")
+            count += 1
+        return count
+
+    def process_due(self, idle: bool, max_items: Optional[int] = None) -> int:
+        """aprocess_dueの同期ラッパー。イベントループの外（IdleManagerのスレッドなど）から呼び出す。"""
+        return asyncio.run(self.aprocess_due(idle, max_items))
+
+    def pending_count(self) -> int:
+        with self._lock:
+            return len(self._pending)
+
+    def get_stats(self) -> Dict[str, float]:
+        """
+        追加・復元・処理・失敗・破棄の件数、未処理の件数、およびユーザーの待ち時間から除外した処理時間の合計と平均（秒）を返す。
+        """
+        with self._lock:
+            stats: Dict[str, float] = {key: float(value) for key, value in self._stats.items()}
+            stats["pending"] = float(len(self._pending))
+            stats["deferred_seconds_total"] = self._deferred_seconds
+            stats["deferred_seconds_mean"] = self._deferred_seconds / self._stats["processed"] if self._stats["processed"] else 0.0
+        return stats
@@ -58,7 +58,7 @@ class SelfEvolvingSystem:
         latest_trace = self.performance_traces[-1]
         
         logger.info("Step 1: Performing meta-cognitive analysis on the latest trace.")
-        self_criticism = self.meta_cognitive_engine.critique_process_and_response(
+        self_criticism = await self.meta_cognitive_engine.acritique_process_and_response(
             query=latest_trace.get("query", ""),
             plan=latest_trace.get("plan", ""),
             cognitive_loop_output=latest_trace.get("cognitive_loop_output", ""),
@@ -77,7 +77,7 @@ class SelfEvolvingSystem:
             **latest_trace,
             "self_criticism": self_criticism
         }
-        improvement_suggestions = self.self_improvement_agent.invoke(improvement_input)
+        improvement_suggestions = await self.self_improvement_agent.ainvoke(improvement_input)
         
         if not improvement_suggestions:
             logger.warning("Could not design any improvement suggestions.")
@@ -88,7 +88,7 @@ class SelfEvolvingSystem:
 
         # 3. 実際に自分を改善（の検討と記録）
         logger.info("Step 3: Implementing (considering) improvements.")
-        self.self_correction_agent.consider_and_log_application(improvement_suggestions)
+        await self.self_correction_agent.aconsider_and_log_application(improvement_suggestions)
         
         # 4. 分析が済んだトレースはクリア
         self.performance_traces.clear()
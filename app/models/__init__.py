@@ -2,7 +2,7 @@
 # title: アプリケーションデータモデル
 # role: アプリケーション全体で使用されるデータ構造（TypedDictなど）を定義する。
 
-from typing import TypedDict, Dict, Any # Added Dict, Any
+from typing import TypedDict, Dict, Any, List, NotRequired, Optional # Added Dict, Any
 
 class MasterAgentResponse(TypedDict):
     """
@@ -22,3 +22,143 @@ class OrchestrationDecision(TypedDict):
     # 今後の拡張のためのフィールド
     # 特定のエージェントに対して動的に適用される設定（例: LLMのtemperature, 特定モジュールの有効/無効）
     agent_configs: Dict[str, Dict[str, Any]]
+    # 応答までの遅延予算（ミリ秒）。処理時間のp90がこれを超えると見積もられるモードは、予算に収まるモードへ切り下げられる。
+    latency_budget_ms: NotRequired[Optional[float]]
+
+class StreamEvent(TypedDict, total=False):
+    """
+    MetaIntelligenceEngine.astreamが逐次返すイベント。
+    type が "token" の場合は content に最終回答の断片、
+    "reset" の場合はフォールバックにより直前までの断片が破棄されたことを示し、
+    "response" の場合は response に完全な応答と計測値が入る。
+    """
+    type: str
+    content: str
+    response: MasterAgentResponse
+    time_to_first_token: Optional[float]
+    total_time: float
+
+class LLMCallRecord(TypedDict):
+    """
+    LLMCallRecorderが記録する、LLM呼び出し1回分の計測値。
+    時間はすべて秒、サイズは文字数。generation_timeには実行枠の待ち時間(queue_wait)を含まない。
+    """
+    timestamp: str
+    request_id: str
+    mode: str
+    agent: str
+    model: str
+    priority: str
+    prompt_chars: int
+    output_chars: int
+    queue_wait: float
+    generation_time: float
+    parse_time: float
+    error: Optional[str]
+
+class StructuredOutputCounts(TypedDict):
+    """
+    StructuredOutputStatsが集計する、エージェント1つ分の構造化出力の解析結果の件数。
+    """
+    parsed: int
+    repaired: int
+    failures: int
+    reasked: int
+    recovered: int
+    defaulted: int
+
+class ModelWarmupResult(TypedDict):
+    """
+    ModelWarmerが計測した、モデル1つ分のウォームアップの結果。時間はすべて秒。
+    cold_first_tokenは読み込みを含む初回の、warm_first_tokenは読み込み後の、最初のトークン（埋め込みでは応答）までの時間。
+    """
+    model: str
+    kind: str
+    cold_first_token: Optional[float]
+    warm_first_token: Optional[float]
+    load_duration: Optional[float]
+    error: Optional[str]
+
+class ModeCostEstimate(TypedDict):
+    """
+    ModeCostModelが見積もった、実行モード1つ分の処理時間（ミリ秒）とLLM呼び出し数。
+    """
+    samples: int
+    latency_p50_ms: float
+    latency_p90_ms: float
+    llm_calls_mean: float
+
+class StepGraphReport(TypedDict):
+    """
+    StepGraphの1回の実行の計測結果。時間はすべて秒。
+    critical_pathは、ステップの処理時間の合計が最大となる依存関係の経路（ステップ名の列）。
+    """
+    wall_seconds: float
+    step_sum_seconds: float
+    critical_path_seconds: float
+    critical_path: List[str]
+    steps: Dict[str, float]
+
+class TraceSpan(TypedDict):
+    """
+    トレース内の1区間の記録。start/endはtime.perf_counter()の値（秒）。
+    laneは区間を実行したスレッドとasyncioタスクの名前。
+    """
+    span_id: int
+    parent_id: Optional[int]
+    name: str
+    category: str
+    start: float
+    end: float
+    lane: str
+    args: Dict[str, Any]
+
+class BatchReport(TypedDict):
+    """
+    BatchRunnerの1回の実行の集計結果。時間はすべて秒。
+    skippedは、以前の実行で完了済みか、入力内でIDが重複していたため処理しなかった件数。レイテンシの分位点は今回処理した（成功した）クエリのみから求める。
+    """
+    processed: int
+    succeeded: int
+    failed: int
+    skipped: int
+    wall_seconds: float
+    throughput_qps: float
+    latency_mean: float
+    latency_p50: float
+    latency_p90: float
+    latency_p99: float
+    latency_max: float
+    modes: Dict[str, int]
+
+class IngestionReport(TypedDict):
+    """
+    DocumentIngestorの1回の実行の集計結果。時間は秒。
+    files_skippedは、以前の実行で取り込みが完了しており、内容も変わっていなかったため読み込まなかったファイル数。
+    """
+    files_total: int
+    files_ingested: int
+    files_skipped: int
+    files_failed: int
+    chunks_added: int
+    wall_seconds: float
+    chunks_per_second: float
+
+class ContextSectionReport(TypedDict):
+    """
+    ContextAssemblerが区画ごとに報告する、トークン予算の配分と切り詰めの結果。
+    トークン数は概算値。
+    """
+    budget_tokens: int
+    original_tokens: int
+    used_tokens: int
+    dropped_tokens: int
+    total_units: int
+    dropped_units: int
+
+class AssembledContext(TypedDict):
+    """
+    ContextAssembler.assembleの結果。sectionsは区画名からプロンプトに埋め込むテキストへの対応。
+    """
+    sections: Dict[str, str]
+    report: Dict[str, ContextSectionReport]
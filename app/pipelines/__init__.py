@@ -3,6 +3,7 @@
 # role: このディレクトリをPythonのパッケージとして定義する。
 
 from .base import BasePipeline
+from .step_graph import Step, StepGraph, StepGraphStats
 from .simple_pipeline import SimplePipeline
 from .full_pipeline import FullPipeline
 from .parallel_pipeline import ParallelPipeline
@@ -2,27 +2,71 @@
 # title: パイプライン基底クラス
 # role: すべての推論パイプラインが従うべき基本的なインターフェースを定義する。
 
+import asyncio
 from abc import ABC, abstractmethod
-from typing import Dict, Any
+import time
+from typing import AsyncIterator, Dict, Any, List, Optional
+from app.llm.streaming import iterate_stream_events, start_stream_task
 from app.models import MasterAgentResponse
 from app.models import OrchestrationDecision # ADDED
+from app.models import StreamEvent
+from app.tracing import traced
 
 class BasePipeline(ABC):
     """
     すべての推論パイプラインの抽象基底クラス。
+    サブクラスのarunの実行は、リクエストのトレースにパイプライン名のスパンとして記録される。
     """
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        if "arun" in cls.__dict__:
+            cls.arun = traced(f"{cls.__name__}.arun", "pipeline")(cls.__dict__["arun"])  # type: ignore[method-assign]
+
     # ◾️◾️◾️◾️◾️◾️◾️◾️◾️◾️◾️↓修正開始◾️◾️◾️◾️◾️◾️◾️◾️◾️◾️◾️
     @abstractmethod
-    def run(self, query: str, orchestration_decision: OrchestrationDecision) -> MasterAgentResponse:
+    async def arun(
+        self, query: str, orchestration_decision: OrchestrationDecision, dialogue_history: Optional[List[str]] = None
+    ) -> MasterAgentResponse:
     # ◾️◾️◾️◾️◾️◾️◾️◾️◾️◾️◾️↑修正終わり◾️◾️◾️◾️◾️◾️◾️◾️◾️◾️◾️
         """
-        パイプラインを実行するメソッド。
+        パイプラインを非同期に実行するメソッド。
 
         Args:
             query (str): ユーザーからのクエリ。
             # ADDED: orchestration_decision (OrchestrationDecision): OrchestrationAgentによって決定された実行モードと関連する設定。
+            dialogue_history (Optional[List[str]]): 要求元のセッションのこれまでの対話履歴。パイプラインはエンジン全体で共有されるため、引数で受け取る。
 
         Returns:
             MasterAgentResponse: パイプラインの実行結果。
         """
-        pass
\ No newline at end of file
+        pass
+
+    def run(
+        self, query: str, orchestration_decision: OrchestrationDecision, dialogue_history: Optional[List[str]] = None
+    ) -> MasterAgentResponse:
+        """
+        arunの同期ラッパー。実行中のイベントループが無いスレッドから呼び出すこと。
+        """
+        return asyncio.run(self.arun(query, orchestration_decision, dialogue_history))
+
+    async def astream(
+        self, query: str, orchestration_decision: OrchestrationDecision, dialogue_history: Optional[List[str]] = None
+    ) -> AsyncIterator[StreamEvent]:
+        """
+        パイプラインを実行し、最終段のLLMが生成したトークンを逐次 "token" イベントとして返す。
+        最後に完全な応答を含む "response" イベントを返す。
+        """
+        start_time = time.perf_counter()
+        first_token_time = None
+        task, queue = start_stream_task(self.arun(query, orchestration_decision, dialogue_history))
+        async for event in iterate_stream_events(task, queue):
+            if event["type"] == "token" and first_token_time is None:
+                first_token_time = time.perf_counter() - start_time
+            yield event
+        response = await task
+        yield {
+            "type": "response",
+            "response": response,
+            "time_to_first_token": first_token_time,
+            "total_time": time.perf_counter() - start_time,
+        }
@@ -3,9 +3,11 @@
 # role: 計画、認知ループ、メタ認知、自己改善を含む、最も包括的な推論パイプライン。
 
 import logging
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional, Tuple
 
 from app.pipelines.base import BasePipeline
+from app.pipelines.step_graph import Step, StepGraph, StepGraphStats
+from app.meta_cognition.reflection_queue import ReflectionQueue
 from app.agents.master_agent import MasterAgent
 from app.agents.planning_agent import PlanningAgent
 from app.agents.cognitive_loop_agent import CognitiveLoopAgent
@@ -22,6 +24,8 @@ logger = logging.getLogger(__name__)
 class FullPipeline(BasePipeline):
     """
     計画、認知ループ、メタ認知、自己改善を含む、最も包括的な推論パイプライン。
+    各段階はStepGraphで実行し、互いに依存しない段階は並行に実行する。
+    内省キューを指定した場合、回答に必要ない自己改善・自己修正・記憶への記録・実行トレースの収集はキューに積み、回答を待たずに返す。
     """
     def __init__(
         self,
@@ -34,7 +38,16 @@ class FullPipeline(BasePipeline):
         self_improvement_agent: SelfImprovementAgent,
         self_correction_agent: SelfCorrectionAgent,
         self_evolving_system: SelfEvolvingSystem,
+        max_concurrency: int = 4,
+        step_graph_stats: Optional[StepGraphStats] = None,
+        reflection_queue: Optional[ReflectionQueue] = None,
     ):
+        """
+        Args:
+            max_concurrency: 並行に実行する段階の最大数。
+            step_graph_stats: 段階のグラフの実行時間（クリティカルパスと各段階の合計）の集計先。
+            reflection_queue: 回答後の段階を積む内省キュー。Noneの場合はすべての段階を回答前に実行する。
+        """
         self.master_agent = master_agent
         self.planning_agent = planning_agent
         self.cognitive_loop_agent = cognitive_loop_agent
@@ -44,70 +57,131 @@ class FullPipeline(BasePipeline):
         self.self_improvement_agent = self_improvement_agent
         self.self_correction_agent = self_correction_agent
         self.self_evolving_system = self_evolving_system
+        self.reflection_queue = reflection_queue
+        self.step_graph, self.reflection_graph = self._build_step_graphs(max_concurrency, step_graph_stats)
+        if reflection_queue is not None:
+            reflection_queue.register("full_pipeline.reflection", self._areflect)
 
-    def run(self, query: str, orchestration_decision: OrchestrationDecision) -> MasterAgentResponse:
+    def _build_step_graphs(self, max_concurrency: int, stats: Optional[StepGraphStats]) -> Tuple[StepGraph, StepGraph]:
         """
-        フルパイプラインを実行します。
+        各段階を依存関係のグラフとして定義する。最終回答の生成と問題発見、自己批判と問題発見は互いに依存しないため並行に実行される。
+        回答後の段階は、内省キューから実行するための別のグラフとしても定義する。
         """
-        logger.info(f"--- Full Pipeline started for query: '{query}' ---")
+        answer_steps = [
+            Step("plan", self._plan, ("query",)),
+            Step("cognitive_loop_output", self._cognitive_loop, ("query", "plan", "dialogue_history")),
+            Step("final_answer", self._final_answer, ("query", "plan", "cognitive_loop_output")),
+            Step("potential_problems", self._discover_problems, ("query", "plan", "cognitive_loop_output")),
+            Step("self_criticism", self._critique, ("query", "plan", "cognitive_loop_output", "final_answer")),
+        ]
+        reflection_steps = [
+            Step(
+                "improvement_suggestions", self._suggest_improvements,
+                ("query", "plan", "cognitive_loop_output", "final_answer", "self_criticism"),
+            ),
+            Step("self_correction", self._self_correct, ("improvement_suggestions",)),
+            Step(
+                "memory_consolidation", self._consolidate_memory,
+                ("query", "plan", "final_answer", "self_criticism", "potential_problems", "improvement_suggestions"),
+            ),
+            Step(
+                "execution_trace", self._collect_trace,
+                ("query", "plan", "cognitive_loop_output", "final_answer", "self_criticism"),
+            ),
+        ]
+        if self.reflection_queue is not None:
+            answer_steps.append(Step(
+                "reflection", self._enqueue_reflection,
+                ("query", "plan", "cognitive_loop_output", "final_answer", "self_criticism", "potential_problems"),
+            ))
+        else:
+            answer_steps.extend(reflection_steps)
+        return (
+            StepGraph("full", answer_steps, max_concurrency=max_concurrency, stats=stats),
+            StepGraph("full.reflection", reflection_steps, max_concurrency=max_concurrency, stats=stats),
+        )
 
-        # 1. Plan
-        plan = self.planning_agent.invoke({"query": query})
+    # 1. Plan
+    async def _plan(self, query: str) -> str:
+        plan = await self.planning_agent.ainvoke({"query": query})
         logger.info(f"Generated Plan:\n{plan}")
+        return plan
 
-        # 2. Cognitive Loop
-        cognitive_loop_output = self.cognitive_loop_agent.invoke({
+    # 2. Cognitive Loop
+    async def _cognitive_loop(self, query: str, plan: str, dialogue_history: List[str]) -> str:
+        cognitive_loop_output = await self.cognitive_loop_agent.ainvoke({
             "query": query,
             "plan": plan,
+            "dialogue_history": dialogue_history,
         })
         logger.info(f"Cognitive Loop Output:\n{cognitive_loop_output}")
+        return cognitive_loop_output
 
-        # 3. Master Agent (Generate Final Answer)
+    # 3. Master Agent (Generate Final Answer)
+    async def _final_answer(self, query: str, plan: str, cognitive_loop_output: str) -> str:
         master_agent_input = {
             "query": query,
             "plan": plan,
             "cognitive_loop_output": cognitive_loop_output,
         }
-        final_answer_response = self.master_agent.invoke(master_agent_input)
-        final_answer = final_answer_response['final_answer'] if isinstance(final_answer_response, dict) else str(final_answer_response)
-
+        final_answer = await self.master_agent.agenerate_final_answer(master_agent_input)
         logger.info(f"Final Answer:\n{final_answer}")
+        return final_answer
 
-        # 4. Meta-Cognitive Reflection (Self-Critique)
-        self_criticism = self.meta_cognitive_engine.critique_process_and_response(
+    # 4. Meta-Cognitive Reflection (Self-Critique)
+    async def _critique(self, query: str, plan: str, cognitive_loop_output: str, final_answer: str) -> str:
+        self_criticism = await self.meta_cognitive_engine.acritique_process_and_response(
             query=query,
             plan=plan,
             cognitive_loop_output=cognitive_loop_output,
             final_answer=final_answer
         )
         logger.info(f"Self-Criticism:\n{self_criticism}")
+        return self_criticism
 
-        # 5. Problem Discovery
-        potential_problems_list = self.problem_discovery_agent.invoke({
+    # 5. Problem Discovery
+    async def _discover_problems(self, query: str, plan: str, cognitive_loop_output: str) -> str:
+        potential_problems_list = await self.problem_discovery_agent.ainvoke({
             "query": query,
             "plan": plan,
             "cognitive_loop_output": cognitive_loop_output,
         })
         potential_problems = "\n".join(potential_problems_list) if potential_problems_list else "特になし"
         logger.info(f"Discovered Potential Problems: {potential_problems}")
+        return potential_problems
 
-        # 6. Self-Improvement Suggestion
-        improvement_suggestions: List[Dict[str, Any]] = []
-        if self_criticism and "問題なし" not in self_criticism:
-            improvement_input = {
-                "query": query,
-                "plan": plan,
-                "cognitive_loop_output": cognitive_loop_output,
-                "final_answer": final_answer,
-                "self_criticism": self_criticism,
-            }
-            improvement_suggestions = self.self_improvement_agent.invoke(improvement_input)
-            logger.info(f"Generated Improvement Suggestions: {improvement_suggestions}")
-            
-            # 7. Self-Correction (Consider applying improvements)
-            self.self_correction_agent.consider_and_log_application(improvement_suggestions)
+    # 6. Self-Improvement Suggestion
+    async def _suggest_improvements(
+        self, query: str, plan: str, cognitive_loop_output: str, final_answer: str, self_criticism: str
+    ) -> List[Dict[str, Any]]:
+        if not self_criticism or "問題なし" in self_criticism:
+            return []
+        improvement_input = {
+            "query": query,
+            "plan": plan,
+            "cognitive_loop_output": cognitive_loop_output,
+            "final_answer": final_answer,
+            "self_criticism": self_criticism,
+        }
+        improvement_suggestions = await self.self_improvement_agent.ainvoke(improvement_input)
+        logger.info(f"Generated Improvement Suggestions: {improvement_suggestions}")
+        return improvement_suggestions
 
-        # 8. Memory Consolidation
+    # 7. Self-Correction (Consider applying improvements)
+    async def _self_correct(self, improvement_suggestions: List[Dict[str, Any]]) -> None:
+        if improvement_suggestions:
+            await self.self_correction_agent.aconsider_and_log_application(improvement_suggestions)
+
+    # 8. Memory Consolidation
+    async def _consolidate_memory(
+        self,
+        query: str,
+        plan: str,
+        final_answer: str,
+        self_criticism: str,
+        potential_problems: str,
+        improvement_suggestions: List[Dict[str, Any]],
+    ) -> None:
         self.memory_consolidator.log_event(
             event_type="full_pipeline_run",
             metadata={
@@ -119,8 +193,11 @@ class FullPipeline(BasePipeline):
                 "improvement_suggestions": improvement_suggestions,
             }
         )
-        
-        # 9. Collect trace for self-evolution
+
+    # 9. Collect trace for self-evolution
+    async def _collect_trace(
+        self, query: str, plan: str, cognitive_loop_output: str, final_answer: str, self_criticism: str
+    ) -> None:
         trace_data = {
             "query": query,
             "plan": plan,
@@ -131,11 +208,29 @@ class FullPipeline(BasePipeline):
         self.self_evolving_system.collect_execution_trace(trace_data)
         logger.info("Execution trace collected for potential self-evolution.")
 
+    async def _enqueue_reflection(self, **values: str) -> None:
+        """回答後の段階の入力を内省キューに積む。"""
+        assert self.reflection_queue is not None
+        self.reflection_queue.enqueue("full_pipeline.reflection", values)
+
+    async def _areflect(self, payload: Dict[str, Any]) -> None:
+        """内省キューから、回答後の段階を実行する。"""
+        await self.reflection_graph.arun(payload)
+
+    async def arun(
+        self, query: str, orchestration_decision: OrchestrationDecision, dialogue_history: Optional[List[str]] = None
+    ) -> MasterAgentResponse:
+        """
+        フルパイプラインを非同期に実行します。
+        対話履歴は、要求元のセッションのものを引数で受け取る。
+        """
+        logger.info(f"--- Full Pipeline started for query: '{query}' ---")
+        values, _ = await self.step_graph.arun({"query": query, "dialogue_history": list(dialogue_history or [])})
         logger.info("--- Full Pipeline finished ---")
 
         return {
-            "final_answer": final_answer,
-            "self_criticism": self_criticism,
-            "potential_problems": potential_problems,
-            "retrieved_info": cognitive_loop_output
-        }
\ No newline at end of file
+            "final_answer": values["final_answer"],
+            "self_criticism": values["self_criticism"],
+            "potential_problems": values["potential_problems"],
+            "retrieved_info": values["cognitive_loop_output"]
+        }
@@ -4,13 +4,14 @@
 
 import logging
 import time
-from typing import Any, Dict
+from typing import Any, Dict, List, Optional
 
 from app.pipelines.base import BasePipeline
 from app.models import MasterAgentResponse
 from app.internal_dialogue.dialogue_participant_agent import DialogueParticipantAgent
 from app.internal_dialogue.consciousness_staging_area import ConsciousnessStagingArea
 from app.integrated_information_processing.integrated_information_agent import IntegratedInformationAgent
+from app.llm.streaming import ainvoke_streaming
 from app.models import OrchestrationDecision # ADDED
 
 from app.config import settings # ADDED
@@ -31,15 +32,17 @@ class InternalDialoguePipeline(BasePipeline):
         self.consciousness_staging_area = consciousness_staging_area
         self.integrated_information_agent = integrated_information_agent
 
-    def run(self, query: str, orchestration_decision: OrchestrationDecision) -> MasterAgentResponse:
+    async def arun(
+        self, query: str, orchestration_decision: OrchestrationDecision, dialogue_history: Optional[List[str]] = None
+    ) -> MasterAgentResponse:
         """
-        パイプラインを実行する。
+        パイプラインを非同期に実行する。
         """
         start_time = time.time()
         logger.info("--- Internal Dialogue Pipeline START ---")
 
         # 1. 問題に関連する思考エージェント（ペルソナ）を動的に生成
-        participants = self.dialogue_participant_agent.invoke({"query": query})
+        participants = await self.dialogue_participant_agent.ainvoke({"query": query})
         if not participants:
             logger.error("対話参加者の生成に失敗しました。")
             return {
@@ -51,14 +54,16 @@ class InternalDialoguePipeline(BasePipeline):
 
         # 2. 意識のステージで内省的対話を実行
         max_turns = settings.PIPELINE_SETTINGS["internal_dialogue"]["max_turns"]
-        dialogue_summary = self.consciousness_staging_area.run_dialogue(query, participants, max_turns=max_turns)
+        dialogue_summary = await self.consciousness_staging_area.arun_dialogue(query, participants, max_turns=max_turns)
 
         # 3. 対話結果を統合して最終回答を生成
         integration_input = {
             "query": query,
             "persona_outputs": dialogue_summary
         }
-        final_answer = self.integrated_information_agent.invoke(integration_input)
+        if self.integrated_information_agent._chain is None:
+            raise RuntimeError("IntegratedInformationAgent's chain is not initialized for this pipeline.")
+        final_answer = await ainvoke_streaming(self.integrated_information_agent._chain, integration_input)
         
         logger.info(f"--- Internal Dialogue Pipeline END ({(time.time() - start_time):.2f} s) ---")
         
@@ -2,10 +2,10 @@
 # title: 並列推論パイプライン
 # role: 複数の思考プロセスを並列実行し、最も優れた回答を選択する。
 
+import asyncio
 import logging
 import time
-from typing import Any, List, Dict
-from concurrent.futures import ThreadPoolExecutor
+from typing import Any, List, Dict, Optional
 
 from app.pipelines.base import BasePipeline
 from app.agents.cognitive_loop_agent import CognitiveLoopAgent
@@ -13,6 +13,8 @@ from app.agents.master_agent import MasterAgent
 from app.models import MasterAgentResponse
 from langchain_core.prompts import ChatPromptTemplate
 from app.models import OrchestrationDecision # ADDED
+from app.llm.instrumentation import with_agent_label
+from app.llm.streaming import ainvoke_streaming
 
 logger = logging.getLogger(__name__)
 
@@ -24,30 +26,29 @@ class ParallelPipeline(BasePipeline):
         self.cognitive_loop_agent_factory = cognitive_loop_agent_factory
         self.master_agent = master_agent
 
-    def _run_single_loop(self, query: str, complexity: str) -> Dict[str, Any]:
-        """単一の認知ループを実行する"""
+    async def _run_single_loop(self, query: str, complexity: str) -> Dict[str, Any]:
+        """単一の認知ループを非同期に実行する"""
         agent: CognitiveLoopAgent = self.cognitive_loop_agent_factory()
         # ここでは複雑性に応じてプロンプト等を変更するロジックを追加できる
         # 今回は簡略化のため、同じエージェントを呼び出す
-        output = agent.invoke({"query": f"({complexity}の複雑度で分析) {query}", "plan": "並列分析"})
+        output = await agent.ainvoke({"query": f"({complexity}の複雑度で分析) {query}", "plan": "並列分析"})
         return {"complexity": complexity, "output": output}
 
     # ◾️◾️◾️◾️◾️◾️◾️◾️◾️◾️◾️↓修正開始◾️◾️◾️◾️◾️◾️◾️◾️◾️◾️◾️
-    def run(self, query: str, orchestration_decision: OrchestrationDecision) -> MasterAgentResponse:
+    async def arun(
+        self, query: str, orchestration_decision: OrchestrationDecision, dialogue_history: Optional[List[str]] = None
+    ) -> MasterAgentResponse:
     # ◾️◾️◾️◾️◾️◾️◾️◾️◾️◾️◾️↑修正終わり◾️◾️◾️◾️◾️◾️◾️◾️◾️◾️◾️
         """
-        パイプラインを実行する。
+        パイプラインを非同期に実行する。
         """
         start_time = time.time()
         logger.info("--- Parallel Pipeline START ---")
 
         complexities = ["low", "medium", "high"]
-        results: List[Dict[str, Any]] = []
-
-        with ThreadPoolExecutor(max_workers=len(complexities)) as executor:
-            futures = [executor.submit(self._run_single_loop, query, comp) for comp in complexities]
-            for future in futures:
-                results.append(future.result())
+        results: List[Dict[str, Any]] = list(
+            await asyncio.gather(*(self._run_single_loop(query, comp) for comp in complexities))
+        )
 
         # 各結果を整形
         formatted_results = "\n\n---\n\n".join(
@@ -68,8 +69,10 @@ class ParallelPipeline(BasePipeline):
             """
         )
         
-        selection_chain = selection_prompt | self.master_agent.llm | self.master_agent.output_parser
-        final_answer = selection_chain.invoke({"query": query, "results": formatted_results})
+        selection_chain = with_agent_label(
+            selection_prompt | self.master_agent.llm | self.master_agent.output_parser, "ParallelPipeline.selection"
+        )
+        final_answer = await ainvoke_streaming(selection_chain, {"query": query, "results": formatted_results})
         
         logger.info(f"--- Parallel Pipeline END ({(time.time() - start_time):.2f} s) ---")
         
@@ -2,10 +2,10 @@
 # title: 量子インスパイアード推論パイプライン
 # role: 複数のペルソナの視点から並列で仮説を生成し、一つの包括的な回答に統合する。
 
+import asyncio
 import logging
 import time
-from typing import Any, List, Dict
-from concurrent.futures import ThreadPoolExecutor
+from typing import Any, List, Dict, Optional
 
 from app.pipelines.base import BasePipeline
 from app.agents.master_agent import MasterAgent
@@ -14,6 +14,8 @@ from app.config import settings
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.runnables import Runnable
 from app.integrated_information_processing.integrated_information_agent import IntegratedInformationAgent
+from app.llm.instrumentation import with_agent_label
+from app.llm.streaming import ainvoke_streaming
 from app.models import OrchestrationDecision
 
 logger = logging.getLogger(__name__)
@@ -26,8 +28,8 @@ class QuantumInspiredPipeline(BasePipeline):
         self.master_agent = master_agent
         self.integrated_information_agent = integrated_information_agent
 
-    def _run_persona_thought(self, query: str, persona_data: Dict[str, str]) -> Dict[str, Any]:
-        """単一のペルソナで思考を実行する"""
+    async def _run_persona_thought(self, query: str, persona_data: Dict[str, str]) -> Dict[str, Any]:
+        """単一のペルソナで思考を非同期に実行する"""
         persona_prompt = ChatPromptTemplate.from_template(
             """{persona}
             あなたは上記のペルソナになりきり、以下の要求に対して回答を生成してください。
@@ -37,19 +39,22 @@ class QuantumInspiredPipeline(BasePipeline):
             ペルソナとしての回答:
             """
         )
-        chain: Runnable = persona_prompt | self.master_agent.llm | self.master_agent.output_parser
-        output = chain.invoke({"query": query, "persona": persona_data["persona"]})
+        chain: Runnable = with_agent_label(
+            persona_prompt | self.master_agent.llm | self.master_agent.output_parser, "QuantumInspiredPipeline.persona"
+        )
+        output = await chain.ainvoke({"query": query, "persona": persona_data["persona"]})
         return {"name": persona_data["name"], "output": output}
 
-    def run(self, query: str, orchestration_decision: OrchestrationDecision) -> MasterAgentResponse:
+    async def arun(
+        self, query: str, orchestration_decision: OrchestrationDecision, dialogue_history: Optional[List[str]] = None
+    ) -> MasterAgentResponse:
         """
-        パイプラインを実行する。
+        パイプラインを非同期に実行する。
         """
         start_time = time.time()
         logger.info("--- Quantum-Inspired Pipeline START ---")
 
         personas = settings.QUANTUM_PERSONAS if hasattr(settings, 'QUANTUM_PERSONAS') else []
-        results: List[Dict[str, Any]] = []
 
         if not personas:
             logger.warning("量子インスパイアードパイプライン用のペルソナが設定されていません。")
@@ -60,10 +65,9 @@ class QuantumInspiredPipeline(BasePipeline):
                 "retrieved_info": ""
             }
 
-        with ThreadPoolExecutor(max_workers=len(personas)) as executor:
-            futures = [executor.submit(self._run_persona_thought, query, p) for p in personas]
-            for future in futures:
-                results.append(future.result())
+        results: List[Dict[str, Any]] = list(
+            await asyncio.gather(*(self._run_persona_thought(query, p) for p in personas))
+        )
 
         # 各結果を整形
         formatted_results = "\n\n---\n\n".join(
@@ -75,7 +79,9 @@ class QuantumInspiredPipeline(BasePipeline):
             "query": query,
             "persona_outputs": formatted_results
         }
-        final_answer = self.integrated_information_agent.invoke(synthesis_input)
+        if self.integrated_information_agent._chain is None:
+            raise RuntimeError("IntegratedInformationAgent's chain is not initialized for this pipeline.")
+        final_answer = await ainvoke_streaming(self.integrated_information_agent._chain, synthesis_input)
         
         logger.info(f"--- Quantum-Inspired Pipeline END ({(time.time() - start_time):.2f} s) ---")
         
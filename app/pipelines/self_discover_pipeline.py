@@ -4,7 +4,7 @@
 
 import logging
 import time
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Optional
 
 from app.pipelines.base import BasePipeline
 from app.agents.planning_agent import PlanningAgent
@@ -36,16 +36,18 @@ class SelfDiscoverPipeline(BasePipeline):
         }
 
     # ◾️◾️◾️◾️◾️◾️◾️◾️◾️◾️◾️↓修正開始◾️◾️◾️◾️◾️◾️◾️◾️◾️◾️◾️
-    def run(self, query: str, orchestration_decision: OrchestrationDecision) -> MasterAgentResponse:
+    async def arun(
+        self, query: str, orchestration_decision: OrchestrationDecision, dialogue_history: Optional[List[str]] = None
+    ) -> MasterAgentResponse:
     # ◾️◾️◾️◾️◾️◾️◾️◾️◾️◾️◾️↑修正終わり◾️◾️◾️◾️◾️◾️◾️◾️◾️◾️◾️
         """
-        パイプラインを実行する。
+        パイプラインを非同期に実行する。
         """
         start_time = time.time()
         logger.info("--- Self-Discover Pipeline START ---")
 
         # 1. 思考戦略の選択
-        strategy_sequence_str = self.planning_agent.select_thinking_modules(query)
+        strategy_sequence_str = await self.planning_agent.aselect_thinking_modules(query)
         strategy_sequence = [s.strip() for s in strategy_sequence_str.split(',')]
         logger.info(f"選択された思考戦略シーケンス: {strategy_sequence}")
 
@@ -76,7 +78,7 @@ class SelfDiscoverPipeline(BasePipeline):
                 input_data = execution_context["query"]
 
             logger.info(f"実行中モジュール: {module_name}, 入力: {input_data}")
-            output = agent.invoke(input_data)
+            output = await agent.ainvoke(input_data)
             
             execution_context["last_output"] = output
             trace_entry = f"【{module_name}の出力】\n{output}"
@@ -4,7 +4,7 @@
 
 import time
 import logging
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional
 
 from app.pipelines.base import BasePipeline
 from app.agents.master_agent import MasterAgent
@@ -23,22 +23,21 @@ class SimplePipeline(BasePipeline):
         self.cognitive_loop_agent = cognitive_loop_agent
 
     # ◾️◾️◾️◾️◾️◾️◾️◾️◾️◾️◾️↓修正開始◾️◾️◾️◾️◾️◾️◾️◾️◾️◾️◾️
-    def run(self, query: str, orchestration_decision: OrchestrationDecision) -> MasterAgentResponse:
+    async def arun(
+        self, query: str, orchestration_decision: OrchestrationDecision, dialogue_history: Optional[List[str]] = None
+    ) -> MasterAgentResponse:
     # ◾️◾️◾️◾️◾️◾️◾️◾️◾️◾️◾️↑修正終わり◾️◾️◾️◾️◾️◾️◾️◾️◾️◾️◾️
         """
-        パイプラインを実行する。
+        パイプラインを非同期に実行する。
         """
         start_time = time.time()
         logger.info("--- Simple Pipeline START ---")
 
-        docs = self.cognitive_loop_agent.retriever.invoke(query)
+        docs = await self.cognitive_loop_agent.retriever.ainvoke(query)
         retrieved_info = "\n\n".join([doc.page_content for doc in docs])
         
         simple_input = {"query": query, "retrieved_info": retrieved_info}
-        
-        if self.master_agent._chain is None:
-            raise RuntimeError("MasterAgent's chain is not initialized for this pipeline.")
-        final_answer = self.master_agent._chain.invoke(simple_input)
+        final_answer = await self.master_agent.agenerate_simple_answer(simple_input)
         
         logger.info(f"--- Simple Pipeline END ({(time.time() - start_time):.2f} s) ---")
 
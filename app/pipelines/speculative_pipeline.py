@@ -2,10 +2,10 @@
 # title: 投機的思考パイプライン
 # role: 高速なローカルモデルで思考ドラフトを生成し、高性能モデルで検証・統合する。
 
+import asyncio
 import logging
 import time
-from typing import Any, List, Dict
-from concurrent.futures import ThreadPoolExecutor
+from typing import Any, List, Dict, Optional
 
 from app.pipelines.base import BasePipeline
 from app.agents.master_agent import MasterAgent
@@ -15,6 +15,8 @@ from langchain_ollama import OllamaLLM
 from app.models import OrchestrationDecision # ADDED: OrchestrationDecisionをインポート
 
 from app.config import settings # ADDED
+from app.llm.streaming import ainvoke_streaming
+from app.llm.instrumentation import with_agent_label
 
 logger = logging.getLogger(__name__)
 
@@ -27,8 +29,8 @@ class SpeculativePipeline(BasePipeline):
         self.verifier_llm = verifier_llm
         self.output_parser = output_parser
 
-    def _generate_draft(self, query: str, draft_number: int) -> str:
-        """単一の思考ドラフトを生成する"""
+    async def _generate_draft(self, query: str, draft_number: int) -> str:
+        """単一の思考ドラフトを非同期に生成する"""
         logger.info(f"思考ドラフト {draft_number} を生成中...")
         draft_prompt = ChatPromptTemplate.from_template(
             """あなたは高速にアイデアを出すブレーンストーミングAIです。以下の要求に対して、完璧でなくて良いので、とにかく思考のドラフト（下書き）を生成してください。
@@ -37,24 +39,24 @@ class SpeculativePipeline(BasePipeline):
             ---
             思考ドラフト:"""
         )
-        chain = draft_prompt | self.drafter_llm | self.output_parser
-        return chain.invoke({"query": query})
+        chain = with_agent_label(draft_prompt | self.drafter_llm | self.output_parser, "SpeculativePipeline.draft")
+        draft: str = await chain.ainvoke({"query": query})
+        return draft
 
     # BasePipelineのシグネチャと一致させるため、orchestration_decision引数を追加
-    def run(self, query: str, orchestration_decision: OrchestrationDecision) -> MasterAgentResponse:
+    async def arun(
+        self, query: str, orchestration_decision: OrchestrationDecision, dialogue_history: Optional[List[str]] = None
+    ) -> MasterAgentResponse:
         """
-        パイプラインを実行する。
+        パイプラインを非同期に実行する。
         """
         start_time = time.time()
         logger.info("--- Speculative Pipeline START ---")
 
         num_drafts = settings.PIPELINE_SETTINGS["speculative"]["num_drafts"]
-        drafts: List[str] = []
-
-        with ThreadPoolExecutor(max_workers=num_drafts) as executor:
-            futures = [executor.submit(self._generate_draft, query, i + 1) for i in range(num_drafts)]
-            for future in futures:
-                drafts.append(future.result())
+        drafts: List[str] = list(
+            await asyncio.gather(*(self._generate_draft(query, i + 1) for i in range(num_drafts)))
+        )
 
         formatted_drafts = "\n\n---\n\n".join(
             [f"【ドラフト {i+1}】\n{draft}" for i, draft in enumerate(drafts)]
@@ -76,8 +78,8 @@ class SpeculativePipeline(BasePipeline):
             """
         )
         
-        verification_chain = verification_prompt | self.verifier_llm | self.output_parser
-        final_answer = verification_chain.invoke({"query": query, "drafts": formatted_drafts})
+        verification_chain = with_agent_label(verification_prompt | self.verifier_llm | self.output_parser, "SpeculativePipeline.verify")
+        final_answer = await ainvoke_streaming(verification_chain, {"query": query, "drafts": formatted_drafts})
         
         logger.info(f"--- Speculative Pipeline END ({(time.time() - start_time):.2f} s) ---")
         
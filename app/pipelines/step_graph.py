@@ -0,0 +1,189 @@
+# /app/pipelines/step_graph.py
+# title: ステップグラフ実行器
+# role: パイプラインの処理を、入力（依存する値の名前）を宣言したステップの有向非巡回グラフとして記述し、
+#       入力が揃ったステップから同時実行数の上限内で並行に実行する。実行ごとにクリティカルパスの処理時間とステップの処理時間の合計を報告する。
+
+from __future__ import annotations
+import asyncio
+import logging
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence, Tuple
+
+from app.models import StepGraphReport
+from app.tracing import trace_span
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class Step:
+    """
+    グラフの1ステップ。funcはinputsの名前をキーワード引数として受け取り、結果はステップ名の値となる。
+    inputsには、他のステップの名前か、実行時に渡す初期値の名前を指定する。
+    """
+    name: str
+    func: Callable[..., Awaitable[Any]]
+    inputs: Tuple[str, ...] = ()
+
+
+class StepGraphStats:
+    """
+    グラフ名ごとに、実行回数と、実時間・ステップの処理時間の合計・クリティカルパスの処理時間の平均を集計する。
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._totals: Dict[str, Dict[str, float]] = {}
+
+    def record(self, graph_name: str, report: StepGraphReport) -> None:
+        with self._lock:
+            totals = self._totals.setdefault(graph_name, {"runs": 0.0, "wall": 0.0, "step_sum": 0.0, "critical_path": 0.0})
+            totals["runs"] += 1
+            totals["wall"] += report["wall_seconds"]
+            totals["step_sum"] += report["step_sum_seconds"]
+            totals["critical_path"] += report["critical_path_seconds"]
+
+    def get_stats(self) -> Dict[str, Dict[str, float]]:
+        """
+        グラフ名ごとの実行回数と各平均（秒）、および並行実行による短縮率（ステップの処理時間の合計 / 実時間）を返す。
+        """
+        with self._lock:
+            snapshot = {name: dict(totals) for name, totals in self._totals.items()}
+        stats: Dict[str, Dict[str, float]] = {}
+        for name, totals in snapshot.items():
+            runs = totals["runs"]
+            stats[name] = {
+                "runs": runs,
+                "wall_mean": totals["wall"] / runs,
+                "step_sum_mean": totals["step_sum"] / runs,
+                "critical_path_mean": totals["critical_path"] / runs,
+                "parallel_speedup": totals["step_sum"] / totals["wall"] if totals["wall"] else 0.0,
+            }
+        return stats
+
+
+class StepGraph:
+    """
+    ステップの有向非巡回グラフ。構築時に、ステップ名の重複と依存関係の循環を検査する。
+    いずれかのステップが例外を送出した場合は、実行中の他のステップをキャンセルして例外を送出する。
+    """
+    def __init__(
+        self,
+        name: str,
+        steps: Sequence[Step],
+        max_concurrency: int = 4,
+        stats: Optional[StepGraphStats] = None,
+    ):
+        """
+        Args:
+            name: 集計とログに用いるグラフの名前。
+            steps: ステップのリスト。並び順は、同時に実行可能になったステップを開始する順序となる。
+            max_concurrency: 同時に実行するステップの最大数。
+            stats: 実行ごとの計測結果の集計先。
+        """
+        self.name = name
+        self.steps = list(steps)
+        self.max_concurrency = max(1, max_concurrency)
+        self.stats = stats
+        self._by_name = {step.name: step for step in self.steps}
+        if len(self._by_name) != len(self.steps):
+            raise ValueError(f"ステップグラフ'{name}'にステップ名の重複があります。")
+        self._check_acyclic()
+
+    def _dependencies(self, step: Step) -> List[str]:
+        """ステップの入力のうち、他のステップの結果であるものを返す。"""
+        return [name for name in step.inputs if name in self._by_name]
+
+    def _check_acyclic(self) -> None:
+        visiting: set = set()
+        visited: set = set()
+
+        def visit(name: str, path: List[str]) -> None:
+            if name in visited:
+                return
+            if name in visiting:
+                raise ValueError(f"ステップグラフ'{self.name}'に循環があります: {' -> '.join(path + [name])}")
+            visiting.add(name)
+            for dependency in self._dependencies(self._by_name[name]):
+                visit(dependency, path + [name])
+            visiting.discard(name)
+            visited.add(name)
+
+        for step in self.steps:
+            visit(step.name, [])
+
+    def _critical_path(self, durations: Dict[str, float]) -> Tuple[float, List[str]]:
+        """処理時間の合計が最大となる依存関係の経路と、その合計を返す。"""
+        longest: Dict[str, Tuple[float, List[str]]] = {}
+
+        def visit(name: str) -> Tuple[float, List[str]]:
+            if name not in longest:
+                upstream = max((visit(d) for d in self._dependencies(self._by_name[name])), default=(0.0, []), key=lambda x: x[0])
+                longest[name] = (upstream[0] + durations.get(name, 0.0), upstream[1] + [name])
+            return longest[name]
+
+        return max((visit(step.name) for step in self.steps), default=(0.0, []), key=lambda x: x[0])
+
+    async def _run_step(
+        self, step: Step, values: Dict[str, Any], semaphore: asyncio.Semaphore, durations: Dict[str, float]
+    ) -> Any:
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                with trace_span(f"{self.name}.{step.name}", "step"):
+                    return await step.func(**{name: values[name] for name in step.inputs})
+            finally:
+                durations[step.name] = time.perf_counter() - start
+
+    async def arun(self, initial_values: Dict[str, Any]) -> Tuple[Dict[str, Any], StepGraphReport]:
+        """
+        グラフを実行し、初期値と全ステップの結果を名前で引けるdictと、計測結果を返す。
+
+        Args:
+            initial_values: ステップの入力として渡す初期値。ステップ名と同じ名前は使えない。
+        """
+        missing = sorted({name for step in self.steps for name in step.inputs} - set(self._by_name) - set(initial_values))
+        if missing:
+            raise ValueError(f"ステップグラフ'{self.name}'の入力が不足しています: {missing}")
+        conflicting = sorted(set(self._by_name) & set(initial_values))
+        if conflicting:
+            raise ValueError(f"ステップグラフ'{self.name}'の初期値にステップ名と同じ名前があります: {conflicting}")
+
+        values = dict(initial_values)
+        durations: Dict[str, float] = {}
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        pending = list(self.steps)
+        running: Dict["asyncio.Task[Any]", str] = {}
+        start = time.perf_counter()
+        try:
+            while pending or running:
+                ready = [step for step in pending if all(name in values for name in step.inputs)]
+                for step in ready:
+                    pending.remove(step)
+                    running[asyncio.create_task(self._run_step(step, values, semaphore, durations))] = step.name
+                done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    values[running.pop(task)] = task.result()
+        finally:
+            for task in running:
+                task.cancel()
+            if running:
+                await asyncio.gather(*running, return_exceptions=True)
+
+        critical_path_seconds, critical_path = self._critical_path(durations)
+        report: StepGraphReport = {
+            "wall_seconds": time.perf_counter() - start,
+            "step_sum_seconds": sum(durations.values()),
+            "critical_path_seconds": critical_path_seconds,
+            "critical_path": critical_path,
+            "steps": durations,
+        }
+        logger.info(
+            f"ステップグラフ'{self.name}': 実時間 {report['wall_seconds']:.3f} s, "
+            f"クリティカルパス {critical_path_seconds:.3f} s ({' -> '.join(critical_path)}), "
+            f"ステップの合計 {report['step_sum_seconds']:.3f} s"
+        )
+        if self.stats is not None:
+            self.stats.record(self.name, report)
+        return values, report
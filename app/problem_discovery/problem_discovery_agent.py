@@ -4,23 +4,27 @@
 
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.runnables import Runnable
-from langchain_core.output_parsers import JsonOutputParser
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Optional
 
 from app.agents.base import AIAgent
+from app.llm.structured_output import StructuredOutputStats, build_structured_chain
 
 class ProblemDiscoveryAgent(AIAgent):
     """
     ユーザーの潜在的な問題や関連する疑問を発見するAIエージェント。
     """
-    def __init__(self, llm: Any, output_parser: Any, prompt_template: ChatPromptTemplate):
+    def __init__(self, llm: Any, output_parser: Any, prompt_template: ChatPromptTemplate, structured_output_stats: Optional[StructuredOutputStats] = None):
         self.llm = llm
-        self.output_parser = JsonOutputParser()
         self.prompt_template = prompt_template
+        self.structured_output_stats = structured_output_stats
         super().__init__()
 
     def build_chain(self) -> Runnable:
-        return self.prompt_template | self.llm | self.output_parser
+        # 出力はリストのため、オブジェクトしか生成できないJSONモードは使わない
+        return build_structured_chain(
+            self.prompt_template, self.llm, "ProblemDiscoveryAgent",
+            stats=self.structured_output_stats, expected_type=list, default=[], json_mode=False,
+        )
 
     def invoke(self, input_data: Dict[str, Any] | str) -> List[str]:
         if not isinstance(input_data, dict):
@@ -3,4 +3,5 @@
 # role: このディレクトリをPythonのパッケージとして定義する。
 
 from .knowledge_base import KnowledgeBase
-from .retriever import Retriever
\ No newline at end of file
+from .lexical_index import BM25Index
+from .retriever import Retriever, retrieval_weights
@@ -0,0 +1,83 @@
+# /app/rag/ann_index.py
+# title: 近似最近傍探索インデックス
+# role: ナレッジベースのベクトルストアで用いるFAISSのインデックス（総当たりのflat、粗い量子化器を学習するIVF、グラフ探索のHNSW）を構築する。
+#       いずれもLangChainのFAISSの既定と同じL2距離を用いるため、ベクトルストアのインデックスを差し替えても検索のスコアの意味は変わらない。
+
+from __future__ import annotations
+import logging
+import math
+from typing import Any, Dict, Optional
+
+import faiss
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+INDEX_TYPES = ("flat", "ivf", "hnsw")
+
+# IVFの粗い量子化器の学習に、リストあたり最低限必要なベクトル数（これより少ない場合はリスト数を減らす）
+_MIN_POINTS_PER_LIST = 39
+
+
+def index_type_of(index: Any) -> str:
+    """FAISSのインデックスの種類（flat、ivf、hnsw）を返す。"""
+    if isinstance(index, faiss.IndexHNSW):
+        return "hnsw"
+    if isinstance(index, faiss.IndexIVF):
+        return "ivf"
+    return "flat"
+
+
+def ivf_list_count(num_vectors: int, nlist: Optional[int] = None) -> int:
+    """IVFのリスト数。指定がなければベクトル数の平方根の4倍とし、学習に十分なベクトル数が得られる範囲に抑える。"""
+    wanted = nlist if nlist else int(4 * math.sqrt(max(num_vectors, 1)))
+    return max(1, min(wanted, num_vectors // _MIN_POINTS_PER_LIST))
+
+
+def build_index(vectors: np.ndarray, index_type: str, params: Optional[Dict[str, Any]] = None) -> Any:
+    """
+    ベクトル（float32の2次元配列）からFAISSのインデックスを構築する。追加の順序は保たれるため、ベクトルストアの位置とドキュメントの対応はそのまま使える。
+
+    Args:
+        index_type: "flat"、"ivf"、"hnsw"のいずれか。
+        params: ivf_nlist（Noneで自動）、ivf_nprobe、hnsw_m、hnsw_ef_construction、hnsw_ef_search。
+    """
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"不明なインデックスの種類です: {index_type}（利用可能: {INDEX_TYPES}）")
+    params = params or {}
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    dimension = vectors.shape[1]
+    index: faiss.Index
+    if index_type == "flat":
+        index = faiss.IndexFlatL2(dimension)
+    elif index_type == "ivf":
+        nlist = ivf_list_count(len(vectors), params.get("ivf_nlist"))
+        index = faiss.IndexIVFFlat(faiss.IndexFlatL2(dimension), dimension, nlist)
+        index.train(vectors)
+    else:
+        hnsw_index = faiss.IndexHNSWFlat(dimension, int(params.get("hnsw_m", 32)))
+        hnsw_index.hnsw.efConstruction = int(params.get("hnsw_ef_construction", 80))
+        index = hnsw_index
+    apply_search_params(index, params)
+    if len(vectors):
+        index.add(vectors)
+    return index
+
+
+def apply_search_params(index: Any, params: Dict[str, Any]) -> None:
+    """検索時の設定（IVFで探索するリスト数、HNSWの探索の幅）をインデックスに設定する。"""
+    kind = index_type_of(index)
+    if kind == "ivf":
+        index.nprobe = min(int(params.get("ivf_nprobe", 16)), index.nlist)
+    elif kind == "hnsw":
+        index.hnsw.efSearch = int(params.get("hnsw_ef_search", 64))
+
+
+def reconstruct_all(index: Any, start: int = 0, end: Optional[int] = None) -> np.ndarray:
+    """インデックスに追加されたベクトルのうち、start番目からend番目の手前までを追加した順に取り出す。"""
+    end = index.ntotal if end is None else end
+    if end <= start:
+        return np.zeros((0, index.d), dtype=np.float32)
+    if index_type_of(index) == "ivf":
+        index.make_direct_map()
+    return index.reconstruct_n(start, end - start)
@@ -0,0 +1,188 @@
+# /app/rag/embedding_cache.py
+# title: 埋め込みキャッシュ
+# role: テキストと埋め込みモデル名のハッシュをキーに、埋め込みベクトルをfloat32のバイト列としてローカルディスク（SQLite）へ保存し、
+#       ナレッジベースへの追加・インデックスの作り直し・検索クエリで、同じテキストの埋め込みを再利用する。
+
+from __future__ import annotations
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+logger = logging.getLogger(__name__)
+
+
+class EmbeddingCacheStore:
+    """
+    埋め込みベクトルを保存するSQLiteベースのストア。最大件数を超えた場合は、最終アクセスが古いものから削除する。
+    複数のCachedEmbeddingsから共有されることを想定し、スレッドセーフに実装されている。
+    """
+    def __init__(self, path: str, max_entries: int):
+        self.path = path
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+
+        cache_dir = os.path.dirname(path)
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS embeddings (
+                key TEXT PRIMARY KEY,
+                model TEXT NOT NULL,
+                vector BLOB NOT NULL,
+                last_accessed REAL NOT NULL
+            )"""
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_lru ON embeddings (last_accessed)")
+        self._conn.commit()
+        self._evicted = 0
+        logger.info(f"埋め込みキャッシュを初期化しました: {path} (最大{max_entries}件)")
+
+    def get_many(self, keys: Sequence[str]) -> Dict[str, List[float]]:
+        """キーに対応するベクトルを返す。存在しないキーは結果に含まれない。"""
+        if not keys:
+            return {}
+        now = time.time()
+        found: Dict[str, List[float]] = {}
+        unique = list(dict.fromkeys(keys))
+        with self._lock:
+            # SQLiteの変数の上限を超えないよう、分けて問い合わせる
+            for i in range(0, len(unique), 500):
+                chunk = unique[i:i + 500]
+                placeholders = ",".join("?" * len(chunk))
+                for key, blob in self._conn.execute(f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", chunk):
+                    found[key] = np.frombuffer(blob, dtype=np.float32).tolist()
+            if found:
+                self._conn.executemany("UPDATE embeddings SET last_accessed = ? WHERE key = ?", [(now, key) for key in found])
+                self._conn.commit()
+        return found
+
+    def put_many(self, model: str, items: Sequence[Tuple[str, List[float]]]) -> None:
+        """ベクトルを保存し、最大件数を超えた分を最終アクセスが古い順に削除する。"""
+        if not items:
+            return
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, model, vector, last_accessed) VALUES (?, ?, ?, ?)",
+                [(key, model, np.asarray(vector, dtype=np.float32).tobytes(), now) for key, vector in items],
+            )
+            count = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+            if count > self.max_entries:
+                self._conn.execute(
+                    "DELETE FROM embeddings WHERE key IN (SELECT key FROM embeddings ORDER BY last_accessed ASC LIMIT ?)",
+                    (count - self.max_entries,),
+                )
+                self._evicted += count - self.max_entries
+            self._conn.commit()
+
+    def clear(self, model: Optional[str] = None) -> None:
+        """キャッシュを削除する。modelが指定された場合はそのモデルのエントリのみ削除する。"""
+        with self._lock:
+            if model is None:
+                self._conn.execute("DELETE FROM embeddings")
+            else:
+                self._conn.execute("DELETE FROM embeddings WHERE model = ?", (model,))
+            self._conn.commit()
+
+    def count(self) -> int:
+        """現在のエントリ数を返す。"""
+        with self._lock:
+            return int(self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0])
+
+    def evicted(self) -> int:
+        """件数の上限により削除したエントリ数を返す。"""
+        with self._lock:
+            return self._evicted
+
+    def close(self) -> None:
+        """データベース接続を閉じる。"""
+        with self._lock:
+            self._conn.close()
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    埋め込みモデルをラップし、キャッシュにないテキストのみを埋め込む。同じ呼び出しの中で重複したテキストは1回だけ埋め込む。
+    OllamaEmbeddingsはクエリと文書を同じ方法で埋め込むため、embed_queryとembed_documentsはキャッシュを共有する。
+    """
+    def __init__(self, embeddings: Embeddings, store: EmbeddingCacheStore, model: str):
+        """
+        Args:
+            embeddings: ラップする埋め込みモデル。
+            store: ベクトルの保存先。
+            model: 埋め込みモデル名。キーの一部となり、モデルを変えた場合は別のエントリとなる。
+        """
+        self.embeddings = embeddings
+        self.store = store
+        self.model = model
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _key(self, text: str) -> str:
+        digest = hashlib.sha256()
+        digest.update(self.model.encode("utf-8"))
+        digest.update(b"\x00")
+        digest.update(text.encode("utf-8"))
+        return digest.hexdigest()
+
+    def _lookup(self, texts: List[str]) -> Tuple[List[str], Dict[str, List[float]], List[str]]:
+        """各テキストのキー、キャッシュにあったベクトル、埋め込みが必要なテキスト（重複なし）を返す。"""
+        keys = [self._key(text) for text in texts]
+        found = self.store.get_many(keys)
+        missed = [text for text, key in zip(texts, keys) if key not in found]
+        with self._lock:
+            self.hits += len(texts) - len(missed)
+            self.misses += len(missed)
+        return keys, found, list(dict.fromkeys(missed))
+
+    def _store(self, missing: List[str], vectors: List[List[float]], found: Dict[str, List[float]]) -> None:
+        # キャッシュから読んだ場合と同じ値を返すよう、float32に丸めたベクトルを用いる
+        items = [(self._key(text), np.asarray(vector, dtype=np.float32).tolist()) for text, vector in zip(missing, vectors)]
+        self.store.put_many(self.model, items)
+        found.update(items)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys, found, missing = self._lookup(texts)
+        if missing:
+            self._store(missing, self.embeddings.embed_documents(missing), found)
+        return [found[key] for key in keys]
+
+    def embed_query(self, text: str) -> List[float]:
+        keys, found, missing = self._lookup([text])
+        if missing:
+            self._store(missing, [self.embeddings.embed_query(text)], found)
+        return found[keys[0]]
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys, found, missing = self._lookup(texts)
+        if missing:
+            self._store(missing, await self.embeddings.aembed_documents(missing), found)
+        return [found[key] for key in keys]
+
+    async def aembed_query(self, text: str) -> List[float]:
+        keys, found, missing = self._lookup([text])
+        if missing:
+            self._store(missing, [await self.embeddings.aembed_query(text)], found)
+        return found[keys[0]]
+
+    def get_stats(self) -> Dict[str, float]:
+        """ヒット数・ミス数（テキスト単位）・ヒット率、エントリ数と件数の上限により削除した数を返す。"""
+        with self._lock:
+            hits, misses = self.hits, self.misses
+        total = hits + misses
+        return {
+            "hits": float(hits),
+            "misses": float(misses),
+            "hit_rate": hits / total if total else 0.0,
+            "entries": float(self.store.count()),
+            "evicted": float(self.store.evicted()),
+        }
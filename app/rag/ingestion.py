@@ -0,0 +1,281 @@
+# /app/rag/ingestion.py
+# title: ドキュメントの一括取り込み
+# role: ディレクトリ内の多数のドキュメントを少しずつ読み込みながら分割し、バッチ単位で並行して埋め込んで、ナレッジベースへ順に追加する。
+#       取り込みの進み具合をファイルの内容のハッシュとともに記録し、中断しても続きから再開できるようにする。
+
+from __future__ import annotations
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, Deque, Dict, Iterator, List, Optional, Sequence, Set
+
+from app.models import IngestionReport
+from app.rag.knowledge_base import KnowledgeBase
+
+logger = logging.getLogger(__name__)
+
+_STATE_FILE = "ingested_files.json"
+
+
+def _file_sha256(path: str) -> str:
+    sha256 = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            sha256.update(block)
+    return sha256.hexdigest()
+
+
+@dataclass
+class _Batch:
+    """埋め込み中、または追加を待っているバッチ。taskがNoneのものは、ファイルの終わりを示す目印。"""
+    key: str
+    digest: str
+    end_chunk: int
+    texts: List[str]
+    metadatas: List[Dict[str, Any]]
+    task: Optional["asyncio.Task[List[List[float]]]"]
+    last: bool
+
+
+class DocumentIngestor:
+    """
+    ディレクトリを走査し、対象の拡張子のファイルをナレッジベースへ取り込む。
+
+    各ファイルはread_block_chars文字ずつ読み込み、区切り文字（段落）の位置で区切ってから分割するため、ファイル全体をメモリに載せない。
+    チャンクはbatch_size件ずつ埋め込み、埋め込みモデルへの要求は最大max_concurrency件を並行させる。
+    埋め込みの完了順によらず、ナレッジベースへはファイル内の順序どおりに追加する。追加はナレッジベースのジャーナルに記録せず、
+    checkpoint_interval_secondsごとと終了時にスナップショットを保存してから、その時点の取り込み済みのチャンク数を状態ファイルへ記録する。
+    再実行時は、内容のハッシュが同じファイルは記録した続きのチャンクから取り込み、取り込みが完了したファイルは読み飛ばす。
+    スナップショットの保存前に終了した場合は、前回の保存以降のチャンクはナレッジベースにも状態にも残らず、再実行時に取り込み直す。
+    スナップショットの保存後、状態を記録する前に終了した場合は、前回の記録以降のチャンクが再実行時にもう一度追加される。
+    """
+    def __init__(
+        self,
+        knowledge_base: KnowledgeBase,
+        extensions: Sequence[str] = (".txt", ".md"),
+        batch_size: int = 64,
+        max_concurrency: int = 4,
+        read_block_chars: int = 1 << 20,
+        state_path: Optional[str] = None,
+        checkpoint_interval_seconds: float = 60.0,
+        log_every_seconds: float = 5.0,
+    ):
+        """
+        Args:
+            extensions: 取り込むファイルの拡張子。
+            batch_size: 1回の埋め込みの要求に含めるチャンク数。
+            max_concurrency: 並行して行う埋め込みの要求の最大数。
+            read_block_chars: ファイルを読み込む単位（文字数）。
+            state_path: 取り込みの状態の保存先。Noneの場合は、ナレッジベースのindex_dirに保存する（index_dirもない場合は保存しない）。
+            checkpoint_interval_seconds: ナレッジベースのスナップショットと取り込みの状態を保存する間隔。
+            log_every_seconds: 進捗をログに出力する間隔。
+        """
+        self.knowledge_base = knowledge_base
+        self.extensions = tuple(ext.lower() for ext in extensions)
+        self.batch_size = max(1, batch_size)
+        self.max_concurrency = max(1, max_concurrency)
+        self.read_block_chars = read_block_chars
+        if state_path is None and knowledge_base.index_dir is not None:
+            state_path = os.path.join(knowledge_base.index_dir, _STATE_FILE)
+        self.state_path = state_path
+        self.checkpoint_interval_seconds = checkpoint_interval_seconds
+        self.log_every_seconds = log_every_seconds
+        self._state: Dict[str, Dict[str, Any]] = self._load_state()
+
+    # --- 状態 ---
+    def _split_settings(self) -> Dict[str, Any]:
+        """チャンクの区切りを決める設定。これが変わった場合は、記録したチャンク数を再開に使えない。"""
+        return {**self.knowledge_base.splitter_settings, "read_block_chars": self.read_block_chars}
+
+    def _load_state(self) -> Dict[str, Dict[str, Any]]:
+        if self.state_path is None or not os.path.exists(self.state_path):
+            return {}
+        try:
+            with open(self.state_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (IOError, json.JSONDecodeError) as e:
+            logger.warning(f"取り込みの状態を読み込めなかったため、最初から取り込みます {self.state_path}: {e}")
+            return {}
+
+    def _save_state(self) -> None:
+        if self.state_path is None:
+            return
+        tmp_path = f"{self.state_path}.tmp"
+        try:
+            os.makedirs(os.path.dirname(self.state_path) or ".", exist_ok=True)
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self._state, f, ensure_ascii=False, indent=2)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.state_path)
+        except (IOError, OSError) as e:
+            logger.error(f"取り込みの状態の保存に失敗しました {self.state_path}: {e}")
+
+    # --- 読み込みと分割 ---
+    def discover(self, directory: str) -> List[str]:
+        """ディレクトリ以下の取り込み対象のファイルを、パスの順に返す。ナレッジベースのソースファイルと隠しファイルは除く。"""
+        source_path = self.knowledge_base.source_path
+        paths: List[str] = []
+        for root, dirs, files in os.walk(directory):
+            dirs[:] = sorted(d for d in dirs if not d.startswith("."))
+            for name in sorted(files):
+                path = os.path.join(root, name)
+                if name.startswith(".") or not name.lower().endswith(self.extensions):
+                    continue
+                if source_path is not None and os.path.abspath(path) == source_path:
+                    continue
+                paths.append(path)
+        return paths
+
+    def iter_chunks(self, path: str) -> Iterator[str]:
+        """ファイルを少しずつ読み込み、チャンクを順に返す。"""
+        splitter = self.knowledge_base.text_splitter
+        separator = self.knowledge_base.splitter_settings["separator"]
+        buffer = ""
+        with open(path, "r", encoding="utf-8", errors="replace") as f:
+            for block in iter(lambda: f.read(self.read_block_chars), ""):
+                buffer += block
+                cut = buffer.rfind(separator)
+                if cut == -1:
+                    # 区切り文字が長く現れない場合も、読み込んだ分が大きくなりすぎないうちに分割する
+                    if len(buffer) < self.read_block_chars * 4:
+                        continue
+                    cut, skip = len(buffer), 0
+                else:
+                    skip = len(separator)
+                yield from splitter.split_text(buffer[:cut])
+                buffer = buffer[cut + skip:]
+        if buffer.strip():
+            yield from splitter.split_text(buffer)
+
+    # --- 取り込み ---
+    async def aingest(self, directory: str) -> IngestionReport:
+        """ディレクトリ以下のファイルを取り込み、集計結果を返す。"""
+        kb = self.knowledge_base
+        paths = self.discover(directory)
+        split_settings = self._split_settings()
+        pending: Deque[_Batch] = deque()
+        failed: Set[str] = set()
+        counts = {"ingested": 0, "skipped": 0, "chunks": 0}
+        started = last_log = last_checkpoint = time.perf_counter()
+        logger.info(f"{directory}から{len(paths)}件のファイルを取り込みます (バッチ: {self.batch_size}件, 並行数: {self.max_concurrency})")
+
+        async def commit_oldest() -> None:
+            nonlocal last_log, last_checkpoint
+            batch = pending.popleft()
+            if batch.key in failed:
+                if batch.task is not None:
+                    batch.task.cancel()
+                return
+            if batch.task is not None:
+                try:
+                    vectors = await batch.task
+                    await asyncio.to_thread(kb.add_embedded_chunks, batch.texts, vectors, batch.metadatas, False, False)
+                except Exception as e:
+                    logger.error(f"ファイルの取り込みに失敗しました {batch.key}: {e}", exc_info=True)
+                    failed.add(batch.key)
+                    return
+                counts["chunks"] += len(batch.texts)
+            record = self._state[batch.key]
+            record["chunks_done"] = batch.end_chunk
+            if batch.last:
+                record["complete"] = True
+                counts["ingested"] += 1
+
+            now = time.perf_counter()
+            if now - last_checkpoint >= self.checkpoint_interval_seconds:
+                await checkpoint()
+                last_checkpoint = now
+            if now - last_log >= self.log_every_seconds:
+                done = counts["ingested"] + counts["skipped"] + len(failed)
+                logger.info(
+                    f"取り込みの進捗: ファイル {done}/{len(paths)}, 追加したチャンク {counts['chunks']}件 "
+                    f"({counts['chunks'] / (now - started):.1f} チャンク/s)"
+                )
+                last_log = now
+
+        async def checkpoint() -> None:
+            # チャンクはジャーナルに記録せずに追加するため、スナップショットを保存できた時点の状態だけを再開の基準として保存する
+            if await asyncio.to_thread(kb.flush):
+                self._save_state()
+
+        async def submit(batch: _Batch) -> None:
+            while len(pending) >= self.max_concurrency:
+                await commit_oldest()
+            pending.append(batch)
+
+        try:
+            for path in paths:
+                key = os.path.relpath(path, directory)
+                try:
+                    digest = await asyncio.to_thread(_file_sha256, path)
+                except OSError as e:
+                    logger.error(f"ファイルを読み込めませんでした {path}: {e}")
+                    failed.add(key)
+                    continue
+                record = self._state.get(key)
+                if record is not None and record["sha256"] == digest and record.get("complete"):
+                    counts["skipped"] += 1
+                    continue
+                start_chunk = 0
+                if record is not None and record["sha256"] == digest and record.get("split") == split_settings:
+                    start_chunk = int(record.get("chunks_done", 0))
+                elif record is not None and record.get("chunks_done"):
+                    logger.warning(f"内容または分割の設定が変わったため、最初から取り込みます（以前に取り込んだチャンクはナレッジベースに残ります）: {path}")
+                self._state[key] = {"sha256": digest, "split": split_settings, "chunks_done": start_chunk, "complete": False}
+
+                texts: List[str] = []
+                index = 0
+                try:
+                    for text in self.iter_chunks(path):
+                        index += 1
+                        if index <= start_chunk:
+                            continue
+                        texts.append(text)
+                        if len(texts) >= self.batch_size:
+                            await submit(self._embed(key, digest, index, texts, last=False))
+                            texts = []
+                        if key in failed:
+                            break
+                except OSError as e:
+                    logger.error(f"ファイルを読み込めませんでした {path}: {e}")
+                    failed.add(key)
+                    continue
+                if key in failed:
+                    continue
+                await submit(self._embed(key, digest, index, texts, last=True))
+            while pending:
+                await commit_oldest()
+        finally:
+            for batch in pending:
+                if batch.task is not None:
+                    batch.task.cancel()
+            await checkpoint()
+
+        wall = time.perf_counter() - started
+        report: IngestionReport = {
+            "files_total": len(paths),
+            "files_ingested": counts["ingested"],
+            "files_skipped": counts["skipped"],
+            "files_failed": len(failed),
+            "chunks_added": counts["chunks"],
+            "wall_seconds": wall,
+            "chunks_per_second": counts["chunks"] / wall if wall > 0 else 0.0,
+        }
+        logger.info(f"取り込みが完了しました: {report}")
+        return report
+
+    def _embed(self, key: str, digest: str, end_chunk: int, texts: List[str], last: bool) -> _Batch:
+        """バッチの埋め込みを開始する。textsが空の場合は、埋め込まずに進み具合だけを記録する目印とする。"""
+        metadatas = [{"source": key, "sha256": digest, "chunk": end_chunk - len(texts) + i} for i in range(len(texts))]
+        task = asyncio.create_task(self.knowledge_base.embeddings.aembed_documents(texts)) if texts else None
+        return _Batch(key, digest, end_chunk, texts, metadatas, task, last)
+
+    def ingest(self, directory: str) -> IngestionReport:
+        """aingestの同期版。"""
+        return asyncio.run(self.aingest(directory))
@@ -1,38 +1,106 @@
 # /app/rag/knowledge_base.py
 # title: ナレッジベース管理
 # role: ドキュメントの読み込み、追加、ベクトルストアの構築と管理を行う。
+#       index_dirを指定した場合、ベクトルストアとドキュメントストアをスナップショットとして保存し、実行中の追加はジャーナルに記録して、
+#       起動時はソースファイルと埋め込みモデルが変わっていなければ再度の埋め込みを行わずに読み込む。
+#       ベクトルストアと同じチャンクに対するBM25の語彙検索インデックスも保持する（保存はせず、読み込み時にドキュメントストアから作る）。
+#       ベクトルストアのインデックスは、設定に応じてflat・IVF・HNSWに切り替え、チャンク数が閾値を超えた場合はバックグラウンドで作り直す。
 
 from __future__ import annotations
+import hashlib
+import json
 import os
 import logging
-from typing import Optional, List
+import shutil
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterator, Optional, List, Tuple
 from langchain_community.vectorstores import FAISS
 from langchain_ollama import OllamaEmbeddings
 from langchain_text_splitters import CharacterTextSplitter
 from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
 
 from app.config import settings
+from app.rag.ann_index import apply_search_params, build_index, index_type_of, reconstruct_all
+from app.rag.lexical_index import BM25Index
+from app.tracing import traced
 
 logger = logging.getLogger(__name__)
 
+# マニフェストの形式が変わった場合は値を上げ、古いインデックスを作り直させる
+MANIFEST_VERSION = 1
+_MANIFEST_FILE = "manifest.json"
+# ジャーナルをスナップショットごとに分ける前の形式のジャーナル（すべての追加を記録し続けていた）
+_LEGACY_JOURNAL_FILE = "additions.jsonl"
+
 class KnowledgeBase:
     """
     ドキュメントを管理し、ベクトルストアを構築・更新するクラス。
-    """
-    def __init__(self, embedding_model_name: str):
-        self.vector_store: Optional[FAISS] = None
-        self.embeddings = OllamaEmbeddings(model=embedding_model_name)
-        self.text_splitter = CharacterTextSplitter(
-            separator="\n\n",
-            chunk_size=1000,
-            chunk_overlap=200,
-            length_function=len,
-        )
+    複数のセッションやバックグラウンドのスレッドから共有されるため、ベクトルストアの検索と更新はlockで排他する。
+    埋め込みの計算は時間がかかるため、lockの外で行う。
 
-    def _load_and_build_store(self, source: str):
+    index_dirを指定した場合の保存形式:
+        manifest.json       埋め込みモデル名、ソースファイルの内容のハッシュと分割の設定、現在のスナップショットとジャーナル、
+                            スナップショットのうちソースファイルから作ったチャンクの数
+        snapshot-<n>/       FAISSのインデックスとドキュメントストア（FAISS.save_localの形式）
+        additions-<n>.jsonl スナップショットの後にadd_documentsで追加したチャンクとその埋め込み。追加ごとにfsyncする
+    スナップショットは、新しいディレクトリへ書き出した後にマニフェストを置き換えることで切り替える。ジャーナルもスナップショットごとに新しいファイルとし、
+    マニフェストを置き換えた後に前のスナップショットとジャーナルを削除するため、ジャーナルは大きくなり続けず、書き出し中に終了しても前の状態が残る。
+    ソースファイルが変わって作り直す場合は、前のスナップショットとジャーナルから実行中に追加したチャンクを取り出して引き継ぐ。
+    """
+    def __init__(
+        self,
+        embedding_model_name: str,
+        embeddings: Optional[Embeddings] = None,
+        index_dir: Optional[str] = None,
+        checkpoint_every: int = 20,
+        build_lexical_index: bool = True,
+        ann_settings: Optional[Dict[str, Any]] = None,
+    ):
         """
-        指定されたソースからドキュメントを読み込み、ベクトルストアを構築する内部メソッド。
+        Args:
+            embedding_model_name: 埋め込みモデル名。保存したインデックスを再利用できるかの判定にも用いる。
+            index_dir: インデックスの保存先。Noneの場合は保存せず、起動ごとにソースから構築する。
+            checkpoint_every: スナップショットを保存する間隔（add_documentsの回数）。それまでの追加はジャーナルから復元する。
+            build_lexical_index: Trueの場合、語彙検索（search_lexical）用のBM25インデックスを保持する。
+            ann_settings: ベクトルストアのインデックスの設定（KNOWLEDGE_BASE_ANN_SETTINGSの形式）。Noneの場合はflatのまま切り替えない。
         """
+        self.vector_store: Optional[FAISS] = None
+        self.lock = threading.RLock()
+        self.embedding_model_name = embedding_model_name
+        self.embeddings = embeddings if embeddings is not None else OllamaEmbeddings(model=embedding_model_name)
+        self.index_dir = index_dir
+        self.checkpoint_every = checkpoint_every
+        self.splitter_settings: Dict[str, Any] = {"separator": "\n\n", "chunk_size": 1000, "chunk_overlap": 200}
+        self.text_splitter = CharacterTextSplitter(**self.splitter_settings, length_function=len)
+        self._source_fingerprint: Dict[str, Any] = {}
+        # 現在のジャーナルのファイル名（index_dirからの相対パス）
+        self._journal_file: Optional[str] = None
+        # ベクトルストアの先頭からこの数のチャンクがソースファイルから作ったもので、以降が実行中に追加したもの
+        self._source_chunks = 0
+        # 最後のスナップショットの後に追加した回数（ジャーナルに記録しなかった追加を含む）
+        self._unsaved_additions = 0
+        self.lexical_index: Optional[BM25Index] = BM25Index() if build_lexical_index else None
+        self.ann_settings = ann_settings
+        self._rebuild_thread: Optional[threading.Thread] = None
+        self._index_stats: Dict[str, float] = {"rebuilds": 0, "rebuild_failures": 0, "last_rebuild_seconds": 0.0}
+
+    # --- ソースからの構築 ---
+    def _fingerprint(self, source: str) -> Dict[str, Any]:
+        """ソースファイルの内容のハッシュと分割の設定。これが変わった場合はインデックスを作り直す。"""
+        digest: Optional[str] = None
+        if os.path.exists(source):
+            sha256 = hashlib.sha256()
+            with open(source, "rb") as f:
+                for block in iter(lambda: f.read(1 << 20), b""):
+                    sha256.update(block)
+            digest = sha256.hexdigest()
+        return {"path": os.path.abspath(source), "sha256": digest, **self.splitter_settings}
+
+    def _build_from_source(self, source: str) -> None:
+        """ソースファイルを分割・埋め込みして、ベクトルストアを構築する。"""
         if not os.path.exists(source):
             logger.warning(f"ナレッジベースのソースファイルが見つかりません: {source}。空のナレッジベースで起動します。")
             self.vector_store = FAISS.from_texts([""], self.embeddings)
@@ -52,15 +120,386 @@ class KnowledgeBase:
             logger.error(f"ナレッジベースの読み込み中に問題が発生しました: {e}", exc_info=True)
             self.vector_store = FAISS.from_texts([""], self.embeddings)
 
+    def _load_and_build_store(self, source: str, force_rebuild: bool = False):
+        """
+        指定されたソースからベクトルストアを用意する内部メソッド。
+        index_dirに再利用できるスナップショットがあれば読み込んで未反映のジャーナルを適用し、なければソースから構築する。
+        """
+        self._source_fingerprint = self._fingerprint(source)
+        if self.index_dir is None:
+            self._build_from_source(source)
+        else:
+            os.makedirs(self.index_dir, exist_ok=True)
+            manifest = self._read_manifest()
+            if force_rebuild or not self._load_snapshot(manifest):
+                additions = self._read_runtime_additions(manifest)
+                self._build_from_source(source)
+                assert self.vector_store is not None
+                self._source_chunks = self.vector_store.index.ntotal
+                if additions:
+                    self._add_carried_over(additions)
+                    logger.info(f"実行中に追加された{len(additions)}件のチャンクを前のナレッジベースから引き継ぎました。")
+                self.save()
+        # 語彙検索インデックスは、ジャーナルから再適用したチャンクも含めて作る
+        self._build_lexical_index()
+        self._apply_ann_settings()
+
+    def _build_lexical_index(self) -> None:
+        """ベクトルストアのドキュメントストアにあるすべてのチャンクから、語彙検索インデックスを作る。"""
+        if self.lexical_index is None or self.vector_store is None:
+            return
+        start = time.perf_counter()
+        docstore = self.vector_store.docstore
+        documents = []
+        for doc_id in self.vector_store.index_to_docstore_id.values():
+            document = docstore.search(doc_id)
+            if isinstance(document, Document):
+                documents.append((doc_id, document.page_content))
+        self.lexical_index.add_many(documents)
+        logger.info(f"語彙検索インデックスを作成しました: {len(documents)}件 ({time.perf_counter() - start:.2f} s)")
+
+    # --- 近似最近傍探索インデックス ---
+    def _target_index_type(self) -> Optional[str]:
+        """設定から、現在のチャンク数で用いるべきインデックスの種類を返す。切り替えない場合はNone。"""
+        if self.ann_settings is None or self.vector_store is None:
+            return None
+        index_type = self.ann_settings["index_type"]
+        if index_type != "auto":
+            return index_type
+        if self.vector_store.index.ntotal >= self.ann_settings["auto_threshold"]:
+            return self.ann_settings["auto_index_type"]
+        return None
+
+    def _apply_ann_settings(self) -> None:
+        """読み込んだインデックスに検索時の設定を反映し、設定と異なる種類であれば作り直しを開始する。"""
+        if self.ann_settings is None or self.vector_store is None:
+            return
+        apply_search_params(self.vector_store.index, self.ann_settings)
+        self._maybe_rebuild_index()
+
+    def _maybe_rebuild_index(self) -> None:
+        """インデックスの種類が設定と異なり、作り直しが進行中でなければ、バックグラウンドのスレッドで作り直す。"""
+        target = self._target_index_type()
+        if target is None or self.vector_store is None or target == index_type_of(self.vector_store.index):
+            return
+        if self._index_stats["rebuild_failures"]:
+            # 失敗した場合は追加のたびに繰り返さず、次の起動まで現在のインデックスを使い続ける
+            return
+        with self.lock:
+            if self._rebuild_thread is not None and self._rebuild_thread.is_alive():
+                return
+            self._rebuild_thread = threading.Thread(
+                target=self._rebuild_in_background, args=(target,), name="knowledge-base-index-rebuild", daemon=True
+            )
+            self._rebuild_thread.start()
+
+    def _rebuild_in_background(self, index_type: str) -> None:
+        try:
+            self.rebuild_index(index_type)
+        except Exception as e:
+            self._index_stats["rebuild_failures"] += 1
+            logger.error(f"ベクトルストアのインデックスの作り直しに失敗しました: {e}", exc_info=True)
+
+    def rebuild_index(self, index_type: str) -> None:
+        """
+        ベクトルストアのインデックスを指定した種類で作り直して差し替える。
+        学習と追加はlockの外で行い、その間に追加されたベクトルは差し替えの直前に新しいインデックスへ追加するため、検索と追加は止まらない。
+        """
+        if self.vector_store is None:
+            return
+        start = time.perf_counter()
+        with self.lock:
+            old_index = self.vector_store.index
+            copied = old_index.ntotal
+            vectors = reconstruct_all(old_index)
+        logger.info(f"ベクトルストアのインデックスを作り直します: {index_type_of(old_index)} -> {index_type} ({copied}件)")
+        new_index = build_index(vectors, index_type, self.ann_settings)
+        with self.lock:
+            if self.vector_store.index is not old_index:
+                logger.warning("ベクトルストアのインデックスが作り直しの間に置き換えられたため、結果を破棄します。")
+                return
+            if old_index.ntotal > copied:
+                new_index.add(reconstruct_all(old_index, copied))
+            self.vector_store.index = new_index
+        elapsed = time.perf_counter() - start
+        self._index_stats["rebuilds"] += 1
+        self._index_stats["last_rebuild_seconds"] = elapsed
+        logger.info(f"ベクトルストアのインデックスを{index_type}に切り替えました ({new_index.ntotal}件, {elapsed:.2f} s)")
+        self.save()
+
+    def wait_for_index_rebuild(self, timeout: Optional[float] = None) -> bool:
+        """進行中のインデックスの作り直しを待つ。timeoutまでに終わった（または進行中でない）場合はTrueを返す。"""
+        thread = self._rebuild_thread
+        if thread is not None:
+            thread.join(timeout)
+            return not thread.is_alive()
+        return True
+
+    def get_index_stats(self) -> Dict[str, Any]:
+        """ベクトルストアのインデックスの種類とチャンク数、作り直しの回数・失敗数・直近の所要時間、作り直し中かどうかを返す。"""
+        index = self.vector_store.index if self.vector_store is not None else None
+        return {
+            "index_type": index_type_of(index) if index is not None else None,
+            "vectors": float(index.ntotal) if index is not None else 0.0,
+            **{key: float(value) for key, value in self._index_stats.items()},
+            "rebuilding": self._rebuild_thread is not None and self._rebuild_thread.is_alive(),
+        }
+
     @classmethod
-    def create_and_load(cls, source: str) -> KnowledgeBase:
+    def create_and_load(
+        cls,
+        source: str,
+        embeddings: Optional[Embeddings] = None,
+        index_dir: Optional[str] = None,
+        checkpoint_every: int = 20,
+        force_rebuild: bool = False,
+        build_lexical_index: bool = True,
+        ann_settings: Optional[Dict[str, Any]] = None,
+    ) -> KnowledgeBase:
         """
         インスタンスを生成し、ドキュメントをロードするクラスメソッド。
+        embeddingsが指定されない場合は、設定されたOllamaの埋め込みモデルを使用する。
+        index_dirを指定した場合は、保存したインデックスを再利用し、ソースか埋め込みモデルが変わっていれば作り直す。
         """
-        kb = cls(embedding_model_name=settings.EMBEDDING_MODEL_NAME)
-        kb._load_and_build_store(source)
+        kb = cls(
+            embedding_model_name=settings.EMBEDDING_MODEL_NAME, embeddings=embeddings,
+            index_dir=index_dir, checkpoint_every=checkpoint_every, build_lexical_index=build_lexical_index,
+            ann_settings=ann_settings,
+        )
+        kb._load_and_build_store(source, force_rebuild=force_rebuild)
         return kb
 
+    @property
+    def source_path(self) -> Optional[str]:
+        """ソースファイルの絶対パス。ソースから読み込む前はNone。"""
+        return self._source_fingerprint.get("path")
+
+    # --- スナップショット ---
+    def _read_manifest(self) -> Optional[Dict[str, Any]]:
+        assert self.index_dir is not None
+        path = os.path.join(self.index_dir, _MANIFEST_FILE)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (IOError, json.JSONDecodeError) as e:
+            logger.warning(f"ナレッジベースのマニフェストを読み込めませんでした {path}: {e}")
+            return None
+
+    def _load_snapshot(self, manifest: Optional[Dict[str, Any]]) -> bool:
+        """マニフェストのスナップショットを再利用できれば読み込む。読み込めなかった場合は、その理由をログに出力してFalseを返す。"""
+        assert self.index_dir is not None
+        if manifest is None:
+            logger.info(f"保存されたナレッジベースがないため、ソースから構築します: {self.index_dir}")
+            return False
+        if manifest.get("version") != MANIFEST_VERSION:
+            reason = f"マニフェストの形式が異なります({manifest.get('version')})"
+        elif manifest.get("embedding_model") != self.embedding_model_name:
+            reason = f"埋め込みモデルが変わりました({manifest.get('embedding_model')} -> {self.embedding_model_name})"
+        elif manifest.get("source") != self._source_fingerprint:
+            reason = "ソースファイルまたは分割の設定が変わりました"
+        else:
+            reason = None
+        if reason is not None:
+            logger.info(f"保存されたナレッジベースを作り直します: {reason}")
+            return False
+
+        snapshot_dir = os.path.join(self.index_dir, manifest["snapshot"])
+        try:
+            start = time.perf_counter()
+            # ドキュメントストアはpickleで保存されている。このクラス自身が書き出したindex_dirのみを読み込むこと
+            self.vector_store = FAISS.load_local(snapshot_dir, self.embeddings, allow_dangerous_deserialization=True)
+        except Exception as e:
+            logger.warning(f"保存されたナレッジベースを読み込めなかったため、ソースから構築します {snapshot_dir}: {e}")
+            return False
+        snapshot_chunks = self.vector_store.index.ntotal
+        self._journal_file = manifest.get("journal", _LEGACY_JOURNAL_FILE)
+        self._repair_journal()
+        replayed, skipped_chunks = self._replay_journal(int(manifest.get("journal_entries", 0)))
+        # 以前の形式では、ジャーナルの先頭のjournal_entries件がスナップショットに含まれる実行中の追加である
+        self._source_chunks = int(manifest.get("source_chunks", snapshot_chunks - skipped_chunks))
+        self._unsaved_additions = replayed
+        self._remove_stale_files(manifest)
+        logger.info(
+            f"保存されたナレッジベースを読み込みました: {snapshot_dir} "
+            f"({self.vector_store.index.ntotal}件, ジャーナルから{replayed}件を適用, {time.perf_counter() - start:.2f} s)"
+        )
+        return True
+
+    def save(self) -> None:
+        """
+        現在のベクトルストアをスナップショットとして保存し、マニフェストを置き換える。index_dirを指定していない場合は何もしない。
+        """
+        if self.index_dir is None or self.vector_store is None:
+            return
+        with self.lock:
+            generation = time.time_ns()
+            snapshot = f"snapshot-{generation}"
+            snapshot_dir = os.path.join(self.index_dir, snapshot)
+            try:
+                self.vector_store.save_local(snapshot_dir)
+                manifest = {
+                    "version": MANIFEST_VERSION,
+                    "embedding_model": self.embedding_model_name,
+                    "source": self._source_fingerprint,
+                    "snapshot": snapshot,
+                    # 以降の追加は新しいジャーナルに記録する（マニフェストを置き換えるまでは前のジャーナルが有効）
+                    "journal": f"additions-{generation}.jsonl",
+                    "source_chunks": self._source_chunks,
+                    "documents": self.vector_store.index.ntotal,
+                    "updated_at": datetime.now(timezone.utc).isoformat(),
+                }
+                tmp_path = os.path.join(self.index_dir, f"{_MANIFEST_FILE}.tmp")
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    json.dump(manifest, f, ensure_ascii=False, indent=2)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp_path, os.path.join(self.index_dir, _MANIFEST_FILE))
+            except (IOError, OSError) as e:
+                logger.error(f"ナレッジベースの保存に失敗しました {snapshot_dir}: {e}")
+                shutil.rmtree(snapshot_dir, ignore_errors=True)
+                return
+            self._journal_file = manifest["journal"]
+            self._unsaved_additions = 0
+            self._remove_stale_files(manifest)
+        logger.info(f"ナレッジベースを保存しました: {snapshot_dir} ({manifest['documents']}件)")
+
+    def flush(self) -> bool:
+        """
+        最後のスナップショットの後にドキュメントが追加されていれば、スナップショットを保存する。
+        すべての追加がスナップショットに含まれている（保存に失敗していない）場合はTrueを返す。
+        """
+        if self._unsaved_additions:
+            self.save()
+        return self._unsaved_additions == 0
+
+    def _remove_stale_files(self, manifest: Dict[str, Any]) -> None:
+        """マニフェストが参照していないスナップショットとジャーナル（置き換え前のもの、保存の途中で終了して残ったもの）を削除する。"""
+        assert self.index_dir is not None
+        for name in os.listdir(self.index_dir):
+            if name in (manifest.get("snapshot"), manifest.get("journal", _LEGACY_JOURNAL_FILE)):
+                continue
+            path = os.path.join(self.index_dir, name)
+            if name.startswith("snapshot-") and os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
+            elif name.startswith("additions") and name.endswith(".jsonl"):
+                try:
+                    os.remove(path)
+                except OSError as e:
+                    logger.warning(f"古いジャーナルを削除できませんでした {path}: {e}")
+
+    # --- 作り直し時の引き継ぎ ---
+    def _read_runtime_additions(self, manifest: Optional[Dict[str, Any]]) -> List[Tuple[str, Optional[List[float]], Dict[str, Any]]]:
+        """
+        前のスナップショットとジャーナルから、実行中に追加したチャンクを（テキスト, 埋め込み, メタデータ）として読み出す。
+        埋め込みモデルが異なるチャンクの埋め込みはNoneとする（引き継ぐ際に埋め込み直す）。
+        """
+        assert self.index_dir is not None
+        if manifest is None or "source_chunks" not in manifest:
+            # 以前の形式では、すべての実行中の追加がジャーナルに残っている
+            return self._read_journal(os.path.join(self.index_dir, _LEGACY_JOURNAL_FILE))
+        additions: List[Tuple[str, Optional[List[float]], Dict[str, Any]]] = []
+        snapshot_dir = os.path.join(self.index_dir, manifest["snapshot"])
+        try:
+            previous = FAISS.load_local(snapshot_dir, self.embeddings, allow_dangerous_deserialization=True)
+        except Exception as e:
+            logger.warning(f"前のナレッジベースを読み込めないため、実行中に追加したチャンクはジャーナルの分のみ引き継ぎます {snapshot_dir}: {e}")
+        else:
+            start = int(manifest["source_chunks"])
+            same_model = manifest.get("embedding_model") == self.embedding_model_name
+            vectors = reconstruct_all(previous.index, start) if same_model else None
+            for offset, position in enumerate(range(start, previous.index.ntotal)):
+                document = previous.docstore.search(previous.index_to_docstore_id[position])
+                if isinstance(document, Document):
+                    vector = vectors[offset].tolist() if vectors is not None else None
+                    additions.append((document.page_content, vector, dict(document.metadata)))
+        return additions + self._read_journal(os.path.join(self.index_dir, manifest["journal"]))
+
+    def _read_journal(self, path: str) -> List[Tuple[str, Optional[List[float]], Dict[str, Any]]]:
+        """ジャーナルのチャンクを読み出す。埋め込みモデルが異なる件の埋め込みはNoneとする。"""
+        additions: List[Tuple[str, Optional[List[float]], Dict[str, Any]]] = []
+        if not os.path.exists(path):
+            return additions
+        with open(path, "r", encoding="utf-8") as f:
+            for line_number, line in enumerate(f, start=1):
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    logger.warning(f"ナレッジベースのジャーナルの壊れた行を読み飛ばします {path}:{line_number}")
+                    continue
+                same_model = entry.get("embedding_model") == self.embedding_model_name
+                for i, text in enumerate(entry["texts"]):
+                    additions.append((text, entry["vectors"][i] if same_model else None, entry["metadatas"][i]))
+        return additions
+
+    def _add_carried_over(self, additions: List[Tuple[str, Optional[List[float]], Dict[str, Any]]]) -> None:
+        """引き継いだチャンクをベクトルストアに追加する。埋め込みのないチャンクは埋め込み直す。"""
+        assert self.vector_store is not None
+        missing = [i for i, (_, vector, _) in enumerate(additions) if vector is None]
+        embedded = iter(self.embeddings.embed_documents([additions[i][0] for i in missing]) if missing else [])
+        vectors: List[List[float]] = [vector if vector is not None else next(embedded) for _, vector, _ in additions]
+        self.vector_store.add_embeddings(
+            [(text, vector) for (text, _, _), vector in zip(additions, vectors)],
+            metadatas=[metadata for _, _, metadata in additions],
+        )
+
+    # --- ジャーナル ---
+    def _journal_path(self) -> str:
+        assert self.index_dir is not None and self._journal_file is not None
+        return os.path.join(self.index_dir, self._journal_file)
+
+    def _repair_journal(self) -> None:
+        """現在のジャーナルから書き込み途中で終了した最後の行を取り除き、以降の追記が壊れないようにする。"""
+        path = self._journal_path()
+        if not os.path.exists(path) or os.path.getsize(path) == 0:
+            return
+        with open(path, "rb+") as f:
+            data = f.read()
+            if data.endswith(b"\n"):
+                return
+            f.truncate(data.rfind(b"\n") + 1)
+        logger.warning(f"ナレッジベースのジャーナルの不完全な最後の行を取り除きました: {path}")
+
+    def _append_journal(self, texts: List[str], vectors: List[List[float]], metadatas: List[Dict[str, Any]]) -> None:
+        entry = {"embedding_model": self.embedding_model_name, "texts": texts, "vectors": vectors, "metadatas": metadatas}
+        try:
+            with open(self._journal_path(), "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry, ensure_ascii=False, default=str) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+        except IOError as e:
+            logger.error(f"ナレッジベースのジャーナルへの書き込みに失敗しました {self._journal_path()}: {e}")
+
+    def _replay_journal(self, start: int) -> Tuple[int, int]:
+        """
+        現在のジャーナルのstart件目以降をベクトルストアに適用し、（適用した件数, 読み飛ばした件に含まれるチャンク数）を返す。
+        埋め込みモデルが異なる件は埋め込み直す。startは以前の形式のジャーナルでのみ0以外となる。
+        """
+        assert self.vector_store is not None
+        path = self._journal_path()
+        if not os.path.exists(path):
+            return 0, 0
+        applied = skipped_chunks = entries = 0
+        with open(path, "r", encoding="utf-8") as f:
+            for line_number, line in enumerate(f, start=1):
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    logger.warning(f"ナレッジベースのジャーナルの壊れた行を読み飛ばします {path}:{line_number}")
+                    continue
+                entries += 1
+                if entries <= start:
+                    skipped_chunks += len(entry["texts"])
+                    continue
+                vectors = entry["vectors"]
+                if entry.get("embedding_model") != self.embedding_model_name:
+                    vectors = self.embeddings.embed_documents(entry["texts"])
+                self.vector_store.add_embeddings(list(zip(entry["texts"], vectors)), metadatas=entry["metadatas"])
+                applied += 1
+        return applied, skipped_chunks
+
+    @traced("KnowledgeBase.add_documents", "knowledge_base")
     def add_documents(self, documents: List[Document]):
         """
         既存のベクトルストアに新しいドキュメントを追加する。
@@ -72,7 +511,79 @@ class KnowledgeBase:
         logger.info(f"{len(documents)}個の新しいドキュメントを知識ベースに追加します。")
         try:
             chunks = self.text_splitter.split_documents(documents)
-            self.vector_store.add_documents(chunks)
+            texts = [chunk.page_content for chunk in chunks]
+            vectors = self.embeddings.embed_documents(texts)
+            self.add_embedded_chunks(texts, vectors, [chunk.metadata for chunk in chunks])
             logger.info("知識ベースの更新が完了しました。")
         except Exception as e:
-            logger.error(f"ドキュメントの追加中にエラーが発生しました: {e}", exc_info=True)
\ No newline at end of file
+            logger.error(f"ドキュメントの追加中にエラーが発生しました: {e}", exc_info=True)
+
+    def add_embedded_chunks(
+        self,
+        texts: List[str],
+        vectors: List[List[float]],
+        metadatas: List[Dict[str, Any]],
+        checkpoint: bool = True,
+        journal: bool = True,
+    ) -> None:
+        """
+        分割・埋め込み済みのチャンクをベクトルストアに追加し、ジャーナルに記録する。
+        checkpointがFalseの場合は、checkpoint_everyに達してもスナップショットを保存しない（呼び出し側がflushで保存する）。
+        journalがFalseの場合はジャーナルに記録しない。次のスナップショットの前に終了すると失われるため、呼び出し側がflushで保存した時点を再開の基準とすること。
+        """
+        if not self.vector_store:
+            raise RuntimeError("知識ベースが初期化されていないため、ドキュメントを追加できません。")
+        with self.lock:
+            ids = self.vector_store.add_embeddings(list(zip(texts, vectors)), metadatas=metadatas)
+            if self.lexical_index is not None:
+                self.lexical_index.add_many(zip(ids, texts))
+            if self.index_dir is not None:
+                # ジャーナルへの追記はベクトルストアへの追加と同じ順序にする
+                if journal:
+                    self._append_journal(texts, vectors, metadatas)
+                self._unsaved_additions += 1
+                checkpoint_due = checkpoint and self._unsaved_additions >= self.checkpoint_every
+            else:
+                checkpoint_due = False
+        if checkpoint_due:
+            self.save()
+        self._maybe_rebuild_index()
+
+    @traced("KnowledgeBase.search_by_vector", "knowledge_base")
+    def search_by_vector(self, vector: List[float], k: int = 4) -> List[Document]:
+        """埋め込み済みのクエリに類似したドキュメントを、最大k件返す。"""
+        if not self.vector_store:
+            return []
+        with self.lock:
+            return self.vector_store.similarity_search_by_vector(vector, k=k)
+
+    @traced("KnowledgeBase.search_lexical", "knowledge_base")
+    def search_lexical(self, query: str, k: int = 4) -> List[Document]:
+        """クエリの語（英数字の単語と文字bigram）に一致するドキュメントを、BM25のスコアが高い順に最大k件返す。"""
+        if not self.vector_store or self.lexical_index is None:
+            return []
+        hits = self.lexical_index.search(query, k)
+        with self.lock:
+            documents = [self.vector_store.docstore.search(doc_id) for doc_id, _ in hits]
+        return [document for document in documents if isinstance(document, Document)]
+
+
+def open_knowledge_base(
+    source: str,
+    embeddings: Optional[Embeddings] = None,
+    index_dir: Optional[str] = None,
+    checkpoint_every: int = 20,
+    build_lexical_index: bool = True,
+    ann_settings: Optional[Dict[str, Any]] = None,
+) -> Iterator[KnowledgeBase]:
+    """
+    ナレッジベースを読み込むContainerのリソース。終了時に、最後のスナップショット以降の追加を含めて保存する。
+    """
+    kb = KnowledgeBase.create_and_load(
+        source, embeddings=embeddings, index_dir=index_dir, checkpoint_every=checkpoint_every,
+        build_lexical_index=build_lexical_index, ann_settings=ann_settings,
+    )
+    try:
+        yield kb
+    finally:
+        kb.flush()
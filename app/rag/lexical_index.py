@@ -0,0 +1,97 @@
+# /app/rag/lexical_index.py
+# title: 語彙検索インデックス（BM25）
+# role: ナレッジベースのチャンクに対する転置インデックスを保持し、BM25でスコアを付けて検索する。
+#       日本語は単語に分かち書きせず文字bigramを語として扱うため、形態素解析器なしで地名や製品名などの固有名詞に一致させられる。
+
+from __future__ import annotations
+import heapq
+import math
+import re
+import threading
+import unicodedata
+from collections import Counter
+from typing import Dict, Iterable, List, Tuple
+
+# 正規化後の英数字の連続は単語として、それ以外の文字（かな・漢字など）の連続は文字bigramに分ける
+_TOKEN_RE = re.compile(r"[a-z0-9]+|[^\W_a-z0-9]+")
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    テキストを検索用の語に分ける。NFKC正規化（全角英数字を半角に）と小文字化の後、英数字は単語、その他は文字bigramとする。
+    1文字だけの連続（「京」など）はその文字を語とする。
+    """
+    tokens: List[str] = []
+    for run in _TOKEN_RE.findall(unicodedata.normalize("NFKC", text).lower()):
+        if run.isascii() or len(run) == 1:
+            tokens.append(run)
+        else:
+            tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return tokens
+
+
+class BM25Index:
+    """
+    ドキュメントIDをキーとするBM25の転置インデックス。追加と検索はlockで排他する。
+    語ごとに（ドキュメントID, 出現回数）の一覧を持ち、検索ではクエリの語の一覧だけを走査する。
+    """
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        """
+        Args:
+            k1: 語の出現回数によるスコアの飽和の度合い。
+            b: ドキュメントの長さによる正規化の度合い（0で正規化しない）。
+        """
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.Lock()
+        self._postings: Dict[str, Dict[str, int]] = {}
+        self._lengths: Dict[str, int] = {}
+        self._total_length = 0
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._lengths)
+
+    def add_many(self, documents: Iterable[Tuple[str, str]]) -> None:
+        """（ドキュメントID, テキスト）を追加する。既に追加されたIDは無視する。"""
+        tokenized = [(doc_id, Counter(tokenize(text))) for doc_id, text in documents]
+        with self._lock:
+            for doc_id, counts in tokenized:
+                if doc_id in self._lengths:
+                    continue
+                length = sum(counts.values())
+                self._lengths[doc_id] = length
+                self._total_length += length
+                for term, count in counts.items():
+                    self._postings.setdefault(term, {})[doc_id] = count
+
+    def search(self, query: str, k: int) -> List[Tuple[str, float]]:
+        """クエリに一致するドキュメントを、BM25のスコアが高い順に最大k件、（ドキュメントID, スコア）として返す。"""
+        terms = Counter(tokenize(query))
+        if not terms:
+            return []
+        scores: Dict[str, float] = {}
+        with self._lock:
+            n = len(self._lengths)
+            if n == 0:
+                return []
+            average_length = self._total_length / n
+            for term, query_count in terms.items():
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1.0 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+                for doc_id, count in postings.items():
+                    norm = self.k1 * (1.0 - self.b + self.b * self._lengths[doc_id] / average_length)
+                    scores[doc_id] = scores.get(doc_id, 0.0) + query_count * idf * count * (self.k1 + 1.0) / (count + norm)
+        return heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+
+    def get_stats(self) -> Dict[str, float]:
+        """ドキュメント数、語彙数、ドキュメントの平均の長さ（語数）を返す。"""
+        with self._lock:
+            n = len(self._lengths)
+            return {
+                "documents": float(n),
+                "terms": float(len(self._postings)),
+                "average_length": self._total_length / n if n else 0.0,
+            }
@@ -1,28 +1,131 @@
 # /app/rag/retriever.py
 # title: 情報検索（レトリーバー）
 # role: ナレッジベースから、与えられたクエリに関連する情報を検索する。
+#       ベクトル検索とBM25の語彙検索の結果を、重み付きのReciprocal Rank Fusion（RRF）で統合する。
 
-from typing import List
+from __future__ import annotations
+import asyncio
+import contextlib
+from contextvars import ContextVar
+from typing import Dict, Iterator, List, Optional, Tuple
 from langchain_core.documents import Document
-from langchain_core.runnables import Runnable
 
 from app.rag.knowledge_base import KnowledgeBase
 
+# retrieval_weightsで設定した、現在のリクエストの（ベクトル検索の重み, 語彙検索の重み）
+_request_weights: ContextVar[Optional[Tuple[float, float]]] = ContextVar("retrieval_weights", default=None)
+
+
+@contextlib.contextmanager
+def retrieval_weights(vector_weight: float, lexical_weight: float) -> Iterator[None]:
+    """
+    ブロック内（そこから開始されたタスクやスレッドを含む）の検索で用いる重みを設定する。
+    パイプラインやエージェントを経由せずに、リクエストごとに検索の重みを変えるために用いる。
+    """
+    token = _request_weights.set((vector_weight, lexical_weight))
+    try:
+        yield
+    finally:
+        _request_weights.reset(token)
+
+
+def reciprocal_rank_fusion(
+    rankings: List[Tuple[List[Document], float]], k: int, rrf_k: int = 60
+) -> List[Document]:
+    """
+    （順位付けされたドキュメント, 重み）の一覧を、スコア Σ 重み / (rrf_k + 順位) の高い順に統合し、最大k件返す。
+    同じチャンクはドキュメントIDで（IDがない場合は本文で）同一とみなす。
+    """
+    scores: Dict[str, float] = {}
+    documents: Dict[str, Document] = {}
+    for ranked, weight in rankings:
+        if weight <= 0:
+            continue
+        for rank, document in enumerate(ranked, start=1):
+            key = document.id or document.page_content
+            scores[key] = scores.get(key, 0.0) + weight / (rrf_k + rank)
+            documents.setdefault(key, document)
+    ordered = sorted(scores, key=lambda key: scores[key], reverse=True)
+    return [documents[key] for key in ordered[:k]]
+
+
 class Retriever:
     """
     ナレッジベースから関連情報を検索するクラス。
+    ベクトル検索と語彙検索からそれぞれcandidates件を取り出し、RRFで統合した上位k件を返す。
+    重みが0の検索は実行しない（語彙検索の重みを0にするとベクトル検索のみとなり、クエリの埋め込みも省略できる）。
     """
-    def __init__(self, knowledge_base: KnowledgeBase):
+    def __init__(
+        self,
+        knowledge_base: KnowledgeBase,
+        k: int = 4,
+        vector_weight: float = 1.0,
+        lexical_weight: float = 1.0,
+        candidates: int = 20,
+        rrf_k: int = 60,
+    ):
         """
         コンストラクタ。
+        kは1回の検索で返すドキュメントの最大数。
+        vector_weightとlexical_weightは既定の重みで、invokeの引数またはretrieval_weightsでリクエストごとに変更できる。
         """
         if not knowledge_base.vector_store:
             raise ValueError("ナレッジベースがロードされていません。")
-        
-        self.langchain_retriever: Runnable = knowledge_base.vector_store.as_retriever()
 
-    def invoke(self, query: str) -> List[Document]:
+        self.knowledge_base = knowledge_base
+        self.k = k
+        self.vector_weight = vector_weight
+        self.lexical_weight = lexical_weight
+        self.candidates = max(candidates, k)
+        self.rrf_k = rrf_k
+
+    def _weights(self, vector_weight: Optional[float], lexical_weight: Optional[float]) -> Tuple[float, float]:
+        """引数、retrieval_weights、既定の重みの順に優先して重みを決める。語彙検索インデックスがない場合はベクトル検索のみとする。"""
+        request = _request_weights.get()
+        vector = vector_weight if vector_weight is not None else (request[0] if request else self.vector_weight)
+        lexical = lexical_weight if lexical_weight is not None else (request[1] if request else self.lexical_weight)
+        if self.knowledge_base.lexical_index is None:
+            lexical = 0.0
+        if vector <= 0 and lexical <= 0:
+            vector = 1.0
+        return vector, lexical
+
+    def invoke(
+        self, query: str, vector_weight: Optional[float] = None, lexical_weight: Optional[float] = None
+    ) -> List[Document]:
         """
         指定されたクエリに最も関連性の高いドキュメントを検索します。
         """
-        return self.langchain_retriever.invoke(query)
\ No newline at end of file
+        vector, lexical = self._weights(vector_weight, lexical_weight)
+        if lexical <= 0:
+            embedded = self.knowledge_base.embeddings.embed_query(query)
+            return self.knowledge_base.search_by_vector(embedded, k=self.k)
+        lexical_docs = self.knowledge_base.search_lexical(query, k=self.candidates)
+        vector_docs: List[Document] = []
+        if vector > 0:
+            embedded = self.knowledge_base.embeddings.embed_query(query)
+            vector_docs = self.knowledge_base.search_by_vector(embedded, k=self.candidates)
+        return reciprocal_rank_fusion([(vector_docs, vector), (lexical_docs, lexical)], self.k, self.rrf_k)
+
+    async def ainvoke(
+        self, query: str, vector_weight: Optional[float] = None, lexical_weight: Optional[float] = None
+    ) -> List[Document]:
+        """
+        invokeの非同期版。検索は、更新との排他を待つ間イベントループを止めないよう別スレッドで行う。
+        語彙検索は、クエリの埋め込みとベクトル検索と並行して行う。
+        """
+        vector, lexical = self._weights(vector_weight, lexical_weight)
+
+        async def search_vector(k: int) -> List[Document]:
+            if vector <= 0:
+                return []
+            embedded = await self.knowledge_base.embeddings.aembed_query(query)
+            return await asyncio.to_thread(self.knowledge_base.search_by_vector, embedded, k)
+
+        if lexical <= 0:
+            return await search_vector(self.k)
+        vector_docs, lexical_docs = await asyncio.gather(
+            search_vector(self.candidates),
+            asyncio.to_thread(self.knowledge_base.search_lexical, query, self.candidates),
+        )
+        return reciprocal_rank_fusion([(vector_docs, vector), (lexical_docs, lexical)], self.k, self.rrf_k)
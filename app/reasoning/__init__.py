@@ -3,3 +3,4 @@
 # role: このディレクトリをPythonのパッケージとして定義する。
 
 from .complexity_analyzer import ComplexityAnalyzer
+from .mode_router import ModeDecisionLog, ModeRouter, ModeRouterStats
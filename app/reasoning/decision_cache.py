@@ -0,0 +1,168 @@
+# /app/reasoning/decision_cache.py
+# title: モード選択の意味的キャッシュ
+# role: クエリの埋め込みをキーにOrchestrationAgentの決定を保存し、言い換えを含む類似したクエリには過去の決定を再利用する。
+#       件数に上限のある小さなベクトル索引をLRUで管理し、再起動後も使えるようディスクに保存する。
+
+from __future__ import annotations
+import copy
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from app.models import OrchestrationDecision
+
+logger = logging.getLogger(__name__)
+
+
+class SemanticDecisionCache:
+    """
+    クエリの埋め込みとモード選択の決定の組を、最大max_entries件まで保持するキャッシュ。
+    新しいクエリとのコサイン類似度が最も高い既存のクエリがsimilarity_threshold以上であれば、その決定を返す。
+    件数が少ないため索引は正規化したベクトルの行列で、検索は全件との内積で行う。上限を超えた場合は最後に使われた時刻が古いものから削除する。
+    """
+    def __init__(
+        self,
+        embeddings: Embeddings,
+        path: Optional[str],
+        max_entries: int = 500,
+        similarity_threshold: float = 0.92,
+    ):
+        """
+        Args:
+            embeddings: クエリの埋め込みに用いるモデル。
+            path: 保存先（npz形式）。Noneの場合は保存しない。
+            max_entries: 保持する決定の最大件数。
+            similarity_threshold: 過去の決定を再利用するコサイン類似度の下限。
+        """
+        self.embeddings = embeddings
+        self.path = path
+        self.max_entries = max_entries
+        self.similarity_threshold = similarity_threshold
+        self.embedding_model = str(getattr(embeddings, "model", type(embeddings).__name__))
+        self._lock = threading.Lock()
+        # キーは索引の行番号。並び順が最後に使われた順（先頭が最も古い）となる。
+        self._entries: "OrderedDict[int, Dict[str, Any]]" = OrderedDict()
+        self._vectors: Optional[np.ndarray] = None
+        self._free_rows: List[int] = []
+        self.hits = 0
+        self.misses = 0
+        self._load()
+
+    # --- 永続化 ---
+    def _load(self) -> None:
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with np.load(self.path) as data:
+                meta = json.loads(str(data["meta"]))
+                vectors = np.array(data["vectors"], dtype=np.float32)
+        except Exception as e:
+            logger.warning(f"モード選択キャッシュを読み込めませんでした {self.path}: {e}")
+            return
+        if meta.get("embedding_model") != self.embedding_model:
+            logger.info(f"埋め込みモデルが変わったため、モード選択キャッシュ {self.path} を使用しません。")
+            return
+        entries = sorted(meta["entries"], key=lambda e: e["last_used"])[-self.max_entries:]
+        if not entries:
+            return
+        self._vectors = np.stack([vectors[e["row"]] for e in entries])
+        for row, entry in enumerate(entries):
+            self._entries[row] = {"query": entry["query"], "decision": entry["decision"], "last_used": entry["last_used"]}
+        logger.info(f"モード選択キャッシュを読み込みました: {self.path} ({len(self._entries)}件)")
+
+    def _save_locked(self) -> None:
+        if not self.path or self._vectors is None:
+            return
+        meta = {
+            "embedding_model": self.embedding_model,
+            "entries": [{"row": row, **entry} for row, entry in self._entries.items()],
+        }
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                np.savez(f, vectors=self._vectors, meta=np.array(json.dumps(meta, ensure_ascii=False)))
+            os.replace(tmp_path, self.path)
+        except IOError as e:
+            logger.error(f"モード選択キャッシュの保存に失敗しました {self.path}: {e}")
+
+    # --- 検索と登録 ---
+    @staticmethod
+    def _normalize(vector: List[float]) -> np.ndarray:
+        array = np.asarray(vector, dtype=np.float32)
+        norm = float(np.linalg.norm(array))
+        return array / norm if norm else array
+
+    def embed(self, query: str) -> np.ndarray:
+        """クエリを正規化したベクトルに変換する。"""
+        return self._normalize(self.embeddings.embed_query(query))
+
+    async def aembed(self, query: str) -> np.ndarray:
+        """embedの非同期版。"""
+        return self._normalize(await self.embeddings.aembed_query(query))
+
+    def lookup(self, vector: np.ndarray) -> Optional[Tuple[OrchestrationDecision, float, str]]:
+        """
+        最も類似したクエリの類似度が閾値以上であれば、その決定・類似度・元のクエリを返す。
+        ヒットした決定は最後に使われたものとして扱う。
+        """
+        with self._lock:
+            if not self._entries or self._vectors is None or self._vectors.shape[1] != vector.shape[0]:
+                self.misses += 1
+                return None
+            rows = np.fromiter(self._entries.keys(), dtype=np.int64, count=len(self._entries))
+            similarities = self._vectors[rows] @ vector
+            best = int(np.argmax(similarities))
+            similarity = float(similarities[best])
+            if similarity < self.similarity_threshold:
+                self.misses += 1
+                return None
+            row = int(rows[best])
+            entry = self._entries[row]
+            entry["last_used"] = time.time()
+            self._entries.move_to_end(row)
+            self.hits += 1
+            self._save_locked()
+            return copy.deepcopy(entry["decision"]), similarity, entry["query"]
+
+    def put(self, query: str, vector: np.ndarray, decision: OrchestrationDecision) -> None:
+        """決定を登録する。上限を超える場合は、最後に使われた時刻が最も古い決定を削除する。"""
+        with self._lock:
+            if self._vectors is None or self._vectors.shape[1] != vector.shape[0]:
+                self._vectors = np.zeros((0, vector.shape[0]), dtype=np.float32)
+                self._entries.clear()
+                self._free_rows.clear()
+            while len(self._entries) >= self.max_entries:
+                evicted, _ = self._entries.popitem(last=False)
+                self._free_rows.append(evicted)
+            if self._free_rows:
+                row = self._free_rows.pop()
+                self._vectors[row] = vector
+            else:
+                row = self._vectors.shape[0]
+                self._vectors = np.vstack([self._vectors, vector[None, :]])
+            self._entries[row] = {"query": query, "decision": copy.deepcopy(dict(decision)), "last_used": time.time()}
+            self._save_locked()
+
+    def clear(self) -> None:
+        """すべての決定を削除する。"""
+        with self._lock:
+            self._entries.clear()
+            self._free_rows.clear()
+            self._vectors = None
+            if self.path and os.path.exists(self.path):
+                os.remove(self.path)
+
+    def get_stats(self) -> Dict[str, float]:
+        """件数、ヒット数、ミス数、ヒット率を返す。"""
+        with self._lock:
+            hits, misses, size = self.hits, self.misses, len(self._entries)
+        total = hits + misses
+        return {"entries": float(size), "hits": float(hits), "misses": float(misses), "hit_rate": hits / total if total else 0.0}
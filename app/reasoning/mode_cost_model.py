@@ -0,0 +1,163 @@
+# /app/reasoning/mode_cost_model.py
+# title: 実行モードのコストモデル
+# role: 実行モードと複雑性レベルごとに、実際に観測した処理時間とLLM呼び出し数の直近の値を保持し、
+#       リクエストの遅延予算（latency_budget_ms）に処理時間のp90が収まらないモードを、予算に収まる最も品質の高いモードへ切り下げる。
+
+from __future__ import annotations
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from typing import Deque, Dict, List, Optional, Tuple
+
+from app.models import ModeCostEstimate
+
+logger = logging.getLogger(__name__)
+
+
+class ModeCostModel:
+    """
+    モードと複雑性レベルの組ごとに、直近window件の（処理時間, LLM呼び出し数）を保持する。
+    組の件数がmin_samplesに満たない場合は、そのモードの全複雑性レベルの値から見積もる。それでも足りないモードは見積もらない。
+    観測値の保存はリクエストごとには行わず、前回の保存からsave_interval_seconds以上経った記録の時と、flushの呼び出し時に行う。
+    """
+    def __init__(
+        self,
+        quality_order: List[str],
+        path: Optional[str] = None,
+        window: int = 100,
+        min_samples: int = 5,
+        save_interval_seconds: float = 30.0,
+    ):
+        """
+        Args:
+            quality_order: 回答の品質が高いと想定する順に並べたモード名。切り下げ先はこの順で選ぶ。
+            path: 観測値の保存先（JSON）。Noneの場合は保存しない。
+            window: 組ごとに保持する観測値の件数。
+            min_samples: 見積もりに必要な最小の件数。
+            save_interval_seconds: 観測値を保存する最短の間隔。0の場合は記録のたびに保存する。
+        """
+        self.quality_order = quality_order
+        self.path = path
+        self.window = window
+        self.min_samples = min_samples
+        self.save_interval_seconds = save_interval_seconds
+        self._lock = threading.Lock()
+        # ファイルへの書き込みは記録の排他の外で行い、書き込み同士はこのlockで排他する
+        self._save_lock = threading.Lock()
+        self._samples: Dict[Tuple[str, str], Deque[Tuple[float, int]]] = {}
+        self._downgrades = 0
+        self._dirty = False
+        self._last_save = time.monotonic()
+        self._load()
+
+    def _load(self) -> None:
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            for key, samples in data.items():
+                mode, complexity = key.split("|", 1)
+                self._samples[(mode, complexity)] = deque(
+                    ((float(latency), int(calls)) for latency, calls in samples), maxlen=self.window
+                )
+            logger.info(f"モードのコストモデルを読み込みました: {self.path} ({len(self._samples)}組)")
+        except (IOError, ValueError) as e:
+            logger.warning(f"モードのコストモデルを読み込めませんでした {self.path}: {e}")
+
+    def flush(self) -> None:
+        """前回の保存以降に記録された観測値があれば保存する。終了時に呼び出す。"""
+        if not self.path:
+            return
+        with self._save_lock:
+            with self._lock:
+                if not self._dirty:
+                    return
+                data = {f"{mode}|{complexity}": list(samples) for (mode, complexity), samples in self._samples.items()}
+                self._dirty = False
+                self._last_save = time.monotonic()
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            tmp_path = f"{self.path}.tmp"
+            try:
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    json.dump(data, f)
+                os.replace(tmp_path, self.path)
+            except IOError as e:
+                logger.error(f"モードのコストモデルの保存に失敗しました {self.path}: {e}")
+                with self._lock:
+                    self._dirty = True
+
+    def record(self, mode: str, complexity: str, latency_seconds: float, llm_calls: int) -> None:
+        """1回分のパイプライン実行の処理時間とLLM呼び出し数を記録する。前回の保存から間隔が空いていれば保存する。"""
+        with self._lock:
+            samples = self._samples.setdefault((mode, complexity), deque(maxlen=self.window))
+            samples.append((latency_seconds, llm_calls))
+            self._dirty = True
+            due = time.monotonic() - self._last_save >= self.save_interval_seconds
+        if due:
+            self.flush()
+
+    @staticmethod
+    def _percentile(values: List[float], q: float) -> float:
+        ordered = sorted(values)
+        position = (len(ordered) - 1) * q
+        lower = int(position)
+        upper = min(lower + 1, len(ordered) - 1)
+        return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+    def estimate(self, mode: str, complexity: str) -> Optional[ModeCostEstimate]:
+        """モードと複雑性レベルの組の処理時間とLLM呼び出し数を見積もる。観測値が足りない場合はNoneを返す。"""
+        with self._lock:
+            samples = list(self._samples.get((mode, complexity), ()))
+            if len(samples) < self.min_samples:
+                samples = [s for (m, _), values in self._samples.items() if m == mode for s in values]
+        if len(samples) < self.min_samples:
+            return None
+        latencies = [latency for latency, _ in samples]
+        return {
+            "samples": len(samples),
+            "latency_p50_ms": self._percentile(latencies, 0.5) * 1000,
+            "latency_p90_ms": self._percentile(latencies, 0.9) * 1000,
+            "llm_calls_mean": sum(calls for _, calls in samples) / len(samples),
+        }
+
+    def choose_mode(self, mode: str, complexity: str, latency_budget_ms: float) -> Tuple[str, Optional[str]]:
+        """
+        モードの処理時間のp90が予算を超えると見積もられる場合、quality_orderでそのモードより後ろにあるモードのうち、
+        予算に収まると見積もられる最初のモードを返す。該当するモードがなければ最後のモード（simple）を返す。
+        切り下げた場合は、その理由も返す。見積もれないモードは切り下げの対象にも切り下げ先にもしない。
+        """
+        estimate = self.estimate(mode, complexity)
+        if estimate is None or estimate["latency_p90_ms"] <= latency_budget_ms:
+            return mode, None
+        candidates = self.quality_order[self.quality_order.index(mode) + 1:] if mode in self.quality_order else self.quality_order
+        chosen: Optional[str] = None
+        chosen_estimate: Optional[ModeCostEstimate] = None
+        for candidate in candidates:
+            candidate_estimate = self.estimate(candidate, complexity)
+            if candidate_estimate is not None and candidate_estimate["latency_p90_ms"] <= latency_budget_ms:
+                chosen, chosen_estimate = candidate, candidate_estimate
+                break
+        if chosen is None:
+            chosen = self.quality_order[-1]
+        with self._lock:
+            self._downgrades += 1
+        reason = (
+            f"'{mode}'の処理時間のp90({estimate['latency_p90_ms']:.0f} ms)が遅延予算({latency_budget_ms:.0f} ms)を超えるため、"
+            + (
+                f"'{chosen}'(p90 {chosen_estimate['latency_p90_ms']:.0f} ms)に切り下げました。"
+                if chosen_estimate is not None else f"予算に収まると見積もれるモードがなく、'{chosen}'に切り下げました。"
+            )
+        )
+        return chosen, reason
+
+    def get_stats(self) -> Dict[str, object]:
+        """切り下げ回数と、観測値のあるモードと複雑性レベルの組ごとの見積もりを返す。"""
+        with self._lock:
+            keys = list(self._samples)
+            downgrades = self._downgrades
+        estimates = {f"{mode}|{complexity}": self.estimate(mode, complexity) for mode, complexity in keys}
+        return {"downgrades": downgrades, "estimates": estimates}
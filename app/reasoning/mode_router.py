@@ -0,0 +1,276 @@
+# /app/reasoning/mode_router.py
+# title: 学習型モードルーター
+# role: 過去にOrchestrationAgentが選択した（クエリ, モード）の記録から、文字n-gramのロジスティック回帰でモードを予測する。
+#       確信度が閾値以上の場合はLLMによるモード選択を省略できるようにする。学習と評価はbenchmarks/mode_router_benchmark.pyで行う。
+
+from __future__ import annotations
+import json
+import logging
+import os
+import re
+import threading
+import time
+import unicodedata
+import zlib
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def char_ngrams(text: str, ngram_range: Tuple[int, int] = (1, 3)) -> List[str]:
+    """
+    テキストを正規化（NFKC、小文字化、空白の圧縮）し、先頭と末尾に境界記号を付けた文字n-gramを返す。
+    分かち書きされない日本語でも、単語分割なしで語や語尾の手がかりを捉えられる。
+    """
+    normalized = _WHITESPACE_RE.sub(" ", unicodedata.normalize("NFKC", text).lower()).strip()
+    padded = f"\x02{normalized}\x03"
+    low, high = ngram_range
+    return [padded[i:i + n] for n in range(low, high + 1) for i in range(len(padded) - n + 1)]
+
+
+class ModeDecisionLog:
+    """
+    モード選択の結果をJSONLファイルに追記する。
+    sourceはどこで決定したか（"llm"または"router"）を表し、ルーターの学習にはLLMによる決定のみを用いる。
+    """
+    def __init__(self, path: Optional[str]):
+        self.path = path
+        self._lock = threading.Lock()
+        if path:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+    def append(self, query: str, chosen_mode: str, source: str, latency: float, confidence: Optional[float] = None) -> None:
+        """1件の決定を記録する。latencyはモード選択にかかった秒数。"""
+        if not self.path:
+            return
+        record = {
+            "timestamp": time.time(),
+            "query": query,
+            "chosen_mode": chosen_mode,
+            "source": source,
+            "latency": latency,
+            "confidence": confidence,
+        }
+        try:
+            with self._lock, open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        except IOError as e:
+            logger.error(f"モード選択の記録の書き込みに失敗しました {self.path}: {e}")
+
+    @staticmethod
+    def read(path: str, source: Optional[str] = "llm") -> List[Dict[str, Any]]:
+        """記録を読み込む。sourceを指定した場合は、その決定元の記録のみを返す。"""
+        if not os.path.exists(path):
+            return []
+        records: List[Dict[str, Any]] = []
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                if record.get("query") and record.get("chosen_mode") and (source is None or record.get("source") == source):
+                    records.append(record)
+        return records
+
+
+class ModeRouter:
+    """
+    文字n-gramを固定次元にハッシュした特徴量による、多クラスのロジスティック回帰。
+    学習していない場合、predictは常に確信度0を返すため、すべてLLMによるモード選択となる。
+    """
+    def __init__(
+        self,
+        ngram_range: Tuple[int, int] = (1, 3),
+        num_features: int = 2 ** 15,
+        modes: Optional[List[str]] = None,
+        weights: Optional[np.ndarray] = None,
+        bias: Optional[np.ndarray] = None,
+    ):
+        self.ngram_range = (int(ngram_range[0]), int(ngram_range[1]))
+        self.num_features = num_features
+        self.modes: List[str] = list(modes or [])
+        self.weights = weights
+        self.bias = bias
+
+    @property
+    def is_trained(self) -> bool:
+        return self.weights is not None and len(self.modes) > 1
+
+    def _featurize(self, query: str) -> Tuple[np.ndarray, np.ndarray]:
+        """クエリを、L2正規化した文字n-gramの出現回数（ハッシュした特徴量の番号と値）に変換する。"""
+        counts: Dict[int, float] = {}
+        for gram in char_ngrams(query, self.ngram_range):
+            # 組み込みのhashはプロセスごとに値が変わるため、保存したモデルと一致するcrc32を使う
+            index = zlib.crc32(gram.encode("utf-8")) % self.num_features
+            counts[index] = counts.get(index, 0.0) + 1.0
+        indices = np.fromiter(counts.keys(), dtype=np.int64, count=len(counts))
+        values = np.fromiter(counts.values(), dtype=np.float64, count=len(counts))
+        return indices, values / np.linalg.norm(values)
+
+    def _to_csr(self, queries: Sequence[str]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        features = [self._featurize(q) for q in queries]
+        indptr = np.zeros(len(features) + 1, dtype=np.int64)
+        indptr[1:] = np.cumsum([len(idx) for idx, _ in features])
+        indices = np.concatenate([idx for idx, _ in features])
+        values = np.concatenate([val for _, val in features])
+        return indptr, indices, values
+
+    @staticmethod
+    def _softmax(logits: np.ndarray) -> np.ndarray:
+        shifted = np.exp(logits - logits.max(axis=1, keepdims=True))
+        return shifted / shifted.sum(axis=1, keepdims=True)
+
+    def fit(
+        self,
+        queries: Sequence[str],
+        labels: Sequence[str],
+        epochs: int = 300,
+        learning_rate: float = 2.0,
+        l2: float = 1e-4,
+    ) -> "ModeRouter":
+        """
+        全件を用いた勾配降下法で学習する。ログに記録される程度の件数（数千件まで）を想定している。
+        """
+        self.modes = sorted(set(labels))
+        indptr, indices, values = self._to_csr(queries)
+        rows = np.repeat(np.arange(len(queries)), np.diff(indptr))
+        targets = np.zeros((len(queries), len(self.modes)))
+        targets[np.arange(len(queries)), [self.modes.index(label) for label in labels]] = 1.0
+
+        weights = np.zeros((self.num_features, len(self.modes)))
+        bias = np.zeros(len(self.modes))
+        for _ in range(epochs):
+            logits = np.add.reduceat(values[:, None] * weights[indices], indptr[:-1], axis=0) + bias
+            error = (self._softmax(logits) - targets) / len(queries)
+            grad = np.zeros_like(weights)
+            np.add.at(grad, indices, values[:, None] * error[rows])
+            weights -= learning_rate * (grad + l2 * weights)
+            bias -= learning_rate * error.sum(axis=0)
+        self.weights, self.bias = weights, bias
+        return self
+
+    def predict_proba(self, query: str) -> Dict[str, float]:
+        """モードごとの確率を返す。学習していない場合は空のdictを返す。"""
+        if not self.is_trained:
+            return {}
+        assert self.weights is not None and self.bias is not None
+        indices, values = self._featurize(query)
+        logits = values @ self.weights[indices] + self.bias
+        probs = self._softmax(logits[None, :])[0]
+        return {mode: float(p) for mode, p in zip(self.modes, probs)}
+
+    def predict(self, query: str) -> Tuple[Optional[str], float]:
+        """最も確率の高いモードとその確率を返す。学習していない場合は(None, 0.0)を返す。"""
+        probs = self.predict_proba(query)
+        if not probs:
+            return None, 0.0
+        mode = max(probs, key=probs.__getitem__)
+        return mode, probs[mode]
+
+    def save(self, path: str) -> None:
+        """学習したモデルをnpz形式で保存する。"""
+        if not self.is_trained:
+            raise ValueError("学習していないモデルは保存できません。")
+        assert self.weights is not None and self.bias is not None
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "wb") as f:
+            np.savez_compressed(
+                f, weights=self.weights, bias=self.bias, modes=np.array(self.modes),
+                ngram_range=np.array(self.ngram_range), num_features=np.array(self.num_features),
+            )
+
+    @classmethod
+    def load(cls, path: str) -> "ModeRouter":
+        """saveで保存したモデルを読み込む。"""
+        with np.load(path) as data:
+            return cls(
+                ngram_range=tuple(data["ngram_range"].tolist()),  # type: ignore[arg-type]
+                num_features=int(data["num_features"]),
+                modes=[str(m) for m in data["modes"]],
+                weights=data["weights"],
+                bias=data["bias"],
+            )
+
+    @classmethod
+    def load_or_untrained(cls, path: str, ngram_range: Tuple[int, int] = (1, 3), num_features: int = 2 ** 15) -> "ModeRouter":
+        """モデルがあれば読み込み、なければ（または読み込めなければ）学習していないルーターを返す。"""
+        if os.path.exists(path):
+            try:
+                router = cls.load(path)
+                logger.info(f"モードルーターを読み込みました: {path} (モード: {router.modes})")
+                return router
+            except Exception as e:
+                logger.warning(f"モードルーターを読み込めませんでした {path}: {e}")
+        else:
+            logger.info(f"モードルーターのモデル {path} がないため、モード選択はすべてLLMで行います。")
+        return cls(ngram_range=ngram_range, num_features=num_features)
+
+
+class ModeRouterStats:
+    """
+    ルーターがモードを決定した数（ヒット）と、LLMに委ねた数を集計する。
+    省略できた時間は、ヒット数とLLMによるモード選択の平均時間から見積もる。
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._fallbacks = 0
+        self._llm_time = 0.0
+        self._router_time = 0.0
+
+    def record_hit(self, elapsed: float) -> None:
+        with self._lock:
+            self._hits += 1
+            self._router_time += elapsed
+
+    def record_fallback(self, llm_elapsed: float) -> None:
+        with self._lock:
+            self._fallbacks += 1
+            self._llm_time += llm_elapsed
+
+    def get_stats(self) -> Dict[str, float]:
+        """ヒット数、LLMに委ねた数、ヒット率、LLMの平均時間、見積もった省略時間（秒）を返す。"""
+        with self._lock:
+            hits, fallbacks, llm_time, router_time = self._hits, self._fallbacks, self._llm_time, self._router_time
+        total = hits + fallbacks
+        llm_mean = llm_time / fallbacks if fallbacks else 0.0
+        return {
+            "hits": float(hits),
+            "fallbacks": float(fallbacks),
+            "hit_rate": hits / total if total else 0.0,
+            "llm_latency_mean": llm_mean,
+            "estimated_saved_seconds": max(0.0, hits * llm_mean - router_time),
+        }
+
+
+def evaluate_router(
+    router: ModeRouter,
+    records: List[Dict[str, Any]],
+    thresholds: Sequence[float],
+) -> List[Dict[str, float]]:
+    """
+    記録に対するルーターの予測を評価する。閾値ごとに、ヒット率（ルーターで決定する割合）、
+    ヒットしたもののLLMとの一致率、全体の一致率、ヒットにより省略できたLLMの時間（1件あたりの平均）を返す。
+    """
+    predictions = [router.predict(r["query"]) for r in records]
+    results: List[Dict[str, float]] = []
+    for threshold in thresholds:
+        hits = [(p, r) for p, r in zip(predictions, records) if p[0] is not None and p[1] >= threshold]
+        correct = sum(1 for (mode, _), r in hits if mode == r["chosen_mode"])
+        saved = sum(float(r.get("latency") or 0.0) for _, r in hits)
+        results.append({
+            "threshold": threshold,
+            "hit_rate": len(hits) / len(records) if records else 0.0,
+            "hit_accuracy": correct / len(hits) if hits else 0.0,
+            "overall_accuracy": (
+                sum(1 for (mode, _), r in zip(predictions, records) if mode == r["chosen_mode"]) / len(records)
+                if records else 0.0
+            ),
+            "saved_seconds_per_query": saved / len(records) if records else 0.0,
+        })
+    return results
@@ -0,0 +1,6 @@
+# /app/server/__init__.py
+# title: HTTPサーバーパッケージ
+# role: 複数のセッションを並行して扱うローカルHTTPサーバーを公開する。
+
+from .sessions import Session, SessionLimitError, SessionManager
+from .http_server import LocalHTTPServer
@@ -0,0 +1,280 @@
+# /app/server/http_server.py
+# title: ローカルHTTPサーバー
+# role: asyncioのストリームで実装した小さなHTTP/1.1サーバー。セッションの作成・終了と、セッション内での質問への応答（JSONまたはNDJSONのストリーミング）、
+#       ヘルスチェックとメトリクスのエンドポイントを提供する。応答ごとに接続を閉じる（keep-aliveは扱わない）。
+#
+# エンドポイント:
+#   GET    /health                      稼働状況
+#   GET    /metrics                     各種統計（JSON）
+#   GET    /metrics/prometheus          LLM呼び出しの統計（Prometheusのテキスト形式）
+#   GET    /sessions                    セッションの一覧
+#   POST   /sessions                    セッションの作成
+#   GET    /sessions/{id}               セッションの概要
+#   DELETE /sessions/{id}               セッションの終了
+#   POST   /sessions/{id}/messages      {"query": "...", "stream": false} に対する応答。streamがtrueの場合はNDJSONでイベントを逐次返す
+#                                       "retrieval_weights": {"vector": 1.0, "lexical": 1.0} で、この要求の知識ベース検索の重みを指定できる
+#   GET    /traces/{request_id}         リクエストのトレース（Chromeのトレースイベント形式）
+
+from __future__ import annotations
+import asyncio
+import contextlib
+import json
+import logging
+import socket
+import time
+from http import HTTPStatus
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+from app.rag.retriever import retrieval_weights
+from app.server.sessions import Session, SessionLimitError, SessionManager
+
+logger = logging.getLogger(__name__)
+
+_HEADER_TIMEOUT_SECONDS = 30
+
+
+class HTTPError(Exception):
+    """HTTPのエラー応答として返す例外。"""
+    def __init__(self, status: HTTPStatus, message: str):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+class LocalHTTPServer:
+    """
+    SessionManagerをHTTPで公開するサーバー。すべての要求は1つのイベントループ上で並行に処理する。
+    """
+    def __init__(
+        self,
+        sessions: SessionManager,
+        metrics: Callable[[], Dict[str, Any]],
+        prometheus_metrics: Optional[Callable[[], str]] = None,
+        traces: Optional[Callable[[str], Optional[Dict[str, Any]]]] = None,
+        host: str = "127.0.0.1",
+        port: int = 8765,
+        max_body_bytes: int = 1_000_000,
+        session_sweep_interval_seconds: float = 60,
+    ):
+        """
+        Args:
+            sessions: セッションの管理。
+            metrics: /metricsで返す統計を集める関数。
+            prometheus_metrics: /metrics/prometheusで返すテキストを作成する関数。
+            traces: リクエストIDに対するトレースを返す関数。トレースがない場合はNoneを返す。
+            max_body_bytes: 受け付ける要求本文の最大バイト数。
+            session_sweep_interval_seconds: 使われていないセッションを終了する確認の間隔（秒）。
+        """
+        self.sessions = sessions
+        self.metrics = metrics
+        self.prometheus_metrics = prometheus_metrics
+        self.traces = traces
+        self.host = host
+        self.port = port
+        self.max_body_bytes = max_body_bytes
+        self.session_sweep_interval_seconds = session_sweep_interval_seconds
+        self.started_at = time.time()
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._sweeper: Optional["asyncio.Task[None]"] = None
+
+    async def start(self) -> None:
+        """待ち受けを開始する。"""
+        self._server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+        self._sweeper = asyncio.create_task(self._sweep_sessions())
+        sockets: Tuple[socket.socket, ...] = self._server.sockets or ()
+        if sockets:
+            self.port = sockets[0].getsockname()[1]
+        logger.info(f"HTTPサーバーを開始しました: http://{self.host}:{self.port}")
+
+    async def serve_forever(self) -> None:
+        """待ち受けを開始し、キャンセルされるまで要求を処理する。"""
+        if self._server is None:
+            await self.start()
+        assert self._server is not None
+        try:
+            await self._server.serve_forever()
+        finally:
+            await self.close()
+
+    async def close(self) -> None:
+        """待ち受けを終了する。"""
+        if self._sweeper is not None:
+            self._sweeper.cancel()
+            self._sweeper = None
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def _sweep_sessions(self) -> None:
+        while True:
+            await asyncio.sleep(self.session_sweep_interval_seconds)
+            expired = self.sessions.expire_idle()
+            if expired:
+                logger.info(f"使われていないセッションを{expired}件終了しました。")
+
+    # --- HTTPの読み書き ---
+    async def _read_request(self, reader: asyncio.StreamReader) -> Tuple[str, str, Dict[str, str], bytes]:
+        request_line = (await reader.readline()).decode("latin-1").strip()
+        parts = request_line.split()
+        if len(parts) != 3:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "不正なリクエスト行です。")
+        method, target, _ = parts
+        headers: Dict[str, str] = {}
+        while True:
+            line = (await reader.readline()).decode("latin-1")
+            if line in ("\r\n", "\n", ""):
+                break
+            name, _, value = line.partition(":")
+            headers[name.strip().lower()] = value.strip()
+        try:
+            length = int(headers.get("content-length", "0") or 0)
+        except ValueError:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "Content-Lengthが不正です。")
+        if length > self.max_body_bytes:
+            raise HTTPError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, f"要求本文が大きすぎます（上限 {self.max_body_bytes} バイト）。")
+        body = await reader.readexactly(length) if length else b""
+        return method.upper(), urlsplit(target).path, headers, body
+
+    @staticmethod
+    async def _write_response(
+        writer: asyncio.StreamWriter, status: HTTPStatus, body: bytes, content_type: str = "application/json; charset=utf-8"
+    ) -> None:
+        head = (
+            f"HTTP/1.1 {status.value} {status.phrase}\r\n"
+            f"Content-Type: {content_type}\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            "Connection: close\r\n\r\n"
+        )
+        writer.write(head.encode("latin-1") + body)
+        await writer.drain()
+
+    async def _write_json(self, writer: asyncio.StreamWriter, status: HTTPStatus, payload: Any) -> None:
+        await self._write_response(writer, status, json.dumps(payload, ensure_ascii=False, default=str).encode("utf-8"))
+
+    @staticmethod
+    def _parse_json(body: bytes) -> Dict[str, Any]:
+        if not body:
+            return {}
+        try:
+            payload = json.loads(body.decode("utf-8"))
+        except (UnicodeDecodeError, json.JSONDecodeError) as e:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, f"要求本文をJSONとして解析できません: {e}")
+        if not isinstance(payload, dict):
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "要求本文はJSONオブジェクトでなければなりません。")
+        return payload
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            try:
+                try:
+                    method, path, _, body = await asyncio.wait_for(self._read_request(reader), _HEADER_TIMEOUT_SECONDS)
+                except (asyncio.TimeoutError, asyncio.IncompleteReadError) as e:
+                    raise HTTPError(HTTPStatus.BAD_REQUEST, f"要求を読み取れませんでした: {e!r}")
+                await self._route(method, path, body, writer)
+            except HTTPError as e:
+                await self._write_json(writer, e.status, {"error": e.message})
+            except Exception as e:
+                logger.error(f"要求の処理中にエラーが発生しました: {e}", exc_info=True)
+                await self._write_json(writer, HTTPStatus.INTERNAL_SERVER_ERROR, {"error": str(e)})
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    # --- ルーティング ---
+    def _session_or_404(self, session_id: str) -> Session:
+        session = self.sessions.get(session_id)
+        if session is None:
+            raise HTTPError(HTTPStatus.NOT_FOUND, f"セッション {session_id} は存在しません。")
+        return session
+
+    async def _route(self, method: str, path: str, body: bytes, writer: asyncio.StreamWriter) -> None:
+        segments: List[str] = [s for s in path.split("/") if s]
+        if segments == ["health"] and method == "GET":
+            await self._write_json(writer, HTTPStatus.OK, {
+                "status": "ok",
+                "uptime_seconds": time.time() - self.started_at,
+                "sessions": self.sessions.get_stats()["active_sessions"],
+            })
+        elif segments == ["metrics"] and method == "GET":
+            await self._write_json(writer, HTTPStatus.OK, self.metrics())
+        elif segments == ["metrics", "prometheus"] and method == "GET" and self.prometheus_metrics is not None:
+            await self._write_response(
+                writer, HTTPStatus.OK, self.prometheus_metrics().encode("utf-8"), "text/plain; version=0.0.4; charset=utf-8"
+            )
+        elif len(segments) == 2 and segments[0] == "traces" and method == "GET" and self.traces is not None:
+            trace = self.traces(segments[1])
+            if trace is None:
+                raise HTTPError(HTTPStatus.NOT_FOUND, f"リクエスト {segments[1]} のトレースは存在しません。")
+            await self._write_json(writer, HTTPStatus.OK, trace)
+        elif segments == ["sessions"] and method == "GET":
+            await self._write_json(writer, HTTPStatus.OK, {"sessions": self.sessions.describe_all()})
+        elif segments == ["sessions"] and method == "POST":
+            try:
+                session = self.sessions.create()
+            except SessionLimitError as e:
+                raise HTTPError(HTTPStatus.SERVICE_UNAVAILABLE, str(e))
+            await self._write_json(writer, HTTPStatus.CREATED, session.describe())
+        elif len(segments) == 2 and segments[0] == "sessions" and method == "GET":
+            await self._write_json(writer, HTTPStatus.OK, self._session_or_404(segments[1]).describe())
+        elif len(segments) == 2 and segments[0] == "sessions" and method == "DELETE":
+            if not self.sessions.close(segments[1]):
+                raise HTTPError(HTTPStatus.NOT_FOUND, f"セッション {segments[1]} は存在しません。")
+            await self._write_json(writer, HTTPStatus.OK, {"session_id": segments[1], "closed": True})
+        elif len(segments) == 3 and segments[0] == "sessions" and segments[2] == "messages" and method == "POST":
+            await self._handle_message(self._session_or_404(segments[1]), self._parse_json(body), writer)
+        else:
+            raise HTTPError(HTTPStatus.NOT_FOUND, f"{method} {path} は存在しません。")
+
+    @staticmethod
+    def _retrieval_weights(payload: Dict[str, Any]) -> contextlib.AbstractContextManager[None]:
+        """要求のretrieval_weightsから、検索の重みを設定するコンテキストを作る。指定がなければ既定の重みを用いる。"""
+        weights = payload.get("retrieval_weights")
+        if weights is None:
+            return contextlib.nullcontext()
+        if not isinstance(weights, dict) or not all(
+            isinstance(weights.get(name, 0), (int, float)) and weights.get(name, 0) >= 0 for name in ("vector", "lexical")
+        ):
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "retrieval_weightsには0以上の数値のvectorとlexicalを指定してください。")
+        return retrieval_weights(float(weights.get("vector", 0)), float(weights.get("lexical", 0)))
+
+    async def _handle_message(self, session: Session, payload: Dict[str, Any], writer: asyncio.StreamWriter) -> None:
+        query = payload.get("query")
+        if not isinstance(query, str) or not query.strip():
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "queryに質問の文字列を指定してください。")
+        weights = self._retrieval_weights(payload)
+
+        if not payload.get("stream"):
+            with weights:
+                response = await self.sessions.ainvoke(session, query)
+            await self._write_json(writer, HTTPStatus.OK, {"session_id": session.session_id, "response": response})
+            return
+
+        # ストリーミングでは、イベントを1行1件のJSON（NDJSON）としてチャンク形式で送る
+        writer.write((
+            f"HTTP/1.1 {HTTPStatus.OK.value} {HTTPStatus.OK.phrase}\r\n"
+            "Content-Type: application/x-ndjson; charset=utf-8\r\n"
+            "Transfer-Encoding: chunked\r\n"
+            "Cache-Control: no-cache\r\n"
+            "Connection: close\r\n\r\n"
+        ).encode("latin-1"))
+
+        async def send(event: Dict[str, Any]) -> None:
+            line = (json.dumps(event, ensure_ascii=False, default=str) + "\n").encode("utf-8")
+            writer.write(f"{len(line):X}\r\n".encode("latin-1") + line + b"\r\n")
+            await writer.drain()
+
+        try:
+            with weights:
+                async for event in self.sessions.astream(session, query):
+                    await send({"session_id": session.session_id, **event})
+        except (ConnectionError, asyncio.CancelledError):
+            raise
+        except Exception as e:
+            # ヘッダーは送信済みのため、エラーもイベントとして返す
+            logger.error(f"ストリーミング応答の処理中にエラーが発生しました: {e}", exc_info=True)
+            await send({"session_id": session.session_id, "type": "error", "error": str(e)})
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
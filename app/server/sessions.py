@@ -0,0 +1,203 @@
+# /app/server/sessions.py
+# title: 対話セッション管理
+# role: HTTPサーバーで複数の利用者と並行して対話できるよう、セッションごとにワーキングメモリと対話履歴を持つMasterAgentを管理する。
+#       同じセッション内の要求は順に処理し、異なるセッションの要求は同じイベントループ上で並行に処理する。
+
+from __future__ import annotations
+import asyncio
+import logging
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional
+
+from app.agents.master_agent import MasterAgent
+from app.idle_manager import IdleManager
+from app.llm.instrumentation import llm_call_context
+from app.models import MasterAgentResponse, StreamEvent
+from app.tracing import start_trace
+
+logger = logging.getLogger(__name__)
+
+
+class SessionLimitError(Exception):
+    """セッション数が上限に達し、新しいセッションを作成できない場合に送出される例外。"""
+
+
+class Session:
+    """
+    1人の利用者との対話。MasterAgentはセッション専用のワーキングメモリと対話履歴を持つ。
+    """
+    def __init__(self, session_id: str, master_agent: MasterAgent):
+        self.session_id = session_id
+        self.master_agent = master_agent
+        # 対話履歴の順序を保つため、同じセッションの要求は1件ずつ処理する
+        self.lock = asyncio.Lock()
+        self.created_at = time.time()
+        self.last_active = self.created_at
+        self.turns = 0
+
+    def describe(self) -> Dict[str, Any]:
+        """セッションの概要を返す。"""
+        return {
+            "session_id": self.session_id,
+            "created_at": self.created_at,
+            "last_active": self.last_active,
+            "turns": self.turns,
+            "busy": self.lock.locked(),
+            "prediction_errors": len(self.master_agent.working_memory.prediction_errors),
+        }
+
+
+class SessionManager:
+    """
+    セッションの作成・取得・終了と、セッション内での要求の実行を行う。
+    最後の要求からidle_timeout_secondsを超えたセッションは終了し、セッション数がmax_sessionsに達した場合は、
+    処理中でないセッションのうち最も長く使われていないものを終了する。
+    セッションの終了時には、ワーキングメモリを記憶の整理のために保存する。
+    いずれのメソッドも、サーバーのイベントループ上から呼び出す。
+    """
+    def __init__(
+        self,
+        master_agent_factory: Callable[[], MasterAgent],
+        max_sessions: int = 100,
+        idle_timeout_seconds: Optional[float] = 1800,
+        idle_manager: Optional[IdleManager] = None,
+    ):
+        """
+        Args:
+            master_agent_factory: セッション専用のワーキングメモリを持つMasterAgentを作成する関数。
+            max_sessions: 同時に保持するセッションの最大数。
+            idle_timeout_seconds: 使われていないセッションを終了するまでの秒数。Noneの場合は終了しない。
+            idle_manager: 処理中の要求がある間はビジー、なくなればアイドルとして通知する先。
+        """
+        self.master_agent_factory = master_agent_factory
+        self.max_sessions = max_sessions
+        self.idle_timeout_seconds = idle_timeout_seconds
+        self.idle_manager = idle_manager
+        # 並び順が最後に使われた順（先頭が最も古い）となる
+        self._sessions: "OrderedDict[str, Session]" = OrderedDict()
+        self._in_flight = 0
+        self._stats = {"created": 0, "closed": 0, "expired": 0, "evicted": 0, "requests": 0, "errors": 0}
+
+    # --- セッションの管理 ---
+    def _end(self, session: Session) -> None:
+        try:
+            session.master_agent.end_session()
+        except Exception as e:
+            logger.error(f"セッション {session.session_id} の終了処理に失敗しました: {e}", exc_info=True)
+
+    def create(self) -> Session:
+        """新しいセッションを作成する。上限に達していて終了できるセッションがない場合はSessionLimitErrorを送出する。"""
+        self.expire_idle()
+        if len(self._sessions) >= self.max_sessions:
+            victim = next((s for s in self._sessions.values() if not s.lock.locked()), None)
+            if victim is None:
+                raise SessionLimitError(f"セッション数が上限({self.max_sessions})に達しています。")
+            logger.info(f"セッション数が上限に達したため、最も長く使われていないセッション {victim.session_id} を終了します。")
+            self._sessions.pop(victim.session_id)
+            self._end(victim)
+            self._stats["evicted"] += 1
+        session = Session(uuid.uuid4().hex, self.master_agent_factory())
+        self._sessions[session.session_id] = session
+        self._stats["created"] += 1
+        logger.info(f"セッション {session.session_id} を作成しました（{len(self._sessions)}件）。")
+        return session
+
+    def get(self, session_id: str) -> Optional[Session]:
+        """セッションを返す。存在しない場合はNoneを返す。"""
+        return self._sessions.get(session_id)
+
+    def describe_all(self) -> List[Dict[str, Any]]:
+        """すべてのセッションの概要を返す。"""
+        return [session.describe() for session in self._sessions.values()]
+
+    def close(self, session_id: str) -> bool:
+        """セッションを終了する。存在しなかった場合はFalseを返す。"""
+        session = self._sessions.pop(session_id, None)
+        if session is None:
+            return False
+        self._end(session)
+        self._stats["closed"] += 1
+        logger.info(f"セッション {session_id} を終了しました。")
+        return True
+
+    def close_all(self) -> None:
+        """すべてのセッションを終了する。"""
+        for session_id in list(self._sessions):
+            self.close(session_id)
+
+    def expire_idle(self, now: Optional[float] = None) -> int:
+        """使われていない時間がidle_timeout_secondsを超えたセッションを終了し、その件数を返す。"""
+        if self.idle_timeout_seconds is None:
+            return 0
+        now = time.time() if now is None else now
+        expired = [
+            s for s in self._sessions.values()
+            if not s.lock.locked() and now - s.last_active > self.idle_timeout_seconds
+        ]
+        for session in expired:
+            self._sessions.pop(session.session_id)
+            self._end(session)
+        self._stats["expired"] += len(expired)
+        return len(expired)
+
+    # --- 要求の実行 ---
+    def _begin(self, session: Session) -> None:
+        self._in_flight += 1
+        self._stats["requests"] += 1
+        if self.idle_manager is not None:
+            self.idle_manager.set_busy()
+        if session.session_id in self._sessions:
+            self._sessions.move_to_end(session.session_id)
+
+    def _done(self, session: Session) -> None:
+        self._in_flight -= 1
+        session.last_active = time.time()
+        if self._in_flight == 0 and self.idle_manager is not None:
+            self.idle_manager.set_idle()
+
+    @staticmethod
+    def request_id(session: Session) -> str:
+        """セッションの次の要求のリクエストID（LLM呼び出しの記録とトレースのID）を返す。"""
+        return f"{session.session_id[:8]}-{session.turns + 1}"
+
+    async def ainvoke(self, session: Session, query: str) -> MasterAgentResponse:
+        """セッション内で1件の要求を処理し、応答を返す。"""
+        async with session.lock:
+            self._begin(session)
+            try:
+                request_id = self.request_id(session)
+                with llm_call_context(request_id=request_id), start_trace(request_id, name="session.request", session_id=session.session_id):
+                    response = await session.master_agent.ainvoke(query)
+                session.turns += 1
+                return response
+            except Exception:
+                self._stats["errors"] += 1
+                raise
+            finally:
+                self._done(session)
+
+    async def astream(self, session: Session, query: str) -> AsyncIterator[StreamEvent]:
+        """セッション内で1件の要求を処理し、ストリーミングのイベントを逐次返す。"""
+        async with session.lock:
+            self._begin(session)
+            try:
+                request_id = self.request_id(session)
+                with llm_call_context(request_id=request_id), start_trace(request_id, name="session.request", session_id=session.session_id):
+                    async for event in session.master_agent.astream(query):
+                        if event["type"] == "response":
+                            session.turns += 1
+                        yield event
+            except Exception:
+                self._stats["errors"] += 1
+                raise
+            finally:
+                self._done(session)
+
+    def get_stats(self) -> Dict[str, float]:
+        """作成・終了・期限切れ・追い出しの件数、要求数とエラー数、現在のセッション数と処理中の要求数を返す。"""
+        stats = {key: float(value) for key, value in self._stats.items()}
+        stats["active_sessions"] = float(len(self._sessions))
+        stats["in_flight"] = float(self._in_flight)
+        return stats
@@ -5,13 +5,21 @@
 from abc import ABC, abstractmethod
 from typing import Any
 
+from app.tracing import traced
+
 class Tool(ABC):
     """
     すべてのツールが継承する抽象基底クラス。
+    サブクラスのuseの実行は、リクエストのトレースにツール名のスパンとして記録される。
     """
     name: str
     description: str
 
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        if "use" in cls.__dict__:
+            cls.use = traced(f"{cls.__name__}.use", "tool")(cls.__dict__["use"])  # type: ignore[method-assign]
+
     @abstractmethod
     def use(self, query: str) -> Any:
         """
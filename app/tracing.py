@@ -0,0 +1,302 @@
+# /app/tracing.py
+# title: リクエスト単位のトレース
+# role: 1件のリクエストの処理（エンジン、パイプライン、エージェント、LLM呼び出し、ツール、知識ベースと知識グラフの操作）を
+#       入れ子の区間（スパン）として記録し、Chromeのトレースイベント形式（chrome://tracing、Perfetto）のJSONとして書き出す。
+#
+# トレースの文脈はContextVarで受け渡すため、asyncioのタスク、asyncio.to_thread、およびcontextvars.copy_context()で
+# 文脈を引き継いだThreadPoolExecutorのスレッドの中の処理も、同じトレースの子のスパンとして記録される。
+
+from __future__ import annotations
+import asyncio
+import contextlib
+import functools
+import inspect
+import itertools
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple, TypeVar
+
+from app.models import TraceSpan
+
+logger = logging.getLogger(__name__)
+
+F = TypeVar("F", bound=Callable[..., Any])
+
+# install_tracerで有効にしたトレーサー。これが設定されていない場合、トレースは記録しない
+_active_tracer: ContextVar[Optional["Tracer"]] = ContextVar("active_tracer", default=None)
+# 現在のスパン（トレーサー, トレースID, スパンID）。トレースの外ではNone
+_current_span: ContextVar[Optional[Tuple["Tracer", str, int]]] = ContextVar("current_span", default=None)
+_span_ids = itertools.count(1)
+
+
+def _lane() -> str:
+    """現在のスレッドとasyncioタスクの名前を返す。"""
+    thread_name = threading.current_thread().name
+    try:
+        task = asyncio.current_task()
+    except RuntimeError:
+        task = None
+    return f"{thread_name}/{task.get_name()}" if task is not None else thread_name
+
+
+class Tracer:
+    """
+    トレースIDごとにスパンを保持する。保持するトレース数がmax_tracesを超えた場合は、最も古いトレースから破棄する。
+    ルートのスパンが終わった後に完了したスパン（応答後にバックグラウンドで続く処理など）も、破棄されるまでは同じトレースに追加される。
+    """
+    def __init__(
+        self,
+        max_traces: int = 50,
+        max_spans_per_trace: int = 10000,
+        export_dir: Optional[str] = None,
+        export_each_trace: bool = False,
+    ):
+        """
+        Args:
+            max_traces: 保持するトレースの最大数。
+            max_spans_per_trace: 1件のトレースに記録するスパンの最大数。超えたスパンは記録しない。
+            export_dir: トレースの書き出し先のディレクトリ。
+            export_each_trace: Trueの場合、ルートのスパンが終わるたびにexport_dirへ書き出す。
+        """
+        self.max_traces = max_traces
+        self.max_spans_per_trace = max_spans_per_trace
+        self.export_dir = export_dir
+        self.export_each_trace = export_each_trace
+        self._lock = threading.Lock()
+        self._traces: "OrderedDict[str, List[TraceSpan]]" = OrderedDict()
+        self._dropped_spans = 0
+
+    def record(self, trace_id: str, span: TraceSpan) -> None:
+        """完了したスパンをトレースに追加する。"""
+        with self._lock:
+            spans = self._traces.get(trace_id)
+            if spans is None:
+                spans = self._traces[trace_id] = []
+                while len(self._traces) > self.max_traces:
+                    self._traces.popitem(last=False)
+            if len(spans) >= self.max_spans_per_trace:
+                self._dropped_spans += 1
+                return
+            spans.append(span)
+
+    def trace_ids(self) -> List[str]:
+        """保持しているトレースIDを古い順に返す。"""
+        with self._lock:
+            return list(self._traces)
+
+    def get_trace(self, trace_id: str) -> List[TraceSpan]:
+        """トレースのスパンを開始時刻の順に返す。"""
+        with self._lock:
+            spans = list(self._traces.get(trace_id, []))
+        return sorted(spans, key=lambda s: (s["start"], -s["end"]))
+
+    @staticmethod
+    def _assign_rows(spans: List[TraceSpan]) -> Dict[int, int]:
+        """
+        スパンに表示行を割り当てる。同じ行の区間が入れ子になるよう、まず親と同じ行を試し、収まらなければ他の行、新しい行の順に割り当てる。
+        （LangChainは内部でタスクを作成するため、実行したタスクごとの行では、LLM呼び出しが親と別の行に分かれてしまう）
+        """
+        rows: Dict[int, int] = {}
+        stacks: List[List[float]] = []  # 行ごとの、開いている区間の終了時刻
+
+        def fits(row: int, span: TraceSpan) -> bool:
+            stack = stacks[row]
+            while stack and stack[-1] <= span["start"]:
+                stack.pop()
+            return not stack or stack[-1] >= span["end"]
+
+        for span in spans:
+            parent_row = rows.get(span["parent_id"]) if span["parent_id"] is not None else None
+            candidates = ([parent_row] if parent_row is not None else []) + [r for r in range(len(stacks)) if r != parent_row]
+            row = next((r for r in candidates if fits(r, span)), None)
+            if row is None:
+                row = len(stacks)
+                stacks.append([])
+            stacks[row].append(span["end"])
+            rows[span["span_id"]] = row
+        return rows
+
+    def to_chrome_trace(self, trace_id: str) -> Optional[Dict[str, Any]]:
+        """
+        トレースをChromeのトレースイベント形式に変換する。トレースがない場合はNoneを返す。
+        各スパンは完了イベント（ph: "X"）となり、並行して実行された区間は別の行（tid）に表示される。
+        """
+        spans = self.get_trace(trace_id)
+        if not spans:
+            return None
+        origin = spans[0]["start"]
+        rows = self._assign_rows(spans)
+        events: List[Dict[str, Any]] = []
+        for span in spans:
+            events.append({
+                "name": span["name"],
+                "cat": span["category"],
+                "ph": "X",
+                "ts": (span["start"] - origin) * 1e6,
+                "dur": (span["end"] - span["start"]) * 1e6,
+                "pid": 1,
+                "tid": rows[span["span_id"]] + 1,
+                "args": {"span_id": span["span_id"], "parent_id": span["parent_id"], "thread": span["lane"], **span["args"]},
+            })
+        metadata = [
+            {"name": "process_name", "ph": "M", "pid": 1, "args": {"name": f"request {trace_id}"}},
+            *({"name": "thread_name", "ph": "M", "pid": 1, "tid": tid, "args": {"name": f"lane {tid}"}} for tid in sorted(set(e["tid"] for e in events))),
+        ]
+        return {"traceEvents": metadata + events, "displayTimeUnit": "ms", "otherData": {"trace_id": trace_id}}
+
+    def export_chrome_trace(self, trace_id: str, path: Optional[str] = None) -> Optional[str]:
+        """トレースをChromeのトレースイベント形式のJSONファイルに書き出し、そのパスを返す。書き出せなかった場合はNoneを返す。"""
+        trace = self.to_chrome_trace(trace_id)
+        if trace is None:
+            return None
+        if path is None:
+            if not self.export_dir:
+                return None
+            path = os.path.join(self.export_dir, f"{trace_id}.json")
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        try:
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(trace, f, ensure_ascii=False, default=str)
+        except IOError as e:
+            logger.error(f"トレースの書き出しに失敗しました {path}: {e}")
+            return None
+        return path
+
+    def _on_trace_finished(self, trace_id: str) -> None:
+        if self.export_each_trace:
+            path = self.export_chrome_trace(trace_id)
+            if path is not None:
+                logger.info(f"トレースを書き出しました: {path}")
+
+    def get_stats(self) -> Dict[str, float]:
+        """保持しているトレース数とスパン数、上限を超えて記録しなかったスパン数を返す。"""
+        with self._lock:
+            return {
+                "traces": float(len(self._traces)),
+                "spans": float(sum(len(spans) for spans in self._traces.values())),
+                "dropped_spans": float(self._dropped_spans),
+            }
+
+
+def install_tracer(tracer: Tracer, enabled: bool = True) -> Iterator[Optional[Tracer]]:
+    """
+    トレーサーを現在のコンテキストで有効にするContainerのリソース。
+    以降にこのコンテキストから開始されたasyncio.runやスレッド（コンテキストを引き継ぐもの）の中で、トレースを記録できるようになる。
+    """
+    if not enabled:
+        yield None
+        return
+    _active_tracer.set(tracer)
+    logger.info(f"リクエスト単位のトレースを有効にしました (書き出し先: {tracer.export_dir}, 毎回の書き出し: {tracer.export_each_trace})")
+    try:
+        yield tracer
+    finally:
+        _active_tracer.set(None)
+
+
+def current_trace_id() -> Optional[str]:
+    """現在のトレースIDを返す。トレースの外ではNoneを返す。"""
+    current = _current_span.get()
+    return current[1] if current is not None else None
+
+
+@contextlib.contextmanager
+def _open_span(tracer: Tracer, trace_id: str, parent_id: Optional[int], name: str, category: str, args: Dict[str, Any]) -> Iterator[None]:
+    span_id = next(_span_ids)
+    token = _current_span.set((tracer, trace_id, span_id))
+    start = time.perf_counter()
+    try:
+        yield
+    except BaseException as e:
+        args = {**args, "error": f"{type(e).__name__}: {e}"}
+        raise
+    finally:
+        try:
+            _current_span.reset(token)
+        except ValueError:
+            # 非同期ジェネレーターが別のコンテキストで閉じられた場合は、元のコンテキストの値を戻す必要がない
+            pass
+        tracer.record(trace_id, {
+            "span_id": span_id, "parent_id": parent_id, "name": name, "category": category,
+            "start": start, "end": time.perf_counter(), "lane": _lane(), "args": args,
+        })
+
+
+@contextlib.contextmanager
+def start_trace(trace_id: Optional[str] = None, name: str = "request", category: str = "request", **args: Any) -> Iterator[None]:
+    """
+    新しいトレースを開始し、ブロックをそのルートのスパンとして記録する。
+    既にトレースの中にある場合は、新しいトレースを開始せずに子のスパンとして記録する。
+    トレーサーが有効でない場合は何もしない。trace_idを省略した場合は新しいIDを割り当てる。
+    """
+    current = _current_span.get()
+    if current is not None:
+        tracer, current_trace, parent_id = current
+        with _open_span(tracer, current_trace, parent_id, name, category, args):
+            yield
+        return
+    active = _active_tracer.get()
+    if active is None:
+        yield
+        return
+    trace_id = trace_id or uuid.uuid4().hex[:12]
+    with _open_span(active, trace_id, None, name, category, args):
+        yield
+    active._on_trace_finished(trace_id)
+
+
+@contextlib.contextmanager
+def trace_span(name: str, category: str = "app", **args: Any) -> Iterator[None]:
+    """ブロックを現在のトレースの子のスパンとして記録する。トレースの外では何もしない。"""
+    current = _current_span.get()
+    if current is None:
+        yield
+        return
+    tracer, trace_id, parent_id = current
+    with _open_span(tracer, trace_id, parent_id, name, category, args):
+        yield
+
+
+def current_span_context() -> Optional[Tuple[Tracer, str, int]]:
+    """現在のスパンを返す。record_spanで、後から完了した区間を記録する際の親として用いる。"""
+    return _current_span.get()
+
+
+def record_span(
+    parent: Optional[Tuple[Tracer, str, int]], name: str, category: str, start: float, end: float, **args: Any
+) -> None:
+    """
+    計測済みの区間（LLM呼び出しのように、開始と終了がコールバックで通知されるもの）を、parentの子のスパンとして記録する。
+    parentがNone（トレースの外で開始された区間）の場合は何もしない。
+    """
+    if parent is None:
+        return
+    tracer, trace_id, parent_id = parent
+    tracer.record(trace_id, {
+        "span_id": next(_span_ids), "parent_id": parent_id, "name": name, "category": category,
+        "start": start, "end": end, "lane": _lane(), "args": args,
+    })
+
+
+def traced(name: str, category: str = "app") -> Callable[[F], F]:
+    """関数（同期・非同期）の呼び出しを、現在のトレースの子のスパンとして記録するデコレーター。"""
+    def decorator(func: F) -> F:
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args: Any, **kwargs: Any) -> Any:
+                with trace_span(name, category):
+                    return await func(*args, **kwargs)
+            return async_wrapper  # type: ignore[return-value]
+
+        @functools.wraps(func)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            with trace_span(name, category):
+                return func(*args, **kwargs)
+        return wrapper  # type: ignore[return-value]
+    return decorator
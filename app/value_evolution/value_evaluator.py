@@ -3,10 +3,12 @@
 # role: AIの応答とユーザーの反応を評価し、システムの核となる価値観を更新・進化させる。
 
 import logging
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.runnables import Runnable
 from langchain_core.output_parsers import JsonOutputParser
+from app.llm.instrumentation import with_agent_label
+from app.llm.structured_output import StructuredOutputStats, build_structured_chain
 
 logger = logging.getLogger(__name__)
 
@@ -14,9 +16,10 @@ class ValueEvaluator:
     """
     AIの応答を評価し、核となる価値観を調整するクラス。
     """
-    def __init__(self, llm: Any, output_parser: Any) -> None:
+    def __init__(self, llm: Any, output_parser: Any, structured_output_stats: Optional[StructuredOutputStats] = None) -> None:
         self.llm = llm
         self.output_parser = output_parser
+        self.structured_output_stats = structured_output_stats
         self.core_values: Dict[str, float] = {
             "Helpfulness": 0.8,
             "Harmlessness": 0.9,
@@ -45,13 +48,26 @@ class ValueEvaluator:
             }}
             """
         )
-        self._chain = self.value_assessment_prompt | self.llm | self.output_parser
+        # 解析できない場合は調整なし（空の辞書）とする
+        chain = build_structured_chain(
+            self.value_assessment_prompt, self.llm, "ValueEvaluator",
+            stats=self.structured_output_stats, expected_type=dict, default={},
+        )
+        self._chain = with_agent_label(chain, "ValueEvaluator")
         logger.info(f"ValueEvaluator initialized with core values: {self.core_values}")
 
     def log_values(self) -> None:
         """現在の核となる価値観をログに出力します。"""
         logger.info(f"Current Core Values: {self.core_values}")
 
+    def _apply_adjustments(self, adjustments: Dict[str, float]) -> None:
+        """LLMが提案した調整値を核となる価値観に反映します。"""
+        for key, adjustment in adjustments.items():
+            if key in self.core_values:
+                self.core_values[key] = max(0.0, min(1.0, self.core_values[key] + adjustment))
+                logger.info(f"Updated {key}: {self.core_values[key]:.2f} (adjusted by {adjustment:.1f})")
+        self.log_values()
+
     def assess_and_update_values(self, final_answer: str) -> None:
         """
         最終回答を評価し、それに応じて核となる価値観を更新します。
@@ -62,12 +78,20 @@ class ValueEvaluator:
                 "core_values": self.core_values,
                 "final_answer": final_answer
             }
-            adjustments: Dict[str, float] = self._chain.invoke(assessment_input)
+            self._apply_adjustments(self._chain.invoke(assessment_input))
+        except Exception as e:
+            logger.error(f"Failed to assess and update values: {e}", exc_info=True)
 
-            for key, adjustment in adjustments.items():
-                if key in self.core_values:
-                    self.core_values[key] = max(0.0, min(1.0, self.core_values[key] + adjustment))
-                    logger.info(f"Updated {key}: {self.core_values[key]:.2f} (adjusted by {adjustment:.1f})")
-            self.log_values()
+    async def aassess_and_update_values(self, final_answer: str) -> None:
+        """
+        assess_and_update_valuesの非同期版。
+        """
+        logger.info(f"Assessing final answer and considering value updates...")
+        try:
+            assessment_input = {
+                "core_values": self.core_values,
+                "final_answer": final_answer
+            }
+            self._apply_adjustments(await self._chain.ainvoke(assessment_input))
         except Exception as e:
             logger.error(f"Failed to assess and update values: {e}", exc_info=True)
\ No newline at end of file
@@ -0,0 +1,93 @@
+# /batch.py
+# title: バッチ処理実行スクリプト
+# role: アプリケーションのDIコンテナを初期化し、JSONLファイルのクエリをまとめて処理して、結果をJSONLファイルに書き出す。
+
+import argparse
+import asyncio
+import json
+import logging
+import sys
+import os
+from dotenv import load_dotenv
+from typing import List, cast
+
+# プロジェクトのルートパスをシステムパスに追加
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+load_dotenv()
+
+from app.containers import Container
+from app.config import settings
+from app.batch_runner import BatchRunner
+from app.utils.ollama_utils import check_ollama_models_availability
+from app.utils.api_key_checker import check_search_api_key
+
+# ロギングの基本設定
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+logger = logging.getLogger(__name__)
+
+
+def main() -> None:
+    """
+    バッチ処理のエントリーポイント。中断した場合は、同じ引数で再実行すると未完了のクエリから再開する。
+    """
+    batch_settings = settings.BATCH_SETTINGS
+    parser = argparse.ArgumentParser(description="JSONLファイルのクエリをまとめて処理します。")
+    parser.add_argument("input", help="1行に1件のクエリを持つJSONLファイル")
+    parser.add_argument("--output", help="結果の書き出し先（既定: <input>.results.jsonl）")
+    parser.add_argument("--concurrency", type=int, default=batch_settings["concurrency"])
+    parser.add_argument("--mode", help="すべてのクエリをこのモードで実行する（既定: OrchestrationAgentで選択）")
+    parser.add_argument("--latency-budget-ms", type=float, default=None)
+    parser.add_argument("--id-field", default=batch_settings["id_field"])
+    parser.add_argument("--query-field", default=batch_settings["query_field"])
+    args = parser.parse_args()
+    output_path = args.output or f"{os.path.splitext(args.input)[0]}.results.jsonl"
+
+    # 依存関係のチェック
+    required_models: List[str] = [
+        str(settings.GENERATION_LLM_SETTINGS["model"]),
+        settings.EMBEDDING_MODEL_NAME
+    ]
+    if not check_ollama_models_availability(required_models):
+        sys.exit(1)
+
+    check_search_api_key()
+
+    # DIコンテナの初期化（バッチ処理ではアイドル時の自律思考は行わない）
+    container = Container()
+    model_warmer = container.model_warmer() if settings.MODEL_WARMUP_SETTINGS["enabled"] else None
+    if model_warmer is not None:
+        model_warmer.start()
+    container.llm_instrumentation.init()
+    container.tracing.init()
+
+    runner = BatchRunner(
+        container.engine(),
+        container.orchestration_agent(),
+        concurrency=args.concurrency,
+        forced_mode=args.mode,
+        latency_budget_ms=args.latency_budget_ms,
+        id_field=args.id_field,
+        query_field=args.query_field,
+        log_every=cast(int, batch_settings["log_every"]),
+    )
+
+    if model_warmer is not None and not model_warmer.wait(cast(float, settings.MODEL_WARMUP_SETTINGS["startup_wait_seconds"])):
+        logger.warning("モデルのウォームアップが完了していませんが、バッチ処理を開始します。")
+
+    try:
+        report = asyncio.run(runner.arun(args.input, output_path))
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+    except KeyboardInterrupt:
+        logger.info(f"バッチ処理を中断しました。同じコマンドを再実行すると続きから処理します: {output_path}")
+    finally:
+        logger.info(f"LLMスケジューラ統計: {container.llm_scheduler().get_stats()}")
+        if settings.REFLECTION_QUEUE_SETTINGS["enabled"]:
+            logger.info(f"応答後の内省キュー統計: {container.reflection_queue().get_stats()}")
+        if settings.MODE_COST_SETTINGS["enabled"]:
+            container.mode_cost_model().flush()
+        container.shutdown_resources()
+        logger.info("--- バッチ処理終了 ---")
+
+
+if __name__ == "__main__":
+    main()
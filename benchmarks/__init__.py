@@ -0,0 +1,3 @@
+# /benchmarks/__init__.py
+# title: ベンチマークパッケージ
+# role: オフライン用のLLM・埋め込みモデルを使って、Ollamaを起動せずに性能を計測するスクリプト群をまとめる。
@@ -0,0 +1,108 @@
+# /benchmarks/ann_benchmark.py
+# title: ベクトルストアのインデックスのベンチマーク
+# role: クラスタ構造を持つ合成ベクトルに対して、flat（総当たり）・IVF・HNSWのインデックスを構築し、
+#       総当たりの検索結果に対する再現率(recall@k)、1件ずつ検索した場合のレイテンシ、構築時間をベクトル数ごとに比較する。
+#       インデックスはナレッジベースと同じapp.rag.ann_indexで構築し、設定はKNOWLEDGE_BASE_ANN_SETTINGSを既定とする。
+#
+# 使い方:
+#   python -m benchmarks.ann_benchmark
+#   python -m benchmarks.ann_benchmark --sizes 10000 100000 --dim 768
+#   python -m benchmarks.ann_benchmark --sizes 100000 --ivf-nprobe 4 16 64 --hnsw-ef-search 16 64 256
+
+from __future__ import annotations
+import argparse
+import json
+import time
+from typing import Any, Dict, List, Optional, Tuple, cast
+
+import numpy as np
+
+from benchmarks.common import format_table, percentile
+
+
+def generate_vectors(count: int, dim: int, queries: int, seed: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    クラスタの中心の周りに分布する、正規化したベクトルとクエリを生成する。
+    文書の埋め込みと同様に、話題ごとのまとまりがある分布とするため、一様な乱数ではなくクラスタ構造を持たせる。
+    """
+    rng = np.random.default_rng(seed)
+    clusters = max(16, int(np.sqrt(count)))
+    centers = rng.standard_normal((clusters, dim)).astype(np.float32)
+    vectors = np.empty((count, dim), dtype=np.float32)
+    # 大きな件数でもメモリを使いすぎないよう、分けて生成する
+    for start in range(0, count, 100000):
+        end = min(start + 100000, count)
+        assignment = rng.integers(0, clusters, end - start)
+        vectors[start:end] = centers[assignment] + 0.5 * rng.standard_normal((end - start, dim)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    sample = vectors[rng.integers(0, count, queries)]
+    query_vectors = sample + 0.1 * rng.standard_normal(sample.shape).astype(np.float32)
+    query_vectors /= np.linalg.norm(query_vectors, axis=1, keepdims=True)
+    return vectors, query_vectors.astype(np.float32)
+
+
+def measure(index: Any, query_vectors: np.ndarray, truth: np.ndarray, k: int) -> Dict[str, float]:
+    """クエリを1件ずつ検索し、総当たりの上位k件との一致率とレイテンシ（ミリ秒）を返す。"""
+    latencies: List[float] = []
+    found = 0
+    for query, expected in zip(query_vectors, truth):
+        start = time.perf_counter()
+        _, ids = index.search(query.reshape(1, -1), k)
+        latencies.append((time.perf_counter() - start) * 1000)
+        found += len(set(ids[0].tolist()) & set(expected.tolist()))
+    return {
+        "recall_at_k": found / (len(truth) * k),
+        "latency_mean_ms": sum(latencies) / len(latencies),
+        "latency_p50_ms": percentile(latencies, 0.5),
+        "latency_p95_ms": percentile(latencies, 0.95),
+    }
+
+
+def main() -> None:
+    from app.config import settings
+    from app.rag.ann_index import apply_search_params, build_index, ivf_list_count
+
+    ann_settings = settings.KNOWLEDGE_BASE_ANN_SETTINGS
+    parser = argparse.ArgumentParser(description="flat・IVF・HNSWの再現率とレイテンシの比較（Ollama不要）")
+    parser.add_argument("--sizes", nargs="+", type=int, default=[10000, 100000, 1000000], help="ベクトル数")
+    parser.add_argument("--dim", type=int, default=128, help="ベクトルの次元数")
+    parser.add_argument("--queries", type=int, default=200, help="クエリ数")
+    parser.add_argument("--k", type=int, default=settings.RETRIEVAL_SETTINGS["candidates"], help="検索で返す件数")
+    parser.add_argument("--ivf-nprobe", nargs="+", type=int, default=[ann_settings["ivf_nprobe"]], help="評価するIVFの探索リスト数")
+    parser.add_argument("--hnsw-ef-search", nargs="+", type=int, default=[ann_settings["hnsw_ef_search"]], help="評価するHNSWの探索の幅")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="結果をJSONで保存するパス")
+    args = parser.parse_args()
+
+    results: List[Dict[str, Any]] = []
+    for size in args.sizes:
+        vectors, query_vectors = generate_vectors(size, args.dim, args.queries, args.seed)
+        print(f"{size}件 x {args.dim}次元のベクトルでインデックスを構築しています...", flush=True)
+
+        built: Dict[str, Tuple[Any, float]] = {}
+        for index_type in ("flat", "ivf", "hnsw"):
+            start = time.perf_counter()
+            built[index_type] = (build_index(vectors, index_type, ann_settings), time.perf_counter() - start)
+        flat_index = built["flat"][0]
+        _, truth = flat_index.search(query_vectors, args.k)
+
+        variants: List[Tuple[str, str, Dict[str, Any]]] = [("flat", "flat", {})]
+        variants += [("ivf", f"ivf nlist={ivf_list_count(size, cast(Optional[int], ann_settings['ivf_nlist']))} nprobe={n}", {**ann_settings, "ivf_nprobe": n}) for n in args.ivf_nprobe]
+        variants += [("hnsw", f"hnsw M={ann_settings['hnsw_m']} ef={ef}", {**ann_settings, "hnsw_ef_search": ef}) for ef in args.hnsw_ef_search]
+        for index_type, label, params in variants:
+            index, build_seconds = built[index_type]
+            apply_search_params(index, params)
+            results.append({"vectors": size, "config": label, "build_seconds": build_seconds, **measure(index, query_vectors, truth, args.k)})
+        del built, flat_index, vectors
+
+    print()
+    headers = ["vectors", "config", "build_seconds", "recall_at_k", "latency_mean_ms", "latency_p50_ms", "latency_p95_ms"]
+    print(format_table(headers, [[r[h] for h in headers] for r in results]))
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
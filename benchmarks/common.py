@@ -0,0 +1,118 @@
+# /benchmarks/common.py
+# title: ベンチマーク共通ユーティリティ
+# role: オフライン用Containerの構築、ピークメモリ使用量の取得、統計値の計算、結果の表形式出力など、各ベンチマークで共通の処理を提供する。
+
+from __future__ import annotations
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+# `python -m benchmarks.xxx` として実行されることを想定し、プロジェクトルートをパスに追加する
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+# ワーカープロセスが結果を出力する行の接頭辞
+RESULT_PREFIX = "BENCHMARK_RESULT "
+
+
+def create_offline_container(
+    token_latency_seconds: float = 0.0,
+    first_token_latency_seconds: float = 0.0,
+    embedding_latency_seconds: float = 0.0,
+    scratch_dir: Optional[str] = None,
+    malformed_json_every: int = 0,
+    latency_by_model: Optional[Dict[str, Tuple[float, float]]] = None,
+    profile_overrides: Optional[Dict[str, Dict[str, Any]]] = None,
+) -> Tuple[Any, Any, Any]:
+    """
+    LLMと埋め込みモデルをオフライン用の実装に置き換えたContainerを構築する。
+    記憶や知識グラフなどの書き込みがリポジトリを汚さないよう、作業ディレクトリを一時ディレクトリへ移す。
+    Container、FakeOllamaLLM、FakeOllamaEmbeddingsを返す。
+    """
+    from dependency_injector import providers
+
+    from app.config import settings
+    from app.containers import Container
+    from app.llm.fake import override_container_with_fakes
+    from app.rag.knowledge_base import KnowledgeBase
+
+    knowledge_base_source = os.path.join(PROJECT_ROOT, settings.KNOWLEDGE_BASE_SOURCE)
+    os.chdir(scratch_dir or tempfile.mkdtemp(prefix="luca3-bench-"))
+
+    container = Container()
+    llm, embeddings = override_container_with_fakes(
+        container,
+        token_latency_seconds=token_latency_seconds,
+        first_token_latency_seconds=first_token_latency_seconds,
+        embedding_latency_seconds=embedding_latency_seconds,
+        malformed_json_every=malformed_json_every,
+        latency_by_model=latency_by_model,
+        profile_overrides=profile_overrides,
+    )
+    container.knowledge_base.override(providers.Resource(
+        KnowledgeBase.create_and_load,
+        source=knowledge_base_source,
+        embeddings=container.embeddings,
+    ))
+    return container, llm, embeddings
+
+
+def peak_rss_mb() -> float:
+    """現在のプロセスのピーク常駐メモリ(RSS)をMB単位で返す。"""
+    import resource
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # LinuxではKB単位、macOSではバイト単位で返される
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def percentile(values: Sequence[float], q: float) -> float:
+    """値のリストのq分位点(0-1)を線形補間で返す。空の場合は0を返す。"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * q
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+def run_worker(module: str, args: List[str]) -> Dict[str, Any]:
+    """
+    ベンチマークのワーカーを別プロセスで実行し、その結果を返す。
+    ピークメモリ使用量を計測対象ごとに独立させるために使用する。
+    """
+    completed = subprocess.run(
+        [sys.executable, "-m", module, *args],
+        cwd=PROJECT_ROOT,
+        capture_output=True,
+        text=True,
+    )
+    for line in reversed(completed.stdout.splitlines()):
+        if line.startswith(RESULT_PREFIX):
+            result: Dict[str, Any] = json.loads(line[len(RESULT_PREFIX):])
+            return result
+    raise RuntimeError(
+        f"ワーカー({module} {' '.join(args)})が結果を返しませんでした (exit code: {completed.returncode})\n"
+        f"{completed.stderr[-2000:]}"
+    )
+
+
+def emit_result(result: Dict[str, Any]) -> None:
+    """ワーカーの結果を親プロセスが読み取れる形式で標準出力に書き出す。"""
+    print(RESULT_PREFIX + json.dumps(result, ensure_ascii=False), flush=True)
+
+
+def format_table(headers: Sequence[str], rows: Sequence[Sequence[Any]]) -> str:
+    """結果を等幅の表として整形する。"""
+    cells = [[str(h) for h in headers]] + [
+        [f"{v:.3f}" if isinstance(v, float) else str(v) for v in row] for row in rows
+    ]
+    widths = [max(len(row[i]) for row in cells) for i in range(len(headers))]
+    lines = ["  ".join(cell.rjust(width) for cell, width in zip(row, widths)) for row in cells]
+    lines.insert(1, "  ".join("-" * width for width in widths))
+    return "\n".join(lines)
@@ -0,0 +1,77 @@
+# /benchmarks/mode_router_benchmark.py
+# title: モードルーターの学習と評価
+# role: OrchestrationAgentが記録した（クエリ, モード）の決定からモードルーターを学習して保存する。
+#       また、記録を学習用と評価用に分け、確信度の閾値ごとのヒット率（LLMを省略できる割合）、LLMとの一致率、省略できる時間を表示する。
+#
+# 使い方:
+#   python -m benchmarks.mode_router_benchmark evaluate
+#   python -m benchmarks.mode_router_benchmark train
+#   python -m benchmarks.mode_router_benchmark evaluate --log memory/mode_decisions.jsonl --thresholds 0.8 0.9 0.95
+
+from __future__ import annotations
+import argparse
+import json
+import random
+import time
+from typing import Any, Dict, List
+
+from benchmarks.common import format_table
+
+
+def main() -> None:
+    from app.config import settings
+    from app.reasoning.mode_router import ModeDecisionLog, ModeRouter, evaluate_router
+
+    router_settings = settings.MODE_ROUTER_SETTINGS
+    parser = argparse.ArgumentParser(description="モードルーターの学習と評価（Ollama不要）")
+    parser.add_argument("command", choices=["train", "evaluate"], help="train: すべての記録で学習して保存する / evaluate: 学習用と評価用に分けて評価する")
+    parser.add_argument("--log", default=router_settings["decision_log_path"], help="モード選択の記録(JSONL)")
+    parser.add_argument("--model", default=router_settings["model_path"], help="学習したモデルの保存先")
+    parser.add_argument(
+        "--thresholds", nargs="+", type=float,
+        default=[0.6, 0.7, 0.8, router_settings["confidence_threshold"], 0.95], help="評価する確信度の閾値",
+    )
+    parser.add_argument("--test-fraction", type=float, default=0.25, help="evaluateで評価に用いる記録の割合")
+    parser.add_argument("--seed", type=int, default=0, help="evaluateで記録を分割する乱数のシード")
+    parser.add_argument("--output", help="evaluateの結果をJSONで保存するパス")
+    args = parser.parse_args()
+
+    # ルーターの学習には、LLMが決定した記録のみを用いる
+    records = ModeDecisionLog.read(args.log, source="llm")
+    if len({r["chosen_mode"] for r in records}) < 2:
+        print(f"{args.log} に2種類以上のモードの記録がないため、学習できません（{len(records)}件）。")
+        return
+
+    def new_router() -> ModeRouter:
+        return ModeRouter(ngram_range=tuple(router_settings["ngram_range"]), num_features=router_settings["num_features"])  # type: ignore[arg-type]
+
+    if args.command == "train":
+        start = time.perf_counter()
+        router = new_router().fit([r["query"] for r in records], [r["chosen_mode"] for r in records])
+        router.save(args.model)
+        print(f"{len(records)}件で学習し、{args.model} に保存しました（{time.perf_counter() - start:.2f} s, モード: {router.modes}）。")
+        return
+
+    shuffled = list(records)
+    random.Random(args.seed).shuffle(shuffled)
+    test_size = max(1, int(len(shuffled) * args.test_fraction))
+    test, train = shuffled[:test_size], shuffled[test_size:]
+    router = new_router().fit([r["query"] for r in train], [r["chosen_mode"] for r in train])
+
+    start = time.perf_counter()
+    results: List[Dict[str, Any]] = evaluate_router(router, test, sorted(set(args.thresholds)))  # type: ignore[assignment]
+    predict_ms = (time.perf_counter() - start) / len(test) * 1000
+    llm_latency_mean = sum(float(r.get("latency") or 0.0) for r in test) / len(test)
+
+    print(f"学習 {len(train)}件 / 評価 {len(test)}件, ルーターの予測 {predict_ms:.2f} ms/件, LLMによるモード選択 {llm_latency_mean:.3f} s/件")
+    print()
+    headers = ["threshold", "hit_rate", "hit_accuracy", "overall_accuracy", "saved_seconds_per_query"]
+    print(format_table(headers, [[r[h] for h in headers] for r in results]))
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
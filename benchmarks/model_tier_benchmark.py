@@ -0,0 +1,165 @@
+# /benchmarks/model_tier_benchmark.py
+# title: エージェント別モデル割り当てベンチマーク
+# role: すべてのエージェントが同じモデルを使う構成と、モード選択・検索評価・ツール選択・クエリ改善を小さなモデルに割り当てた構成とで、
+#       モード選択からパイプライン実行までの処理時間とモデル別のLLM呼び出し数を比較する。
+#       モデルの速度差はオフライン用LLMのモデル別遅延で模擬する。
+#
+# 使い方:
+#   python -m benchmarks.model_tier_benchmark
+#   python -m benchmarks.model_tier_benchmark --modes simple full --runs 3 --small-token-latency 0.002 --large-token-latency 0.01
+
+from __future__ import annotations
+import argparse
+import asyncio
+import json
+import logging
+import tempfile
+import time
+from typing import Any, Dict, List
+
+from dependency_injector import providers
+
+from benchmarks.common import create_offline_container, emit_result, format_table, percentile, run_worker
+from benchmarks.pipeline_benchmark import ALL_MODES, DEFAULT_QUERIES
+
+WIRINGS = ["single", "tiered"]
+
+# tiered構成で小さなモデルに割り当てる役割（短いモード名・JSON・検索クエリしか出力しないもの）
+SMALL_MODEL_ROLES = ["orchestration", "retrieval_evaluation", "tool_selection", "query_refinement"]
+
+
+def build_profile_overrides(wiring: str, large_model: str, small_model: str) -> Dict[str, Dict[str, Any]]:
+    """構成名から、役割ごとのモデルの上書き設定を作成する。"""
+    overrides: Dict[str, Dict[str, Any]] = {"generation": {"model": large_model}}
+    for role in SMALL_MODEL_ROLES:
+        overrides[role] = {"model": small_model if wiring == "tiered" else large_model}
+    return overrides
+
+
+async def _run(container: Any, llm: Any, mode: str, queries: List[str], runs: int) -> Dict[str, Any]:
+    """モード選択と、指定したモードのパイプラインを繰り返し実行し、計測値を集計する。"""
+    orchestration_agent = container.orchestration_agent()
+    pipeline = container.engine().pipelines[mode]
+    wall_times: List[float] = []
+    by_model: Dict[str, int] = {}
+    completion_chars = 0
+    errors: List[str] = []
+
+    for _ in range(runs):
+        for query in queries:
+            llm.reset_stats()
+            start = time.perf_counter()
+            try:
+                decision = await orchestration_agent.ainvoke({"query": query})
+                # 比較のため、モード選択の結果に関わらず指定したモードで実行する
+                response = await pipeline.arun(query, {**decision, "chosen_mode": mode})
+                if not response.get("final_answer"):
+                    errors.append(f"{query}: 空の回答")
+            except Exception as e:
+                errors.append(f"{query}: {type(e).__name__}: {e}")
+            wall_times.append(time.perf_counter() - start)
+            stats = llm.get_stats()
+            completion_chars += stats["completion_chars"]
+            for model, model_stats in stats["by_model"].items():
+                by_model[model] = by_model.get(model, 0) + model_stats["calls"]
+
+    count = len(wall_times)
+    return {
+        "mode": mode,
+        "samples": count,
+        "wall_mean": sum(wall_times) / count,
+        "wall_p95": percentile(wall_times, 0.95),
+        "calls_by_model": {model: calls / count for model, calls in by_model.items()},
+        "completion_chars": completion_chars / count,
+        "errors": errors,
+    }
+
+
+def run_worker_mode(args: argparse.Namespace) -> None:
+    """1つの構成・モードを現在のプロセスで計測し、結果を出力する。"""
+    wiring, mode = args.worker.split(":", 1)
+    latency_by_model = {
+        args.large_model: (args.large_first_token_latency, args.large_token_latency),
+        args.small_model: (args.small_first_token_latency, args.small_token_latency),
+    }
+    with tempfile.TemporaryDirectory(prefix="luca3-bench-") as scratch_dir:
+        container, llm, _ = create_offline_container(
+            scratch_dir=scratch_dir,
+            latency_by_model=latency_by_model,
+            profile_overrides=build_profile_overrides(wiring, args.large_model, args.small_model),
+        )
+        # 繰り返し実行したクエリでモード選択のLLM呼び出しが省略されないよう、モード選択のキャッシュは使用しない
+        container.orchestration_decision_cache.override(providers.Object(None))
+        logging.getLogger().setLevel(args.log_level)
+        container.init_resources()
+        container.engine()
+        result = asyncio.run(_run(container, llm, mode, args.queries, args.runs))
+        result["wiring"] = wiring
+        container.shutdown_resources()
+    emit_result(result)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="単一モデル構成とエージェント別モデル構成の比較ベンチマーク（Ollama不要）")
+    parser.add_argument("--modes", nargs="+", default=["simple", "full", "parallel"], choices=ALL_MODES, help="計測するモード")
+    parser.add_argument("--runs", type=int, default=2, help="各クエリの繰り返し回数")
+    parser.add_argument("--queries", nargs="+", default=DEFAULT_QUERIES, help="使用するクエリ")
+    parser.add_argument("--large-model", default="gemma3:latest", help="生成に用いるモデル名")
+    parser.add_argument("--small-model", default="gemma3:1b", help="tiered構成で小さな役割に用いるモデル名")
+    parser.add_argument("--large-first-token-latency", type=float, default=0.05, help="大きなモデルの最初のトークンまでの遅延（秒）")
+    parser.add_argument("--large-token-latency", type=float, default=0.004, help="大きなモデルの1トークンあたりの遅延（秒）")
+    parser.add_argument("--small-first-token-latency", type=float, default=0.015, help="小さなモデルの最初のトークンまでの遅延（秒）")
+    parser.add_argument("--small-token-latency", type=float, default=0.001, help="小さなモデルの1トークンあたりの遅延（秒）")
+    parser.add_argument("--output", help="結果をJSONで保存するパス")
+    parser.add_argument("--log-level", default="WARNING", help="ワーカーのログレベル")
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker_mode(args)
+        return
+
+    results: List[Dict[str, Any]] = []
+    for mode in args.modes:
+        for wiring in WIRINGS:
+            worker_args = [
+                "--worker", f"{wiring}:{mode}",
+                "--runs", str(args.runs),
+                "--large-model", args.large_model,
+                "--small-model", args.small_model,
+                "--large-first-token-latency", str(args.large_first_token_latency),
+                "--large-token-latency", str(args.large_token_latency),
+                "--small-first-token-latency", str(args.small_first_token_latency),
+                "--small-token-latency", str(args.small_token_latency),
+                "--log-level", args.log_level,
+                "--queries", *args.queries,
+            ]
+            result = run_worker("benchmarks.model_tier_benchmark", worker_args)
+            results.append(result)
+            print(f"{mode}/{wiring}: 完了 ({result['samples']}回, 平均 {result['wall_mean']:.3f} s)", flush=True)
+
+    headers = ["mode", "wiring", "wall_mean_s", "wall_p95_s", "speedup", "large_calls", "small_calls", "completion_chars", "errors"]
+    rows = []
+    baseline: Dict[str, float] = {}
+    for r in results:
+        if r["wiring"] == "single":
+            baseline[r["mode"]] = r["wall_mean"]
+        rows.append([
+            r["mode"], r["wiring"], r["wall_mean"], r["wall_p95"],
+            baseline.get(r["mode"], r["wall_mean"]) / r["wall_mean"] if r["wall_mean"] else 0.0,
+            r["calls_by_model"].get(args.large_model, 0.0), r["calls_by_model"].get(args.small_model, 0.0),
+            r["completion_chars"], len(r["errors"]),
+        ])
+    print()
+    print(format_table(headers, rows))
+    for r in results:
+        for error in r["errors"][:3]:
+            print(f"[{r['mode']}/{r['wiring']}] {error}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
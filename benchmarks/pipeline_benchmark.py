@@ -0,0 +1,155 @@
+# /benchmarks/pipeline_benchmark.py
+# title: 推論パイプライン エンドツーエンドベンチマーク
+# role: オフライン用LLMを注入したContainerで、MetaIntelligenceEngineの全実行モードを実行し、モードごとの処理時間・LLM呼び出し数・入出力文字数・ピークメモリを計測する。
+#
+# 使い方:
+#   python -m benchmarks.pipeline_benchmark
+#   python -m benchmarks.pipeline_benchmark --modes simple full --runs 5 --token-latency 0.005 --output bench.json
+#   python -m benchmarks.pipeline_benchmark --modes full --malformed-json-every 3
+
+from __future__ import annotations
+import argparse
+import asyncio
+import json
+import logging
+import tempfile
+import time
+from typing import Any, Dict, List
+
+from benchmarks.common import create_offline_container, emit_result, format_table, peak_rss_mb, percentile, run_worker
+
+ALL_MODES = ["simple", "full", "parallel", "quantum", "speculative", "self_discover", "internal_dialogue"]
+
+DEFAULT_QUERIES = [
+    "こんにちは",
+    "地球温暖化の主な原因を教えてください。",
+    "リモートワークとオフィスワークの生産性をどのように比較すべきか、なぜその観点が重要かを説明してください。",
+]
+
+
+async def _run_mode(container: Any, llm: Any, mode: str, queries: List[str], runs: int) -> Dict[str, Any]:
+    """指定したモードのパイプラインを繰り返し実行し、1回ごとの計測値を集計する。"""
+    pipeline = container.engine().pipelines[mode]
+    decision = {"chosen_mode": mode, "reason": "benchmark", "agent_configs": {}}
+    wall_times: List[float] = []
+    calls: List[int] = []
+    prompt_chars: List[int] = []
+    completion_chars: List[int] = []
+    errors: List[str] = []
+
+    for _ in range(runs):
+        for query in queries:
+            llm.reset_stats()
+            start = time.perf_counter()
+            try:
+                # フォールバックで失敗が隠れないよう、エンジンを介さずパイプラインを直接実行する
+                response = await pipeline.arun(query, decision)
+                if not response.get("final_answer"):
+                    errors.append(f"{query}: 空の回答")
+            except Exception as e:
+                errors.append(f"{query}: {type(e).__name__}: {e}")
+            wall_times.append(time.perf_counter() - start)
+            stats = llm.get_stats()
+            calls.append(stats["calls"])
+            prompt_chars.append(stats["prompt_chars"])
+            completion_chars.append(stats["completion_chars"])
+
+    count = len(wall_times)
+    json_stats = container.structured_output_stats().get_stats().values()
+    # ステップグラフで実行するパイプラインは、クリティカルパスと各段階の処理時間の合計も報告する
+    step_graph = container.step_graph_stats().get_stats().get(mode)
+    return {
+        "mode": mode,
+        "samples": count,
+        "wall_mean": sum(wall_times) / count,
+        "wall_p50": percentile(wall_times, 0.5),
+        "wall_p95": percentile(wall_times, 0.95),
+        "llm_calls": sum(calls) / count,
+        "prompt_chars": sum(prompt_chars) / count,
+        "completion_chars": sum(completion_chars) / count,
+        "json_repaired": sum(s["repaired"] for s in json_stats),
+        "json_reasked": sum(s["reasked"] for s in json_stats),
+        "json_defaulted": sum(s["defaulted"] for s in json_stats),
+        "critical_path": step_graph["critical_path_mean"] if step_graph else None,
+        "step_sum": step_graph["step_sum_mean"] if step_graph else None,
+        "errors": errors,
+    }
+
+
+def run_worker_mode(args: argparse.Namespace) -> None:
+    """1つのモードを現在のプロセスで計測し、結果を出力する。"""
+    with tempfile.TemporaryDirectory(prefix="luca3-bench-") as scratch_dir:
+        container, llm, _ = create_offline_container(
+            token_latency_seconds=args.token_latency,
+            first_token_latency_seconds=args.first_token_latency,
+            scratch_dir=scratch_dir,
+            malformed_json_every=args.malformed_json_every,
+        )
+        logging.getLogger().setLevel(args.log_level)
+        # Containerの初期化（ナレッジベースの構築など）は計測対象に含めない
+        container.init_resources()
+        container.engine()
+        result = asyncio.run(_run_mode(container, llm, args.worker, args.queries, args.runs))
+        result["peak_rss_mb"] = peak_rss_mb()
+        container.shutdown_resources()
+    emit_result(result)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="全実行モードのエンドツーエンドベンチマーク（Ollama不要）")
+    parser.add_argument("--modes", nargs="+", default=ALL_MODES, choices=ALL_MODES, help="計測するモード")
+    parser.add_argument("--runs", type=int, default=3, help="各クエリの繰り返し回数")
+    parser.add_argument("--queries", nargs="+", default=DEFAULT_QUERIES, help="使用するクエリ")
+    parser.add_argument("--token-latency", type=float, default=0.0, help="1トークンあたりの生成遅延（秒）")
+    parser.add_argument("--first-token-latency", type=float, default=0.0, help="最初のトークンまでの遅延（秒）")
+    parser.add_argument("--malformed-json-every", type=int, default=0, help="JSON応答のうちこの件数に1件を崩して返す（0で無効）")
+    parser.add_argument("--output", help="結果をJSONで保存するパス")
+    parser.add_argument("--log-level", default="WARNING", help="ワーカーのログレベル")
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker_mode(args)
+        return
+
+    results: List[Dict[str, Any]] = []
+    for mode in args.modes:
+        # ピークメモリをモードごとに独立して計測するため、モードごとに別プロセスで実行する
+        worker_args = [
+            "--worker", mode,
+            "--runs", str(args.runs),
+            "--token-latency", str(args.token_latency),
+            "--first-token-latency", str(args.first_token_latency),
+            "--malformed-json-every", str(args.malformed_json_every),
+            "--log-level", args.log_level,
+            "--queries", *args.queries,
+        ]
+        result = run_worker("benchmarks.pipeline_benchmark", worker_args)
+        results.append(result)
+        print(f"{mode}: 完了 ({result['samples']}回, 平均 {result['wall_mean']:.3f} s)", flush=True)
+
+    headers = [
+        "mode", "runs", "wall_mean_s", "wall_p95_s", "critical_path_s", "step_sum_s", "llm_calls", "prompt_chars", "completion_chars",
+        "json_repaired", "json_reasked", "json_defaulted", "peak_rss_mb", "errors",
+    ]
+    rows = [
+        [
+            r["mode"], r["samples"], r["wall_mean"], r["wall_p95"],
+            "-" if r["critical_path"] is None else r["critical_path"], "-" if r["step_sum"] is None else r["step_sum"], r["llm_calls"], r["prompt_chars"], r["completion_chars"],
+            r["json_repaired"], r["json_reasked"], r["json_defaulted"], r["peak_rss_mb"], len(r["errors"]),
+        ]
+        for r in results
+    ]
+    print()
+    print(format_table(headers, rows))
+    for r in results:
+        for error in r["errors"][:3]:
+            print(f"[{r['mode']}] {error}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,207 @@
+# /benchmarks/retrieval_benchmark.py
+# title: 知識ベース検索のベンチマーク
+# role: 架空の固有名詞（製品名・地名）を含むドキュメントと、それを問う短い日本語のクエリを生成し、
+#       ベクトル検索のみ・語彙検索（BM25）のみ・RRFによる統合の各構成で、正解のチャンクの再現率(recall@k)、MRRとレイテンシを比較する。
+#
+# クエリには、製品名をそのまま含むものと、言い換えたもの（製品名をひらがなで書くか省いて地名で指し、分類を同義語で述べる）がある。
+# 言い換えたクエリはドキュメントと共通の文字bigramが少ないため、語彙検索だけでは見つけにくい。再現率はクエリの種類ごとにも示す。
+#
+# 既定ではオフライン用の埋め込みモデル（FakeOllamaEmbeddings）を用いる。これは文字bigramを射影したものであり、
+# 実際の埋め込みモデルよりも表層の一致に強く、言い換えには弱いため、ベクトル検索のみの構成との差は実際と異なって出る。--ollama-modelで実際のモデルを計測できる。
+#
+# 使い方:
+#   python -m benchmarks.retrieval_benchmark
+#   python -m benchmarks.retrieval_benchmark --documents 2000 --queries 300 --embedding-latency 0.01
+#   python -m benchmarks.retrieval_benchmark --paraphrase-ratio 1.0
+#   python -m benchmarks.retrieval_benchmark --ollama-model nomic-embed-text --documents 300 --queries 100
+
+from __future__ import annotations
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+from typing import Any, Dict, List, Tuple
+
+from benchmarks.common import format_table, percentile
+
+_KANA = "アイウエオカキクケコサシスセソタチツテトナニヌネノハヒフヘホマミムメモヤユヨラリルレロワガギグゲゴザジズゼゾダデドバビブベボパピプペポ"
+_PLACE_KANJI = "北南東西山川田島崎浜松杉森岡原野沢宮坂橋谷村本城瀬戸浦津尾根倉見里"
+_PLACE_SUFFIXES = ["市", "町", "村", "郡"]
+# 分類と、言い換えたクエリで用いるその同義語
+_CATEGORIES = {
+    "調理家電": ["キッチン用の電化製品", "台所で使う家電"],
+    "産業用ロボット": ["工場の自動化機械", "製造ラインの機械"],
+    "醸造酒": ["日本酒やビールのようなお酒", "発酵させて造る酒"],
+    "鉄道車両": ["電車", "列車"],
+    "業務用ソフトウェア": ["企業向けのアプリ", "仕事で使うプログラム"],
+    "観光施設": ["旅行者向けの名所", "観光スポット"],
+    "農業機械": ["トラクターなどの農機", "畑で使う機械"],
+    "医療機器": ["病院で使う装置", "診療用の機器"],
+}
+_FILLER = [
+    "製品の品質は第三者機関によって定期的に検査されている。",
+    "開発チームは利用者の声をもとに改良を重ねてきた。",
+    "販売開始から数年で国内外に多くの利用者を獲得した。",
+    "価格は同じ分類の他の製品と比べて標準的な水準である。",
+    "保守と修理のための窓口が各地域に設けられている。",
+    "環境への負荷を減らすための取り組みも進められている。",
+    "地域の経済に大きく貢献しているとして評価されている。",
+    "詳しい仕様は公式の資料で公開されている。",
+]
+_QUERY_TEMPLATES = [
+    "{name}はどこで作られていますか？",
+    "{name}について教えて",
+    "{name}の分類は？",
+    "{place}の{name}とは",
+]
+_PARAPHRASE_TEMPLATES = [
+    "{reading}という{synonym}について知りたい",
+    "{reading}って何の製品？",
+    "{place}生まれの{synonym}の名前を教えて",
+]
+
+
+def _to_hiragana(text: str) -> str:
+    """カタカナをひらがなに変換する。"""
+    return "".join(chr(ord(c) - 0x60) if "ァ" <= c <= "ヶ" else c for c in text)
+
+
+def generate_eval_set(
+    documents: int, queries: int, seed: int, paraphrase_ratio: float = 0.5
+) -> Tuple[List[str], List[Tuple[str, str, str]]]:
+    """
+    ドキュメント（段落）と、（クエリ, 正解のドキュメントの製品名, クエリの種類）の組を生成する。
+    各ドキュメントは、製品名・地名・分類を述べる1文と、すべてのドキュメントで共通の定型文から成る。
+    ナレッジベースでは複数の段落が1つのチャンクにまとめられるため、正解は製品名の段落を含むチャンクとなる。
+    クエリの種類は、製品名をそのまま含む"exact"と、paraphrase_ratioの割合で生成する言い換えた"paraphrase"のいずれか。
+    """
+    rng = random.Random(seed)
+    names: List[str] = []
+    seen = set()
+    while len(names) < documents:
+        name = "".join(rng.choice(_KANA) for _ in range(rng.randint(3, 5)))
+        if name not in seen:
+            seen.add(name)
+            names.append(name)
+    texts: List[str] = []
+    places: List[str] = []
+    categories: List[str] = []
+    for name in names:
+        place = "".join(rng.choice(_PLACE_KANJI) for _ in range(2)) + rng.choice(_PLACE_SUFFIXES)
+        category = rng.choice(list(_CATEGORIES))
+        places.append(place)
+        categories.append(category)
+        filler = rng.sample(_FILLER, 5)
+        texts.append(f"{name}は{place}で開発された{category}である。" + "".join(filler))
+    pairs: List[Tuple[str, str, str]] = []
+    for _ in range(queries):
+        i = rng.randrange(documents)
+        if rng.random() < paraphrase_ratio:
+            query = rng.choice(_PARAPHRASE_TEMPLATES).format(
+                reading=_to_hiragana(names[i]), place=places[i], synonym=rng.choice(_CATEGORIES[categories[i]]),
+            )
+            pairs.append((query, names[i], "paraphrase"))
+        else:
+            pairs.append((rng.choice(_QUERY_TEMPLATES).format(name=names[i], place=places[i]), names[i], "exact"))
+    return texts, pairs
+
+
+def evaluate(retriever: Any, pairs: List[Tuple[str, str, str]], vector_weight: float, lexical_weight: float) -> Dict[str, float]:
+    """
+    各クエリを検索し、正解のチャンクが上位k件に含まれる割合（全体とクエリの種類ごと）・MRR・レイテンシの統計を返す。
+    クエリが1件もない種類の再現率はNaNとする。
+    """
+    hits = 0
+    hits_by_kind = {"exact": 0, "paraphrase": 0}
+    queries_by_kind = {"exact": 0, "paraphrase": 0}
+    reciprocal_ranks = 0.0
+    latencies: List[float] = []
+    for query, name, kind in pairs:
+        queries_by_kind[kind] += 1
+        start = time.perf_counter()
+        documents = retriever.invoke(query, vector_weight=vector_weight, lexical_weight=lexical_weight)
+        latencies.append((time.perf_counter() - start) * 1000)
+        for rank, document in enumerate(documents, start=1):
+            if any(paragraph.startswith(f"{name}は") for paragraph in document.page_content.split("\n\n")):
+                hits += 1
+                hits_by_kind[kind] += 1
+                reciprocal_ranks += 1.0 / rank
+                break
+    return {
+        "recall_at_k": hits / len(pairs),
+        "recall_exact": hits_by_kind["exact"] / queries_by_kind["exact"] if queries_by_kind["exact"] else float("nan"),
+        "recall_paraphrase": (
+            hits_by_kind["paraphrase"] / queries_by_kind["paraphrase"] if queries_by_kind["paraphrase"] else float("nan")
+        ),
+        "mrr": reciprocal_ranks / len(pairs),
+        "latency_mean_ms": sum(latencies) / len(latencies),
+        "latency_p50_ms": percentile(latencies, 0.5),
+        "latency_p95_ms": percentile(latencies, 0.95),
+    }
+
+
+def main() -> None:
+    from app.config import settings
+    from app.llm.fake import FakeOllamaEmbeddings
+    from app.rag.knowledge_base import KnowledgeBase
+    from app.rag.retriever import Retriever
+
+    retrieval_settings = settings.RETRIEVAL_SETTINGS
+    parser = argparse.ArgumentParser(description="ベクトル検索・語彙検索・RRFによる統合の再現率とレイテンシの比較")
+    parser.add_argument("--documents", type=int, default=1000, help="生成するドキュメント数")
+    parser.add_argument("--queries", type=int, default=200, help="生成するクエリ数")
+    parser.add_argument("--paraphrase-ratio", type=float, default=0.5, help="クエリのうち、言い換えたクエリの割合")
+    parser.add_argument("--k", type=int, default=retrieval_settings["k"], help="検索で返すドキュメント数")
+    parser.add_argument("--candidates", type=int, default=retrieval_settings["candidates"], help="RRFで統合する各検索の候補数")
+    parser.add_argument("--rrf-k", type=int, default=retrieval_settings["rrf_k"])
+    parser.add_argument(
+        "--weights", nargs="+", default=["1:0", "0:1", "1:1", "1:2", "2:1"],
+        help="比較する（ベクトル検索の重み:語彙検索の重み）。1:0はベクトル検索のみ",
+    )
+    parser.add_argument("--embedding-latency", type=float, default=0.0, help="オフライン用の埋め込みモデルの1件あたりの遅延（秒）")
+    parser.add_argument("--ollama-model", help="指定した場合、この名前のOllamaの埋め込みモデルを用いる")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="結果をJSONで保存するパス")
+    args = parser.parse_args()
+
+    if args.ollama_model:
+        from langchain_ollama import OllamaEmbeddings
+        embeddings: Any = OllamaEmbeddings(model=args.ollama_model)
+    else:
+        embeddings = FakeOllamaEmbeddings(latency_seconds=args.embedding_latency)
+
+    texts, pairs = generate_eval_set(args.documents, args.queries, args.seed, args.paraphrase_ratio)
+    source = os.path.join(tempfile.mkdtemp(prefix="luca3-retrieval-"), "documents.txt")
+    with open(source, "w", encoding="utf-8") as f:
+        f.write("\n\n".join(texts))
+
+    start = time.perf_counter()
+    kb = KnowledgeBase.create_and_load(source, embeddings=embeddings)
+    build_seconds = time.perf_counter() - start
+    retriever = Retriever(kb, k=args.k, candidates=args.candidates, rrf_k=args.rrf_k)
+    chunks = kb.vector_store.index.ntotal if kb.vector_store is not None else 0
+    paraphrases = sum(1 for _, _, kind in pairs if kind == "paraphrase")
+    print(
+        f"ドキュメント {args.documents}件（チャンク {chunks}件）, クエリ {len(pairs)}件（うち言い換え {paraphrases}件）, k={args.k}, "
+        f"構築 {build_seconds:.2f} s, 語彙検索インデックス {kb.lexical_index.get_stats() if kb.lexical_index else None}"
+    )
+    print()
+
+    results: List[Dict[str, Any]] = []
+    for weights in args.weights:
+        vector_weight, lexical_weight = (float(w) for w in weights.split(":"))
+        label = "vector" if lexical_weight == 0 else "lexical" if vector_weight == 0 else f"rrf {weights}"
+        results.append({"config": label, **evaluate(retriever, pairs, vector_weight, lexical_weight)})
+
+    headers = ["config", "recall_at_k", "recall_exact", "recall_paraphrase", "mrr", "latency_mean_ms", "latency_p50_ms", "latency_p95_ms"]
+    print(format_table(headers, [[r[h] for h in headers] for r in results]))
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+# /build_index.py
+# title: ナレッジベースのインデックス構築スクリプト
+# role: アプリケーションを起動せずに、ソースファイルからナレッジベースのインデックスを構築し、ドキュメントのディレクトリ以下のファイルを取り込んで保存する。
+#       保存したインデックスは、ソースファイルと埋め込みモデルが変わらない限り、起動時にそのまま読み込まれる。
+
+import argparse
+import json
+import logging
+import sys
+import os
+from dotenv import load_dotenv
+from typing import Sequence, cast
+
+# プロジェクトのルートパスをシステムパスに追加
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+load_dotenv()
+
+from app.containers import Container
+from app.config import settings
+from app.rag.ingestion import DocumentIngestor
+from app.rag.knowledge_base import KnowledgeBase
+from app.utils.ollama_utils import check_ollama_models_availability
+
+# ロギングの基本設定
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+logger = logging.getLogger(__name__)
+
+
+def main() -> None:
+    """
+    インデックス構築のエントリーポイント。保存済みのインデックスが再利用できる場合は、--forceを指定しない限り作り直さない。
+    ドキュメントの取り込みは、中断しても同じコマンドを再実行すると続きから再開する。
+    """
+    index_settings = settings.KNOWLEDGE_BASE_INDEX_SETTINGS
+    ingestion_settings = settings.INGESTION_SETTINGS
+    parser = argparse.ArgumentParser(description="ナレッジベースのインデックスを構築して保存します。")
+    parser.add_argument("--source", default=settings.KNOWLEDGE_BASE_SOURCE)
+    parser.add_argument("--index-dir", default=index_settings["index_dir"])
+    parser.add_argument("--force", action="store_true", help="保存済みのインデックスが再利用できる場合も作り直す")
+    parser.add_argument("--documents-dir", default=ingestion_settings["documents_dir"], help="このディレクトリ以下のファイルを取り込む")
+    parser.add_argument("--skip-documents", action="store_true", help="ドキュメントのディレクトリを取り込まない")
+    parser.add_argument("--batch-size", type=int, default=ingestion_settings["batch_size"])
+    parser.add_argument("--concurrency", type=int, default=ingestion_settings["max_concurrency"])
+    args = parser.parse_args()
+
+    if not check_ollama_models_availability([settings.EMBEDDING_MODEL_NAME]):
+        sys.exit(1)
+
+    container = Container()
+    kb = KnowledgeBase.create_and_load(
+        args.source,
+        embeddings=container.cached_embeddings(),
+        index_dir=args.index_dir,
+        checkpoint_every=cast(int, index_settings["checkpoint_every"]),
+        force_rebuild=args.force,
+        ann_settings=settings.KNOWLEDGE_BASE_ANN_SETTINGS,
+    )
+    if not args.skip_documents:
+        ingestor = DocumentIngestor(
+            kb,
+            extensions=cast(Sequence[str], ingestion_settings["extensions"]),
+            batch_size=args.batch_size,
+            max_concurrency=args.concurrency,
+            read_block_chars=cast(int, ingestion_settings["read_block_chars"]),
+            checkpoint_interval_seconds=cast(float, ingestion_settings["checkpoint_interval_seconds"]),
+            log_every_seconds=cast(float, ingestion_settings["log_every_seconds"]),
+        )
+        try:
+            report = ingestor.ingest(args.documents_dir)
+        except KeyboardInterrupt:
+            logger.info("取り込みを中断しました。同じコマンドを再実行すると続きから取り込みます。")
+            kb.flush()
+            sys.exit(130)
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+    # チャンク数が閾値を超えてインデックスの作り直しが始まった場合は、切り替えた後のインデックスを保存する
+    kb.wait_for_index_rebuild()
+    kb.flush()
+    with open(os.path.join(args.index_dir, "manifest.json"), "r", encoding="utf-8") as f:
+        print(json.dumps(json.load(f), ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
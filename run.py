@@ -6,7 +6,7 @@ import logging
 import sys
 import os
 from dotenv import load_dotenv
-from typing import List, Any
+from typing import List, Any, cast
 
 # プロジェクトのルートパスをシステムパスに追加
 sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
@@ -38,18 +38,50 @@ def main() -> None:
     
     # DIコンテナの初期化とワイヤリング
     container = Container()
+
+    # モデルの読み込みは、知識ベースやエージェントの初期化と並行して進める
+    model_warmer = container.model_warmer() if settings.MODEL_WARMUP_SETTINGS["enabled"] else None
+    if model_warmer is not None:
+        model_warmer.start()
+
     container.wire(modules=[__name__, "app.main"])
 
+    # LLM呼び出しの計測とトレースを有効化（アイドルマネージャーのスレッドにも引き継がれるよう、起動より前に行う）
+    container.llm_instrumentation.init()
+    container.tracing.init()
+
     # アイドルマネージャーの取得と起動
     idle_manager = container.idle_manager()
     idle_manager.start()
 
+    if model_warmer is not None and not model_warmer.wait(cast(float, settings.MODEL_WARMUP_SETTINGS["startup_wait_seconds"])):
+        logger.warning("モデルのウォームアップが完了していませんが、対話を開始します。")
+
     try:
         # メインループの実行
         main_loop()
     finally:
         # アプリケーション終了時にリソースを解放
         idle_manager.stop()
+        if settings.LLM_RESPONSE_CACHE_SETTINGS["enabled"]:
+            logger.info(f"LLM応答キャッシュ統計: {container.llm_profile_registry().get_cache_stats()}")
+        if model_warmer is not None:
+            logger.info(f"モデルのウォームアップ統計: {model_warmer.get_stats()}")
+        if settings.EMBEDDING_CACHE_SETTINGS["enabled"]:
+            logger.info(f"埋め込みキャッシュ統計: {container.embedding_cache().get_stats()}")
+        if settings.MODE_ROUTER_SETTINGS["enabled"]:
+            logger.info(f"モードルーター統計: {container.mode_router_stats().get_stats()}")
+        if settings.ORCHESTRATION_DECISION_CACHE_SETTINGS["enabled"]:
+            logger.info(f"モード選択キャッシュ統計: {container.orchestration_decision_cache().get_stats()}")
+        logger.info(f"LLMスケジューラ統計: {container.llm_scheduler().get_stats()}")
+        logger.info(f"初回トークン到達時間(TTFT)統計: {container.engine().streaming_stats.get_stats()}")
+        logger.info(f"パイプライン期限・ヘッジ実行統計: {container.engine().deadline_stats.get_stats()}")
+        logger.info(f"ステップグラフ統計: {container.step_graph_stats().get_stats()}")
+        if settings.REFLECTION_QUEUE_SETTINGS["enabled"]:
+            logger.info(f"応答後の内省キュー統計: {container.reflection_queue().get_stats()}")
+        if settings.MODE_COST_SETTINGS["enabled"]:
+            logger.info(f"モードのコストモデル統計: {container.mode_cost_model().get_stats()}")
+            container.mode_cost_model().flush()
         container.shutdown_resources()
         logger.info("--- AI協調応答システム終了 ---")
 
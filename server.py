@@ -0,0 +1,140 @@
+# /server.py
+# title: ローカルHTTPサーバー実行スクリプト
+# role: アプリケーションのDIコンテナを初期化し、複数のセッションと並行して対話するローカルHTTPサーバーを開始する。
+
+import argparse
+import asyncio
+import logging
+import sys
+import os
+from dotenv import load_dotenv
+from typing import Any, Dict, List, cast
+
+# プロジェクトのルートパスをシステムパスに追加
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+load_dotenv()
+
+from app.containers import Container
+from app.config import settings
+from app.agents.master_agent import MasterAgent
+from app.memory.working_memory import WorkingMemory
+from app.server import LocalHTTPServer, SessionManager
+from app.utils.ollama_utils import check_ollama_models_availability
+from app.utils.api_key_checker import check_search_api_key
+
+# ロギングの基本設定
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+logger = logging.getLogger(__name__)
+
+
+def collect_metrics(container: Container, sessions: SessionManager) -> Dict[str, Any]:
+    """/metricsで返す各種統計を集める。"""
+    engine = container.engine()
+    metrics: Dict[str, Any] = {
+        "sessions": sessions.get_stats(),
+        "llm_scheduler": container.llm_scheduler().get_stats(),
+        "ttft": engine.streaming_stats.get_stats(),
+        "deadlines": engine.deadline_stats.get_stats(),
+        "step_graphs": container.step_graph_stats().get_stats(),
+        "knowledge_base_index": container.knowledge_base().get_index_stats(),
+    }
+    if settings.TRACING_SETTINGS["enabled"]:
+        metrics["tracing"] = container.tracer().get_stats()
+    if settings.LLM_RESPONSE_CACHE_SETTINGS["enabled"]:
+        metrics["llm_response_cache"] = container.llm_profile_registry().get_cache_stats()
+    if settings.EMBEDDING_CACHE_SETTINGS["enabled"]:
+        metrics["embedding_cache"] = container.embedding_cache().get_stats()
+    if settings.MODE_ROUTER_SETTINGS["enabled"]:
+        metrics["mode_router"] = container.mode_router_stats().get_stats()
+    if settings.ORCHESTRATION_DECISION_CACHE_SETTINGS["enabled"]:
+        metrics["orchestration_decision_cache"] = container.orchestration_decision_cache().get_stats()
+    if settings.REFLECTION_QUEUE_SETTINGS["enabled"]:
+        metrics["reflection_queue"] = container.reflection_queue().get_stats()
+    if settings.MODE_COST_SETTINGS["enabled"]:
+        metrics["mode_cost_model"] = container.mode_cost_model().get_stats()
+    return metrics
+
+
+def main() -> None:
+    """
+    HTTPサーバーモードのエントリーポイント。
+    """
+    parser = argparse.ArgumentParser(description="Luca3をローカルHTTPサーバーとして起動します。")
+    parser.add_argument("--host", default=settings.SERVER_SETTINGS["host"])
+    parser.add_argument("--port", type=int, default=settings.SERVER_SETTINGS["port"])
+    args = parser.parse_args()
+
+    # 依存関係のチェック
+    required_models: List[str] = [
+        str(settings.GENERATION_LLM_SETTINGS["model"]),
+        settings.EMBEDDING_MODEL_NAME
+    ]
+    if not check_ollama_models_availability(required_models):
+        sys.exit(1)
+
+    check_search_api_key()
+
+    # DIコンテナの初期化
+    container = Container()
+
+    # モデルの読み込みは、知識ベースやエージェントの初期化と並行して進める
+    model_warmer = container.model_warmer() if settings.MODEL_WARMUP_SETTINGS["enabled"] else None
+    if model_warmer is not None:
+        model_warmer.start()
+
+    # LLM呼び出しの計測とトレースを有効化（アイドルマネージャーのスレッドにも引き継がれるよう、起動より前に行う）
+    container.llm_instrumentation.init()
+    container.tracing.init()
+
+    # アイドルマネージャーの取得と起動（処理中の要求がなくなるとアイドルとなる）
+    idle_manager = container.idle_manager()
+    idle_manager.start()
+    idle_manager.set_idle()
+
+    def create_master_agent() -> MasterAgent:
+        # セッションごとに専用のワーキングメモリを持たせる。知識ベースや知識グラフなどはコンテナのシングルトンを共有する
+        working_memory = WorkingMemory()
+        return container.master_agent(
+            working_memory=working_memory,
+            predictive_coding_engine=container.predictive_coding_engine(working_memory=working_memory),
+        )
+
+    server_settings = settings.SERVER_SETTINGS
+    sessions = SessionManager(
+        create_master_agent,
+        max_sessions=cast(int, server_settings["max_sessions"]),
+        idle_timeout_seconds=cast(float, server_settings["session_idle_timeout_seconds"]),
+        idle_manager=idle_manager,
+    )
+    server = LocalHTTPServer(
+        sessions,
+        metrics=lambda: collect_metrics(container, sessions),
+        prometheus_metrics=container.llm_call_recorder().render_prometheus,
+        traces=container.tracer().to_chrome_trace if settings.TRACING_SETTINGS["enabled"] else None,
+        host=args.host,
+        port=args.port,
+        max_body_bytes=cast(int, server_settings["max_body_bytes"]),
+        session_sweep_interval_seconds=cast(float, server_settings["session_sweep_interval_seconds"]),
+    )
+
+    if model_warmer is not None and not model_warmer.wait(cast(float, settings.MODEL_WARMUP_SETTINGS["startup_wait_seconds"])):
+        logger.warning("モデルのウォームアップが完了していませんが、要求の受け付けを開始します。")
+
+    try:
+        asyncio.run(server.serve_forever())
+    except KeyboardInterrupt:
+        logger.info("HTTPサーバーを停止します。")
+    finally:
+        # アプリケーション終了時に、残っているセッションのワーキングメモリを保存してリソースを解放
+        sessions.close_all()
+        idle_manager.stop()
+        logger.info(f"セッション統計: {sessions.get_stats()}")
+        logger.info(f"LLMスケジューラ統計: {container.llm_scheduler().get_stats()}")
+        if settings.MODE_COST_SETTINGS["enabled"]:
+            container.mode_cost_model().flush()
+        container.shutdown_resources()
+        logger.info("--- AI協調応答システム（HTTPサーバー）終了 ---")
+
+
+if __name__ == "__main__":
+    main()
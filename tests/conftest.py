@@ -0,0 +1,64 @@
+# /tests/conftest.py
+# title: テスト共通のフィクスチャ
+# role: Ollamaを起動せずに実行できるよう、オフライン用のLLM・埋め込みモデルを提供し、テストの書き込み先を一時ディレクトリに限定する。
+
+import os
+import sys
+
+import pytest
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from app.llm.fake import FakeOllamaEmbeddings, FakeOllamaLLM  # noqa: E402
+
+
+@pytest.fixture
+def fake_llm() -> FakeOllamaLLM:
+    """呼び出しが並行して重なるよう、最初のトークンまでに短い遅延を挟むオフライン用のLLM。"""
+    return FakeOllamaLLM(model="fake", first_token_latency_seconds=0.01)
+
+
+@pytest.fixture
+def fake_embeddings() -> FakeOllamaEmbeddings:
+    return FakeOllamaEmbeddings(dimensions=64)
+
+
+@pytest.fixture(autouse=True)
+def _isolated_cwd(tmp_path, monkeypatch):
+    """記憶や索引などの相対パスへの書き込みがリポジトリを汚さないよう、作業ディレクトリを一時ディレクトリへ移す。"""
+    monkeypatch.chdir(tmp_path)
+
+
+@pytest.fixture
+def offline_container(tmp_path):
+    """LLMと埋め込みモデルをオフライン用の実装に置き換えたContainerと、そのFakeOllamaLLM、FakeOllamaEmbeddingsを返す。"""
+    from benchmarks.common import create_offline_container
+
+    return create_offline_container(first_token_latency_seconds=0.005, scratch_dir=str(tmp_path))
+
+
+@pytest.fixture
+def master_agent_factory(offline_container):
+    """
+    server.pyと同様に、セッション専用のワーキングメモリと予測符号化エンジンを持つMasterAgentを作成する関数を返す。
+    テストの終了時には、作業ディレクトリを戻す前に予測符号化エンジンのスレッドの終了を待つ。
+    """
+    from app.memory.working_memory import WorkingMemory
+
+    container, _, _ = offline_container
+    created = []
+
+    def create():
+        working_memory = WorkingMemory()
+        agent = container.master_agent(
+            working_memory=working_memory,
+            predictive_coding_engine=container.predictive_coding_engine(working_memory=working_memory),
+        )
+        created.append(agent)
+        return agent
+
+    yield create
+    for agent in created:
+        agent.predictive_coding_engine.close(wait=True)
@@ -0,0 +1,75 @@
+# /tests/test_ann_index.py
+# title: 近似最近傍探索インデックスのテスト
+# role: 各種類のインデックスが追加の順序を保つこと、IVFのリスト数の調整、ナレッジベースのautoの設定による
+#       バックグラウンドでの作り直し（作り直しの間の追加を含む）と、作り直したインデックスの保存と読み込みを確認する。
+
+import numpy as np
+import pytest
+from langchain_core.documents import Document
+
+import app.rag.knowledge_base as knowledge_base_module
+from app.rag.ann_index import build_index, index_type_of, ivf_list_count, reconstruct_all
+from app.rag.knowledge_base import KnowledgeBase
+
+ANN_SETTINGS = {
+    "index_type": "auto", "auto_threshold": 30, "auto_index_type": "hnsw", "ivf_nlist": None,
+    "ivf_nprobe": 16, "hnsw_m": 16, "hnsw_ef_construction": 40, "hnsw_ef_search": 64,
+}
+
+
+@pytest.mark.parametrize("index_type", ["flat", "ivf", "hnsw"])
+def test_build_index_keeps_insertion_order(index_type):
+    vectors = np.random.default_rng(0).standard_normal((400, 16)).astype(np.float32)
+
+    index = build_index(vectors, index_type, ANN_SETTINGS)
+
+    assert index_type_of(index) == index_type
+    np.testing.assert_allclose(reconstruct_all(index), vectors, rtol=1e-6)
+    np.testing.assert_allclose(reconstruct_all(index, 390), vectors[390:], rtol=1e-6)
+    _, ids = index.search(vectors[:5], 1)
+    assert ids[:, 0].tolist() == [0, 1, 2, 3, 4]
+
+
+def test_ivf_list_count_is_limited_by_training_points():
+    assert ivf_list_count(100) == 2
+    assert ivf_list_count(1_000_000) == 4000
+    assert ivf_list_count(1_000_000, nlist=64) == 64
+    assert ivf_list_count(10) == 1
+
+
+def _open(tmp_path, embeddings, **kwargs):
+    source = tmp_path / "source.txt"
+    if not source.exists():
+        source.write_text("\n\n".join(f"段落{i}: " + "説明の文章です。" * 30 for i in range(20)), encoding="utf-8")
+    return KnowledgeBase.create_and_load(
+        str(source), embeddings=embeddings, index_dir=str(tmp_path / "index"), ann_settings=ANN_SETTINGS, **kwargs
+    )
+
+
+def test_auto_switches_index_in_background_and_keeps_concurrent_additions(tmp_path, fake_embeddings, monkeypatch):
+    kb = _open(tmp_path, fake_embeddings, checkpoint_every=1000)
+    assert kb.get_index_stats()["index_type"] == "flat"
+    original_build = knowledge_base_module.build_index
+
+    def build_while_adding(vectors, index_type, params):
+        # 作り直しの間（lockの外）に追加されたチャンクも、差し替えたインデックスに含まれる
+        kb.add_embedded_chunks(["作り直しの間の追加"], fake_embeddings.embed_documents(["作り直しの間の追加"]), [{}])
+        return original_build(vectors, index_type, params)
+
+    monkeypatch.setattr(knowledge_base_module, "build_index", build_while_adding)
+    while kb.vector_store.index.ntotal < ANN_SETTINGS["auto_threshold"]:
+        kb.add_documents([Document(page_content=f"追加 {kb.vector_store.index.ntotal}")])
+    assert kb.wait_for_index_rebuild(timeout=30)
+    monkeypatch.setattr(knowledge_base_module, "build_index", original_build)
+
+    stats = kb.get_index_stats()
+    assert stats["index_type"] == "hnsw" and stats["rebuilds"] == 1
+    store = kb.vector_store
+    assert store.index.ntotal == len(store.index_to_docstore_id)
+    last = store.docstore.search(store.index_to_docstore_id[store.index.ntotal - 1])
+    assert last.page_content == "作り直しの間の追加"
+    assert kb.search_by_vector(fake_embeddings.embed_query("作り直しの間の追加"), k=1)[0].page_content == "作り直しの間の追加"
+
+    reopened = _open(tmp_path, fake_embeddings)
+    assert reopened.get_index_stats()["index_type"] == "hnsw"
+    assert reopened.vector_store.index.ntotal == store.index.ntotal
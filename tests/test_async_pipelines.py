@@ -0,0 +1,155 @@
+# /tests/test_async_pipelines.py
+# title: 非同期実行経路のテスト
+# role: simple・fullパイプラインのarunによる回答生成、エンジンのarunでの失敗時のsimpleへのフォールバックと、
+#       同期ラッパー（run）をイベントループの外と実行中のイベントループの中から呼び出した場合の振る舞いを確認する。
+
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from langchain_core.documents import Document
+from langchain_core.language_models.fake import FakeListLLM
+from langchain_core.output_parsers import StrOutputParser
+
+from app.agents.master_agent import MasterAgent
+from app.engine import MetaIntelligenceEngine
+from app.pipelines.base import BasePipeline
+from app.pipelines.full_pipeline import FullPipeline
+from app.pipelines.simple_pipeline import SimplePipeline
+
+DECISION = {"chosen_mode": "simple", "reason": "テスト", "agent_configs": {}}
+
+
+class RecordingListLLM(FakeListLLM):
+    """受け取ったプロンプトを記録するFakeListLLM。"""
+    prompts: list = []
+
+    def _call(self, prompt, stop=None, run_manager=None, **kwargs):
+        self.prompts.append(prompt)
+        return super()._call(prompt, stop=stop, run_manager=run_manager, **kwargs)
+
+    async def _acall(self, prompt, stop=None, run_manager=None, **kwargs):
+        self.prompts.append(prompt)
+        return await super()._acall(prompt, stop=stop, run_manager=run_manager, **kwargs)
+
+
+class StubAgent:
+    """ainvokeで決まった結果を返し、入力を記録するエージェント。"""
+    def __init__(self, result):
+        self.result = result
+        self.inputs = []
+
+    async def ainvoke(self, input_data):
+        self.inputs.append(input_data)
+        return self.result
+
+
+class StubRetriever:
+    async def ainvoke(self, query):
+        return [Document(page_content=f"{query}に関する資料")]
+
+
+class StaticPipeline(BasePipeline):
+    """決まった回答を返すか、例外を送出するパイプライン。"""
+    def __init__(self, answer="", error=None):
+        self.answer = answer
+        self.error = error
+        self.modes = []
+
+    async def arun(self, query, orchestration_decision, dialogue_history=None):
+        self.modes.append(orchestration_decision["chosen_mode"])
+        if self.error is not None:
+            raise self.error
+        return {"final_answer": self.answer, "self_criticism": "", "potential_problems": "", "retrieved_info": ""}
+
+
+def _master_agent(llm):
+    """回答の生成のみに用いるMasterAgent。対話の処理に必要な構成要素は与えない。"""
+    return MasterAgent(
+        llm=llm,
+        output_parser=StrOutputParser(),
+        memory_consolidator=None,
+        ethical_motivation_engine=None,
+        predictive_coding_engine=None,
+        working_memory=None,
+        engine=None,
+        value_evaluator=None,
+        orchestration_agent=None,
+    )
+
+
+def test_simple_pipeline_answers_from_the_retrieved_information():
+    llm = RecordingListLLM(responses=["簡潔な回答です。"], prompts=[])
+    pipeline = SimplePipeline(_master_agent(llm), SimpleNamespace(retriever=StubRetriever()))
+
+    response = asyncio.run(pipeline.arun("猫とは", DECISION))
+
+    assert response["final_answer"] == "簡潔な回答です。"
+    assert response["retrieved_info"] == "猫とはに関する資料"
+    # 計画や認知ループの結果を含まない、関連情報のみのプロンプトで生成する
+    assert len(llm.prompts) == 1
+    assert "猫とはに関する資料" in llm.prompts[0] and "関連情報" in llm.prompts[0]
+
+
+def test_full_pipeline_answers_from_the_plan_and_cognitive_loop_output():
+    llm = RecordingListLLM(responses=["計画に基づく回答です。"], prompts=[])
+    planning_agent = StubAgent("1. 定義を調べる")
+    cognitive_loop_agent = StubAgent("猫は哺乳類である。")
+
+    async def critique(**kwargs):
+        return "問題なし"
+
+    logged = []
+    traces = []
+    pipeline = FullPipeline(
+        master_agent=_master_agent(llm),
+        planning_agent=planning_agent,
+        cognitive_loop_agent=cognitive_loop_agent,
+        meta_cognitive_engine=SimpleNamespace(acritique_process_and_response=critique),
+        problem_discovery_agent=StubAgent([]),
+        memory_consolidator=SimpleNamespace(log_event=lambda **kwargs: logged.append(kwargs)),
+        self_improvement_agent=StubAgent([]),
+        self_correction_agent=None,
+        self_evolving_system=SimpleNamespace(collect_execution_trace=traces.append),
+    )
+
+    response = asyncio.run(pipeline.arun("猫とは", {**DECISION, "chosen_mode": "full"}))
+
+    assert response["final_answer"] == "計画に基づく回答です。"
+    assert response["retrieved_info"] == "猫は哺乳類である。"
+    assert cognitive_loop_agent.inputs == [{"query": "猫とは", "plan": "1. 定義を調べる", "dialogue_history": []}]
+    assert "1. 定義を調べる" in llm.prompts[0] and "猫は哺乳類である。" in llm.prompts[0]
+    assert logged[0]["metadata"]["final_answer"] == "計画に基づく回答です。"
+    assert traces[0]["self_criticism"] == "問題なし"
+
+
+def test_engine_falls_back_to_simple_when_the_pipeline_fails():
+    simple = StaticPipeline("simpleの回答")
+    failing = StaticPipeline(error=ValueError("失敗"))
+    engine = MetaIntelligenceEngine({"simple": simple, "full": failing})
+
+    response = asyncio.run(engine.arun("猫とは", {**DECISION, "chosen_mode": "full"}))
+
+    assert response["final_answer"] == "simpleの回答"
+    assert failing.modes == ["full"] and simple.modes == ["simple"]
+
+
+def test_sync_run_wraps_arun_outside_an_event_loop():
+    assert StaticPipeline("回答").run("猫とは", DECISION)["final_answer"] == "回答"
+
+
+@pytest.mark.filterwarnings("ignore:coroutine .* was never awaited:RuntimeWarning")
+def test_sync_run_inside_a_running_loop_must_be_moved_to_a_thread():
+    pipeline = StaticPipeline("回答")
+
+    async def main():
+        # 同期ラッパーは新しいイベントループで実行するため、実行中のイベントループからは呼び出せない
+        with pytest.raises(RuntimeError):
+            pipeline.run("猫とは", DECISION)
+        # ループの中からは、arunを待つか、別スレッドで同期ラッパーを呼び出す
+        awaited = await pipeline.arun("猫とは", DECISION)
+        threaded = await asyncio.to_thread(pipeline.run, "猫とは", DECISION)
+        return awaited, threaded
+
+    awaited, threaded = asyncio.run(main())
+    assert awaited["final_answer"] == threaded["final_answer"] == "回答"
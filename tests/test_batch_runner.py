@@ -0,0 +1,52 @@
+# /tests/test_batch_runner.py
+# title: バッチ処理ランナーのテスト
+# role: 複数のワーカーが同じエンジンで並行して処理しても各項目の結果が混ざらないこと、中断後の再実行で処理済みの項目を読み飛ばすことを確認する。
+
+import asyncio
+import json
+
+from app.batch_runner import BatchRunner
+
+TOPICS = ["火星移住の是非", "深海探査の予算", "都市農業の普及", "再生可能エネルギーの課題"]
+
+
+def _write_items(path, mode="internal_dialogue"):
+    with open(path, "w", encoding="utf-8") as f:
+        for i, topic in enumerate(TOPICS):
+            f.write(json.dumps({"id": f"q{i}", "query": topic, "mode": mode}, ensure_ascii=False) + "\n")
+
+
+def _read_results(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return {record["id"]: record for record in map(json.loads, f)}
+
+
+def test_concurrent_internal_dialogue_items_stay_separate(offline_container, tmp_path):
+    container, _, _ = offline_container
+    input_path, output_path = tmp_path / "items.jsonl", tmp_path / "results.jsonl"
+    _write_items(input_path)
+    runner = BatchRunner(container.engine(), container.orchestration_agent(), concurrency=len(TOPICS))
+
+    report = asyncio.run(runner.arun(str(input_path), str(output_path)))
+
+    assert report["succeeded"] == len(TOPICS) and report["failed"] == 0
+    results = _read_results(output_path)
+    for i, topic in enumerate(TOPICS):
+        response = results[f"q{i}"]["response"]
+        others = [other for other in TOPICS if other != topic]
+        for field in ("final_answer", "retrieved_info"):
+            assert topic in response[field]
+            assert not any(other in response[field] for other in others)
+
+
+def test_rerun_skips_completed_items(offline_container, tmp_path):
+    container, _, _ = offline_container
+    input_path, output_path = tmp_path / "items.jsonl", tmp_path / "results.jsonl"
+    _write_items(input_path, mode="simple")
+    runner = BatchRunner(container.engine(), container.orchestration_agent(), concurrency=2)
+
+    first = asyncio.run(runner.arun(str(input_path), str(output_path)))
+    second = asyncio.run(runner.arun(str(input_path), str(output_path)))
+
+    assert first["succeeded"] == len(TOPICS)
+    assert second["processed"] == 0 and second["skipped"] == len(TOPICS)
@@ -0,0 +1,85 @@
+# /tests/test_context_assembler.py
+# title: トークン予算付きコンテキスト組み立てのテスト
+# role: トークン数の概算と切り詰め、区画ごとの予算の配分と余りの再配分、重要度順の切り詰め（新しい対話、関連の強いエッジ）と、
+#       その報告を確認する。
+
+from app.knowledge_graph.models import Edge, KnowledgeGraph, Node
+from app.memory.context_assembler import ContextAssembler, ContextSection, estimate_tokens, truncate_to_tokens
+
+
+def test_token_estimate_and_truncation():
+    # 非ASCII文字は1文字1トークン、ASCII文字は4文字で1トークン
+    assert estimate_tokens("日本語") == 3
+    assert estimate_tokens("abcd") == 1 and estimate_tokens("abcde") == 2
+    assert truncate_to_tokens("あいうえお", 3) == "あいう"
+    assert truncate_to_tokens("あいう", 10) == "あいう"
+
+
+def test_unused_share_is_redistributed_and_long_units_are_cut():
+    assembler = ContextAssembler(100, {"plan": 1.0, "final_retrieved_info": 1.0}, min_partial_tokens=8)
+    result = assembler.assemble([
+        ContextSection.from_text("plan", "計画" * 5),
+        ContextSection("final_retrieved_info", ["資料" * 30, "参考" * 30], separator="\n\n"),
+    ])
+
+    report = result["report"]
+    # planが必要としない分は、検索結果の区画に回る
+    assert report["plan"]["budget_tokens"] == 10 and report["plan"]["dropped_tokens"] == 0
+    assert report["final_retrieved_info"]["budget_tokens"] == 90
+    assert report["final_retrieved_info"]["used_tokens"] <= 90
+    assert report["final_retrieved_info"]["dropped_tokens"] == 121 - report["final_retrieved_info"]["used_tokens"]
+    # 上位のチャンクはそのまま残り、予算の境界にかかったチャンクは途中で切られる
+    first, second = result["sections"]["final_retrieved_info"].split("\n\n")
+    assert first == "資料" * 30
+    assert second.startswith("参考") and second.endswith("…")
+    assert report["final_retrieved_info"]["dropped_units"] == 1
+
+
+def test_dialogue_history_keeps_the_newest_turns_in_order():
+    history = ["User: 一つ目の質問", "AI: 一つ目の回答", "User: 二つ目の質問", "AI: 二つ目の回答"]
+    section = ContextSection.from_dialogue_history("dialogue_history", history)
+    result = ContextAssembler(20, {}, min_partial_tokens=100).assemble([section])
+
+    assert result["sections"]["dialogue_history"] == "User: 二つ目の質問\nAI: 二つ目の回答"
+    report = result["report"]["dialogue_history"]
+    assert (report["total_units"], report["dropped_units"]) == (4, 2)
+    assert report["used_tokens"] <= report["budget_tokens"] == 20
+
+    everything = ContextAssembler(1000, {}).assemble([section])
+    assert everything["sections"]["dialogue_history"] == "\n".join(history)
+    assert everything["report"]["dialogue_history"]["dropped_tokens"] == 0
+
+
+def _graph():
+    nodes = [Node(id=i, label="概念") for i in ("三毛猫", "哺乳類", "動物", "生物", "天気")]
+    edges = [
+        Edge(source="三毛猫", target="哺乳類", label="分類", weight=0.9),
+        Edge(source="哺乳類", target="動物", label="分類", weight=0.8),
+        Edge(source="動物", target="生物", label="分類", weight=1.0),
+        Edge(source="天気", target="生物", label="関連", weight=0.1),
+    ]
+    return KnowledgeGraph(nodes=nodes, edges=edges)
+
+
+def test_relevant_subgraph_is_limited_to_hops_and_ordered_by_relevance():
+    graph = _graph()
+    assert graph.find_mentioned_nodes("三毛猫は哺乳類ですか") == ["三毛猫", "哺乳類"]
+
+    subgraph = graph.relevant_subgraph(["三毛猫"], max_hops=2)
+    assert [n.id for n in subgraph.nodes] == ["三毛猫", "哺乳類", "動物"]
+    # 重み / (1 + シードに近い側の端点の距離) の大きい順
+    assert [(e.source, e.target) for e in subgraph.edges] == [("三毛猫", "哺乳類"), ("哺乳類", "動物")]
+
+
+def test_knowledge_graph_section_keeps_whole_edges_with_their_nodes():
+    subgraph = _graph().relevant_subgraph(["三毛猫"], max_hops=2)
+    section = ContextSection.from_knowledge_graph("long_term_memory_context", subgraph)
+    # 最も関連の強いエッジとその端点のみが収まる予算
+    kept_lines = section.units[:3]
+    budget = sum(estimate_tokens(line) for line in kept_lines) + 2 + 1
+    result = ContextAssembler(budget, {}, min_partial_tokens=1).assemble([section])
+
+    text = result["sections"]["long_term_memory_context"]
+    assert text == KnowledgeGraph.format_lines(kept_lines[:2], kept_lines[2:])
+    assert "動物" not in text and "…" not in text
+    assert result["report"]["long_term_memory_context"]["dropped_units"] == len(section.units) - 3
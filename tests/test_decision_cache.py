@@ -0,0 +1,55 @@
+# /tests/test_decision_cache.py
+# title: モード選択の意味的キャッシュのテスト
+# role: 類似度の閾値による再利用、最後に使われた時刻による削除と空いた行の再利用、再起動後の読み込み、埋め込みモデルが変わった場合の破棄を確認する。
+
+import numpy as np
+
+from app.llm.fake import FakeOllamaEmbeddings
+from app.reasoning.decision_cache import SemanticDecisionCache
+
+
+def _unit(*values):
+    vector = np.asarray(values, dtype=np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+def test_lookup_reuses_decisions_above_the_threshold(fake_embeddings):
+    cache = SemanticDecisionCache(fake_embeddings, path=None, similarity_threshold=0.9)
+    cache.put("こんにちは", _unit(1, 0, 0), {"chosen_mode": "simple"})
+
+    decision, similarity, query = cache.lookup(_unit(1, 0.1, 0))
+    decision["chosen_mode"] = "full"
+
+    assert query == "こんにちは" and similarity > 0.9
+    # 返した決定を書き換えても、キャッシュの決定は変わらない
+    assert cache.lookup(_unit(1, 0, 0))[0] == {"chosen_mode": "simple"}
+    assert cache.lookup(_unit(0, 1, 0)) is None
+    assert cache.get_stats()["hits"] == 2 and cache.get_stats()["misses"] == 1
+
+
+def test_least_recently_used_decision_is_evicted(fake_embeddings):
+    cache = SemanticDecisionCache(fake_embeddings, path=None, max_entries=2, similarity_threshold=0.99)
+    cache.put("a", _unit(1, 0, 0), {"chosen_mode": "simple"})
+    cache.put("b", _unit(0, 1, 0), {"chosen_mode": "full"})
+    assert cache.lookup(_unit(1, 0, 0)) is not None
+    cache.put("c", _unit(0, 0, 1), {"chosen_mode": "parallel"})
+
+    assert cache.lookup(_unit(0, 1, 0)) is None
+    # 削除した決定の行は新しい決定のベクトルで上書きされている
+    assert cache.lookup(_unit(0, 0, 1))[2] == "c"
+    assert cache.lookup(_unit(1, 0, 0))[2] == "a"
+
+
+def test_cache_is_reloaded_only_for_the_same_embedding_model(tmp_path, fake_embeddings):
+    path = str(tmp_path / "decision_cache.npz")
+    cache = SemanticDecisionCache(fake_embeddings, path=path, max_entries=2, similarity_threshold=0.99)
+    for i, vector in enumerate((_unit(1, 0, 0), _unit(0, 1, 0), _unit(0, 0, 1))):
+        cache.put(f"q{i}", vector, {"chosen_mode": f"mode{i}"})
+
+    reloaded = SemanticDecisionCache(fake_embeddings, path=path, max_entries=2, similarity_threshold=0.99)
+    assert reloaded.get_stats()["entries"] == 2
+    assert reloaded.lookup(_unit(0, 0, 1))[0] == {"chosen_mode": "mode2"}
+    assert reloaded.lookup(_unit(1, 0, 0)) is None
+
+    other_model = FakeOllamaEmbeddings(model="other-embedding-model", dimensions=64)
+    assert SemanticDecisionCache(other_model, path=path).get_stats()["entries"] == 0
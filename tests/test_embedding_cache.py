@@ -0,0 +1,60 @@
+# /tests/test_embedding_cache.py
+# title: 埋め込みキャッシュのテスト
+# role: キャッシュにないテキストのみを（重複を除いて）埋め込むこと、初回とキャッシュからの値が一致すること、
+#       再起動後の再利用、埋め込みモデルごとのキーの分離、件数の上限による削除を確認する。
+
+import asyncio
+import time
+
+from app.rag.embedding_cache import CachedEmbeddings, EmbeddingCacheStore
+
+
+def test_only_missing_texts_are_embedded_once(tmp_path, fake_embeddings):
+    store = EmbeddingCacheStore(str(tmp_path / "cache.sqlite3"), max_entries=100)
+    cached = CachedEmbeddings(fake_embeddings, store, model="fake-embedding")
+
+    first = cached.embed_documents(["りんご", "みかん", "りんご"])
+    assert fake_embeddings.texts == 2
+    second = cached.embed_documents(["みかん", "ぶどう"])
+    query = cached.embed_query("りんご")
+
+    assert fake_embeddings.texts == 3
+    assert first[0] == first[2] == query
+    assert second[0] == first[1]
+    stats = cached.get_stats()
+    assert (stats["hits"], stats["misses"], stats["entries"]) == (2.0, 4.0, 3.0)
+
+
+def test_async_embeddings_share_the_cache_across_restarts(tmp_path, fake_embeddings):
+    path = str(tmp_path / "cache.sqlite3")
+    cached = CachedEmbeddings(fake_embeddings, EmbeddingCacheStore(path, max_entries=100), model="fake-embedding")
+
+    async def embed_concurrently():
+        return await asyncio.gather(cached.aembed_documents(["文書A", "文書B"]), cached.aembed_query("文書C"))
+
+    documents, query = asyncio.run(embed_concurrently())
+    cached.store.close()
+
+    reopened = CachedEmbeddings(fake_embeddings, EmbeddingCacheStore(path, max_entries=100), model="fake-embedding")
+    before = fake_embeddings.texts
+    assert reopened.embed_documents(["文書A", "文書B", "文書C"]) == documents + [query]
+    assert fake_embeddings.texts == before
+
+    other_model = CachedEmbeddings(fake_embeddings, reopened.store, model="other-embedding-model")
+    other_model.embed_query("文書A")
+    assert fake_embeddings.texts == before + 1
+
+
+def test_least_recently_used_vectors_are_evicted(tmp_path, fake_embeddings):
+    store = EmbeddingCacheStore(str(tmp_path / "cache.sqlite3"), max_entries=2)
+    cached = CachedEmbeddings(fake_embeddings, store, model="fake-embedding")
+    for text in ("a", "b", "a", "c"):
+        cached.embed_documents([text])
+        time.sleep(0.01)
+
+    before = fake_embeddings.texts
+    cached.embed_documents(["a", "c"])
+    assert fake_embeddings.texts == before
+    cached.embed_documents(["b"])
+    assert fake_embeddings.texts == before + 1
+    assert cached.get_stats()["evicted"] >= 1
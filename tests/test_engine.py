@@ -0,0 +1,132 @@
+# /tests/test_engine.py
+# title: メタインテリジェンスエンジンのテスト
+# role: モードごとの期限とヘッジ実行（期限内に終わった場合・ヘッジした場合・どちらも期限を過ぎた場合）、
+#       遅延予算によるモードの切り下げが、arunとastreamのいずれでも1回だけ適用されること、
+#       ヘッジ実行でキャンセルされたパイプラインの処理時間がコストモデルに記録されないこと、
+#       対話履歴がメインとヘッジのパイプラインの双方に渡されることを確認する。
+
+import asyncio
+
+from app.engine import MetaIntelligenceEngine
+from app.pipelines.base import BasePipeline
+from app.reasoning.mode_cost_model import ModeCostModel
+
+
+class RecordingPipeline(BasePipeline):
+    """受け取った決定と対話履歴を記録し、モード名を含む回答を返すパイプライン。"""
+    def __init__(self, name: str, delay_seconds: float = 0.0):
+        self.name = name
+        self.delay_seconds = delay_seconds
+        self.decisions: list = []
+        self.histories: list = []
+
+    async def arun(self, query, orchestration_decision, dialogue_history=None):
+        self.decisions.append(orchestration_decision)
+        self.histories.append(dialogue_history)
+        await asyncio.sleep(self.delay_seconds)
+        return {"final_answer": f"{self.name}: {query}", "self_criticism": "", "potential_problems": "", "retrieved_info": ""}
+
+
+_DECISION = {"chosen_mode": "full", "reason": "テスト", "agent_configs": {}}
+
+
+def test_primary_finishing_before_hedge_after_is_not_hedged():
+    pipelines = {"full": RecordingPipeline("full", delay_seconds=0.01), "simple": RecordingPipeline("simple")}
+    engine = MetaIntelligenceEngine(pipelines, deadlines={"full": {"hedge_after_seconds": 1.0, "deadline_seconds": 5}})
+
+    response = asyncio.run(engine.arun("質問", _DECISION))
+
+    assert response["final_answer"] == "full: 質問"
+    assert not pipelines["simple"].decisions
+    assert engine.deadline_stats.get_stats()["full"] == {"runs": 1, "hedged": 0, "primary_won": 0, "hedge_won": 0, "deadline_exceeded": 0}
+
+
+def test_hedged_run_past_the_deadline_cancels_both_pipelines():
+    pipelines = {"full": RecordingPipeline("full", delay_seconds=5.0), "simple": RecordingPipeline("simple", delay_seconds=5.0)}
+    engine = MetaIntelligenceEngine(pipelines, deadlines={"full": {"hedge_after_seconds": 0.02, "deadline_seconds": 0.1}})
+
+    async def run():
+        response = await engine.arun("質問", _DECISION)
+        others = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+        return response, others
+
+    response, others = asyncio.run(run())
+
+    assert "時間内に要求を処理できませんでした" in response["final_answer"]
+    assert "deadline: 0.1 s" in response["self_criticism"]
+    assert engine.deadline_stats.get_stats()["full"]["deadline_exceeded"] == 1
+    assert all(task.done() or task.cancelling() for task in others)
+
+
+def test_unhedged_deadline_falls_back_to_simple():
+    pipelines = {"full": RecordingPipeline("full", delay_seconds=5.0), "simple": RecordingPipeline("simple")}
+    engine = MetaIntelligenceEngine(pipelines, deadlines={"full": {"hedge_after_seconds": None, "deadline_seconds": 0.05}})
+
+    response = asyncio.run(engine.arun("質問", _DECISION))
+
+    assert response["final_answer"] == "simple: 質問"
+    assert engine.deadline_stats.get_stats()["full"]["deadline_exceeded"] == 1
+
+
+def _engine_with_slow_modes():
+    """どのモードも遅延予算（5 ms）に収まらず、simpleモードへ切り下げられるエンジン。"""
+    cost_model = ModeCostModel(quality_order=["full", "simple"], min_samples=1)
+    # 複雑性の分析器を指定しないため、複雑性レベルは"unknown"として記録・見積もられる
+    cost_model.record("full", "unknown", 2.0, 10)
+    cost_model.record("simple", "unknown", 0.01, 1)
+    pipelines = {"full": RecordingPipeline("full"), "simple": RecordingPipeline("simple")}
+    return MetaIntelligenceEngine(pipelines, cost_model=cost_model), pipelines
+
+
+def test_arun_applies_latency_budget_once():
+    engine, pipelines = _engine_with_slow_modes()
+    decision = {"chosen_mode": "full", "reason": "テスト", "agent_configs": {}}
+
+    response = asyncio.run(engine.arun("質問", decision, latency_budget_ms=5))
+
+    assert response["final_answer"] == "simple: 質問"
+    assert engine.cost_model.get_stats()["downgrades"] == 1
+    assert pipelines["simple"].decisions[0]["chosen_mode"] == "simple"
+
+
+def test_astream_applies_latency_budget_once():
+    engine, pipelines = _engine_with_slow_modes()
+    decision = {"chosen_mode": "full", "reason": "テスト", "agent_configs": {}}
+
+    async def collect():
+        return [event async for event in engine.astream("質問", decision, latency_budget_ms=5)]
+
+    events = asyncio.run(collect())
+
+    assert events[-1]["response"]["final_answer"] == "simple: 質問"
+    assert engine.cost_model.get_stats()["downgrades"] == 1
+    assert not pipelines["full"].decisions
+    # ストリーミングの統計は、切り下げ後のモードで記録される
+    assert set(engine.streaming_stats.get_stats()) == {"simple"}
+
+
+def test_cancelled_hedge_loser_is_not_recorded():
+    cost_model = ModeCostModel(quality_order=["full", "simple"], min_samples=1)
+    pipelines = {"full": RecordingPipeline("full", delay_seconds=5.0), "simple": RecordingPipeline("simple")}
+    engine = MetaIntelligenceEngine(
+        pipelines, deadlines={"full": {"hedge_after_seconds": 0.05, "deadline_seconds": 10}}, cost_model=cost_model,
+    )
+    decision = {"chosen_mode": "full", "reason": "テスト", "agent_configs": {}}
+
+    response = asyncio.run(engine.arun("質問", decision))
+
+    assert response["final_answer"] == "simple: 質問"
+    assert engine.deadline_stats.get_stats()["full"]["hedge_won"] == 1
+    assert cost_model.estimate("full", "unknown") is None
+    assert cost_model.estimate("simple", "unknown")["samples"] == 1
+
+
+def test_dialogue_history_is_passed_to_the_primary_and_hedge_pipelines():
+    pipelines = {"full": RecordingPipeline("full", delay_seconds=5.0), "simple": RecordingPipeline("simple")}
+    engine = MetaIntelligenceEngine(pipelines, deadlines={"full": {"hedge_after_seconds": 0.02, "deadline_seconds": 10}})
+    history = ["User: 前の質問", "AI: 前の回答"]
+
+    response = asyncio.run(engine.arun("質問", _DECISION, dialogue_history=history))
+
+    assert response["final_answer"] == "simple: 質問"
+    assert pipelines["full"].histories == pipelines["simple"].histories == [history]
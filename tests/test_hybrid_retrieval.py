@@ -0,0 +1,99 @@
+# /tests/test_hybrid_retrieval.py
+# title: ハイブリッド検索のテスト
+# role: 語の分割とBM25の順位付け、重み付きのReciprocal Rank Fusionによる統合、
+#       レトリーバーの重みの優先順位（引数、retrieval_weights、既定）と、実行中に追加したチャンクが語彙検索に反映されること、
+#       ベンチマークの言い換えたクエリが製品名をそのまま含まないことを確認する。
+
+import asyncio
+
+import pytest
+from langchain_core.documents import Document
+
+from app.rag.knowledge_base import KnowledgeBase
+from benchmarks.retrieval_benchmark import generate_eval_set
+from app.rag.lexical_index import BM25Index, tokenize
+from app.rag.retriever import Retriever, reciprocal_rank_fusion, retrieval_weights
+
+
+def test_tokenize_uses_words_for_ascii_and_bigrams_otherwise():
+    assert tokenize("ＧＰＵ搭載のNovaX-2") == ["gpu", "搭載", "載の", "novax", "2"]
+    assert tokenize("京") == ["京"]
+
+
+def test_bm25_ranks_rare_terms_and_ignores_duplicate_ids():
+    index = BM25Index()
+    index.add_many([
+        ("a", "北山市で開発された調理家電です。"),
+        ("b", "南川町で開発された農業機械です。"),
+        ("c", "南川町の観光施設です。南川町は海沿いです。"),
+    ])
+    index.add_many([("a", "重複したIDは無視される")])
+
+    ranked = [doc_id for doc_id, _ in index.search("南川町の農業機械", k=3)]
+
+    # 「南川町」はbとcに、「農業機械」はbにのみ含まれる。aはどの語も含まない
+    assert ranked == ["b", "c"]
+    assert index.search("存在しない語句", k=3) == []
+    assert index.get_stats()["documents"] == 3
+
+
+def _docs(*names):
+    return [Document(page_content=name, id=name) for name in names]
+
+
+def test_reciprocal_rank_fusion_weights_and_deduplicates():
+    vector = _docs("x", "y", "z")
+    lexical = _docs("z", "y", "w")
+
+    # z: 1/63 + 1/61 > y: 1/62 + 1/62
+    fused = reciprocal_rank_fusion([(vector, 1.0), (lexical, 1.0)], k=3, rrf_k=60)
+    assert [d.id for d in fused] == ["z", "y", "x"]
+
+    # y: 3/62 + 1/62 > z: 3/63 + 1/61
+    vector_heavy = reciprocal_rank_fusion([(vector, 3.0), (lexical, 1.0)], k=2, rrf_k=60)
+    assert [d.id for d in vector_heavy] == ["y", "z"]
+
+    vector_only = reciprocal_rank_fusion([(vector, 1.0), (lexical, 0.0)], k=10, rrf_k=60)
+    assert [d.id for d in vector_only] == ["x", "y", "z"]
+
+
+@pytest.fixture
+def retriever(tmp_path, fake_embeddings):
+    paragraphs = [f"製品{i}は一般的な説明の文章です。品質は検査されています。" for i in range(20)]
+    source = tmp_path / "source.txt"
+    source.write_text("\n\n".join(paragraphs), encoding="utf-8")
+    kb = KnowledgeBase.create_and_load(str(source), embeddings=fake_embeddings)
+    return Retriever(kb, k=2, candidates=10)
+
+
+def test_runtime_additions_are_searchable_lexically(retriever):
+    retriever.knowledge_base.add_documents([Document(page_content="ミナカタ精機は北浜市の産業用ロボットです。")])
+
+    results = retriever.invoke("ミナカタ精機", vector_weight=0, lexical_weight=1)
+
+    assert results[0].page_content.startswith("ミナカタ精機")
+
+
+def test_weights_from_arguments_override_the_request_weights(retriever, monkeypatch):
+    calls = []
+    original = retriever.knowledge_base.search_lexical
+    monkeypatch.setattr(retriever.knowledge_base, "search_lexical", lambda query, k: calls.append(query) or original(query, k))
+
+    with retrieval_weights(1.0, 0.0):
+        retriever.invoke("製品3")
+        asyncio.run(retriever.ainvoke("製品3"))
+        assert calls == []
+        retriever.invoke("製品3", lexical_weight=1.0)
+    assert calls == ["製品3"]
+
+    # 既定の重みではベクトル検索と語彙検索を統合し、同期版と非同期版は同じ結果を返す
+    assert [d.page_content for d in retriever.invoke("製品3")] == [d.page_content for d in asyncio.run(retriever.ainvoke("製品3"))]
+
+
+def test_benchmark_paraphrased_queries_do_not_repeat_the_product_name():
+    texts, pairs = generate_eval_set(documents=50, queries=40, seed=0, paraphrase_ratio=1.0)
+
+    assert len(texts) == 50 and {kind for _, _, kind in pairs} == {"paraphrase"}
+    assert all(name not in query for query, name, _ in pairs)
+    _, exact = generate_eval_set(documents=50, queries=40, seed=0, paraphrase_ratio=0.0)
+    assert all(kind == "exact" and name in query for query, name, kind in exact)
@@ -0,0 +1,73 @@
+# /tests/test_ingestion.py
+# title: ドキュメントの一括取り込みのテスト
+# role: 取り込み済みのファイルの読み飛ばしと、途中で失敗した取り込みを再実行した際に、チャンクが重複せずに続きから取り込まれることを確認する。
+
+import collections
+import json
+
+from app.rag.ingestion import DocumentIngestor
+from app.rag.knowledge_base import KnowledgeBase
+
+
+def _make_documents(tmp_path):
+    documents = tmp_path / "documents"
+    documents.mkdir()
+    for name in ("a", "b"):
+        paragraphs = [f"{name}の段落{i}: " + "取り込みの確認に用いる文章です。" * 8 for i in range(12)]
+        (documents / f"{name}.txt").write_text("\n\n".join(paragraphs), encoding="utf-8")
+    return str(documents)
+
+
+def _open(tmp_path, embeddings):
+    source = tmp_path / "source.txt"
+    if not source.exists():
+        source.write_text("ソースの内容です。", encoding="utf-8")
+    return KnowledgeBase.create_and_load(str(source), embeddings=embeddings, index_dir=str(tmp_path / "index"))
+
+
+def _chunk_ids(kb):
+    store = kb.vector_store
+    metadatas = [store.docstore.search(store.index_to_docstore_id[i]).metadata for i in range(store.index.ntotal)]
+    return [(m["source"], m["chunk"]) for m in metadatas if "chunk" in m]
+
+
+def test_rerun_skips_ingested_files(tmp_path, fake_embeddings):
+    documents = _make_documents(tmp_path)
+    kb = _open(tmp_path, fake_embeddings)
+    first = DocumentIngestor(kb, batch_size=2, max_concurrency=2).ingest(documents)
+    assert first["files_ingested"] == 2 and first["chunks_added"] > 0
+
+    second = DocumentIngestor(_open(tmp_path, fake_embeddings), batch_size=2).ingest(documents)
+
+    assert second["files_skipped"] == 2
+    assert second["chunks_added"] == 0
+
+
+def test_resume_after_failure_does_not_duplicate_chunks(tmp_path, fake_embeddings, monkeypatch):
+    documents = _make_documents(tmp_path)
+    kb = _open(tmp_path, fake_embeddings)
+    original = type(fake_embeddings).aembed_documents
+    calls = 0
+
+    async def flaky(self, texts):
+        nonlocal calls
+        calls += 1
+        if calls == 3:
+            raise RuntimeError("embedding failed")
+        return await original(self, texts)
+
+    monkeypatch.setattr(type(fake_embeddings), "aembed_documents", flaky)
+    failed = DocumentIngestor(kb, batch_size=2, max_concurrency=1).ingest(documents)
+    assert failed["files_failed"] == 1
+    monkeypatch.setattr(type(fake_embeddings), "aembed_documents", original)
+
+    reopened = _open(tmp_path, fake_embeddings)
+    resumed = DocumentIngestor(reopened, batch_size=2, max_concurrency=1).ingest(documents)
+
+    assert resumed["files_failed"] == 0
+    ids = _chunk_ids(reopened)
+    assert [key for key, count in collections.Counter(ids).items() if count > 1] == []
+    for source in ("a.txt", "b.txt"):
+        assert sorted(chunk for name, chunk in ids if name == source) == list(range(max(c for n, c in ids if n == source) + 1))
+    state = json.loads((tmp_path / "index" / "ingested_files.json").read_text(encoding="utf-8"))
+    assert all(record["complete"] for record in state.values())
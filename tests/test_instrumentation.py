@@ -0,0 +1,79 @@
+# /tests/test_instrumentation.py
+# title: LLM呼び出しの計測のテスト
+# role: 並行したリクエストのLLM呼び出しがリクエストIDごとに分けて記録されること、エージェント名・モード・待ち時間の記録、
+#       保持するリクエスト数の上限、JSONLとPrometheus形式の出力を確認する。
+
+import asyncio
+import contextvars
+import json
+
+from langchain_core.output_parsers import StrOutputParser
+from langchain_core.prompts import PromptTemplate
+
+from app.llm.fake import FakeOllamaLLM
+from app.llm.instrumentation import LLMCallRecorder, install_llm_instrumentation, llm_call_context, with_agent_label
+from app.llm.scheduler import LLMScheduler
+
+
+def _run_instrumented(recorder, coroutine_function):
+    """レコーダーを有効にした独立したコンテキストでコルーチンを実行する（他のテストにレコーダーが残らないようにする）。"""
+    def run():
+        resource = install_llm_instrumentation(recorder)
+        next(resource)
+        try:
+            return asyncio.run(coroutine_function())
+        finally:
+            resource.close()
+    return contextvars.copy_context().run(run)
+
+
+def test_calls_are_recorded_per_request(tmp_path):
+    recorder = LLMCallRecorder(
+        jsonl_path=str(tmp_path / "llm_calls.jsonl"), prometheus_path=str(tmp_path / "llm_metrics.prom"),
+    )
+    # 実行枠を1つにして、2つのリクエストの呼び出しのどちらかが待つようにする
+    llm = FakeOllamaLLM(model="fake", first_token_latency_seconds=0.02, scheduler=LLMScheduler(max_concurrency=1))
+    planner = with_agent_label(PromptTemplate.from_template("計画: {q}") | llm | StrOutputParser(), "PlanningAgent")
+    answerer = with_agent_label(PromptTemplate.from_template("回答: {q}") | llm | StrOutputParser(), "MasterAgent")
+
+    async def request(request_id):
+        with llm_call_context(request_id=request_id, mode="full"):
+            await planner.ainvoke({"q": request_id})
+            await answerer.ainvoke({"q": request_id})
+
+    async def scenario():
+        await asyncio.gather(request("r1"), request("r2"))
+
+    _run_instrumented(recorder, scenario)
+
+    for request_id in ("r1", "r2"):
+        records = recorder.get_request_records(request_id)
+        assert [r["agent"] for r in records] == ["PlanningAgent", "MasterAgent"]
+        assert all(r["mode"] == "full" and r["error"] is None and r["output_chars"] > 0 for r in records)
+    waits = [r["queue_wait"] for rid in ("r1", "r2") for r in recorder.get_request_records(rid)]
+    assert max(waits) > 0.01
+    breakdown = recorder.get_request_breakdown("r1")
+    assert {row["agent"] for row in breakdown} == {"PlanningAgent", "MasterAgent"}
+
+    with open(tmp_path / "llm_calls.jsonl", "r", encoding="utf-8") as f:
+        assert len([json.loads(line) for line in f]) == 4
+    # 終了時にPrometheus形式のスナップショットを書き出す
+    metrics = (tmp_path / "llm_metrics.prom").read_text(encoding="utf-8")
+    assert 'luca_llm_calls_total{agent="PlanningAgent",mode="full"} 2' in metrics
+
+
+def test_only_the_latest_requests_are_kept():
+    recorder = LLMCallRecorder(max_requests=2)
+    llm = FakeOllamaLLM(model="fake")
+    chain = with_agent_label(PromptTemplate.from_template("{q}") | llm | StrOutputParser(), "Agent")
+
+    async def scenario():
+        for request_id in ("r1", "r2", "r3"):
+            with llm_call_context(request_id=request_id):
+                await chain.ainvoke({"q": request_id})
+
+    _run_instrumented(recorder, scenario)
+
+    assert recorder.get_request_records("r1") == []
+    assert len(recorder.get_request_records("r3")) == 1
+    assert 'luca_llm_calls_total{agent="Agent",mode="none"} 3' in recorder.render_prometheus()
@@ -0,0 +1,31 @@
+# /tests/test_internal_dialogue.py
+# title: 内的対話のテスト
+# role: 同じConsciousnessStagingAreaで並行して実行した対話の履歴が、互いに混ざらないことを確認する。
+
+import asyncio
+
+from app.internal_dialogue.consciousness_staging_area import ConsciousnessStagingArea
+from app.internal_dialogue.mediator_agent import MediatorAgent
+
+PARTICIPANTS = [
+    {"name": "楽観主義者", "persona": "物事の明るい面に注目する楽観主義者です。"},
+    {"name": "現実主義者", "persona": "実現可能性を重視する現実主義者です。"},
+]
+
+
+def test_concurrent_dialogues_keep_separate_histories(fake_llm):
+    staging_area = ConsciousnessStagingArea(fake_llm, MediatorAgent(fake_llm))
+
+    async def run_both():
+        return await asyncio.gather(
+            staging_area.arun_dialogue("火星移住の是非", PARTICIPANTS, max_turns=3),
+            staging_area.arun_dialogue("深海探査の予算", PARTICIPANTS, max_turns=3),
+        )
+
+    mars, deep_sea = asyncio.run(run_both())
+
+    assert "火星移住の是非" in mars and "深海探査の予算" not in mars
+    assert "深海探査の予算" in deep_sea and "火星移住の是非" not in deep_sea
+    # 各対話はそれぞれの発言と調停者の指示だけから成る
+    assert mars.count("@調停者:") == deep_sea.count("@調停者:")
+    assert mars.count("\n") == deep_sea.count("\n")
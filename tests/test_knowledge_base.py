@@ -0,0 +1,184 @@
+# /tests/test_knowledge_base.py
+# title: ナレッジベースの保存と復元のテスト
+# role: スナップショットとジャーナルからの復元、スナップショットごとのジャーナルの切り替え、ソースの変更による作り直しでの実行中の追加の引き継ぎ、
+#       以前の形式（すべての追加を1つのジャーナルに記録し続ける形式）の読み込み、変更がない場合に埋め込まずに読み込むこと、
+#       埋め込みモデルの変更による作り直し、書き込み途中や壊れたジャーナルの行の扱いを確認する。
+
+import json
+import os
+
+from langchain_core.documents import Document
+
+from app.rag.knowledge_base import KnowledgeBase
+
+SOURCE_TEXT = "\n\n".join(f"段落{i}: 北山市で開発された調理家電の説明です。" * 3 for i in range(6))
+
+
+def _write_source(tmp_path, text=SOURCE_TEXT):
+    source = tmp_path / "source.txt"
+    source.write_text(text, encoding="utf-8")
+    return str(source)
+
+
+def _open(source, index_dir, embeddings, **kwargs):
+    return KnowledgeBase.create_and_load(source, embeddings=embeddings, index_dir=str(index_dir), **kwargs)
+
+
+def _texts(kb):
+    store = kb.vector_store
+    return [store.docstore.search(store.index_to_docstore_id[i]).page_content for i in range(store.index.ntotal)]
+
+
+def _journal_lines(index_dir):
+    manifest = json.loads((index_dir / "manifest.json").read_text(encoding="utf-8"))
+    path = index_dir / manifest["journal"]
+    return path.read_text(encoding="utf-8").splitlines() if path.exists() else []
+
+
+def test_journal_replays_additions_after_restart(tmp_path, fake_embeddings):
+    source, index_dir = _write_source(tmp_path), tmp_path / "index"
+    kb = _open(source, index_dir, fake_embeddings, checkpoint_every=100)
+    source_chunks = kb.vector_store.index.ntotal
+    kb.add_documents([Document(page_content="実行中に学んだ知識その1")])
+    kb.add_documents([Document(page_content="実行中に学んだ知識その2")])
+    assert len(_journal_lines(index_dir)) == 2
+
+    # flushせずに終了した場合も、ジャーナルから復元される
+    reopened = _open(source, index_dir, fake_embeddings)
+
+    assert reopened.vector_store.index.ntotal == source_chunks + 2
+    assert reopened.search_lexical("知識その2", k=1)[0].page_content == "実行中に学んだ知識その2"
+
+
+def test_save_starts_a_new_journal_and_removes_the_old_one(tmp_path, fake_embeddings):
+    source, index_dir = _write_source(tmp_path), tmp_path / "index"
+    kb = _open(source, index_dir, fake_embeddings, checkpoint_every=2)
+    for i in range(3):
+        kb.add_documents([Document(page_content=f"追加{i}")])
+
+    # 2回目の追加でスナップショットを保存したため、ジャーナルには3回目の追加だけが残る
+    assert len(_journal_lines(index_dir)) == 1
+    assert len([name for name in os.listdir(index_dir) if name.startswith("additions")]) == 1
+    assert len([name for name in os.listdir(index_dir) if name.startswith("snapshot-")]) == 1
+
+    assert kb.flush()
+    assert _journal_lines(index_dir) == []
+    assert _texts(_open(source, index_dir, fake_embeddings)) == _texts(kb)
+
+
+def test_unjournaled_additions_are_kept_by_flush(tmp_path, fake_embeddings):
+    source, index_dir = _write_source(tmp_path), tmp_path / "index"
+    kb = _open(source, index_dir, fake_embeddings)
+    texts = ["一括で取り込んだチャンクA", "一括で取り込んだチャンクB"]
+    kb.add_embedded_chunks(texts, fake_embeddings.embed_documents(texts), [{}, {}], checkpoint=False, journal=False)
+    assert _journal_lines(index_dir) == []
+
+    assert kb.flush()
+
+    assert _texts(_open(source, index_dir, fake_embeddings))[-2:] == texts
+
+
+def test_rebuild_from_changed_source_carries_over_runtime_additions(tmp_path, fake_embeddings):
+    source, index_dir = _write_source(tmp_path), tmp_path / "index"
+    kb = _open(source, index_dir, fake_embeddings, checkpoint_every=1)
+    kb.add_documents([Document(page_content="スナップショットに含まれる追加")])
+    kb.add_embedded_chunks(["ジャーナルにある追加"], fake_embeddings.embed_documents(["ジャーナルにある追加"]), [{"source": "x"}], checkpoint=False)
+
+    _write_source(tmp_path, "新しいソースの内容です。")
+    rebuilt = _open(source, index_dir, fake_embeddings)
+
+    assert _texts(rebuilt) == ["新しいソースの内容です。", "スナップショットに含まれる追加", "ジャーナルにある追加"]
+    assert rebuilt.vector_store.docstore.search(rebuilt.vector_store.index_to_docstore_id[2]).metadata == {"source": "x"}
+    # 引き継いだ追加は、次の作り直しでも実行中の追加として扱われる
+    _write_source(tmp_path, "さらに新しいソースです。")
+    assert _texts(_open(source, index_dir, fake_embeddings))[1:] == ["スナップショットに含まれる追加", "ジャーナルにある追加"]
+
+
+def test_legacy_journal_format_is_loaded_and_migrated(tmp_path, fake_embeddings):
+    source, index_dir = _write_source(tmp_path), tmp_path / "index"
+    kb = _open(source, index_dir, fake_embeddings)
+    source_chunks = kb.vector_store.index.ntotal
+    included, pending = "スナップショットに含まれる追加", "ジャーナルにだけある追加"
+    kb.add_embedded_chunks([included], fake_embeddings.embed_documents([included]), [{}], journal=False)
+    kb.save()
+    # 以前の形式: 1つのジャーナルにすべての追加を記録し、マニフェストにはスナップショットに含まれる件数を記録する
+    manifest_path = index_dir / "manifest.json"
+    manifest = json.loads(manifest_path.read_text(encoding="utf-8"))
+    (index_dir / manifest.pop("journal")).unlink(missing_ok=True)
+    del manifest["source_chunks"]
+    manifest["journal_entries"] = 1
+    manifest_path.write_text(json.dumps(manifest), encoding="utf-8")
+    with open(index_dir / "additions.jsonl", "w", encoding="utf-8") as f:
+        for text in (included, pending):
+            entry = {"embedding_model": kb.embedding_model_name, "texts": [text], "vectors": fake_embeddings.embed_documents([text]), "metadatas": [{}]}
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+    legacy = _open(source, index_dir, fake_embeddings)
+    assert legacy.vector_store.index.ntotal == source_chunks + 2
+    assert legacy._source_chunks == source_chunks
+    assert legacy.flush()
+    assert not (index_dir / "additions.jsonl").exists()
+
+    _write_source(tmp_path, "新しいソースの内容です。")
+    assert _texts(_open(source, index_dir, fake_embeddings)) == ["新しいソースの内容です。", included, pending]
+
+
+def test_unchanged_source_is_loaded_without_embedding(tmp_path, fake_embeddings):
+    source, index_dir = _write_source(tmp_path), tmp_path / "index"
+    built = _open(source, index_dir, fake_embeddings)
+    embedded = fake_embeddings.texts
+
+    reopened = _open(source, index_dir, fake_embeddings)
+
+    assert fake_embeddings.texts == embedded
+    assert _texts(reopened) == _texts(built)
+    _open(source, index_dir, fake_embeddings, force_rebuild=True)
+    assert fake_embeddings.texts == 2 * embedded
+
+
+def test_embedding_model_change_rebuilds_and_reembeds_additions(tmp_path, fake_embeddings, monkeypatch):
+    from app.config import settings
+
+    source, index_dir = _write_source(tmp_path), tmp_path / "index"
+    kb = _open(source, index_dir, fake_embeddings, checkpoint_every=1)
+    kb.add_documents([Document(page_content="スナップショットに含まれる追加")])
+    kb.add_embedded_chunks(["ジャーナルにある追加"], fake_embeddings.embed_documents(["ジャーナルにある追加"]), [{}], checkpoint=False)
+    source_chunks = kb._source_chunks
+
+    monkeypatch.setattr(settings, "EMBEDDING_MODEL_NAME", "another-embedding-model")
+    before = fake_embeddings.texts
+    rebuilt = _open(source, index_dir, fake_embeddings)
+
+    # ソースのチャンクと、引き継いだ2件の追加をすべて埋め込み直す
+    assert fake_embeddings.texts - before == source_chunks + 2
+    assert _texts(rebuilt)[-2:] == ["スナップショットに含まれる追加", "ジャーナルにある追加"]
+    manifest = json.loads((index_dir / "manifest.json").read_text(encoding="utf-8"))
+    assert manifest["embedding_model"] == "another-embedding-model"
+
+
+def test_torn_journal_line_is_dropped_on_load(tmp_path, fake_embeddings):
+    source, index_dir = _write_source(tmp_path), tmp_path / "index"
+    kb = _open(source, index_dir, fake_embeddings, checkpoint_every=100)
+    kb.add_documents([Document(page_content="完全に書き込まれた追加")])
+    manifest = json.loads((index_dir / "manifest.json").read_text(encoding="utf-8"))
+    with open(index_dir / manifest["journal"], "a", encoding="utf-8") as f:
+        f.write('{"texts": ["書き込み途中')
+
+    reopened = _open(source, index_dir, fake_embeddings, checkpoint_every=100)
+    reopened.add_documents([Document(page_content="再起動後の追加")])
+
+    assert _texts(_open(source, index_dir, fake_embeddings))[-2:] == ["完全に書き込まれた追加", "再起動後の追加"]
+
+
+def test_corrupt_journal_line_is_skipped_on_replay(tmp_path, fake_embeddings):
+    source, index_dir = _write_source(tmp_path), tmp_path / "index"
+    kb = _open(source, index_dir, fake_embeddings, checkpoint_every=100)
+    kb.add_documents([Document(page_content="壊れた行の前の追加")])
+    journal = index_dir / json.loads((index_dir / "manifest.json").read_text(encoding="utf-8"))["journal"]
+    with open(journal, "a", encoding="utf-8") as f:
+        f.write("{壊れた行}\n")
+    kb.add_documents([Document(page_content="壊れた行の後の追加")])
+
+    reopened = _open(source, index_dir, fake_embeddings)
+
+    assert _texts(reopened)[-2:] == ["壊れた行の前の追加", "壊れた行の後の追加"]
@@ -0,0 +1,49 @@
+# /tests/test_llm_profiles.py
+# title: エージェント別LLMプロファイルのテスト
+# role: 役割ごとの設定の重ね合わせと、役割ごとに1つのインスタンス、実行中の上書き（既定値への復帰、応答キャッシュの切り替え）を確認する。
+
+from app.llm.fake import FakeOllamaLLM
+from app.llm.profiles import LLMProfileRegistry
+from app.llm.response_cache import ResponseCacheStore
+
+BASE = {"model": "large", "temperature": 0.7}
+PROFILES = {
+    "classification": {"model": "small", "temperature": 0.0, "num_predict": 64, "cache": True},
+    "generation": {},
+}
+
+
+def _registry(tmp_path, **kwargs):
+    store = ResponseCacheStore(str(tmp_path / "cache.sqlite3"), max_entries=100, ttl_seconds=0)
+    return LLMProfileRegistry(BASE, PROFILES, cache_store=store, llm_factory=FakeOllamaLLM, **kwargs)
+
+
+def test_roles_layer_their_profile_over_the_base_settings(tmp_path):
+    registry = _registry(tmp_path, overrides={"classification": {"num_predict": 32}})
+
+    classification = registry.get("classification")
+
+    assert registry.get("classification") is classification
+    assert (classification.model, classification.temperature, classification.num_predict) == ("small", 0.0, 32)
+    assert classification.cache is not None
+    # 未定義の役割は既定の役割（generation）の設定を用いる
+    unknown = registry.get("unknown_agent")
+    assert (unknown.model, unknown.temperature, unknown.cache) == ("large", 0.7, None)
+    assert registry.models() == ["small", "large"]
+
+
+def test_override_updates_existing_instances_and_their_cache(tmp_path):
+    registry = _registry(tmp_path)
+    llm = registry.get("classification")
+    llm.invoke("分類してください: こんにちは")
+    llm.invoke("分類してください: こんにちは")
+    assert registry.get_cache_stats()["classification"]["hits"] == 1
+
+    registry.override("classification", temperature=0.3, num_predict=None)
+
+    assert registry.get("classification") is llm
+    assert (llm.temperature, llm.num_predict) == (0.3, None)
+    # 設定が変わったため、以前の設定の応答は再利用しない
+    llm.invoke("分類してください: こんにちは")
+    assert registry.get_cache_stats()["classification"]["hits"] == 0
+    assert registry.describe()["classification"] == {"model": "small", "temperature": 0.3}
@@ -0,0 +1,43 @@
+# /tests/test_mode_cost_model.py
+# title: 実行モードのコストモデルのテスト
+# role: 観測値の保存が記録ごとではなく間隔をあけて行われること、flushで保存され再読み込みできること、遅延予算による切り下げを確認する。
+
+import json
+
+from app.reasoning.mode_cost_model import ModeCostModel
+
+
+def test_record_defers_saving_until_flush(tmp_path):
+    path = tmp_path / "mode_cost_model.json"
+    model = ModeCostModel(["full", "simple"], path=str(path), min_samples=1, save_interval_seconds=3600)
+
+    model.record("full", "high", 1.5, 8)
+    assert not path.exists()
+
+    model.flush()
+    assert json.loads(path.read_text(encoding="utf-8")) == {"full|high": [[1.5, 8]]}
+    reloaded = ModeCostModel(["full", "simple"], path=str(path), min_samples=1)
+    assert reloaded.estimate("full", "high")["samples"] == 1
+
+
+def test_record_saves_when_interval_elapsed(tmp_path):
+    path = tmp_path / "mode_cost_model.json"
+    model = ModeCostModel(["full", "simple"], path=str(path), save_interval_seconds=0)
+
+    model.record("simple", "low", 0.2, 1)
+
+    assert json.loads(path.read_text(encoding="utf-8")) == {"simple|low": [[0.2, 1]]}
+
+
+def test_choose_mode_downgrades_to_fastest_mode_within_budget():
+    model = ModeCostModel(["full", "parallel", "simple"], min_samples=2)
+    for _ in range(2):
+        model.record("full", "high", 10.0, 12)
+        model.record("parallel", "high", 3.0, 5)
+        model.record("simple", "high", 0.5, 1)
+
+    assert model.choose_mode("full", "high", 20000) == ("full", None)
+    chosen, reason = model.choose_mode("full", "high", 5000)
+    assert chosen == "parallel" and reason
+    assert model.choose_mode("full", "high", 100)[0] == "simple"
+    assert model.get_stats()["downgrades"] == 2
@@ -0,0 +1,44 @@
+# /tests/test_mode_router.py
+# title: 学習型モードルーターのテスト
+# role: モード選択の記録の読み込み（LLMによる決定のみを学習に用いる）、学習したモデルの保存と読み込み、学習していないルーターの挙動を確認する。
+
+from app.reasoning.mode_router import ModeDecisionLog, ModeRouter
+
+TRAINING = [
+    ("こんにちは", "simple"), ("ありがとう", "simple"), ("おはよう", "simple"), ("元気ですか", "simple"),
+    ("意識とは何かを多角的に深く考察して", "full"), ("倫理と自由意志の関係を深く分析して", "full"),
+    ("AIの未来を多角的に考察して", "full"), ("人間の創造性について深く分析して", "full"),
+]
+
+
+def test_decision_log_keeps_only_llm_decisions_for_training(tmp_path):
+    path = str(tmp_path / "logs" / "mode_decisions.jsonl")
+    log = ModeDecisionLog(path)
+    log.append("こんにちは", "simple", "llm", 0.5)
+    log.append("こんばんは", "simple", "router", 0.001, confidence=0.95)
+    with open(path, "a", encoding="utf-8") as f:
+        f.write('{"query": "書き込み途中')
+
+    assert [r["query"] for r in ModeDecisionLog.read(path)] == ["こんにちは"]
+    assert len(ModeDecisionLog.read(path, source=None)) == 2
+
+
+def test_trained_router_round_trips_through_save_and_load(tmp_path):
+    queries, labels = zip(*TRAINING)
+    router = ModeRouter(num_features=2 ** 12).fit(queries, labels)
+    path = str(tmp_path / "mode_router.npz")
+    router.save(path)
+
+    loaded = ModeRouter.load_or_untrained(path)
+
+    assert loaded.modes == ["full", "simple"]
+    assert loaded.predict("こんにちは")[0] == "simple"
+    assert loaded.predict("意識について深く考察して")[0] == "full"
+    assert loaded.predict_proba("ありがとう") == router.predict_proba("ありがとう")
+
+
+def test_untrained_router_defers_to_the_llm(tmp_path):
+    router = ModeRouter.load_or_untrained(str(tmp_path / "missing.npz"))
+
+    assert not router.is_trained
+    assert router.predict("こんにちは") == (None, 0.0)
@@ -0,0 +1,23 @@
+# /tests/test_pipeline_benchmark.py
+# title: 推論パイプラインのベンチマークのテスト
+# role: オフライン用のLLMと埋め込みモデルで全実行モードのベンチマークを1回ずつ実行し、どのモードでも失敗や空の回答がないこと、
+#       LLMの呼び出しが計測されていることを確認する。
+
+import asyncio
+
+from benchmarks.pipeline_benchmark import ALL_MODES, DEFAULT_QUERIES, _run_mode
+
+
+def test_every_mode_runs_offline_without_errors(offline_container):
+    container, llm, _ = offline_container
+    container.init_resources()
+    try:
+        results = [asyncio.run(_run_mode(container, llm, mode, DEFAULT_QUERIES, runs=1)) for mode in ALL_MODES]
+    finally:
+        container.shutdown_resources()
+
+    assert [r["mode"] for r in results] == ALL_MODES
+    assert {r["mode"]: r["errors"] for r in results} == {mode: [] for mode in ALL_MODES}
+    for r in results:
+        assert r["samples"] == len(DEFAULT_QUERIES)
+        assert r["llm_calls"] > 0 and r["completion_chars"] > 0
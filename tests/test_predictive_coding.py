@@ -0,0 +1,62 @@
+# /tests/test_predictive_coding.py
+# title: 予測符号化エンジンのテスト
+# role: 先行して計算した予測が、同じ対話履歴の入力でのみ再利用されること、
+#       予測誤差があった場合のワールドモデルの更新が応答を待たせずに別スレッドで行われることを確認する。
+
+import asyncio
+import threading
+
+
+class StubWorldModel:
+    """呼び出しを記録し、更新はreleaseがセットされるまで終わらないワールドモデル。"""
+    def __init__(self):
+        self.predicted = []
+        self.release = threading.Event()
+        self.updated = threading.Event()
+
+    async def apredict_next_state(self, input_data):
+        self.predicted.append(input_data["dialogue_history"])
+        return f"予測: {input_data['dialogue_history']}"
+
+    async def acalculate_prediction_error(self, input_data):
+        return {"error_type": "新規情報", "key_info": ["x"], "summary": input_data["actual_input"]}
+
+    async def aupdate_model(self, input_data):
+        self.release.wait(timeout=5)
+        self.updated.set()
+        return "更新しました"
+
+
+def _engine_with_stub(master_agent_factory):
+    engine = master_agent_factory().predictive_coding_engine
+    stub = StubWorldModel()
+    engine.world_model_agent = stub
+    return engine, stub
+
+
+def test_prepared_prediction_is_reused_only_for_the_same_history(master_agent_factory):
+    engine, stub = _engine_with_stub(master_agent_factory)
+    stub.release.set()
+    history = ["User: こんにちは", "AI: こんにちは"]
+
+    engine.prepare_next_prediction(history)
+    asyncio.run(engine.aprocess_input("天気は？", history))
+    assert stub.predicted == ["User: こんにちは\nAI: こんにちは"]
+
+    engine.prepare_next_prediction(history)
+    stale = engine._prepared[1]
+    asyncio.run(engine.aprocess_input("別の話題", history + ["User: 天気は？"]))
+    stale.result(timeout=5)
+    # 対話履歴が異なるため、先行した予測は使わずに予測し直す
+    assert sorted(stub.predicted[1:]) == sorted(["User: こんにちは\nAI: こんにちは", "User: こんにちは\nAI: こんにちは\nUser: 天気は？"])
+
+
+def test_world_model_update_does_not_block_the_response(master_agent_factory):
+    engine, stub = _engine_with_stub(master_agent_factory)
+
+    prediction_error = asyncio.run(engine.aprocess_input("新しい情報です", []))
+
+    assert prediction_error["summary"] == "新しい情報です"
+    assert not stub.updated.is_set()
+    stub.release.set()
+    assert stub.updated.wait(timeout=5)
@@ -0,0 +1,88 @@
+# /tests/test_reflection_queue.py
+# title: 応答後の内省キューのテスト
+# role: 再起動後の未処理の項目の復元とジャーナルの書き直し、対話中に処理する項目の選択、失敗した項目の再試行と破棄を確認する。
+
+import asyncio
+import json
+
+from app.meta_cognition.reflection_queue import ReflectionQueue
+
+
+def _journal_ops(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line)["op"] for line in f]
+
+
+def test_pending_items_are_recovered_after_restart(tmp_path):
+    path = str(tmp_path / "reflection_queue.jsonl")
+    queue = ReflectionQueue(path)
+    queue.enqueue("evaluate", {"final_answer": "回答1"})
+    queue.enqueue("evaluate", {"final_answer": "回答2"})
+    processed = []
+
+    async def handler(payload):
+        processed.append(payload["final_answer"])
+
+    queue.register("evaluate", handler)
+    assert asyncio.run(queue.aprocess_due(idle=True, max_items=1)) == 1
+    # 異常終了の代わりに、書き込み途中の行を残す
+    with open(path, "a", encoding="utf-8") as f:
+        f.write('{"op": "put", "item": {"id"')
+
+    recovered = ReflectionQueue(path)
+    assert recovered.get_stats()["recovered"] == 1
+    # 起動時に、未処理の項目のみからなるジャーナルに書き直される
+    assert _journal_ops(path) == ["put"]
+
+    recovered.register("evaluate", handler)
+    assert asyncio.run(recovered.aprocess_due(idle=True)) == 1
+    assert processed == ["回答1", "回答2"]
+    assert recovered.pending_count() == 0
+    # すべて処理し終えるとジャーナルは空に書き直される
+    assert _journal_ops(path) == []
+
+
+def test_only_overdue_items_are_processed_while_busy(tmp_path):
+    queue = ReflectionQueue(str(tmp_path / "queue.jsonl"), max_defer_seconds=60)
+    processed = []
+
+    async def handler(payload):
+        processed.append(payload["n"])
+
+    queue.register("evaluate", handler)
+    queue.enqueue("evaluate", {"n": 1})
+    queue.enqueue("unregistered", {"n": 2})
+    enqueued_at = queue._pending[next(iter(queue._pending))]["enqueued_at"]
+
+    assert asyncio.run(queue.aprocess_due(idle=False, now=enqueued_at + 1)) == 0
+    assert asyncio.run(queue.aprocess_due(idle=False, now=enqueued_at + 61)) == 1
+    # 処理関数が登録されていない項目は、登録されるまで残る
+    assert asyncio.run(queue.aprocess_due(idle=True)) == 0
+    assert processed == [1]
+    assert queue.pending_count() == 1
+
+
+def test_failed_items_are_retried_across_restarts_then_dropped(tmp_path):
+    path = str(tmp_path / "queue.jsonl")
+    calls = []
+
+    async def failing(payload):
+        calls.append(payload)
+        raise RuntimeError("evaluation failed")
+
+    queue = ReflectionQueue(path, max_attempts=2)
+    queue.register("evaluate", failing)
+    queue.enqueue("evaluate", {"final_answer": "回答"})
+    # 1回の呼び出しでは、失敗した項目を再試行しない
+    assert asyncio.run(queue.aprocess_due(idle=True)) == 1
+    assert queue.pending_count() == 1
+
+    restarted = ReflectionQueue(path, max_attempts=2)
+    assert next(iter(restarted._pending.values()))["attempts"] == 1
+    restarted.register("evaluate", failing)
+    assert asyncio.run(restarted.aprocess_due(idle=True)) == 1
+
+    assert len(calls) == 2
+    assert restarted.pending_count() == 0
+    assert restarted.get_stats()["dropped"] == 1
+    assert ReflectionQueue(path).pending_count() == 0
@@ -0,0 +1,54 @@
+# /tests/test_response_cache.py
+# title: LLM応答キャッシュのテスト
+# role: 最終アクセスが古い順の削除、有効期限、再起動後の再利用、生成設定ごとのキーの分離と、キャッシュにヒットした呼び出しが生成まで到達しないことを確認する。
+
+import time
+
+from langchain_core.language_models.fake import FakeListLLM
+
+from app.llm.response_cache import LLMResponseCache, ResponseCacheStore
+
+
+def test_store_evicts_least_recently_used(tmp_path):
+    store = ResponseCacheStore(str(tmp_path / "cache.sqlite3"), max_entries=2, ttl_seconds=0)
+    store.put("a", "m", "A")
+    time.sleep(0.01)
+    store.put("b", "m", "B")
+    time.sleep(0.01)
+    assert store.get("a") == "A"
+    time.sleep(0.01)
+    store.put("c", "m", "C")
+
+    assert store.get("b") is None
+    assert (store.get("a"), store.get("c")) == ("A", "C")
+
+
+def test_store_expires_entries_and_persists_across_reopen(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    store = ResponseCacheStore(path, max_entries=10, ttl_seconds=60)
+    store.put("key", "m", "value")
+    store.close()
+
+    reopened = ResponseCacheStore(path, max_entries=10, ttl_seconds=60)
+    assert reopened.get("key") == "value"
+    reopened.ttl_seconds = 1e-9
+    assert reopened.get("key") is None
+    assert reopened.count() == 0
+
+
+def test_cache_keys_are_separated_by_generation_settings(tmp_path):
+    store = ResponseCacheStore(str(tmp_path / "cache.sqlite3"), max_entries=10, ttl_seconds=0)
+    cold = LLMResponseCache(store, {"model": "m", "temperature": 0.0})
+    warm = LLMResponseCache(store, {"model": "m", "temperature": 0.7})
+    # FakeListLLMは生成のたびに次の応答を返し、生成した回数をiに数える
+    llm = FakeListLLM(responses=["分類A", "分類B"], cache=cold)
+
+    first = llm.invoke("分類してください: こんにちは")
+    second = llm.invoke("分類してください: こんにちは")
+    assert first == second == "分類A"
+    assert llm.i == 1
+    assert cold.get_stats()["hits"] == 1
+
+    other = FakeListLLM(responses=["分類C"], cache=warm)
+    assert other.invoke("分類してください: こんにちは") == "分類C"
+    assert warm.get_stats()["misses"] == 1
@@ -0,0 +1,114 @@
+# /tests/test_scheduler.py
+# title: LLMリクエストスケジューラのテスト
+# role: 空いた実行枠がinteractiveな呼び出しに優先して割り当てられること、バックグラウンドの同時実行数の上限、
+#       待機中のキャンセルで実行枠が失われないことを確認する。
+
+import asyncio
+
+import pytest
+from langchain_core.outputs import Generation, LLMResult
+from langchain_ollama import OllamaLLM
+
+from app.llm.scheduler import LLMPriority, LLMScheduler, ScheduledOllamaLLM, llm_priority
+
+
+def test_interactive_waiters_are_admitted_before_background():
+    async def scenario():
+        scheduler = LLMScheduler(max_concurrency=1)
+        order = []
+        release_first = asyncio.Event()
+
+        async def call(name, priority, hold=None):
+            async with scheduler.aslot(priority):
+                order.append(name)
+                if hold is not None:
+                    await hold.wait()
+
+        first = asyncio.create_task(call("first", LLMPriority.BACKGROUND, release_first))
+        await asyncio.sleep(0)
+        # バックグラウンドの呼び出しが先に待ち始めても、interactiveな呼び出しが先に実行枠を得る
+        waiting = [asyncio.create_task(call("background", LLMPriority.BACKGROUND))]
+        await asyncio.sleep(0)
+        waiting.append(asyncio.create_task(call("interactive", LLMPriority.INTERACTIVE)))
+        await asyncio.sleep(0)
+        assert scheduler.get_stats()["background"]["queue_depth"] == 1
+        assert scheduler.get_stats()["interactive"]["queue_depth"] == 1
+
+        release_first.set()
+        await asyncio.gather(first, *waiting)
+        return order, scheduler.get_stats()
+
+    order, stats = asyncio.run(scenario())
+    assert order == ["first", "interactive", "background"]
+    assert stats["interactive"]["completed"] == 1 and stats["background"]["completed"] == 2
+
+
+def test_background_concurrency_is_capped():
+    async def scenario():
+        scheduler = LLMScheduler(max_concurrency=3, max_background_concurrency=1)
+        hold = asyncio.Event()
+        running = {"background": 0, "peak": 0}
+
+        async def background():
+            async with scheduler.aslot(LLMPriority.BACKGROUND):
+                running["background"] += 1
+                running["peak"] = max(running["peak"], running["background"])
+                await hold.wait()
+                running["background"] -= 1
+
+        tasks = [asyncio.create_task(background()) for _ in range(3)]
+        await asyncio.sleep(0)
+        # バックグラウンドの上限に達していても、interactiveな呼び出しは空いた実行枠を得られる
+        async with scheduler.aslot(LLMPriority.INTERACTIVE):
+            active = scheduler.get_stats()
+        hold.set()
+        await asyncio.gather(*tasks)
+        return running["peak"], active
+
+    peak, active = asyncio.run(scenario())
+    assert peak == 1
+    assert active["background"]["active"] == 1 and active["interactive"]["active"] == 1
+
+
+def test_cancelled_waiter_does_not_leak_a_slot():
+    async def scenario():
+        scheduler = LLMScheduler(max_concurrency=1)
+        await scheduler.aacquire(LLMPriority.INTERACTIVE)
+        waiter = asyncio.create_task(scheduler.aacquire(LLMPriority.INTERACTIVE))
+        await asyncio.sleep(0)
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        scheduler.release(LLMPriority.INTERACTIVE)
+        # キャンセルした待機が枠を保持したままになっていなければ、次の呼び出しはすぐに実行枠を得る
+        await asyncio.wait_for(scheduler.aacquire(LLMPriority.BACKGROUND), timeout=1)
+        return scheduler.get_stats()
+
+    stats = asyncio.run(scenario())
+    assert stats["interactive"]["queue_depth"] == 0
+    assert stats["background"]["active"] == 1
+
+
+def test_scheduled_llm_calls_use_the_current_priority(monkeypatch):
+    scheduler = LLMScheduler(max_concurrency=2)
+    generated = []
+
+    async def fake_agenerate(self, prompts, stop=None, run_manager=None, **kwargs):
+        # Ollamaへの要求の代わりに、実行枠を得た状態で呼ばれたことを記録する
+        stats = scheduler.get_stats()
+        generated.append(stats["interactive"]["active"] + stats["background"]["active"])
+        await asyncio.sleep(0.01)
+        return LLMResult(generations=[[Generation(text="回答")] for _ in prompts])
+
+    monkeypatch.setattr(OllamaLLM, "_agenerate", fake_agenerate)
+    llm = ScheduledOllamaLLM(model="fake", scheduler=scheduler)
+
+    async def scenario():
+        with llm_priority(LLMPriority.BACKGROUND):
+            return await asyncio.gather(*(llm.ainvoke(f"質問{i}") for i in range(3)))
+
+    assert asyncio.run(scenario()) == ["回答"] * 3
+    assert len(generated) == 3 and all(1 <= active <= 2 for active in generated)
+    stats = scheduler.get_stats()
+    assert stats["background"]["completed"] == 3
+    assert stats["interactive"]["completed"] == 0
@@ -0,0 +1,40 @@
+# /tests/test_session_history.py
+# title: セッションごとの対話履歴のテスト
+# role: エンジンとパイプラインを共有する複数のセッションのMasterAgentが、それぞれの対話履歴だけをパイプラインに渡すことを確認する。
+
+import asyncio
+
+
+def test_full_pipeline_receives_each_sessions_history(offline_container, master_agent_factory, monkeypatch):
+    container, _, _ = offline_container
+    engine = container.engine()
+    cognitive_loop_agent = engine.pipelines["full"].cognitive_loop_agent
+    original_ainvoke = cognitive_loop_agent.ainvoke
+    received = {}
+
+    async def recording_ainvoke(input_data):
+        received[input_data["query"]] = list(input_data["dialogue_history"])
+        return await original_ainvoke(input_data)
+
+    async def choose_full(input_data):
+        return {"chosen_mode": "full", "reason": "テスト", "agent_configs": {}}
+
+    monkeypatch.setattr(cognitive_loop_agent, "ainvoke", recording_ainvoke)
+    alice, bob = master_agent_factory(), master_agent_factory()
+    for agent in (alice, bob):
+        monkeypatch.setattr(agent.orchestration_agent, "ainvoke", choose_full)
+    alice.dialogue_history = ["User: 猫の飼い方", "AI: 猫について"]
+    bob.dialogue_history = ["User: 登山の装備", "AI: 登山について"]
+
+    async def run_both():
+        await asyncio.gather(alice.ainvoke("火星移住の是非"), bob.ainvoke("深海探査の予算"))
+
+    asyncio.run(run_both())
+
+    histories = {tuple(history) for history in received.values()}
+    assert ("User: 猫の飼い方", "AI: 猫について") in histories
+    assert ("User: 登山の装備", "AI: 登山について") in histories
+    # 回答後は、それぞれのセッションの履歴にだけ今回の対話が追加される
+    assert alice.dialogue_history[2] == "User: 火星移住の是非"
+    assert bob.dialogue_history[2] == "User: 深海探査の予算"
+    assert len(alice.dialogue_history) == len(bob.dialogue_history) == 4
@@ -0,0 +1,30 @@
+# /tests/test_sessions.py
+# title: 対話セッション管理のテスト
+# role: セッションの終了（明示的な終了、上限による追い出し）で、セッションごとの予測符号化エンジンのスレッドが終了することを確認する。
+
+from app.server.sessions import SessionManager
+
+
+def test_predictive_coding_engine_close_stops_threads(master_agent_factory):
+    engine = master_agent_factory().predictive_coding_engine
+    engine.prepare_next_prediction(["User: こんにちは", "AI: こんにちは"])
+
+    engine.close(wait=True)
+
+    for executor in (engine._prediction_executor, engine._update_executor):
+        assert executor._shutdown
+        assert not any(thread.is_alive() for thread in executor._threads)
+
+
+def test_ended_sessions_shut_down_their_executors(master_agent_factory):
+    sessions = SessionManager(master_agent_factory, max_sessions=1, idle_timeout_seconds=None)
+    first = sessions.create()
+    second = sessions.create()  # 上限に達しているため、最初のセッションは追い出される
+
+    assert sessions.get(first.session_id) is None
+    assert first.master_agent.predictive_coding_engine._prediction_executor._shutdown
+    assert first.master_agent.predictive_coding_engine._update_executor._shutdown
+    assert not second.master_agent.predictive_coding_engine._update_executor._shutdown
+
+    sessions.close(second.session_id)
+    assert second.master_agent.predictive_coding_engine._update_executor._shutdown
@@ -0,0 +1,101 @@
+# /tests/test_step_graph.py
+# title: ステップグラフ実行器のテスト
+# role: 依存関係に従った実行順序と独立したステップの並行実行、同時実行数の上限、クリティカルパスの計測、
+#       失敗時に実行中のステップがキャンセルされること、グラフの構成の誤りの検出を確認する。
+
+import asyncio
+
+import pytest
+
+from app.pipelines.step_graph import Step, StepGraph, StepGraphStats
+
+
+def _tracked_steps(log, delays):
+    """ステップの開始と終了をlogに記録するステップのリスト。resultは入力の値を連結した文字列。"""
+    running = {"now": 0, "peak": 0}
+
+    def make(name, inputs):
+        async def func(**kwargs):
+            running["now"] += 1
+            running["peak"] = max(running["peak"], running["now"])
+            log.append(f"start:{name}")
+            await asyncio.sleep(delays[name])
+            log.append(f"end:{name}")
+            running["now"] -= 1
+            return name + "(" + ",".join(str(kwargs[i]) for i in inputs) + ")"
+        return Step(name, func, inputs)
+
+    steps = [
+        make("plan", ("query",)),
+        make("answer", ("plan",)),
+        make("problems", ("plan",)),
+        make("summary", ("answer", "problems")),
+    ]
+    return steps, running
+
+
+def test_independent_steps_run_concurrently_after_their_inputs():
+    log = []
+    steps, running = _tracked_steps(log, {"plan": 0.01, "answer": 0.05, "problems": 0.02, "summary": 0.01})
+    stats = StepGraphStats()
+    graph = StepGraph("test", steps, max_concurrency=4, stats=stats)
+
+    values, report = asyncio.run(graph.arun({"query": "q"}))
+
+    assert values["summary"] == "summary(answer(plan(q)),problems(plan(q)))"
+    assert log.index("end:plan") < log.index("start:answer") and log.index("end:plan") < log.index("start:problems")
+    assert log[-1] == "end:summary"
+    assert running["peak"] == 2
+    assert report["critical_path"] == ["plan", "answer", "summary"]
+    assert report["critical_path_seconds"] < report["step_sum_seconds"]
+    assert stats.get_stats()["test"]["runs"] == 1
+
+
+def test_max_concurrency_limits_parallel_steps():
+    log = []
+    steps, running = _tracked_steps(log, {"plan": 0.0, "answer": 0.02, "problems": 0.02, "summary": 0.0})
+
+    asyncio.run(StepGraph("serial", steps, max_concurrency=1).arun({"query": "q"}))
+
+    assert running["peak"] == 1
+
+
+def test_failing_step_cancels_running_steps():
+    cancelled = asyncio.Event()
+
+    async def slow():
+        try:
+            await asyncio.sleep(5)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+
+    async def fail():
+        await asyncio.sleep(0.01)
+        raise RuntimeError("step failed")
+
+    graph = StepGraph("failing", [Step("slow", slow), Step("fail", fail)])
+
+    async def run():
+        with pytest.raises(RuntimeError, match="step failed"):
+            await graph.arun({})
+        return cancelled.is_set()
+
+    assert asyncio.run(run())
+
+
+async def _noop(**kwargs):
+    return None
+
+
+def test_invalid_graphs_are_rejected():
+    with pytest.raises(ValueError, match="循環"):
+        StepGraph("cycle", [Step("a", _noop, ("b",)), Step("b", _noop, ("a",))])
+    with pytest.raises(ValueError, match="重複"):
+        StepGraph("duplicate", [Step("a", _noop), Step("a", _noop)])
+
+    graph = StepGraph("inputs", [Step("a", _noop, ("query",))])
+    with pytest.raises(ValueError, match="不足"):
+        asyncio.run(graph.arun({}))
+    with pytest.raises(ValueError, match="ステップ名と同じ"):
+        asyncio.run(graph.arun({"query": "q", "a": 1}))
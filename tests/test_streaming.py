@@ -0,0 +1,91 @@
+# /tests/test_streaming.py
+# title: 最終回答トークンストリーミングのテスト
+# role: 並行したストリーミングのイベントが互いのキューに混ざらないこと、イテレーションの打ち切りでタスクがキャンセルされること、
+#       ヘッジ実行でsimpleパイプラインの回答を採用した場合に、それまでの断片の取り消し（reset）の後にsimpleパイプラインの断片が送出されることを確認する。
+
+import asyncio
+import contextlib
+
+from langchain_core.runnables import RunnableGenerator
+
+from app.engine import MetaIntelligenceEngine
+from app.llm.streaming import ainvoke_streaming, emit_stream_reset, iterate_stream_events, start_stream_task
+from app.pipelines.base import BasePipeline
+
+
+async def _echo_tokens(inputs):
+    """入力のqueryを1文字ずつ、間を空けて生成するチェーンの本体。"""
+    async for input_data in inputs:
+        for char in input_data["query"]:
+            await asyncio.sleep(0.001)
+            yield char
+
+
+def _chain():
+    return RunnableGenerator(_echo_tokens)
+
+
+def test_concurrent_streams_do_not_mix():
+    chain = _chain()
+
+    async def scenario():
+        streams = [start_stream_task(ainvoke_streaming(chain, {"query": f"質問{i}"})) for i in range(3)]
+        results = []
+        for task, queue in streams:
+            events = [event async for event in iterate_stream_events(task, queue)]
+            results.append(("".join(e["content"] for e in events if e["type"] == "token"), task.result()))
+        return results, await ainvoke_streaming(chain, {"query": "質問0"})
+
+    results, unstreamed = asyncio.run(scenario())
+
+    assert results == [(f"質問{i}", f"質問{i}") for i in range(3)]
+    # ストリーミング実行中でなければ、同じ回答を送出せずに返す
+    assert unstreamed == results[0][1]
+
+
+def test_stopping_iteration_cancels_the_task():
+    async def scenario():
+        async def producer():
+            emit_stream_reset()
+            await asyncio.sleep(5)
+
+        task, queue = start_stream_task(producer())
+        async with contextlib.aclosing(iterate_stream_events(task, queue)) as events:
+            async for _ in events:
+                break
+        await asyncio.sleep(0)
+        return task.cancelled()
+
+    assert asyncio.run(scenario())
+
+
+class StreamingPipeline(BasePipeline):
+    """最終回答をストリーミングで生成し、その後delay_secondsだけ待ってから返すパイプライン。"""
+    def __init__(self, chain, query, delay_seconds=0.0):
+        self.chain = chain
+        self.query = query
+        self.delay_seconds = delay_seconds
+
+    async def arun(self, query, orchestration_decision, dialogue_history=None):
+        answer = await ainvoke_streaming(self.chain, {"query": self.query})
+        await asyncio.sleep(self.delay_seconds)
+        return {"final_answer": answer, "self_criticism": "", "potential_problems": "", "retrieved_info": ""}
+
+
+def test_hedge_winner_resets_and_replays_its_tokens():
+    chain = _chain()
+    pipelines = {"full": StreamingPipeline(chain, "詳しい分析", delay_seconds=5.0), "simple": StreamingPipeline(chain, "短い回答")}
+    engine = MetaIntelligenceEngine(pipelines, deadlines={"full": {"hedge_after_seconds": 0.1, "deadline_seconds": 10}})
+
+    async def collect():
+        decision = {"chosen_mode": "full", "reason": "テスト", "agent_configs": {}}
+        return [event async for event in engine.astream("質問", decision)]
+
+    events = asyncio.run(collect())
+
+    types = [event["type"] for event in events]
+    assert types.count("reset") == 1 and types[-1] == "response"
+    reset = types.index("reset")
+    assert "token" in types[:reset]
+    replayed = "".join(event["content"] for event in events[reset + 1:] if event["type"] == "token")
+    assert replayed == events[-1]["response"]["final_answer"] == "短い回答"
@@ -0,0 +1,66 @@
+# /tests/test_structured_output.py
+# title: 構造化出力の修復と再要求のテスト
+# role: 崩れたJSONの修復、修復できない出力のエージェント単位の再要求、再要求も失敗した場合の既定値と、その集計を確認する。
+
+import pytest
+from langchain_core.language_models.fake import FakeListLLM
+from langchain_core.prompts import PromptTemplate
+
+from app.llm.structured_output import JSON_REASK_MARKER, StructuredOutputStats, build_structured_chain, repair_json
+
+
+@pytest.mark.parametrize("text, expected", [
+    ('```json\n{"mode": "simple",}\n```', {"mode": "simple"}),
+    ('以下が結果です: {"mode": "full", "reason": "複雑な質', {"mode": "full", "reason": "複雑な質"}),
+    ("{'mode': 'simple', 'cached': True, 'note': None}", {"mode": "simple", "cached": True, "note": None}),
+    ('{"mode": , "reason": "x"}', {"mode": None, "reason": "x"}),
+])
+def test_repair_json(text, expected):
+    assert repair_json(text) == expected
+
+
+def test_repair_json_rejects_text_without_json():
+    with pytest.raises(ValueError):
+        repair_json("JSONで出力できませんでした。")
+
+
+class RecordingListLLM(FakeListLLM):
+    """受け取ったプロンプトを記録するFakeListLLM。"""
+    prompts: list = []
+
+    def _call(self, prompt, stop=None, run_manager=None, **kwargs):
+        self.prompts.append(prompt)
+        return super()._call(prompt, stop=stop, run_manager=run_manager, **kwargs)
+
+
+def _chain(responses, stats, default=None):
+    llm = RecordingListLLM(responses=responses, prompts=[])
+    prompt = PromptTemplate.from_template("モードを選んでください: {query}")
+    chain = build_structured_chain(prompt, llm, "OrchestrationAgent", stats=stats, expected_type=dict, default=default, max_reasks=1)
+    return chain, llm
+
+
+def test_unparseable_output_is_reasked_once_for_the_agent():
+    stats = StructuredOutputStats()
+    chain, llm = _chain(["JSONで出力できませんでした。", '{"mode": "simple"}'], stats)
+
+    assert chain.invoke({"query": "こんにちは"}) == {"mode": "simple"}
+
+    assert len(llm.prompts) == 2
+    assert JSON_REASK_MARKER in llm.prompts[1] and "こんにちは" in llm.prompts[1]
+    assert stats.get_stats()["OrchestrationAgent"] == {
+        "parsed": 1, "repaired": 0, "failures": 1, "reasked": 1, "recovered": 1, "defaulted": 0,
+    }
+
+
+def test_default_is_used_when_the_reask_also_fails():
+    stats = StructuredOutputStats()
+    default = {"mode": "simple"}
+    chain, _ = _chain(["失敗", '["リストは期待する形ではない"]'], stats, default=default)
+
+    result = chain.invoke({"query": "こんにちは"})
+
+    assert result == default and result is not default
+    counts = stats.get_stats()["OrchestrationAgent"]
+    assert (counts["failures"], counts["reasked"], counts["defaulted"]) == (2, 1, 1)
+    assert "失敗 2/2" in stats.format_summary()
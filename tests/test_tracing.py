@@ -0,0 +1,108 @@
+# /tests/test_tracing.py
+# title: リクエスト単位のトレースのテスト
+# role: タスクやスレッドにまたがるスパンの親子関係、並行したリクエストのトレースの分離、保持数の上限、
+#       Chromeのトレースイベント形式への書き出しを確認する。
+
+import asyncio
+import contextvars
+import json
+
+from app.tracing import Tracer, install_tracer, start_trace, trace_span, traced
+
+
+def _run_traced(tracer, coroutine_function):
+    """トレーサーを有効にした独立したコンテキストでコルーチンを実行する（他のテストにトレーサーが残らないようにする）。"""
+    def run():
+        resource = install_tracer(tracer)
+        next(resource)
+        return asyncio.run(coroutine_function())
+    return contextvars.copy_context().run(run)
+
+
+@traced("lookup", "knowledge_base")
+def _lookup(value):
+    return value
+
+
+def test_spans_follow_tasks_and_threads_and_traces_stay_separate():
+    tracer = Tracer()
+
+    async def request(name):
+        with start_trace(name, name="request"):
+            async def step(i):
+                with trace_span(f"step{i}"):
+                    await asyncio.sleep(0.01)
+                    await asyncio.to_thread(_lookup, i)
+            await asyncio.gather(step(1), step(2))
+
+    async def scenario():
+        await asyncio.gather(request("a"), request("b"))
+
+    _run_traced(tracer, scenario)
+
+    assert sorted(tracer.trace_ids()) == ["a", "b"]
+    for trace_id in ("a", "b"):
+        spans = tracer.get_trace(trace_id)
+        by_id = {span["span_id"]: span for span in spans}
+        names = {span["name"]: span for span in spans}
+        assert sorted(names) == ["lookup", "request", "step1", "step2"]
+        assert len(spans) == 5
+        root = names["request"]
+        assert root["parent_id"] is None
+        for span in spans:
+            if span["name"].startswith("step"):
+                assert span["parent_id"] == root["span_id"]
+            if span["name"] == "lookup":
+                assert by_id[span["parent_id"]]["name"] in ("step1", "step2")
+
+
+def test_spans_outside_a_trace_are_not_recorded():
+    tracer = Tracer()
+
+    async def scenario():
+        with trace_span("orphan"):
+            _lookup(1)
+
+    _run_traced(tracer, scenario)
+    assert tracer.get_stats()["spans"] == 0
+
+
+def test_oldest_traces_and_excess_spans_are_dropped():
+    tracer = Tracer(max_traces=2, max_spans_per_trace=2)
+
+    async def scenario():
+        for trace_id in ("t1", "t2", "t3"):
+            with start_trace(trace_id):
+                for i in range(3):
+                    with trace_span(f"span{i}"):
+                        pass
+
+    _run_traced(tracer, scenario)
+
+    assert tracer.trace_ids() == ["t2", "t3"]
+    stats = tracer.get_stats()
+    assert stats["spans"] == 4
+    # 各トレースのルートと3つの子のスパンのうち、上限を超えた2つずつは記録しない
+    assert stats["dropped_spans"] == 6
+
+
+def test_chrome_trace_export(tmp_path):
+    tracer = Tracer(export_dir=str(tmp_path), export_each_trace=True)
+
+    async def scenario():
+        with start_trace("req", name="request", query="q"):
+            async def child(i):
+                with trace_span(f"child{i}"):
+                    await asyncio.sleep(0.01)
+            await asyncio.gather(child(1), child(2))
+
+    _run_traced(tracer, scenario)
+
+    with open(tmp_path / "req.json", "r", encoding="utf-8") as f:
+        trace = json.load(f)
+    events = [event for event in trace["traceEvents"] if event["ph"] == "X"]
+    assert [event["name"] for event in events][0] == "request"
+    assert events[0]["ts"] == 0 and events[0]["args"]["query"] == "q"
+    # 並行した2つの子のスパンは別の行に表示される
+    children = [event for event in events if event["name"].startswith("child")]
+    assert len({event["tid"] for event in children}) == 2
@@ -0,0 +1,123 @@
+# /tests/test_warmup.py
+# title: モデルのウォームアップのテスト
+# role: 偽のOllamaクライアントを用いて、全モデルのコールド・ウォームの計測と失敗の記録、モデルの割り当ての変更への追従、
+#       keep_aliveが切れる前の再読み込みとtouchによる延長を確認する。
+
+import threading
+import time
+
+from app.llm.warmup import ModelWarmer
+
+
+class FakeOllamaClient:
+    """generateとembedの呼び出しを記録する、ollama.Clientの代わり。failに含まれるモデルは例外を送出する。"""
+    def __init__(self, fail=()):
+        self.fail = set(fail)
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def _record(self, kind, model, kwargs):
+        with self._lock:
+            self.calls.append((kind, model, kwargs))
+        if model in self.fail:
+            raise ConnectionError(f"{model} is not available")
+
+    def generate(self, model, **kwargs):
+        self._record("generate", model, kwargs)
+        if not kwargs.get("stream"):
+            return {"done": True}
+        return iter([{"response": "は", "done": False}, {"response": "", "done": True, "load_duration": 2_000_000_000}])
+
+    def embed(self, model, **kwargs):
+        self._record("embed", model, kwargs)
+        return {"embeddings": [[0.0]], "load_duration": 500_000_000}
+
+
+def _warmer(client, llm_models=("small", "large"), keep_alive=300, margin=60):
+    models = list(llm_models)
+    return ModelWarmer(
+        llm_models=lambda: models,
+        embedding_models=["embed"],
+        keep_alive_seconds=keep_alive,
+        rewarm_margin_seconds=margin,
+        client=client,
+    ), models
+
+
+def test_warm_up_probes_every_model_twice_and_records_failures():
+    client = FakeOllamaClient(fail={"large"})
+    warmer, _ = _warmer(client)
+    warmer.start()
+    assert warmer.wait(timeout=5)
+
+    stats = warmer.get_stats()
+    assert set(stats) == {"small", "large", "embed"}
+    assert stats["small"]["kind"] == "llm" and stats["small"]["error"] is None
+    assert stats["small"]["load_duration"] == 2.0
+    assert stats["small"]["cold_first_token"] is not None and stats["small"]["warm_first_token"] is not None
+    assert stats["embed"]["kind"] == "embedding" and stats["embed"]["load_duration"] == 0.5
+    assert stats["large"]["error"].startswith("ConnectionError")
+    assert stats["large"]["cold_first_token"] is None
+
+    # 成功したモデルはコールドとウォームの2回ずつ、keep_aliveを指定して呼ばれる
+    assert sum(1 for kind, model, _ in client.calls if model == "small") == 2
+    assert sum(1 for kind, model, _ in client.calls if model == "embed") == 2
+    assert all(kwargs["keep_alive"] == 300 for _, _, kwargs in client.calls)
+    # 返される結果はコピーであり、内部の記録は変わらない
+    stats["small"]["error"] = "changed"
+    assert warmer.get_stats()["small"]["error"] is None
+
+
+def test_rewarm_only_models_close_to_expiry():
+    client = FakeOllamaClient()
+    warmer, models = _warmer(client)
+    warmer.warm_up()
+    client.calls.clear()
+    now = time.time()
+
+    # keep_alive(300) - margin(60) = 240秒経つまでは再読み込みしない
+    assert warmer.rewarm_if_due(now=now + 100) == []
+    assert client.calls == []
+
+    # 使用されたモデルはtouchでkeep_aliveの延長が記録され、再読み込みの対象から外れる
+    warmer.touch("small")
+    due = warmer.rewarm_if_due(now=time.time() + 239)
+    assert due == []
+    due = warmer.rewarm_if_due(now=now + 250)
+    assert sorted(due) == ["embed", "large", "small"]
+    # 再読み込みはプロンプトなしの生成要求と空の埋め込みで行う
+    assert ("generate", "small", {"keep_alive": 300}) in client.calls
+    assert ("embed", "embed", {"input": "", "keep_alive": 300}) in client.calls
+
+    # 再読み込みしたモデルは、次の期限まで対象にならない
+    client.calls.clear()
+    assert warmer.rewarm_if_due(now=time.time() + 100) == []
+
+    # 実行中に割り当てられた生成モデルも対象に含まれる（一度も読み込んでいないため、すぐに再読み込みされる）
+    models.append("tiny")
+    assert warmer.rewarm_if_due(now=time.time() + 1) == ["tiny"]
+
+
+def test_rewarm_disabled_for_infinite_keep_alive_and_before_startup_finishes():
+    client = FakeOllamaClient()
+    warmer, _ = _warmer(client, keep_alive=-1)
+    assert warmer.rewarm_if_due(now=time.time() + 10**6) == []
+    assert client.calls == []
+
+    release = threading.Event()
+
+    class BlockingClient(FakeOllamaClient):
+        def generate(self, model, **kwargs):
+            release.wait(5)
+            return super().generate(model, **kwargs)
+
+    blocking = BlockingClient()
+    warmer, _ = _warmer(blocking, llm_models=("small",))
+    warmer.start()
+    try:
+        # 起動時のウォームアップが終わるまでは、再読み込みを行わない
+        assert warmer.rewarm_if_due(now=time.time() + 10**6) == []
+        assert not warmer.wait(timeout=0.05)
+    finally:
+        release.set()
+    assert warmer.wait(timeout=5)